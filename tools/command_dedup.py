@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+IntelliVend mock parancs deduplikáció (idempotens parancs kezelés)
+==================================================================
+
+A parancsok QoS 1-gyel érkeznek, így a broker egy parancsot többször is
+kézbesíthet (újraküldés kapcsolatvesztés után, duplikált PUBLISH). Memória
+nélkül a mock minden példányt végrehajtana: a második kézbesítés még egy italt
+töltene.
+
+Az eszköz ezért korlátos méretű, TTL-es LRU cache-ben tartja a nemrég kapott
+parancsokat. A kulcs a parancs command_id mezője; ennek hiányában a topic és a
+teljes payload hash-e, ha a payload tartalmaz timestamp mezőt (a backend minden
+parancsba tesz). Azonosító és timestamp nélkül két azonos parancs nem
+különböztethető meg egy újraküldéstől, ezért ezek deduplikáció nélkül futnak.
+
+Ismételt kézbesítéskor a parancs nem fut újra:
+- ha már befejeződött, a cache-elt eredmény (complete / error üzenetek) újra
+  kimegy, mint egy nyugta,
+- ha még fut vagy sorban áll, a másolat csak naplózásra kerül (az eredmény
+  úgyis megérkezik).
+
+Egy parancs akkor fejeződik be, amikor a végeredményét előállító recording()
+blokk véget ér (entry.finish()), nem az első publikált üzenetnél: a futás közbeni
+hibák (pl. PUMP_TIMEOUT) nem zárják le. Ha a parancs egy későbbi feldolgozóhoz
+kerül (pl. rendelés sorba), az entry.hand_off() után az aktuális blokk nem zárja
+le, hanem a következő recording(entry) blokk.
+
+Használat:
+    dedup = CommandDedup(size=1024, ttl=600.0, clock=clock)
+    key = command_key(topic, payload)       # None: nem deduplikálható
+    entry = dedup.lookup(key)               # None: új parancs
+    entry = dedup.add(key)
+    with recording(entry):
+        ...                                 # a record_reply() hívások az entry-be kerülnek
+    entry.finished                          # True: a blokk végén a parancs befejeződött
+"""
+
+import hashlib
+import json
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_DEDUP_SIZE = 1024
+DEFAULT_DEDUP_TTL = 600.0   # simulated seconds; well beyond any QoS 1 redelivery window
+
+# Results of a lookup (metrics label)
+HIT = "hit"
+MISS = "miss"
+UNTRACKED = "untracked"
+
+# The command whose outcome is being produced (set by the worker running it; copied into child tasks)
+current_entry: ContextVar = ContextVar("current_entry", default=None)
+
+
+def command_key(topic: str, payload: Dict) -> Optional[str]:
+    """Deduplikációs kulcs: command_id, ennek hiányában a topic + payload hash-e (csak timestamp-pel)"""
+    command_id = payload.get("command_id")
+    if command_id is not None:
+        return f"id:{command_id}"
+    if payload.get("timestamp") is None:
+        return None
+    digest = hashlib.sha1(f"{topic}\n{json.dumps(payload, sort_keys=True, separators=(',', ':'))}".encode()).hexdigest()
+    return f"sha1:{digest}"
+
+
+class DedupEntry:
+    """Egy nemrég kapott parancs: lejárati idő, a publikált eredmény üzenetek és a befejezettség"""
+
+    __slots__ = ("key", "expires_at", "replies", "finished", "handed_off")
+
+    def __init__(self, key: str, expires_at: float):
+        self.key = key
+        self.expires_at = expires_at
+        # (topic name, payload, qos) of the completions / errors, in publish order
+        self.replies: List[Tuple[str, Dict, int]] = []
+        # Set by the final outcome; until then a redelivery is ignored instead of answered
+        self.finished = False
+        self.handed_off = False
+
+    def finish(self):
+        """A parancs végeredménye megvan: ismételt kézbesítésre a replies újra kimegy"""
+        self.finished = True
+
+    def hand_off(self):
+        """A parancs egy későbbi recording() blokkban fejeződik be, nem az aktuálisban"""
+        self.handed_off = True
+
+
+class CommandDedup:
+    """Korlátos LRU cache TTL-lel a nemrég végrehajtott parancsokhoz (eszközönként egy)"""
+
+    def __init__(self, size: int, ttl: float, clock):
+        """
+        Args:
+            size: Megjegyzett parancsok maximális száma (felette a legrégebben használt kiesik)
+            ttl: Egy parancs megjegyzésének ideje szimulált másodpercben
+            clock: Szimulációs óra (SimClock)
+        """
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries: "OrderedDict[str, DedupEntry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def lookup(self, key: str) -> Optional[DedupEntry]:
+        """Korábban kapott, még érvényes parancs (None, ha új); találatnál a legutóbb használt lesz"""
+        entry = self.entries.get(key)
+        if entry is not None and entry.expires_at <= self.clock.monotonic():
+            del self.entries[key]
+            self.expired += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def add(self, key: str) -> DedupEntry:
+        """Új parancs felvétele; a lejárt és a méret feletti legrégebbi bejegyzések kiesnek"""
+        now = self.clock.monotonic()
+        entry = DedupEntry(key, now + self.ttl)
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+
+        # Expired entries first (the front is the least recently used, usually also the oldest)
+        while self.entries:
+            oldest = next(iter(self.entries.values()))
+            if oldest.expires_at > now:
+                break
+            self.entries.popitem(last=False)
+            self.expired += 1
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evicted += 1
+        return entry
+
+    def describe(self) -> str:
+        """Leírás a banner számára"""
+        return f"last {self.size} commands per device for {self.ttl:g}s (command_id, or payload hash with timestamp)"
+
+
+@contextmanager
+def recording(entry: Optional[DedupEntry]):
+    """A blokkban (és az abból indított task-okban) publikált eredmények az entry-hez kerülnek;
+    a blokk végén a parancs befejeződik, hacsak közben tovább nem adták (hand_off)"""
+    if entry is not None:
+        entry.handed_off = False
+    reset = current_entry.set(entry)
+    try:
+        yield
+    finally:
+        current_entry.reset(reset)
+        if entry is not None and not entry.handed_off:
+            entry.finish()
+
+
+def record_reply(name: str, payload: Dict, qos: int):
+    """Eredmény üzenet (complete / error) megjegyzése az éppen futó parancshoz, ha van"""
+    entry = current_entry.get()
+    if entry is not None:
+        entry.replies.append((name, payload, qos))
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+IntelliVend mock eszköz állapot tábla
+=====================================
+
+A szimulált pumpák állapota tömör, tömb alapú táblában (array modul), a
+fleet összes eszközére közösen: eszközönként 8 pumpa slot, pumpánként
+állandó méret (~30 bájt), függetlenül az eszközök számától.
+
+Pumpánként: aktuális művelet (telemetry.STATES kód), futó műveletek száma
+(átfedő parancsok ugyanarra a pumpára), progress, cél, indítás ideje és az
+utolsó hiba kódja. A pumps_active érték ebből származtatott, így nem
+csúszhat el (pl. negatívba) egy megszakított művelet után.
+
+Konzisztencia: az írások egy szekvencia számláló (seqlock) két növelése
+között történnek. Az olvasók (heartbeat: snapshot(), pumps_active metrika:
+active_total(), akár más szálról) zár nélkül másolnak, és újrapróbálnak, ha
+közben írás történt - a hot path soha nem vár. A status telemetria nem innen
+olvas: a recept szintű, kumulált progress-t az adagolás maga küldi.
+
+Érvénytelen pumpa szám (nem 1-8) ValueError: a parancsot a tábla előtt kell
+ellenőrizni, különben egy másik pumpa állapotát írná.
+
+Használat:
+    table = PumpStateTable(clock)
+    base = table.add_device()
+    table.begin(base, 3, "dispensing", 50.0)
+    table.progress(base, 3, 12.5)
+    table.end(base, 3)
+    table.snapshot(base)    # {"pumps_active": ..., "pumps": [...], "error": ...}
+"""
+
+from array import array
+from typing import Dict, List
+
+from telemetry import STATE_CODES, STATES
+
+# Pumps per device (IntelliVend_ESP32/config.h.sample), shared by every per-pump table of the mock
+NUM_PUMPS = 8
+
+IDLE = STATE_CODES["idle"]
+
+# Retries of a lock-free read before copying regardless (the writer is never blocked)
+SNAPSHOT_RETRIES = 8
+
+
+class PumpStateTable:
+    """Tömb alapú pumpa állapot tábla seqlock snapshot-tal"""
+
+    __slots__ = ("clock", "size", "sequence", "state", "running", "progress_ml", "target_ml",
+                 "started", "error", "device_error", "error_codes", "error_index")
+
+    def __init__(self, clock):
+        """
+        Args:
+            clock: Szimulációs óra (SimClock), az eltelt idő számításához
+        """
+        self.clock = clock
+        self.size = 0
+        self.sequence = 0
+
+        # Per pump slot
+        self.state = array("B")
+        self.running = array("B")
+        self.progress_ml = array("d")
+        self.target_ml = array("d")
+        self.started = array("d")
+        self.error = array("H")
+
+        # Per device (error reported without a pump, e.g. emergency stop)
+        self.device_error = array("H")
+
+        # Interned error codes (index 0 = no error)
+        self.error_codes: List[str] = [""]
+        self.error_index: Dict[str, int] = {"": 0}
+
+    def add_device(self) -> int:
+        """Egy eszköz felvétele; az eszköz első slotjának indexe"""
+        base = self.size
+        self.sequence += 1
+        for column in (self.state, self.running, self.error):
+            column.extend([0] * NUM_PUMPS)
+        for column in (self.progress_ml, self.target_ml, self.started):
+            column.extend([0.0] * NUM_PUMPS)
+        self.device_error.append(0)
+        self.size += NUM_PUMPS
+        self.sequence += 1
+        return base
+
+    def slot(self, base: int, pump_id: int) -> int:
+        """Eszköz slot bázis + pumpa szám (1-8) -> slot index (más pumpa szám: ValueError)"""
+        if not isinstance(pump_id, int) or isinstance(pump_id, bool) or not 1 <= pump_id <= NUM_PUMPS:
+            raise ValueError(f"Invalid pump number: {pump_id!r} (1-{NUM_PUMPS})")
+        return base + pump_id - 1
+
+    def begin(self, base: int, pump_id: int, state: str, target_ml: float = 0.0):
+        """Művelet indítása egy pumpán (a pumpa hibája törlődik)"""
+        slot = self.slot(base, pump_id)
+        self.sequence += 1
+        self.state[slot] = STATE_CODES[state]
+        self.running[slot] = min(self.running[slot] + 1, 255)
+        self.progress_ml[slot] = 0.0
+        self.target_ml[slot] = target_ml
+        self.started[slot] = self.clock.monotonic()
+        self.error[slot] = 0
+        self.sequence += 1
+
+    def progress(self, base: int, pump_id: int, progress_ml: float):
+        slot = self.slot(base, pump_id)
+        self.sequence += 1
+        self.progress_ml[slot] = progress_ml
+        self.sequence += 1
+
+    def end(self, base: int, pump_id: int):
+        """Művelet vége (befejezés vagy megszakítás); az utolsó futó művelettel a pumpa idle"""
+        slot = self.slot(base, pump_id)
+        self.sequence += 1
+        if self.running[slot]:
+            self.running[slot] -= 1
+        if not self.running[slot]:
+            self.state[slot] = IDLE
+        self.sequence += 1
+
+    def set_error(self, base: int, pump_id: int, error_code: str):
+        """Utolsó hiba rögzítése (pump_id 0 vagy érvénytelen: eszköz szintű hiba)"""
+        index = self.error_index.get(error_code)
+        if index is None:
+            index = self.error_index[error_code] = len(self.error_codes)
+            self.error_codes.append(error_code)
+        self.sequence += 1
+        if isinstance(pump_id, int) and 1 <= pump_id <= NUM_PUMPS:
+            self.error[self.slot(base, pump_id)] = index
+        else:
+            self.device_error[base // NUM_PUMPS] = index
+        self.sequence += 1
+
+    def active(self, base: int) -> int:
+        """Működő pumpák száma egy eszközön"""
+        running = self.running
+        return sum(1 for slot in range(base, base + NUM_PUMPS) if running[slot])
+
+    def busy(self, base: int, pump_ids, states) -> List[int]:
+        """A megadott állapotú műveletet futtató pumpák (pl. karbantartás alatt álló pumpák egy rendelésből)"""
+        codes = {STATE_CODES[state] for state in states}
+        running = self.running
+        state = self.state
+        return [pump_id for pump_id in pump_ids
+                if running[self.slot(base, pump_id)] and state[self.slot(base, pump_id)] in codes]
+
+    def active_total(self) -> int:
+        """Működő pumpák száma az összes eszközön"""
+        return self.size - self.running.tobytes().count(0)
+
+    def snapshot(self, base: int) -> Dict:
+        """Egy eszköz konzisztens pillanatképe (zár nélkül, írás közben újrapróbálva)"""
+        end = base + NUM_PUMPS
+        for _ in range(SNAPSHOT_RETRIES):
+            before = self.sequence
+            columns = (self.state[base:end], self.running[base:end], self.progress_ml[base:end],
+                       self.target_ml[base:end], self.started[base:end], self.error[base:end])
+            device_error = self.device_error[base // NUM_PUMPS]
+            if before % 2 == 0 and self.sequence == before:
+                break
+
+        now = self.clock.monotonic()
+        pumps = []
+        for offset, (state, running, progress_ml, target_ml, started, error) in enumerate(zip(*columns)):
+            pumps.append({
+                "pump_id": offset + 1,
+                "state": STATES[state] if running else "idle",
+                "progress_ml": round(progress_ml, 2),
+                "target_ml": round(target_ml, 2),
+                "elapsed_ms": int((now - started) * 1000) if running else 0,
+                "error": self.error_codes[error] or None,
+            })
+        return {
+            "pumps_active": sum(1 for running in columns[1] if running),
+            "pumps": pumps,
+            "error": self.error_codes[device_error] or None,
+        }
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+IntelliVend ESP32 Mock Benchmark
+================================
+
+Mikrobenchmarkok a mock üzenet kódolási / publikálási hot path-jaira, hogy a
+szimulátor saját regresszióit elkapjuk, mielőtt a backendet gyanúsítanánk.
+
+Mért hot path-ok:
+- on_message:      bejövő dispense parancs JSON dekódolása és dispatch
+- status/<mód>:    status payload összeállítása és publikálása (legacy, json, struct)
+- complete:        dispense complete payload összeállítása és publikálása
+- publish_error:   hiba payload összeállítása és publikálása
+- heartbeat:       heartbeat payload összeállítása és publikálása
+
+Transportok:
+- stub:      a kliens publish() hívása nem csinál semmit (csak a mock saját költsége)
+- loopback:  in-process broker, TCP nélkül (mqtt_broker.LoopbackClient)
+- paho:      valódi paho-mqtt kliens TCP-n, egy külön szálon futó beágyazott brokerhez
+
+Eredmények: üzenet/másodperc (a legjobb ismétlés), valamint üzenetenként a
+tracemalloc szerinti csúcs allokáció és a megmaradt memória. A --compare egy
+korábbi JSON eredményhez hasonlít, és regresszió esetén 1-es kilépési kóddal tér vissza.
+
+Használat:
+    python3 esp32_bench.py
+    python3 esp32_bench.py --output baseline.json
+    python3 esp32_bench.py --compare baseline.json --threshold 10
+    python3 esp32_bench.py --transport stub --filter status
+
+Követelmények:
+    pip install paho-mqtt
+"""
+
+import paho.mqtt.client as mqtt
+import asyncio
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from esp32_mock import CancelToken, ESP32Mock
+from mqtt_asyncio import AsyncioHelper
+from mqtt_broker import MQTTBroker
+from sim_clock import SimClock
+
+TRANSPORTS = ("stub", "loopback", "paho")
+
+# Messages published between two event loop yields (lets paho flush its socket)
+BATCH_SIZE = 100
+
+# Number of single-message samples in the allocation pass
+ALLOC_SAMPLES = 500
+
+DISPENSE_COMMAND = json.dumps({
+    "pump_id": 42,
+    "amount_ml": [
+        {"pump_number": 1, "quantity_ml": 40, "ingredient": "Vodka", "order": 1},
+        {"pump_number": 4, "quantity_ml": 120, "ingredient": "Orange juice", "order": 2},
+    ],
+    "duration_ms": None,
+    "recipe_name": "Screwdriver",
+    "timestamp": "2025-01-01T18:00:00.000Z",
+    "command_id": "bench-1",
+}).encode()
+
+
+class StubClient:
+    """paho kliens helyettesítő: a publish nem csinál semmit"""
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        return None
+
+
+class BenchMessage:
+    """Bejövő üzenet (a paho MQTTMessage mezőivel)"""
+
+    __slots__ = ("topic", "payload", "qos", "retain")
+
+    def __init__(self, topic: str, payload: bytes):
+        self.topic = topic
+        self.payload = payload
+        self.qos = 1
+        self.retain = False
+
+
+# ----------------------------------------------------------------------
+# Benchmarks: each returns a zero-argument callable performing one message
+# ----------------------------------------------------------------------
+
+def bench_on_message(mock: ESP32Mock) -> Callable[[], None]:
+    message = BenchMessage(mock.topic("dispense/command"), DISPENSE_COMMAND)
+
+    def run():
+        mock.on_message(mock.client, None, message)
+        # Workers are not running: discard the queued job (without the emergency stop reply)
+        mock.job_queue.get_nowait()
+        mock.job_queue.task_done()
+    return run
+
+
+def bench_status(mode: str) -> Callable[[ESP32Mock], Callable[[], None]]:
+    def setup(mock: ESP32Mock) -> Callable[[], None]:
+        mock.telemetry.mode = mode
+        telemetry = mock.telemetry
+        state = {"progress": 0.0}
+
+        def run():
+            # Every call changes progress, so batched modes never suppress
+            state["progress"] = (state["progress"] + 0.5) % 200.0
+            telemetry.update(3, "dispensing", state["progress"], 200.0, 20.0, 1500)
+            telemetry.flush()
+        return run
+    return setup
+
+
+def bench_complete(mock: ESP32Mock) -> Callable[[], None]:
+    token = CancelToken("dispense", "bench-1")
+
+    def run():
+        complete = {
+            "pump_id": 3,
+            "recipe_name": "Screwdriver",
+            "requested_ml": 40.0,
+            "actual_ml": round(40.0 * mock.random.uniform(0.95, 1.05), 2),
+            "duration_ms": 2000,
+            "telemetry_bytes": int(mock.telemetry.pump_bytes([3])),
+            "timestamp": mock.clock.utc_timestamp()
+        }
+        mock.publish_complete("dispense/complete", complete, token)
+    return run
+
+
+def bench_publish_error(mock: ESP32Mock) -> Callable[[], None]:
+    def run():
+        mock.publish_error(3, "PUMP_TIMEOUT", "Pump did not respond", "warning", {"timeout_ms": 5000}, "bench-1")
+    return run
+
+
+def bench_heartbeat(mock: ESP32Mock) -> Callable[[], None]:
+    return mock.send_heartbeat
+
+
+BENCHMARKS: Dict[str, Callable[[ESP32Mock], Callable[[], None]]] = {
+    "on_message": bench_on_message,
+    "status/legacy": bench_status("legacy"),
+    "status/json": bench_status("json"),
+    "status/struct": bench_status("struct"),
+    "complete": bench_complete,
+    "publish_error": bench_publish_error,
+    "heartbeat": bench_heartbeat,
+}
+
+
+# ----------------------------------------------------------------------
+# Transports
+# ----------------------------------------------------------------------
+
+class BrokerThread:
+    """Beágyazott broker külön szálon, hogy a broker munkája ne terhelje a mért event loop-ot"""
+
+    def __init__(self):
+        self.broker = MQTTBroker("127.0.0.1", 0)
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            self.loop.run_until_complete(self.broker.start())
+        self.ready.set()
+        self.loop.run_forever()
+
+    def start(self) -> int:
+        self.thread.start()
+        self.ready.wait()
+        return self.broker.port
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.broker.stop(), self.loop).result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+
+
+async def create_mock(transport: str, broker_port: Optional[int]) -> ESP32Mock:
+    """Mock példány a mérésekhez (workerek, heartbeat, feliratkozások és deduplikáció nélkül)"""
+    loopback = MQTTBroker() if transport == "loopback" else None
+    # The same command is dispatched on every iteration: dedup would discard all but the first
+    mock = ESP32Mock(broker="127.0.0.1", port=broker_port or 1883, clock=SimClock(), seed=1, loopback=loopback, dedup_size=0)
+    mock.loop = asyncio.get_running_loop()
+    mock.job_queue = asyncio.Queue()
+    mock.pump_budget = asyncio.Semaphore(mock.max_active_pumps)
+
+    if transport == "stub":
+        mock.client = StubClient()
+        mock.connected = True
+        return mock
+
+    connected = asyncio.Event()
+    mock.client.on_connect = lambda client, userdata, flags, reason_code, properties: connected.set()
+    if transport == "paho":
+        AsyncioHelper(mock.loop, mock.client)
+    mock.client.connect("127.0.0.1", broker_port or 1883, keepalive=60)
+    await asyncio.wait_for(connected.wait(), timeout=5)
+    mock.connected = True
+    return mock
+
+
+async def close_mock(mock: ESP32Mock, transport: str):
+    if transport == "stub":
+        return
+    mock.client.on_disconnect = None
+    mock.client.disconnect()
+    await asyncio.sleep(0.05)
+
+
+# ----------------------------------------------------------------------
+# Runner
+# ----------------------------------------------------------------------
+
+async def measure(run: Callable[[], None], iterations: int, repeats: int) -> Dict:
+    """Throughput (üzenet/s) és üzenetenkénti allokáció mérése"""
+    # Warmup
+    for _ in range(min(iterations, 1000)):
+        run()
+    await asyncio.sleep(0)
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        done = 0
+        while done < iterations:
+            for _ in range(min(BATCH_SIZE, iterations - done)):
+                run()
+            done += BATCH_SIZE
+            await asyncio.sleep(0)
+        timings.append(time.perf_counter() - start)
+
+    best = min(timings)
+
+    # Allocation pass (separate, tracemalloc slows everything down)
+    peaks = []
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        for index in range(ALLOC_SAMPLES):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            run()
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+            if index % BATCH_SIZE == BATCH_SIZE - 1:
+                await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "repeats": repeats,
+        "msgs_per_sec": round(iterations / best, 1),
+        "ns_per_msg": round(best / iterations * 1e9, 1),
+        "median_msgs_per_sec": round(iterations / statistics.median(timings), 1),
+        "alloc_peak_bytes_per_msg": round(statistics.mean(peaks), 1),
+        "retained_bytes_per_msg": round(retained / ALLOC_SAMPLES, 1),
+    }
+
+
+async def run_suite(transports: List[str], names: List[str], iterations: int, repeats: int) -> Dict[str, Dict]:
+    broker_thread = None
+    broker_port = None
+    if "paho" in transports:
+        broker_thread = BrokerThread()
+        broker_port = broker_thread.start()
+
+    results = {}
+    try:
+        for transport in transports:
+            for name in names:
+                mock = await create_mock(transport, broker_port)
+                try:
+                    run = BENCHMARKS[name](mock)
+                    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                        result = await measure(run, iterations, repeats)
+                finally:
+                    await close_mock(mock, transport)
+
+                key = f"{name}@{transport}"
+                results[key] = result
+                print(f"{key:<28}{result['msgs_per_sec']:>14,.0f}{result['ns_per_msg']:>12,.0f}"
+                      f"{result['alloc_peak_bytes_per_msg']:>14,.0f}{result['retained_bytes_per_msg']:>12,.1f}")
+    finally:
+        if broker_thread is not None:
+            broker_thread.stop()
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """Eredmények összevetése egy korábbi futással; visszaadja a regressziókat"""
+    regressions = []
+    print()
+    print(f"{'Benchmark':<28}{'msgs/s':>12}{'baseline':>12}{'delta':>9}{'alloc B':>10}{'baseline':>10}{'delta':>9}")
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            print(f"{key:<28}{result['msgs_per_sec']:>12,.0f}{'-':>12}")
+            continue
+
+        speed_delta = (result["msgs_per_sec"] / previous["msgs_per_sec"] - 1.0) * 100.0
+        previous_alloc = previous["alloc_peak_bytes_per_msg"]
+        alloc_delta = ((result["alloc_peak_bytes_per_msg"] / previous_alloc - 1.0) * 100.0) if previous_alloc else 0.0
+
+        flags = []
+        if speed_delta < -threshold:
+            flags.append("SLOWER")
+        if alloc_delta > threshold:
+            flags.append("MORE ALLOC")
+        if flags:
+            regressions.append(f"{key}: {', '.join(flags)}")
+
+        print(f"{key:<28}{result['msgs_per_sec']:>12,.0f}{previous['msgs_per_sec']:>12,.0f}{speed_delta:>+8.1f}%"
+              f"{result['alloc_peak_bytes_per_msg']:>10,.0f}{previous_alloc:>10,.0f}{alloc_delta:>+8.1f}%  {' '.join(flags)}")
+    return regressions
+
+
+def parse_list(value: str, allowed) -> List[str]:
+    items = [item.strip() for item in value.split(",") if item.strip()]
+    for item in items:
+        if item not in allowed:
+            raise argparse.ArgumentTypeError(f"Unknown value: {item} (allowed: {', '.join(allowed)})")
+    return items
+
+
+def main():
+    """CLI entry point"""
+    parser = argparse.ArgumentParser(
+        description="IntelliVend ESP32 Mock Benchmark - hot path mikrobenchmarkok",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Példák:
+  # Teljes suite, eredmény mentése baseline-ként
+  python3 esp32_bench.py --output baseline.json
+
+  # Összehasonlítás a baseline-nal (10% feletti lassulás / allokáció növekedés = regresszió)
+  python3 esp32_bench.py --compare baseline.json
+
+  # Csak a status hot path, stub transporttal
+  python3 esp32_bench.py --transport stub --filter status
+        """
+    )
+
+    parser.add_argument("--transport", type=lambda value: parse_list(value, TRANSPORTS), default=list(TRANSPORTS),
+                        help="Transportok vesszővel elválasztva: stub,loopback,paho (default: mind)")
+    parser.add_argument("--filter", default=None, help="Csak a nevükben ezt tartalmazó benchmarkok futtatása")
+    parser.add_argument("--iterations", type=int, default=20000, help="Üzenetek száma ismétlésenként (default: 20000)")
+    parser.add_argument("--repeats", type=int, default=5, help="Ismétlések száma, a legjobb számít (default: 5)")
+    parser.add_argument("--output", default=None, help="Eredmények mentése JSON fájlba")
+    parser.add_argument("--compare", default=None, help="Összehasonlítás egy korábbi JSON eredménnyel")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regresszió küszöb százalékban (default: 10)")
+
+    args = parser.parse_args()
+
+    if args.iterations < 1 or args.repeats < 1:
+        print("Iterations and repeats must be at least 1")
+        return 1
+
+    names = [name for name in BENCHMARKS if args.filter is None or args.filter in name]
+    if not names:
+        print(f"No benchmark matches filter: {args.filter}")
+        return 1
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    print(f"{'Benchmark':<28}{'msgs/s':>14}{'ns/msg':>12}{'alloc B/msg':>14}{'retained B':>12}")
+    results = asyncio.run(run_suite(args.transport, names, args.iterations, args.repeats))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).replace(tzinfo=None).isoformat() + "Z",
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "paho_mqtt": getattr(mqtt, "__version__", None) or _paho_version(),
+            "iterations": args.iterations,
+            "repeats": args.repeats,
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:g}%:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\nNo regressions over {args.threshold:g}%")
+
+    return 0
+
+
+def _paho_version() -> Optional[str]:
+    try:
+        from importlib.metadata import version
+        return version("paho-mqtt")
+    except Exception:
+        return None
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,586 @@
+#!/usr/bin/env python3
+"""
+IntelliVend Load Generator
+==========================
+
+Terhelés generátor az ESP32 mock (vagy valódi eszköz) és a backend MQTT útvonalának
+méréséhez. Úgy publikál parancsokat, mint a backend commandDispense / commandFlush /
+commandCalibration metódusai, és minden parancsot párosít a válaszával
+(intellivend/dispense/complete, intellivend/maintenance/complete, intellivend/error).
+
+Funkciók:
+- Érkezési eloszlások: constant, poisson, burst
+- Trace mód (--trace): a dispensing_log előzmények visszajátszása az eredeti
+  receptekkel és (összenyomott) érkezési időközökkel, lusta feldolgozással
+- Closed-loop mód: legfeljebb --max-outstanding folyamatban lévő parancs
+- Parancs -> befejezés latency HDR-stílusú hisztogramokban (p50/p95/p99/max)
+- Throughput, hibák error_code szerint, timeoutok
+
+Párosítás: minden parancs kap egy "command_id" mezőt, amit a mock visszaküld a
+válaszokban. Ha a befejezés üzenetben nincs command_id (pl. valódi firmware), a
+generátor az adott eszköz legrégebbi, azonos típusú függő parancsával párosít (FIFO).
+Hibát csak command_id alapján párosít: az azonosító nélküli hibák (pl. az általános
+emergency stop) külön számolódnak. A parancs a végső válaszáig függő marad; a
+futás közbeni hibák (PUMP_TIMEOUT, CALIBRATION_TIMEOUT) után még jön a befejezés.
+
+Használat:
+    python3 esp32_loadgen.py --broker 127.0.0.1 --rate 2 --duration 60
+    python3 esp32_loadgen.py --devices 50 --rate 100 --arrival poisson --duration 300
+    python3 esp32_loadgen.py --arrival burst --burst-size 20 --rate 5 --max-outstanding 40
+    python3 esp32_loadgen.py --trace backup.sql.gz --trace-speed 60 --trace-start "2025-03-07 18:00"
+
+Követelmények:
+    pip install paho-mqtt
+"""
+
+import paho.mqtt.client as mqtt
+import asyncio
+import json
+import os
+import time
+import random
+import argparse
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+from hdr_histogram import HdrHistogram
+from mqtt_asyncio import AsyncioHelper
+from trace_workload import TraceOrder, TraceWorkload, parse_timestamp
+
+COMMAND_KINDS = ("dispense", "flush", "calibration")
+
+# Errors reported while the command keeps running (its complete message follows)
+PROGRESS_ERRORS = ("PUMP_TIMEOUT", "CALIBRATION_TIMEOUT")
+
+# Interval of progress lines and timeout sweeps (seconds)
+PROGRESS_INTERVAL = 5.0
+TIMEOUT_SWEEP_INTERVAL = 0.5
+
+class PendingCommand:
+    """Elküldött, válaszra váró parancs"""
+
+    __slots__ = ("command_id", "kind", "device", "pump_id", "sent_at")
+
+    def __init__(self, command_id: str, kind: str, device: Optional[str], pump_id: int, sent_at: float):
+        self.command_id = command_id
+        self.kind = kind
+        self.device = device
+        self.pump_id = pump_id
+        self.sent_at = sent_at
+
+class LoadGenerator:
+    """Parancs generátor latency méréssel"""
+
+    def __init__(self, broker: str = "homeassistant.local", port: int = 1883, username: str = None, password: str = None,
+                 devices: Optional[List[str]] = None, rate: float = 1.0, arrival: str = "constant", burst_size: int = 10,
+                 mix: Optional[Dict[str, float]] = None, max_outstanding: int = 0, timeout: float = 120.0,
+                 recipe_ingredients: int = 3, dispense_ml: float = 40.0, flush_ms: int = 3000, calibration_ml: float = 20.0,
+                 seed: Optional[int] = None, trace: Optional[TraceWorkload] = None):
+        """
+        Args:
+            broker: MQTT broker IP címe
+            port: MQTT broker port
+            username: MQTT username (opcionális)
+            password: MQTT password (opcionális)
+            devices: Cél eszköz azonosítók (intellivend/<device>/...); None = egyetlen eszköz, intellivend/...
+            rate: Átlagos parancs ráta (parancs / másodperc)
+            arrival: Érkezési eloszlás: constant, poisson vagy burst
+            burst_size: Parancsok száma egy burst-ben (burst módban)
+            mix: Parancs típusok aránya, pl. {"dispense": 0.8, "flush": 0.1, "calibration": 0.1}
+            max_outstanding: Folyamatban lévő parancsok max. száma (closed loop); 0 = open loop
+            timeout: Válasz timeout másodpercben
+            recipe_ingredients: Összetevők száma recept parancsonként; 0 = egy pumpás dispense
+            dispense_ml: Összetevőnkénti (vagy egy pumpás) mennyiség ml-ben
+            flush_ms: Öblítés időtartama ms-ban
+            calibration_ml: Kalibrációs teszt mennyiség ml-ben
+            seed: Véletlenszám seed (opcionális)
+            trace: Rendelés előzmények visszajátszása (None = szintetikus érkezés és parancs mix)
+        """
+        self.broker = broker
+        self.port = port
+        self.username = username
+        self.password = password
+        self.devices = devices or [None]
+        self.rate = rate
+        self.arrival = arrival
+        self.burst_size = burst_size
+        self.mix = mix or {"dispense": 1.0}
+        self.max_outstanding = max_outstanding
+        self.timeout = timeout
+        self.recipe_ingredients = recipe_ingredients
+        self.dispense_ml = dispense_ml
+        self.flush_ms = flush_ms
+        self.calibration_ml = calibration_ml
+        self.random = random.Random(seed)
+        self.trace = trace
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"INTELLIVEND_LOADGEN_{self.random.randrange(1 << 24):06x}", clean_session=True)
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        if self.username and self.password:
+            self.client.username_pw_set(self.username, self.password)
+
+        # Correlation state
+        self.run_id = f"{self.random.randrange(1 << 32):08x}"
+        self.sequence = 0
+        self.pending: Dict[str, PendingCommand] = {}
+        self.fifo: Dict[tuple, deque] = {}
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.connected: Optional[asyncio.Event] = None
+
+        # Statistics
+        self.histograms = {kind: HdrHistogram() for kind in COMMAND_KINDS}
+        self.sent = Counter()
+        self.completed = Counter()
+        self.errors = Counter()
+        self.device_errors = Counter()
+        self.timeouts = Counter()
+        self.unmatched = 0
+        self.delayed_sends = 0
+        self.started_at = 0.0
+        self.finished_at = 0.0
+
+    def topic(self, device: Optional[str], name: str) -> str:
+        return f"intellivend/{name}" if device is None else f"intellivend/{device}/{name}"
+
+    def on_connect(self, client, userdata, flags, reason_code, properties):
+        """Válasz topicok feliratkozása"""
+        if reason_code != 0:
+            print(f"[LOADGEN] Connection failed with code {reason_code}")
+            return
+
+        names = ("dispense/complete", "maintenance/complete", "error")
+        if self.devices == [None]:
+            topics = [self.topic(None, name) for name in names]
+        else:
+            topics = [self.topic("+", name) for name in names]
+        for topic in topics:
+            client.subscribe(topic, 1)
+
+        print(f"[LOADGEN] Connected to MQTT broker {self.broker}:{self.port}")
+        self.connected.set()
+
+    def on_message(self, client, userdata, msg):
+        """Válasz párosítása a függő parancshoz"""
+        received_at = time.perf_counter()
+        try:
+            payload = json.loads(msg.payload.decode())
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return
+
+        parts = msg.topic.split("/")
+        device = None if self.devices == [None] else parts[1]
+        name = "/".join(parts[1:] if device is None else parts[2:])
+
+        command_id = payload.get("command_id")
+        if name == "error":
+            error_code = payload.get("error_code", "UNKNOWN")
+            if command_id is None:
+                # Not the outcome of one command (e.g. the device-wide emergency stop)
+                self.device_errors[error_code] += 1
+                return
+            command = self.pending.get(command_id)
+            if command is None:
+                self.unmatched += 1
+                return
+            self.errors[error_code] += 1
+            if error_code not in PROGRESS_ERRORS:
+                self.release(command)
+            return
+
+        kind = "dispense" if name == "dispense/complete" else payload.get("action_type")
+        command = self.match(command_id, device, kind)
+        if command is None:
+            self.unmatched += 1
+            return
+        self.histograms[command.kind].record(int((received_at - command.sent_at) * 1_000_000))
+        self.completed[command.kind] += 1
+        self.release(command)
+
+    def match(self, command_id: Optional[str], device: Optional[str], kind: Optional[str]) -> Optional[PendingCommand]:
+        """Befejezett parancs keresése command_id, vagy annak hiányában FIFO alapján (azonos eszköz és típus)"""
+        if command_id is not None:
+            return self.pending.get(command_id)
+
+        # Fallback for devices that do not echo command_id
+        queue = self.fifo.get((device, kind))
+        return queue[0] if queue else None
+
+    def release(self, command: PendingCommand):
+        """Parancs lezárása (válasz vagy timeout)"""
+        self.pending.pop(command.command_id, None)
+        queue = self.fifo.get((command.device, command.kind))
+        if queue:
+            try:
+                queue.remove(command)
+            except ValueError:
+                pass
+        if self.slots is not None:
+            self.slots.release()
+
+    def build_command(self, kind: str, order: Optional[TraceOrder] = None) -> tuple:
+        """Parancs payload összeállítása (a backend publisher-eivel azonos formátum; order: visszajátszott rendelés)"""
+        self.sequence += 1
+        command_id = f"{self.run_id}-{self.sequence}"
+
+        if order is not None:
+            payload = {
+                "pump_id": order.log_id,  # dispensing_log id, as the backend sends it
+                "amount_ml": order.ingredients,
+                "duration_ms": None,
+                "recipe_name": order.recipe_name,
+                "timestamp": _iso_now()
+            }
+            pump_id = 0
+        elif kind == "dispense" and self.recipe_ingredients > 0:
+            pumps = self.random.sample(range(1, 9), min(8, self.recipe_ingredients))
+            payload = {
+                "pump_id": self.sequence,  # dispensing_log id in the backend
+                "amount_ml": [
+                    {"pump_number": pump, "quantity_ml": self.dispense_ml, "ingredient": f"Ingredient {pump}", "order": order}
+                    for order, pump in enumerate(pumps, start=1)
+                ],
+                "duration_ms": None,
+                "recipe_name": f"Load test {self.sequence}",
+                "timestamp": _iso_now()
+            }
+            pump_id = 0
+        elif kind == "dispense":
+            pump_id = self.random.randint(1, 8)
+            payload = {
+                "pump_id": pump_id,
+                "amount_ml": self.dispense_ml,
+                "duration_ms": int(self.dispense_ml / 20.0 * 1000),
+                "recipe_name": f"Load test {self.sequence}",
+                "timestamp": _iso_now()
+            }
+        elif kind == "flush":
+            pump_id = self.random.randint(1, 8)
+            payload = {"pump_id": pump_id, "duration_ms": self.flush_ms}
+        else:
+            pump_id = self.random.randint(1, 8)
+            payload = {"pump_id": pump_id, "test_amount_ml": self.calibration_ml, "timeout_ms": int(self.timeout * 1000)}
+
+        payload["command_id"] = command_id
+        topic_name = {"dispense": "dispense/command", "flush": "maintenance/flush", "calibration": "calibration/start"}[kind]
+        return command_id, pump_id, topic_name, payload
+
+    def send(self, kind: str, order: Optional[TraceOrder] = None):
+        """Egy parancs elküldése egy véletlen cél eszköznek"""
+        device = self.random.choice(self.devices)
+        command_id, pump_id, topic_name, payload = self.build_command(kind, order)
+
+        command = PendingCommand(command_id, kind, device, pump_id, time.perf_counter())
+        self.pending[command_id] = command
+        self.fifo.setdefault((device, kind), deque()).append(command)
+        self.sent[kind] += 1
+
+        self.client.publish(self.topic(device, topic_name), json.dumps(payload), qos=1)
+
+    def arrival_delays(self):
+        """Két parancs közötti várakozási idők (másodperc) a választott eloszlás szerint"""
+        if self.arrival == "poisson":
+            while True:
+                yield self.random.expovariate(self.rate)
+        elif self.arrival == "burst":
+            while True:
+                for _ in range(self.burst_size - 1):
+                    yield 0.0
+                yield self.burst_size / self.rate
+        else:
+            while True:
+                yield 1.0 / self.rate
+
+    def arrivals(self):
+        """(várakozás, parancs típus, rendelés) az előző parancs óta: trace, vagy eloszlás és mix alapján"""
+        if self.trace is not None:
+            for delay, order in self.trace:
+                yield delay, "dispense", order
+            return
+
+        delays = self.arrival_delays()
+        delay = 0.0
+        while True:
+            yield delay, self.choose_kind(), None
+            delay = next(delays)
+
+    def choose_kind(self) -> str:
+        kinds = list(self.mix)
+        return self.random.choices(kinds, weights=[self.mix[kind] for kind in kinds])[0]
+
+    async def sweep_timeouts(self):
+        """Timeoutolt parancsok lezárása"""
+        while True:
+            await asyncio.sleep(TIMEOUT_SWEEP_INTERVAL)
+            deadline = time.perf_counter() - self.timeout
+            for command in [c for c in self.pending.values() if c.sent_at < deadline]:
+                self.timeouts[command.kind] += 1
+                self.release(command)
+
+    async def print_progress(self):
+        """Időszakos állapot kiírás"""
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            elapsed = time.perf_counter() - self.started_at
+            completed = sum(self.completed.values())
+            print(f"[LOADGEN] {elapsed:6.0f}s sent={sum(self.sent.values())} completed={completed} "
+                  f"outstanding={len(self.pending)} errors={sum(self.errors.values())} "
+                  f"timeouts={sum(self.timeouts.values())} throughput={completed / elapsed:.2f}/s")
+
+    async def run_async(self, duration: Optional[float] = None, count: Optional[int] = None):
+        """Terhelés futtatása duration másodpercig vagy count parancsig, majd a válaszok kivárása"""
+        loop = asyncio.get_running_loop()
+        self.connected = asyncio.Event()
+        if self.max_outstanding > 0:
+            self.slots = asyncio.Semaphore(self.max_outstanding)
+
+        AsyncioHelper(loop, self.client)
+        self.client.connect(self.broker, self.port, keepalive=60)
+        await asyncio.wait_for(self.connected.wait(), timeout=10)
+
+        background = [loop.create_task(self.sweep_timeouts()), loop.create_task(self.print_progress())]
+        try:
+            self.started_at = time.perf_counter()
+            next_send = self.started_at
+            end = None if duration is None else self.started_at + duration
+            sent = 0
+
+            for delay, kind, order in self.arrivals():
+                next_send += delay
+                if (count is not None and sent >= count) or (end is not None and next_send >= end):
+                    break
+                now = time.perf_counter()
+                if next_send > now:
+                    await asyncio.sleep(next_send - now)
+
+                if self.slots is not None:
+                    if self.slots.locked():
+                        self.delayed_sends += 1
+                    await self.slots.acquire()
+
+                self.send(kind, order)
+                sent += 1
+
+            # Drain: wait for outstanding replies (bounded by the timeout sweep)
+            while self.pending:
+                await asyncio.sleep(0.05)
+            self.finished_at = time.perf_counter()
+        finally:
+            for task in background:
+                task.cancel()
+            self.client.disconnect()
+            await asyncio.sleep(0.1)
+
+    def report(self) -> Dict:
+        """Eredmények összegzése"""
+        elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        completed = sum(self.completed.values())
+        overall = HdrHistogram()
+        for hist in self.histograms.values():
+            overall.merge(hist)
+
+        def latency_ms(hist: HdrHistogram) -> Dict:
+            summary = hist.summary()
+            return {key: (round(value / 1000.0, 3) if key not in ("count",) else value) for key, value in summary.items()}
+
+        report = {
+            "elapsed_s": round(elapsed, 3),
+            "sent": dict(self.sent),
+            "completed": dict(self.completed),
+            "errors": dict(self.errors),
+            "errors_without_command_id": dict(self.device_errors),
+            "timeouts": dict(self.timeouts),
+            "unmatched_replies": self.unmatched,
+            "delayed_sends": self.delayed_sends,
+            "throughput_per_s": round(completed / elapsed, 3) if elapsed > 0 else 0.0,
+            "latency_ms": {kind: latency_ms(hist) for kind, hist in self.histograms.items() if hist.total_count},
+            "latency_ms_overall": latency_ms(overall),
+            "histograms": {kind: hist.to_dict() for kind, hist in self.histograms.items() if hist.total_count},
+        }
+        if self.trace is not None:
+            report["trace"] = {
+                "orders": self.trace.orders,
+                "skipped_without_details": self.trace.skipped_empty,
+                "orphan_details": self.trace.orphan_details,
+                "first_started_at": self.trace.first_started_at.isoformat() if self.trace.first_started_at else None,
+                "last_started_at": self.trace.last_started_at.isoformat() if self.trace.last_started_at else None,
+                "speed": self.trace.speed,
+            }
+        return report
+
+    def print_report(self, report: Dict, histogram: bool = False):
+        print()
+        print("=" * 72)
+        print("IntelliVend Load Generator - Results")
+        print("=" * 72)
+        print(f"Elapsed: {report['elapsed_s']:.1f}s   Throughput: {report['throughput_per_s']:.2f} completions/s")
+        print(f"Sent: {sum(report['sent'].values())}   Completed: {sum(report['completed'].values())}   "
+              f"Errors: {sum(report['errors'].values())}   Timeouts: {sum(report['timeouts'].values())}   "
+              f"Unmatched: {report['unmatched_replies']}   Delayed sends: {report['delayed_sends']}")
+        if "trace" in report:
+            trace = report["trace"]
+            print(f"Trace: {trace['orders']} orders from {trace['first_started_at']} to {trace['last_started_at']} at {trace['speed']:g}x   "
+                  f"Skipped (no details): {trace['skipped_without_details']}   Orphan details: {trace['orphan_details']}")
+        if report["errors"]:
+            print("Errors by code: " + ", ".join(f"{code}={count}" for code, count in sorted(report["errors"].items())))
+        if report["errors_without_command_id"]:
+            print("Errors without command_id: " + ", ".join(f"{code}={count}" for code, count in sorted(report["errors_without_command_id"].items())))
+        print()
+        print(f"{'Latency (ms)':<14}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'p99.9':>10}{'max':>10}")
+        rows = list(report["latency_ms"].items()) + [("overall", report["latency_ms_overall"])]
+        for kind, lat in rows:
+            print(f"{kind:<14}{lat['count']:>8}{lat['p50']:>10.1f}{lat['p95']:>10.1f}{lat['p99']:>10.1f}{lat['p99.9']:>10.1f}{lat['max']:>10.1f}")
+        print("=" * 72)
+
+        if histogram:
+            for kind, hist in self.histograms.items():
+                if hist.total_count:
+                    print(f"\n{kind} latency distribution:")
+                    print(hist.percentile_distribution(scale=1000.0, unit="ms"))
+
+def _iso_now() -> str:
+    """Időbélyeg a backend new Date().toISOString() formátumában"""
+    now = time.time()
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(now)) + f".{int(now * 1000) % 1000:03d}Z"
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Parancs arány feldolgozása, pl. "dispense=0.8,flush=0.1,calibration=0.1" """
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in COMMAND_KINDS:
+            raise argparse.ArgumentTypeError(f"Unknown command kind: {kind}")
+        mix[kind] = float(weight) if weight else 1.0
+    return mix
+
+def main():
+    """CLI entry point"""
+    parser = argparse.ArgumentParser(
+        description="IntelliVend Load Generator - parancs -> befejezés latency mérés",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Példák:
+  # 2 parancs/s egy eszköznek, 60 másodpercig
+  python3 esp32_loadgen.py --broker 127.0.0.1 --rate 2 --duration 60
+
+  # Poisson érkezés 50 eszközös fleet ellen, vegyes parancsokkal
+  python3 esp32_loadgen.py --devices 50 --rate 100 --arrival poisson --mix dispense=0.8,flush=0.1,calibration=0.1
+
+  # Closed loop: legfeljebb 20 folyamatban lévő parancs
+  python3 esp32_loadgen.py --rate 50 --max-outstanding 20 --count 1000 --output report.json
+
+  # Péntek esti csúcs visszajátszása egy adatbázis mentésből 60x gyorsítva
+  python3 esp32_loadgen.py --trace backup.sql.gz --trace-speed 60 --trace-start "2025-03-07 18:00" --trace-end "2025-03-08 02:00"
+
+  # Táblánkénti TSV export (mysql --batch), 10 percnél hosszabb szünetek nélkül
+  python3 esp32_loadgen.py --trace dispensing_log.tsv --trace-details dispensing_details.tsv --trace-speed 20 --trace-max-gap 600
+        """
+    )
+
+    parser.add_argument("--broker", default="192.168.0.55", help="MQTT broker IP címe (default: 192.168.0.55)")
+    parser.add_argument("--port", type=int, default=1883, help="MQTT broker port (default: 1883)")
+    parser.add_argument("--username", default=None, help="MQTT username (opcionális)")
+    parser.add_argument("--password", default=None, help="MQTT password (opcionális)")
+    parser.add_argument("--devices", type=int, default=1, help="Cél eszközök száma; 1 felett intellivend/<device>/... topicok (default: 1)")
+    parser.add_argument("--device-prefix", default="ESP32_MOCK", help="Eszköz azonosító prefix fleet módban (default: ESP32_MOCK)")
+    parser.add_argument("--rate", type=float, default=1.0, help="Átlagos parancs ráta, parancs/s (default: 1.0)")
+    parser.add_argument("--arrival", choices=("constant", "poisson", "burst"), default="constant", help="Érkezési eloszlás (default: constant)")
+    parser.add_argument("--burst-size", type=int, default=10, help="Parancsok száma burst-önként (default: 10)")
+    parser.add_argument("--mix", type=parse_mix, default={"dispense": 1.0}, help="Parancs arányok, pl. dispense=0.8,flush=0.1,calibration=0.1")
+    parser.add_argument("--max-outstanding", type=int, default=0, help="Folyamatban lévő parancsok max. száma (closed loop), 0 = open loop")
+    parser.add_argument("--duration", type=float, default=None, help="Terhelés időtartama másodpercben")
+    parser.add_argument("--count", type=int, default=None, help="Elküldendő parancsok száma")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Válasz timeout másodpercben (default: 120)")
+    parser.add_argument("--recipe-ingredients", type=int, default=3, help="Összetevők száma receptenként, 0 = egy pumpás dispense (default: 3)")
+    parser.add_argument("--dispense-ml", type=float, default=40.0, help="Mennyiség összetevőnként ml-ben (default: 40)")
+    parser.add_argument("--flush-ms", type=int, default=3000, help="Öblítés időtartama ms-ban (default: 3000)")
+    parser.add_argument("--calibration-ml", type=float, default=20.0, help="Kalibrációs teszt mennyiség ml-ben (default: 20)")
+    parser.add_argument("--trace", default=None, help="Rendelés előzmények visszajátszása: SQL mentés (.sql, .sql.gz) vagy a dispensing_log CSV / TSV exportja")
+    parser.add_argument("--trace-details", default=None, help="A dispensing_details CSV / TSV exportja (SQL mentésnél nem kell)")
+    parser.add_argument("--trace-pumps", default=None, help="A pumps tábla exportja a pumps.id -> pump_number leképezéshez (SQL mentésnél nem kell)")
+    parser.add_argument("--trace-speed", type=float, default=1.0, help="Időtömörítés: az eredeti időközök ennyiszer rövidebbek (default: 1)")
+    parser.add_argument("--trace-start", default=None, help="Visszajátszás kezdete a started_at alapján, pl. \"2025-03-07 18:00\"")
+    parser.add_argument("--trace-end", default=None, help="Visszajátszás vége a started_at alapján")
+    parser.add_argument("--trace-max-gap", type=float, default=None, help="Rendelések közötti eredeti szünet felső korlátja másodpercben (zárva tartás kihagyása)")
+    parser.add_argument("--seed", type=int, default=None, help="Véletlenszám seed (opcionális)")
+    parser.add_argument("--histogram", action="store_true", help="Teljes percentilis eloszlás kiírása")
+    parser.add_argument("--output", default=None, help="Eredmények mentése JSON fájlba")
+
+    args = parser.parse_args()
+
+    if args.duration is None and args.count is None and args.trace is None:
+        print("Either --duration, --count or --trace is required")
+        return 1
+
+    trace = None
+    if args.trace is not None:
+        if args.trace_speed <= 0 or (args.trace_max_gap is not None and args.trace_max_gap < 0):
+            print("Trace speed must be positive and the maximum gap must not be negative")
+            return 1
+        missing = [path for path in (args.trace, args.trace_details, args.trace_pumps) if path is not None and not os.path.isfile(path)]
+        if missing:
+            print(f"Trace file not found: {', '.join(missing)}")
+            return 1
+        try:
+            start = parse_timestamp(args.trace_start) if args.trace_start else None
+            end = parse_timestamp(args.trace_end) if args.trace_end else None
+        except ValueError as e:
+            print(f"Invalid trace window: {e}")
+            return 1
+        trace = TraceWorkload(args.trace, args.trace_details, args.trace_pumps, args.trace_speed, start, end, args.trace_max_gap)
+
+    if args.rate <= 0 or args.burst_size < 1:
+        print("Rate must be positive and burst size at least 1")
+        return 1
+
+    if args.flush_ms <= 0 or args.calibration_ml <= 0:
+        print("Flush duration and calibration amount must be positive")
+        return 1
+
+    devices = None
+    if args.devices > 1:
+        devices = [f"{args.device_prefix}_{index:03d}" for index in range(1, args.devices + 1)]
+
+    generator = LoadGenerator(
+        broker=args.broker,
+        port=args.port,
+        username=args.username,
+        password=args.password,
+        devices=devices,
+        rate=args.rate,
+        arrival=args.arrival,
+        burst_size=args.burst_size,
+        mix=args.mix,
+        max_outstanding=args.max_outstanding,
+        timeout=args.timeout,
+        recipe_ingredients=args.recipe_ingredients,
+        dispense_ml=args.dispense_ml,
+        flush_ms=args.flush_ms,
+        calibration_ml=args.calibration_ml,
+        seed=args.seed,
+        trace=trace
+    )
+
+    if trace is not None:
+        print(f"[LOADGEN] Target: {args.broker}:{args.port}, {args.devices} device(s), trace {trace.describe()}")
+    else:
+        print(f"[LOADGEN] Target: {args.broker}:{args.port}, {args.devices} device(s), {args.rate:g} cmd/s {args.arrival}")
+
+    try:
+        asyncio.run(generator.run_async(args.duration, args.count))
+    except KeyboardInterrupt:
+        print("\n[LOADGEN] Interrupted, reporting partial results")
+
+    report = generator.report()
+    generator.print_report(report, args.histogram)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[LOADGEN] Report saved to {args.output}")
+
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -13,29 +13,313 @@ Funkciók:
 - Emergency stop kezelés
 - Heartbeat küldés (10 másodpercenként)
 - Real-time status updates (500ms-enként)
+- Fleet mód: több száz szimulált eszköz egyetlen asyncio folyamatban
+- Több folyamatos fleet (--processes): eszközök szétosztva worker folyamatok között
+- Hálózati zavarok (késleltetés, jitter, eldobás, duplikálás, kapcsolatbontás, reconnect storm),
+  exponenciális backoff-os újrakapcsolódás, offline QoS 1 pufferelés
+- Beépített profilozás (handlerenkénti cProfile, tracemalloc, collapsed stack), MQTT-n kapcsolható
+- Eszköz oldali rendelés sor (--order-queue): receptek egymás után, pozíció és ETA (dispense/queue)
+- Elérhetőség: retained availability topic (birth + Last Will), adaptív heartbeat periódus
+- Idempotens parancs kezelés: ismételt kézbesítés (QoS 1) nem fut újra, LRU + TTL cache, nyugta az eredménnyel
+- Soak teszt (--soak 24h): vegyes forgalom, RSS / szál / fájlleíró / üzenet ráta drift figyelés, riport
+- Gyors meleg újraindítás (--snapshot): mmap állapot pillanatkép, megszakított műveletek folytatása vagy hibája, reset_reason
+- Gyorsított és virtuális (discrete-event) szimulált idő, reprodukálható seed
+- Beágyazott MQTT broker (külső broker nélkül) és TCP nélküli loopback transport
+- Opcionális kötegelt status telemetria (JSON, MessagePack vagy bináris struct kódolás)
+- Nem blokkoló naplózás háttérszálon, szintekkel, mintavételezéssel és JSON-lines fájllal
 
 Használat:
     python3 esp32_mock.py
     python3 esp32_mock.py --broker 192.168.0.55 --port 1883
     python3 esp32_mock.py --error-rate 0.1  # 10% esély hibára
+    python3 esp32_mock.py --devices 500     # 500 eszköz (intellivend/<device>/... topicok)
+    python3 esp32_mock.py --devices 2000 --processes 8  # 8 worker folyamat
+    python3 esp32_mock.py --time-scale 100  # 100x gyorsított idő
+    python3 esp32_mock.py --embedded-broker # saját broker a 127.0.0.1:1883 címen
 
 Követelmények:
     pip install paho-mqtt
 """
 
 import paho.mqtt.client as mqtt
+import asyncio
 import json
 import time
-import threading
 import random
 import argparse
-from datetime import datetime
-from typing import Dict, Optional
+import logging
+import os
+import signal
+import statistics
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Optional, Set
+
+from command_dedup import (DEFAULT_DEDUP_SIZE, DEFAULT_DEDUP_TTL, HIT, MISS, UNTRACKED, CommandDedup, command_key,
+                           current_entry, record_reply, recording)
+from device_state import NUM_PUMPS, PumpStateTable
+from fleet_runner import ShardedFleet, ShardReporter, plan_shards, shard_path
+from flow_physics import DEFAULT_BOTTLE_ML, TARGET_REACHED, TIMEOUT, FlowPhysics
+from link_impairment import OFFLINE_BUFFER_SIZE, ImpairedLink, LinkImpairment, ReconnectBackoff, force_disconnect
+from mock_logging import DeviceLogger, parse_sampling, setup_logging
+from mock_metrics import MetricsServer, MockMetrics
+from mock_profiling import PROFILE_TOPIC, MockProfiler
+from mqtt_asyncio import AsyncioHelper
+from mqtt_broker import LoopbackClient, MQTTBroker
+from mqtt_recorder import INBOUND, OUTBOUND, TrafficRecorder
+from order_queue import (CANCELLED, MAINTENANCE_STATES, POURING, QUEUED, WAITING_FOR_PUMPS, Order, OrderQueue,
+                         order_ingredients, validate_ingredients, validate_order)
+from sim_clock import SimClock
+from state_snapshot import ABORT, DEFAULT_SNAPSHOT_INTERVAL, RESET_POWERON, RESTART_POLICIES, RESUME, SnapshotStore
+from soak import DEFAULT_RATE_TOLERANCE, DEFAULT_RSS_GROWTH, DEFAULT_SOAK_INTERVAL, DEFAULT_SOAK_RATE, SoakTest, parse_duration
+from telemetry import TELEMETRY_MODES, StatusPublisher, telemetry_available
+
+# Delay between device connects in fleet mode, to avoid a connect storm (seconds)
+FLEET_CONNECT_INTERVAL = 0.005
+
+# Command dispatcher defaults
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE_DEPTH = 16
+
+# Maximum number of simultaneously running pumps in concurrent recipe mode (PSU limit)
+DEFAULT_MAX_ACTIVE_PUMPS = 4
+
+# Heartbeat period (simulated seconds); the adaptive mode uses a second, shorter period while pumps run
+DEFAULT_HEARTBEAT_INTERVAL = 10.0
+
+# Retained presence payloads on <prefix>/availability (birth on connect, Last Will on connection loss)
+AVAILABILITY_ONLINE = "online"
+AVAILABILITY_OFFLINE = "offline"
+
+# Calibration trials per pump for bulk calibration (pump_id -1), and the accepted maximum
+DEFAULT_CALIBRATION_TRIALS = 3
+MAX_CALIBRATION_TRIALS = 20
+
+# Command topic of each operation kind (dedup key of an operation recovered after a restart)
+COMMAND_TOPICS = {
+    "dispense": "dispense/command",
+    "order": "dispense/command",
+    "flush": "maintenance/flush",
+    "calibration": "calibration/start",
+}
+
+# Remaining amount below which a resumed dispense is considered complete (ml)
+RESUME_MIN_ML = 0.5
+
+# Payload key of a resumed dispense: the original command and the ml poured per pump before the restart
+RESUMED_KEY = "resumed"
+
+class CancelToken:
+    """Műveletenkénti megszakítási token (emergency stop)
+    
+    A szimulációk a token.sleep()-en keresztül várakoznak, így a cancel()
+    hívás azonnal (a következő event loop iterációban) felébreszti őket.
+    A megszakítás kérésének ideje valós időben (perf_counter) rögzül, ebből
+    számolható a stop latency.
+    """
+    
+    __slots__ = ("kind", "command_id", "payload", "poured", "carried", "started_at", "cancelled", "reason", "requested_at", "command_time", "_waiters")
+    
+    def __init__(self, kind: str, command_id: Optional[str] = None, payload: Optional[Dict] = None):
+        self.kind = kind
+        self.command_id = command_id
+        # Original command and poured ml per pump (state snapshot: resumed or aborted after a restart)
+        self.payload = payload
+        self.poured: Dict[int, float] = {}
+        # Poured ml per pump before a restart (resumed dispense), and the start on the simulation clock
+        self.carried: Dict[int, float] = {}
+        self.started_at = 0.0
+        self.cancelled = False
+        self.reason: Optional[str] = None
+        self.requested_at: Optional[float] = None
+        self.command_time: Optional[float] = None
+        # Concurrent sleepers of one operation (parallel pumps of a recipe or a bulk calibration)
+        self._waiters: Set[asyncio.Future] = set()
+        
+    def cancel(self, reason: str, requested_at: Optional[float] = None, command_time: Optional[float] = None):
+        """Művelet megszakítása
+        
+        Args:
+            reason: Megszakítás oka
+            requested_at: A stop parancs beérkezése (time.perf_counter), None = most
+            command_time: A stop parancs küldési ideje a backend szerint (Unix idő), ha ismert
+        """
+        if self.cancelled:
+            return
+        self.cancelled = True
+        self.reason = reason
+        self.requested_at = time.perf_counter() if requested_at is None else requested_at
+        self.command_time = command_time
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(True)
+                
+    async def sleep(self, delay: float, until: Optional[asyncio.Future] = None) -> bool:
+        """Várakozás delay másodpercig (vagy az until future teljesüléséig); True, ha közben a műveletet megszakították"""
+        if self.cancelled:
+            return True
+        
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.add(waiter)
+        handle = loop.call_later(delay, _resolve_waiter, waiter)
+        if until is not None:
+            wake = lambda _: _resolve_waiter(waiter)
+            until.add_done_callback(wake)
+        try:
+            return await waiter
+        finally:
+            handle.cancel()
+            if until is not None:
+                until.remove_done_callback(wake)
+            self._waiters.discard(waiter)
+            
+    def stop_context(self) -> Dict:
+        """Stop latency adatok az EMERGENCY_STOP hiba payloadhoz"""
+        context = {
+            "operation": self.kind,
+            "stop_latency_ms": round((time.perf_counter() - self.requested_at) * 1000, 3)
+        }
+        if self.command_time is not None:
+            context["end_to_end_latency_ms"] = round((time.time() - self.command_time) * 1000, 3)
+        return context
+
+def _resolve_waiter(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(False)
+
+def parse_timestamp(value) -> Optional[float]:
+    """ISO időbélyeg (pl. a backend new Date().toISOString()) átalakítása Unix időre"""
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def recipe_pump_duration_ms(quantity_ml: float) -> int:
+    """Egy recept összetevő adagolási ideje (20ml/s, minimum 500ms)"""
+    return max(500, int((quantity_ml / 20.0) * 1000))
+
+def estimate_recipe_ms(payload: Dict, concurrent: bool = False, max_active_pumps: int = DEFAULT_MAX_ACTIVE_PUMPS) -> int:
+    """Egy dispense parancs becsült adagolási ideje (a rendelés sor ETA-jához)
+    
+    Egyszerű parancsnál a duration_ms (vagy 20ml/s), több pumpás receptnél a
+    soros adagolás ideje a pumpák közötti 500ms szünettel; párhuzamos módban
+    szakaszonként a leghosszabb összetevő, de legalább a tápegység limit szerinti idő.
+    """
+    amount_ml = payload.get("amount_ml")
+    if not isinstance(amount_ml, list):
+        duration_ms = payload.get("duration_ms")
+        return int(duration_ms) if duration_ms is not None else int((amount_ml / 20.0) * 1000)
+    
+    if not concurrent:
+        return sum(recipe_pump_duration_ms(item.get("quantity_ml", 0.0)) for item in amount_ml) + 500 * (len(amount_ml) - 1)
+    
+    total_ms = 0
+    for stage in plan_recipe_stages(amount_ml, payload.get("layered", False)):
+        durations = [recipe_pump_duration_ms(item.get("quantity_ml", 0.0)) for _, item in stage]
+        total_ms += max(max(durations), sum(durations) // max_active_pumps)
+    return total_ms
+
+def plan_recipe_stages(ingredients: list, layered: bool = False) -> list:
+    """Recept összetevők szakaszokra bontása az "order" precedencia alapján
+    
+    A nem rétegzett összetevők egy szakaszba kerülnek (párhuzamosan futnak);
+    egy rétegzett összetevő (item "layered": true, vagy az egész recept
+    layered) lezárja az előző szakaszt és önálló szakaszt alkot.
+    
+    Returns:
+        Szakaszok listája, mindegyik (eredeti index, összetevő) párok listája
+    """
+    ordered = sorted(enumerate(ingredients), key=lambda pair: pair[1].get("order", pair[0] + 1))
+    stages = []
+    current = []
+    for index, item in ordered:
+        if layered or item.get("layered", False):
+            if current:
+                stages.append(current)
+                current = []
+            stages.append([(index, item)])
+        else:
+            current.append((index, item))
+    if current:
+        stages.append(current)
+    return stages
+
+def remaining_dispense(payload: Dict, poured: Dict[int, float]) -> Optional[Dict]:
+    """A megszakított adagolás hátralévő része (poured: pumpánként kiadagolt ml); None, ha nincs hátra semmi
+    
+    Ha már folyt ki valami, a folytatás payload-ja az eredeti parancsot és a kiadagolt
+    mennyiséget is viszi (RESUMED_KEY): a befejezés az eredeti kért mennyiséget és a
+    teljes kiadagolt mennyiséget jelenti, egy újabb restart pedig az eredetiből számol.
+    """
+    amount_ml = payload.get("amount_ml")
+    if isinstance(amount_ml, list):
+        ingredients = []
+        for item in amount_ml:
+            left = item.get("quantity_ml", 0.0) - poured.get(item.get("pump_number", 1), 0.0)
+            if left >= RESUME_MIN_ML:
+                ingredients.append(dict(item, quantity_ml=round(left, 2)))
+        if not ingredients:
+            return None
+        resumed = dict(payload, amount_ml=ingredients)
+    else:
+        left = (amount_ml or 0.0) - poured.get(payload.get("pump_id"), 0.0)
+        if left < RESUME_MIN_ML:
+            return None
+        resumed = dict(payload, amount_ml=round(left, 2))
+        resumed.pop("duration_ms", None)  # recalculated from the remaining amount
+    
+    if any(ml > 0 for ml in poured.values()):
+        resumed[RESUMED_KEY] = {"payload": payload, "poured": {str(pump_id): ml for pump_id, ml in poured.items()}}
+    return resumed
+
+def valid_pump_target(pump_id) -> bool:
+    """Karbantartás cél pumpa: 1-8, vagy -1 (az összes pumpa)"""
+    return isinstance(pump_id, int) and not isinstance(pump_id, bool) and (pump_id == -1 or 1 <= pump_id <= NUM_PUMPS)
+
+def command_label(handler) -> str:
+    """Handler metrika címkéje a metódus nevéből (handle_dispense_command -> dispense)"""
+    return handler.__name__.replace("handle_", "").replace("_command", "")
 
 class ESP32Mock:
     """ESP32 MQTT kliens szimulátor"""
     
-    def __init__(self, broker: str = "homeassistant.local", port: int = 1883, username: str = None, password: str = None, error_rate: float = 0.0):
+    def __init__(
+        self,
+        broker: str = "homeassistant.local",
+        port: int = 1883,
+        username: str = None,
+        password: str = None,
+        error_rate: float = 0.0,
+        device_id: Optional[str] = None,
+        clock: Optional[SimClock] = None,
+        seed: Optional[int] = None,
+        workers: int = DEFAULT_WORKERS,
+        queue_depth: int = DEFAULT_QUEUE_DEPTH,
+        concurrent_recipes: bool = False,
+        max_active_pumps: int = DEFAULT_MAX_ACTIVE_PUMPS,
+        order_queue: int = 0,
+        dedup_size: int = DEFAULT_DEDUP_SIZE,
+        dedup_ttl: float = DEFAULT_DEDUP_TTL,
+        heartbeat_interval: float = DEFAULT_HEARTBEAT_INTERVAL,
+        heartbeat_active_interval: Optional[float] = None,
+        loopback: Optional[MQTTBroker] = None,
+        telemetry: str = "legacy",
+        telemetry_interval: float = 0.5,
+        telemetry_delta_ml: float = 0.0,
+        metrics: Optional[MockMetrics] = None,
+        recorder: Optional[TrafficRecorder] = None,
+        physics: Optional[FlowPhysics] = None,
+        pump_state: Optional[PumpStateTable] = None,
+        impairment: Optional[LinkImpairment] = None,
+        profiler: Optional[MockProfiler] = None,
+    ):
         """
         Args:
             broker: MQTT broker IP címe
@@ -43,127 +327,504 @@ class ESP32Mock:
             username: MQTT username (opcionális)
             password: MQTT password (opcionális)
             error_rate: Hibák generálásának valószínűsége (0.0 - 1.0)
+            device_id: Eszköz azonosító fleet módban (client ID és topic prefix: intellivend/<device_id>/...).
+                       None esetén az eredeti, egyetlen eszközös topicokat használja.
+            clock: Szimulációs óra (None = valós idő)
+            seed: Véletlenszám seed a reprodukálható futásokhoz (None = véletlen)
+            workers: Dispense/flush/calibration parancsokat végrehajtó workerek száma
+            queue_depth: Várakozó parancsok maximális száma; telítettségnél BUSY hiba
+            concurrent_recipes: Több pumpás receptek nem rétegzett összetevőinek párhuzamos adagolása
+            max_active_pumps: Egyszerre működő pumpák maximális száma párhuzamos módban (tápegység limit)
+            order_queue: Várakozó rendelések max. száma az eszköz rendelés sorában (0 = nincs sor, minden dispense azonnal indul)
+            dedup_size: Megjegyzett parancsok száma az ismételt kézbesítések kiszűréséhez (0 = nincs deduplikáció)
+            dedup_ttl: Egy parancs megjegyzésének ideje szimulált másodpercben
+            heartbeat_interval: Heartbeat periódus (szimulált másodperc; adaptív módban üresjáratban)
+            heartbeat_active_interval: Heartbeat periódus működő pumpák mellett (None = nincs adaptív mód)
+            loopback: In-process broker, amihez az eszköz TCP nélkül kapcsolódik (None = hálózati kapcsolat)
+            telemetry: Status mód: legacy (pumpánkénti JSON), json, msgpack vagy struct (kötegelt frame)
+            telemetry_interval: Kötegelt status frame-ek közötti idő (másodperc)
+            telemetry_delta_ml: Kötegelt módban ennél kisebb progress változás nem kerül újraküldésre
+            metrics: Közös Prometheus metrikák (None = nincs mérés)
+            recorder: Forgalom rögzítő (fogadott és publikált üzenetek, None = nincs rögzítés)
+            physics: Közös flow fizika motor (None = fix 20ml/s lineáris adagolás)
+            pump_state: Közös pumpa állapot tábla (fleet); None esetén saját tábla
+            impairment: Hálózati zavarok (késleltetés, eldobás, duplikálás, kapcsolatbontás; None = nincs)
+            profiler: Közös profiler (handlerenkénti cProfile, tracemalloc; None = nincs profilozás)
         """
         self.broker = broker
         self.port = port
         self.username = username
         self.password = password
         self.error_rate = error_rate
+        self.device_id = device_id
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.concurrent_recipes = concurrent_recipes
+        self.max_active_pumps = max_active_pumps
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_active_interval = heartbeat_active_interval
+        self.loopback = loopback
+        
+        # Optional Prometheus metrics (shared by all devices of a fleet)
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.attach(self)
+        
+        # Optional traffic recording (shared append-only log)
+        self.recorder = recorder
+        
+        # Optional profiler (shared); the first device listens on the runtime control topic
+        self.profiler = profiler
+        self.profile_control = profiler.attach(self) if profiler is not None else False
+        
+        # Per-device identity and topic namespace
+        if device_id is None:
+            self.client_id = "ESP32_MOCK"
+            self.topic_prefix = "intellivend"
+            self.tag = "[ESP32]"
+        else:
+            self.client_id = device_id
+            self.topic_prefix = f"intellivend/{device_id}"
+            self.tag = f"[{device_id}]"
+        
+        # Optional flow physics (shared engine, 8 pump slots per device, seeded by the client ID) and
+        # per-pump calibration factors, as in the firmware's pumpCalibration
+        self.physics = physics
+        self.physics_base = physics.add_device(self.client_id) if physics is not None else 0
+        self.calibration_factors: Dict[int, float] = {}
+        
+        # Queued, sampled logging (formatting happens on the log listener thread)
+        self.log = DeviceLogger(self.tag, self.client_id)
         
-        # MQTT client (use callback API v2)
-        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id="ESP32_MOCK", clean_session=True)
+        # Simulated time and per-device random source (reproducible with a seed)
+        self.clock = clock or SimClock()
+        self.random = random.Random(f"{seed}:{self.client_id}") if seed is not None else random.Random()
+        
+        # Optional device-side order queue: dispenses run one after another, the next one pre-validated
+        self.orders = OrderQueue(order_queue, self.clock) if order_queue > 0 else None
+        
+        # Recently received commands: a redelivered QoS 1 command is acknowledged, not executed again
+        self.dedup = CommandDedup(dedup_size, dedup_ttl, self.clock) if dedup_size > 0 else None
+        
+        # Optional link impairment (own random source, so commands stay reproducible) and reconnect backoff
+        self.impairment = impairment
+        self.link = None
+        if impairment is not None:
+            self.link = ImpairedLink(impairment, random.Random(f"{seed}:{self.client_id}:link") if seed is not None else random.Random(), metrics)
+        self.backoff = ReconnectBackoff(self.link.random if self.link is not None else self.random)
+        
+        # MQTT client (use callback API v2; the loopback client mimics the same interface)
+        if loopback is not None:
+            self.client = LoopbackClient(loopback, client_id=self.client_id, clean_session=True)
+        else:
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=self.client_id, clean_session=True)
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
         self.client.on_disconnect = self.on_disconnect
         
+        # Last Will: the broker marks the device offline (retained) as soon as the connection is lost
+        self.client.will_set(self.topic("availability"), AVAILABILITY_OFFLINE, qos=1, retain=True)
+        
         # Set username/password if provided
         if self.username and self.password:
             self.client.username_pw_set(self.username, self.password)
         
-        # State
+        # Pump status telemetry (legacy per-pump JSON or batched frames)
+        self.telemetry = StatusPublisher(self.publish_raw, self.topic, self.clock, telemetry, telemetry_interval, telemetry_delta_ml)
+        
+        # Command routing (full topic -> handler)
+        # Priority lane: executed immediately on the network loop, bypassing queued work
+        self.priority_handlers = {
+            self.topic("emergency/stop"): self.handle_emergency_stop,
+        }
+        if self.profile_control:
+            self.priority_handlers[PROFILE_TOPIC] = self.profiler.handle_control
+        # Worker lane: queued and executed by the bounded worker pool
+        self.handlers = {
+            self.topic("dispense/command"): self.handle_dispense_command,
+            self.topic("maintenance/flush"): self.handle_flush_command,
+            self.topic("calibration/start"): self.handle_calibration_command,
+        }
+        
+        # State (per-pump operation, progress and errors live in the array-backed table)
         self.connected = False
-        self.uptime_start = time.time()
-        self.active_dispense: Optional[Dict] = None
-        self.active_flush: Optional[Dict] = None
-        self.active_calibration: Optional[Dict] = None
-        self.pumps_active = 0
+        self.disconnected_at: Optional[float] = None
+        
+        # QoS 1/2 messages published while disconnected (sent in order after the reconnect)
+        self.offline_buffer: deque = deque()
+        self.uptime_start = self.clock.monotonic()
+        
+        # Boot identity (a restored state snapshot continues the uptime and reports why the device restarted)
+        self.boot_count = 1
+        self.reset_reason = RESET_POWERON
+        self.reset_reported = False
+        self.restart_policy = ABORT
+        self.interrupted_operations: list = []
+        self.pump_state = pump_state or PumpStateTable(self.clock)
+        self.state_base = self.pump_state.add_device()
+        
+        # Tasks (created on the event loop in run_async)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.tasks: Set[asyncio.Task] = set()
+        self.heartbeat_task: Optional[asyncio.Task] = None
+        self.job_queue: Optional[asyncio.Queue] = None
+        self.pump_budget: Optional[asyncio.Semaphore] = None
+        self.disconnected: Optional[asyncio.Event] = None
+        self.shutting_down = False
+        
+        # Emergency stop: per-operation cancel tokens, and a latch that aborts
+        # operations starting while the stop is still active
+        self.operations: Set[CancelToken] = set()
+        self.stop_event = asyncio.Event()
+        
+        # Adaptive heartbeat: set when the first pump starts, so the fast period applies at once
+        self.pumps_started = asyncio.Event()
+        self.estop_clear_task: Optional[asyncio.Task] = None
+        
+    @property
+    def pumps_active(self) -> int:
+        """Működő pumpák száma (az állapot táblából származtatva)"""
+        return self.pump_state.active(self.state_base)
         
-        # Threads
-        self.heartbeat_thread = None
-        self.stop_event = threading.Event()
+    def state_snapshot(self) -> Dict:
+        """Az eszköz pumpáinak konzisztens pillanatképe (heartbeat, metrikák, diagnosztika)"""
+        return self.pump_state.snapshot(self.state_base)
+        
+    def topic(self, name: str) -> str:
+        """Teljes topic név az eszköz prefixével"""
+        return f"{self.topic_prefix}/{name}"
+        
+    def publish(self, name: str, payload: Dict, qos: int = 0, retain: bool = False):
+        """JSON payload publikálása az eszköz topic prefixe alatt"""
+        data = json.dumps(payload)
+        self.send(self.topic(name), data, qos, retain)
+        if self.recorder is not None:
+            self.recorder.record(OUTBOUND, self.topic(name), data, qos, retain)
+        if self.metrics is not None:
+            self.metrics.messages_published.inc((name,))
+            
+    def publish_raw(self, name: str, payload: bytes, qos: int = 0):
+        """Kész (kódolt) payload publikálása az eszköz topic prefixe alatt"""
+        self.send(self.topic(name), payload, qos)
+        if self.recorder is not None:
+            self.recorder.record(OUTBOUND, self.topic(name), payload, qos)
+        if self.metrics is not None:
+            self.metrics.messages_published.inc((name,))
+            
+    def send(self, topic: str, payload, qos: int = 0, retain: bool = False):
+        """Üzenet küldése (zavart kapcsolaton át, ha van); offline a QoS 1/2 üzenetek pufferbe kerülnek"""
+        if not self.connected:
+            self.buffer_offline(topic, payload, qos, retain)
+        elif self.link is not None and self.impairment.shapes_traffic:
+            self.link.outbound(self.transmit, topic, payload, qos, retain)
+        else:
+            self.client.publish(topic, payload, qos=qos, retain=retain)
+            
+    def transmit(self, topic: str, payload, qos: int, retain: bool):
+        """Késleltetett küldés vége: a kapcsolat közben megszakadhatott"""
+        if self.connected:
+            self.client.publish(topic, payload, qos=qos, retain=retain)
+        else:
+            self.buffer_offline(topic, payload, qos, retain)
+            
+    def buffer_offline(self, topic: str, payload, qos: int, retain: bool):
+        if qos > 0 and len(self.offline_buffer) < OFFLINE_BUFFER_SIZE:
+            self.offline_buffer.append((topic, payload, qos, retain))
+            if self.metrics is not None:
+                self.metrics.offline_buffered.inc()
+        else:
+            if qos > 0:
+                self.log.warning("Offline buffer full (%d), message to %s lost", OFFLINE_BUFFER_SIZE, topic, category="connection")
+            if self.metrics is not None:
+                self.metrics.offline_dropped.inc()
+                
+    def flush_offline(self) -> int:
+        """Offline pufferelt üzenetek elküldése (kapcsolódás után, sorrendben)"""
+        flushed = 0
+        while self.offline_buffer and self.connected:
+            self.send(*self.offline_buffer.popleft())
+            flushed += 1
+        return flushed
+        
+    def force_disconnect(self, reason: str):
+        """Váratlan kapcsolatvesztés előidézése (hálózati zavar, reconnect storm)"""
+        self.log.info("Forcing disconnect (%s)", reason, category="connection")
+        if self.metrics is not None:
+            self.metrics.forced_disconnects.inc()
+        force_disconnect(self.client)
+        
+    def spawn(self, coro) -> asyncio.Task:
+        """Szimuláció indítása coroutine-ként (szál helyett)"""
+        task = self.loop.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
         
     def on_connect(self, client, userdata, flags, reason_code, properties):
         """MQTT kapcsolódás esemény (Callback API v2)"""
         if reason_code == 0 or (hasattr(reason_code, 'value') and reason_code.value == 0):
             self.connected = True
-            print(f"[ESP32] Connected to MQTT broker {self.broker}:{self.port}")
+            self.backoff.reset()
+            self.log.info("Connected to MQTT broker %s:%s", self.broker, self.port, category="connection")
+            if self.disconnected_at is not None:
+                outage = self.clock.monotonic() - self.disconnected_at
+                self.disconnected_at = None
+                if self.metrics is not None:
+                    self.metrics.outages.observe(outage)
+                self.log.info("Reconnected after %.1fs offline", outage, category="connection", outage_s=round(outage, 3))
             
             # Subscribe to command topics
             topics = [
-                ("intellivend/dispense/command", 1),
-                ("intellivend/maintenance/flush", 1),
-                ("intellivend/calibration/start", 1),
-                ("intellivend/emergency/stop", 2),
+                (self.topic("dispense/command"), 1),
+                (self.topic("maintenance/flush"), 1),
+                (self.topic("calibration/start"), 1),
+                (self.topic("emergency/stop"), 2),
             ]
             
+            if self.profile_control:
+                topics.append((PROFILE_TOPIC, 1))
+            
             for topic, qos in topics:
                 client.subscribe(topic, qos)
-                print(f"[ESP32] Subscribed to: {topic} (QoS {qos})")
+                self.log.debug("Subscribed to: %s (QoS %d)", topic, qos, category="connection")
+            
+            # Birth message (retained) before anything buffered while offline
+            self.publish_availability(AVAILABILITY_ONLINE)
             
-            # Start heartbeat thread (only once)
-            if self.heartbeat_thread is None or not self.heartbeat_thread.is_alive():
-                self.heartbeat_thread = threading.Thread(target=self.heartbeat_loop, daemon=True)
-                self.heartbeat_thread.start()
-                print(f"[ESP32] Heartbeat thread started")
+            # Completions and errors published while offline
+            flushed = self.flush_offline()
+            if flushed:
+                self.log.info("Sent %d message(s) buffered while offline", flushed, category="connection")
             
+            # Start heartbeat task (only once)
+            if self.heartbeat_task is None or self.heartbeat_task.done():
+                self.heartbeat_task = self.spawn(self.heartbeat_loop())
+                self.log.debug("Heartbeat task started", category="heartbeat")
+        
         else:
             rc_val = reason_code.value if hasattr(reason_code, 'value') else reason_code
-            print(f"[ESP32] Connection failed with code {rc_val}")
-    
+            self.log.warning("Connection failed with code %s", rc_val, category="connection")
+            
     def on_disconnect(self, client, userdata, flags, reason_code, properties):
         """MQTT kapcsolat megszakadás (Callback API v2)"""
         self.connected = False
+        if self.disconnected_at is None:
+            self.disconnected_at = self.clock.monotonic()
         rc_val = reason_code.value if hasattr(reason_code, 'value') else reason_code
         if rc_val != 0:
-            print(f"[ESP32] Unexpected disconnect (code {rc_val}), reconnecting...")
-    
+            self.log.warning("Unexpected disconnect (code %s)", rc_val, category="connection")
+        if self.disconnected is not None:
+            self.disconnected.set()
+            
     def on_message(self, client, userdata, msg):
-        """MQTT üzenet fogadása"""
+        """MQTT üzenet fogadása (zavart kapcsolaton késleltetve / duplikálva)"""
+        if self.link is not None and self.impairment.shapes_traffic:
+            self.link.inbound(self.receive, msg)
+        else:
+            self.receive(msg)
+            
+    def receive(self, msg):
+        """Fogadott üzenet feldolgozása és továbbítása a handlernek"""
         try:
             topic = msg.topic
+            if self.recorder is not None:
+                self.recorder.record(INBOUND, topic, msg.payload, msg.qos, msg.retain)
+            if self.metrics is not None and topic.startswith(self.topic_prefix):
+                self.metrics.messages_received.inc((topic[len(self.topic_prefix) + 1:],))
             payload = json.loads(msg.payload.decode())
             
-            print(f"\n[ESP32] Received on {topic}:")
-            print(f"   {json.dumps(payload, indent=3)}")
-            
-            # Route to appropriate handler
-            if topic == "intellivend/dispense/command":
-                self.handle_dispense_command(payload)
-            elif topic == "intellivend/maintenance/flush":
-                self.handle_flush_command(payload)
-            elif topic == "intellivend/calibration/start":
-                self.handle_calibration_command(payload)
-            elif topic == "intellivend/emergency/stop":
-                self.handle_emergency_stop(payload)
-                
+            self.log.info("Received on %s", topic, category="command", command_id=payload.get("command_id") if isinstance(payload, dict) else None)
+            if self.log.isEnabledFor(logging.DEBUG):
+                self.log.debug("   %s", json.dumps(payload, indent=3), category="command")
+            
+            # Route to appropriate handler (never block the network loop)
+            handler = self.priority_handlers.get(topic)
+            if handler is not None:
+                started = self.clock.monotonic()
+                if self.profiler is not None and topic != PROFILE_TOPIC:
+                    self.profiler.call(self.client_id, handler.__name__, handler, payload)
+                else:
+                    handler(payload)
+                if self.metrics is not None:
+                    label = "profile_control" if topic == PROFILE_TOPIC else command_label(handler)
+                    self.metrics.handler_duration.observe(self.clock.monotonic() - started, (label,))
+                return
+            
+            handler = self.handlers.get(topic)
+            if handler is not None:
+                entry = None
+                if self.dedup is not None:
+                    key = command_key(topic, payload)
+                    if key is None:
+                        self.count_dedup(UNTRACKED)
+                    elif self.acknowledge_duplicate(key, payload):
+                        return
+                    else:
+                        entry = self.dedup.add(key)
+                self.dispatch(handler, payload, entry)
+        
         except json.JSONDecodeError as e:
-            print(f"[ESP32] Invalid JSON: {e}")
+            self.log.warning("Invalid JSON: %s", e, category="command")
         except Exception as e:
-            print(f"[ESP32] Error handling message: {e}")
-    
-    def handle_dispense_command(self, payload: Dict):
-        """Dispense parancs kezelése - támogatja mind az egyszerű, mind a komplex formátumot"""
+            self.log.error("Error handling message: %s", e, category="command")
+            
+    def acknowledge_duplicate(self, key: str, payload: Dict) -> bool:
+        """Ismételten kézbesített parancs nyugtázása újbóli végrehajtás nélkül (False: új parancs)
+        
+        Befejezett parancsnál a megjegyzett eredmény üzenetek újra kimennek; futó
+        vagy sorban álló parancsnál a másolat eldobásra kerül (az eredmény úgyis jön).
+        """
+        entry = self.dedup.lookup(key)
+        self.count_dedup(MISS if entry is None else HIT)
+        if entry is None:
+            return False
+        
+        command_id = payload.get("command_id")
+        if entry.finished:
+            self.log.info("Duplicate command %s, resending %d reply(s)", key, len(entry.replies), category="command", command_id=command_id)
+            for name, reply, qos in entry.replies:
+                self.publish(name, reply, qos=qos)
+        else:
+            self.log.info("Duplicate command %s still in progress, ignored", key, category="command", command_id=command_id)
+        return True
+        
+    def count_dedup(self, result: str):
+        if self.metrics is not None:
+            self.metrics.command_dedup.inc((result,))
+            
+    def dispatch(self, handler, payload: Dict, entry=None):
+        """Parancs sorba állítása a worker pool számára (túlterhelésnél BUSY hiba)
+        
+        entry: a parancs deduplikációs bejegyzése; az eredmény üzenetek ebbe kerülnek
+        """
+        try:
+            self.job_queue.put_nowait((handler, payload, entry))
+        except asyncio.QueueFull:
+            pump_id = payload.get("pump_id", 0)
+            with recording(entry):
+                self.publish_error(pump_id, "BUSY", f"Command queue full ({self.queue_depth} pending), command rejected", "warning", command_id=payload.get("command_id"))
+                
+    async def worker_loop(self):
+        """Parancs végrehajtó worker (bounded pool)"""
+        while True:
+            handler, payload, entry = await self.job_queue.get()
+            started = self.clock.monotonic()
+            try:
+                with recording(entry):
+                    await self.profiled(handler.__name__, handler(payload))
+            except Exception as e:
+                self.log.error("Error handling command: %s", e, category="command")
+            finally:
+                self.job_queue.task_done()
+                if self.metrics is not None:
+                    self.metrics.handler_duration.observe(self.clock.monotonic() - started, (command_label(handler),))
+                    
+    def profiled(self, label: str, coro):
+        """Coroutine futtatása a profilerrel, ha van és be van kapcsolva (egyébként változatlan)"""
+        if self.profiler is None:
+            return coro
+        return self.profiler.wrap(self.client_id, label, coro)
+        
+    @contextmanager
+    def operation(self, kind: str, command_id: Optional[str] = None, payload: Optional[Dict] = None):
+        """Futó művelet regisztrálása megszakítási tokennel (command_id: a parancs azonosítója, payload: az eredeti parancs)
+        
+        Folytatott adagolásnál (RESUMED_KEY) a token a restart előtti eredeti parancsot
+        és a már kiadagolt mennyiséget viszi tovább (pillanatkép, befejezés).
+        """
+        resumed = payload.get(RESUMED_KEY) if payload is not None else None
+        token = CancelToken(kind, command_id, payload if resumed is None else resumed["payload"])
+        token.started_at = self.clock.monotonic()
+        if resumed is not None:
+            token.carried = {int(pump_id): ml for pump_id, ml in resumed["poured"].items()}
+            token.poured = dict(token.carried)
+        if self.stop_event.is_set():
+            token.cancel("Emergency stop active")
+        self.operations.add(token)
+        try:
+            yield token
+        finally:
+            self.operations.discard(token)
+            
+    @contextmanager
+    def pumps_running(self, pump_ids: list, state: str, target_ml: float = 0.0):
+        """Pumpák működésének rögzítése az állapot táblában a blokk idejére (megszakításkor is felszabadul)"""
+        idle = self.heartbeat_active_interval is not None and not self.pumps_active
+        for pump_id in pump_ids:
+            self.pump_state.begin(self.state_base, pump_id, state, target_ml)
+        if idle:
+            self.pumps_started.set()
+        try:
+            yield
+        finally:
+            for pump_id in pump_ids:
+                self.pump_state.end(self.state_base, pump_id)
+                
+    def report_emergency_stop(self, token: CancelToken, pump_id: int):
+        """Megszakított művelet jelentése a mért stop latency-vel"""
+        context = token.stop_context()
+        self.log.warning("%s stopped (emergency) after %.3fms", token.kind.capitalize(), context["stop_latency_ms"], category="estop", pump_id=pump_id, stop_latency_ms=context["stop_latency_ms"])
+        self.publish_error(pump_id, "EMERGENCY_STOP", "Emergency stop triggered", "warning", context, token.command_id)
+        
+    def drop_queued_jobs(self, reason: str) -> int:
+        """Várakozó (még el nem kezdett) parancsok eldobása, mindegyikről EMERGENCY_STOP hiba a command_id-jével"""
+        dropped = 0
+        while not self.job_queue.empty():
+            handler, payload, entry = self.job_queue.get_nowait()
+            self.job_queue.task_done()
+            dropped += 1
+            # The outcome of the command: closes its dedup entry, so a redelivery gets this reply
+            pump_id = payload.get("pump_id") or 0
+            context = {"operation": command_label(handler), "queued": True}
+            with recording(entry):
+                self.publish_error(pump_id, "EMERGENCY_STOP", f"Emergency stop: {reason} (command discarded before start)", "warning", context, payload.get("command_id"))
+        return dropped
+        
+    async def handle_dispense_command(self, payload: Dict):
+        """Dispense parancs kezelése - rendelés sorral sorba állítva, egyébként azonnal indul"""
+        if self.orders is not None:
+            self.submit_order(payload)
+        else:
+            await self.dispense(payload)
+            
+    async def dispense(self, payload: Dict):
+        """Adagolás végrehajtása - támogatja mind az egyszerű, mind a komplex formátumot"""
         pump_id = payload.get("pump_id")
         amount_ml = payload.get("amount_ml")
         duration_ms = payload.get("duration_ms")  # Optional, calculated if not provided
         recipe_name = payload.get("recipe_name", "Unknown")
+        command_id = payload.get("command_id")  # Optional, echoed in replies for correlation
         
         # Validate required fields
         if pump_id is None or amount_ml is None:
-            self.publish_error(pump_id or 0, "INVALID_COMMAND", "Missing required fields: pump_id and amount_ml", "critical")
+            self.publish_error(pump_id or 0, "INVALID_COMMAND", "Missing required fields: pump_id and amount_ml", "critical", command_id=command_id)
+            return
+        # Pump numbers and quantities only: the order volume cap applies when an order is queued
+        problem = validate_ingredients(order_ingredients(payload))
+        if problem is not None:
+            self.publish_error(pump_id, "INVALID_COMMAND", problem, "warning", command_id=command_id)
             return
         
         # Handle complex multi-pump dispense (amount_ml is array)
         if isinstance(amount_ml, list):
-            print(f"[ESP32] Multi-pump recipe: {recipe_name or 'Unknown'}")
+            self.log.info("Multi-pump recipe: %s", recipe_name or "Unknown", category="dispense")
             
             # Simulate random error
-            if random.random() < self.error_rate:
+            if self.random.random() < self.error_rate:
                 error_codes = ["PUMP_STUCK", "FLOW_SENSOR_ERROR", "TIMEOUT"]
-                error_code = random.choice(error_codes)
-                self.publish_error(amount_ml[0].get("pump_number", 1), error_code, f"Simulated error: {error_code}", "critical")
+                error_code = self.random.choice(error_codes)
+                self.publish_error(amount_ml[0].get("pump_number", 1), error_code, f"Simulated error: {error_code}", "critical", command_id=command_id)
                 return
             
-            print(f"[ESP32] Starting multi-pump dispense: {len(amount_ml)} ingredients")
-            
-            # Run dispense in separate thread for ALL pumps
-            thread = threading.Thread(
-                target=self.simulate_multi_pump_dispense,
-                args=(amount_ml, recipe_name or "Multi-ingredient"),
-                daemon=True
-            )
-            thread.start()
+            self.log.info("Starting multi-pump dispense: %d ingredients", len(amount_ml), category="dispense")
             
+            # Run dispense for ALL pumps
+            with self.operation("dispense", command_id, payload) as token:
+                if self.concurrent_recipes:
+                    await self.simulate_concurrent_recipe(amount_ml, recipe_name or "Multi-ingredient", token, payload.get("layered", False))
+                else:
+                    await self.simulate_multi_pump_dispense(amount_ml, recipe_name or "Multi-ingredient", token)
+        
         # Handle simple single-pump dispense (amount_ml is number)
         else:
             # Calculate duration if not provided (assume 20ml/s flow rate)
@@ -172,25 +833,200 @@ class ESP32Mock:
                 duration_ms = int((amount_ml / flow_rate_ml_s) * 1000)
             
             # Simulate random error
-            if random.random() < self.error_rate:
+            if self.random.random() < self.error_rate:
                 error_codes = ["PUMP_STUCK", "FLOW_SENSOR_ERROR", "TIMEOUT"]
-                error_code = random.choice(error_codes)
-                self.publish_error(pump_id, error_code, f"Simulated error: {error_code}", "critical")
+                error_code = self.random.choice(error_codes)
+                self.publish_error(pump_id, error_code, f"Simulated error: {error_code}", "critical", command_id=command_id)
                 return
             
-            print(f"[ESP32] Starting dispense: Pump {pump_id}, {amount_ml}ml, {duration_ms}ms")
+            self.log.info("Starting dispense: Pump %s, %sml, %sms", pump_id, amount_ml, duration_ms, category="dispense", pump_id=pump_id)
             
-            # Run dispense in separate thread
-            thread = threading.Thread(
-                target=self.simulate_dispense,
-                args=(pump_id, amount_ml, duration_ms, recipe_name),
-                daemon=True
-            )
-            thread.start()
-    
-    def simulate_multi_pump_dispense(self, ingredients: list, recipe_name: str):
+            # Run dispense
+            with self.operation("dispense", command_id, payload) as token:
+                await self.simulate_dispense(pump_id, amount_ml, duration_ms, recipe_name, token)
+                
+    def submit_order(self, payload: Dict):
+        """Rendelés ellenőrzése és felvétele a rendelés sorba (tele sornál BUSY hiba)"""
+        pump_id = payload.get("pump_id")
+        command_id = payload.get("command_id")
+        if pump_id is None or payload.get("amount_ml") is None:
+            self.publish_error(pump_id or 0, "INVALID_COMMAND", "Missing required fields: pump_id and amount_ml", "critical", command_id=command_id)
+            return
+        
+        ingredients = order_ingredients(payload)
+        problem = validate_order(ingredients)
+        if problem is not None:
+            self.publish_error(pump_id, "INVALID_COMMAND", problem, "warning", command_id=command_id)
+            self.count_order("invalid")
+            return
+        
+        estimated_ms = estimate_recipe_ms(payload, self.concurrent_recipes, self.max_active_pumps)
+        order = Order(payload, ingredients, estimated_ms, self.clock.monotonic())
+        order.dedup = current_entry.get()
+        position = self.orders.submit(order)
+        if position is None:
+            self.publish_error(pump_id, "BUSY", f"Order queue full ({self.orders.depth} waiting), order rejected", "warning", command_id=command_id)
+            self.count_order("rejected")
+            return
+        
+        # The order loop (or an emergency stop) produces the outcome, not this handler
+        if order.dedup is not None:
+            order.dedup.hand_off()
+        self.count_order("accepted")
+        self.log.info("Order queued: %s, %.1fml, position %d", order.recipe_name, order.estimated_ml, position, category="dispense", command_id=command_id)
+        if position == 1 and self.orders.current is not None:
+            self.precheck_order(order)
+        self.publish_order_queue()
+        
+    async def order_loop(self):
+        """Rendelések adagolása egymás után; az előző befejezése után a következő azonnal indul"""
+        while True:
+            order = await self.orders.next()
+            self.count_order("started")
+            if self.metrics is not None:
+                self.metrics.order_wait.observe(order.started_at - order.accepted_at)
+            try:
+                # Pre-validate the next order while this one pours
+                order.blocked_pumps = self.pump_state.busy(self.state_base, order.pump_ids, MAINTENANCE_STATES)
+                head = self.orders.head()
+                if head is not None:
+                    self.precheck_order(head)
+                self.publish_order_queue()
+                
+                with recording(order.dedup):
+                    if order.blocked_pumps:
+                        if not await self.wait_for_pumps(order):
+                            continue
+                        order.blocked_pumps = []
+                        order.started_at = self.clock.monotonic()
+                        self.publish_order_queue()
+                    await self.profiled("dispense", self.dispense(order.payload))
+            except Exception as e:
+                self.log.error("Error handling order: %s", e, category="dispense")
+            finally:
+                self.orders.finish()
+                
+    def precheck_order(self, order: Order):
+        """A következő rendelés előzetes ellenőrzése: karbantartás alatt álló pumpák, palack szint
+        
+        A palack szintből az éppen adagoló rendelés teljes mennyisége is levonásra kerül.
+        """
+        order.blocked_pumps = self.pump_state.busy(self.state_base, order.pump_ids, MAINTENANCE_STATES)
+        if self.physics is not None:
+            current = self.orders.current
+            needed: Dict[int, float] = {}
+            for pump_id, quantity_ml in order.ingredients + (current.ingredients if current is not None else []):
+                needed[pump_id] = needed.get(pump_id, 0.0) + quantity_ml
+            order.low_level_pumps = [
+                pump_id for pump_id, quantity_ml in sorted(needed.items())
+                if self.physics.result(self.physics.slot(self.physics_base, pump_id))["bottle_ml"] < quantity_ml
+            ]
+        if order.blocked_pumps or order.low_level_pumps:
+            self.log.warning("Next order %s: pumps in maintenance %s, low bottle %s", order.recipe_name, order.blocked_pumps, order.low_level_pumps, category="dispense", command_id=order.command_id)
+            
+    async def wait_for_pumps(self, order: Order) -> bool:
+        """Várakozás a rendelés karbantartás alatt álló pumpáira; False, ha közben megszakították"""
+        self.log.info("Order %s waiting for pumps %s", order.recipe_name, order.blocked_pumps, category="dispense", command_id=order.command_id)
+        with self.operation("order", order.command_id, order.payload) as token:
+            while self.pump_state.busy(self.state_base, order.pump_ids, MAINTENANCE_STATES):
+                if await token.sleep(0.1):
+                    self.report_emergency_stop(token, 0)
+                    return False
+        return True
+        
+    def publish_order_queue(self):
+        """Pozíció és ETA minden rendelésről (dispense/queue, QoS 1)"""
+        for order, position, eta_ms in self.orders.positions():
+            if position:
+                state = QUEUED
+            else:
+                state = WAITING_FOR_PUMPS if order.blocked_pumps else POURING
+            self.publish_order(order, state, position, eta_ms)
+            
+    def publish_order(self, order: Order, state: str, position: int, eta_ms: int):
+        update = {
+            "pump_id": 0 if isinstance(order.payload.get("amount_ml"), list) else order.payload.get("pump_id"),
+            "recipe_name": order.recipe_name,
+            "state": state,
+            "position": position,
+            "queue_length": len(self.orders),
+            "eta_ms": eta_ms,
+            "estimated_ml": round(order.estimated_ml, 2),
+            "estimated_duration_ms": order.estimated_ms,
+            "timestamp": self.clock.utc_timestamp()
+        }
+        if order.blocked_pumps:
+            update["blocked_pumps"] = order.blocked_pumps
+        if order.low_level_pumps:
+            update["low_level_pumps"] = order.low_level_pumps
+        if order.command_id is not None:
+            update["command_id"] = order.command_id
+        self.publish("dispense/queue", update, qos=1)
+        if state == CANCELLED:
+            # Final outcome of an order that never poured
+            record_reply("dispense/queue", update, 1)
+            
+    def count_order(self, result: str):
+        if self.metrics is not None:
+            self.metrics.orders.inc((result,))
+            
+    async def pour(self, pump_id: int, amount_ml: float, duration_ms: int, token: CancelToken, report) -> Optional[float]:
+        """Egy pumpa adagolása 500ms-enkénti progress callback-kel (report(ml, running))
+        
+        Flow physics nélkül fix duration_ms alatt lineárisan (±5% eltérés a végén),
+        egyébként a flow physics motorral (duration_ms nem számít).
+        
+        Returns:
+            Az adagolt (mért) mennyiség, None ha közben megszakították
+        """
+        def track(current_ml: float, running: bool):
+            self.pump_state.progress(self.state_base, pump_id, current_ml)
+            token.poured[pump_id] = token.carried.get(pump_id, 0.0) + current_ml
+            report(current_ml, running)
+        
+        if self.physics is not None:
+            return await self.physics_pour(pump_id, amount_ml, token, track)
+        
+        steps = int(duration_ms / 1000.0 / 0.5)  # 500ms-enként update
+        if steps < 1:
+            steps = 1
+        
+        for i in range(steps + 1):
+            if token.cancelled:
+                return None
+            
+            progress = i / steps
+            track(amount_ml * progress, progress < 1.0)
+            
+            if i < steps:
+                await token.sleep(0.5)
+        
+        # Simulate slight variance in actual amount (+/- 5%)
+        return round(amount_ml * self.random.uniform(0.95, 1.05), 2)
+        
+    async def physics_pour(self, pump_id: int, amount_ml: float, token: CancelToken, report) -> Optional[float]:
+        """Adagolás a flow physics motorral: a pumpa a cél impulzusszámig fut, mint a firmware-en"""
+        if token.cancelled:
+            return None
+        
+        slot = self.physics.slot(self.physics_base, pump_id)
+        done = self.physics.start_pump(slot, amount_ml, self.calibration_factors.get(pump_id, 1.0))
+        while not done.done():
+            report(self.physics.measured_ml(slot) if self.physics.is_running(slot, done) else 0.0, True)
+            if await token.sleep(0.5, until=done):
+                self.physics.stop_pump(slot, done)
+                return None
+        
+        result = done.result()
+        report(result["measured_ml"], False)
+        self.log.debug("Pump %s: %d pulses, %.2fml measured, %.2fml delivered, bottle %.0fml", pump_id, result["flow_pulses"], result["measured_ml"], result["delivered_ml"], result["bottle_ml"], category="dispense", pump_id=pump_id, **result)
+        if result["reason"] == TIMEOUT:
+            self.publish_error(pump_id, "PUMP_TIMEOUT", "Flow timeout - check pump/sensor", "warning", result, token.command_id)
+        return result["measured_ml"]
+        
+    async def simulate_multi_pump_dispense(self, ingredients: list, recipe_name: str, token: CancelToken):
         """Több pumpás adagolás szimulálása (mint az ESP32)"""
-        total_start_time = time.time()
+        total_start_time = self.clock.monotonic()
         total_actual_ml = 0.0
         total_requested_ml = 0.0
         
@@ -198,7 +1034,10 @@ class ESP32Mock:
         total_recipe_ml = sum(item.get("quantity_ml", 0.0) for item in ingredients)
         cumulative_ml = 0.0
         
-        print(f"[ESP32] Recipe: {recipe_name}, Total volume: {total_recipe_ml:.1f}ml")
+        recipe_pumps = [item.get("pump_number", 1) for item in ingredients]
+        telemetry_start = self.telemetry.pump_bytes(recipe_pumps)
+        
+        self.log.info("Recipe: %s, Total volume: %.1fml", recipe_name, total_recipe_ml, category="dispense")
         
         # Process each pump sequentially (like real ESP32)
         for idx, item in enumerate(ingredients):
@@ -207,37 +1046,12 @@ class ESP32Mock:
             ingredient_name = item.get("ingredient", "Unknown")
             order = item.get("order", idx + 1)
             
-            print(f"[ESP32] [{order}/{len(ingredients)}] Pump {pump_number}: {quantity_ml}ml of {ingredient_name} (cumulative: {cumulative_ml:.1f}/{total_recipe_ml:.1f}ml)")
-            
-            # Calculate duration for this pump (assume 20ml/s)
-            flow_rate_ml_s = 20.0
-            duration_ms = int((quantity_ml / flow_rate_ml_s) * 1000)
-            if duration_ms < 500:
-                duration_ms = 500
-            
-            # Simulate this pump's dispense
-            self.pumps_active += 1
-            start_time = time.time()
-            duration_sec = duration_ms / 1000.0
-            
-            steps = int(duration_sec / 0.5)
-            if steps < 1:
-                steps = 1
+            self.log.info("[%s/%d] Pump %s: %sml of %s (cumulative: %.1f/%.1fml)", order, len(ingredients), pump_number, quantity_ml, ingredient_name, cumulative_ml, total_recipe_ml, category="dispense", pump_id=pump_number)
             
-            for i in range(steps + 1):
-                if self.stop_event.is_set():
-                    print(f"[ESP32] Dispense stopped (emergency)")
-                    self.publish_error(pump_number, "EMERGENCY_STOP", "Emergency stop triggered", "warning")
-                    self.pumps_active -= 1
-                    return
-                
-                progress = i / steps
-                current_ml = quantity_ml * progress
-                elapsed_ms = int((time.time() - start_time) * 1000)
-                
+            def report(current_ml: float, running: bool):
                 # Calculate cumulative recipe progress
                 recipe_progress_ml = cumulative_ml + current_ml
-                recipe_elapsed_ms = int((time.time() - total_start_time) * 1000)
+                recipe_elapsed_ms = int((self.clock.monotonic() - total_start_time) * 1000)
                 
                 # Calculate flow rate (ml/s) based on total elapsed time
                 if recipe_elapsed_ms > 0:
@@ -245,72 +1059,132 @@ class ESP32Mock:
                 else:
                     flow_rate = 0.0
                 
-                # Publish status (CUMULATIVE recipe progress, not individual pump)
-                status = {
-                    "pump_id": pump_number,
-                    "state": "dispensing" if progress < 1.0 else "idle",
-                    "progress_ml": round(recipe_progress_ml, 2),  # Cumulative!
-                    "target_ml": total_recipe_ml,  # Total recipe volume!
-                    "flow_rate_ml_s": round(flow_rate, 2),
-                    "elapsed_ms": recipe_elapsed_ms,
-                    "timestamp": datetime.utcnow().isoformat() + "Z"
-                }
-                
-                self.client.publish("intellivend/status", json.dumps(status), qos=0)
-                print(f"[ESP32] Recipe Status: {recipe_progress_ml:.1f}/{total_recipe_ml:.1f}ml ({(recipe_progress_ml/total_recipe_ml)*100:.0f}%)")
-                
-                if i < steps:
-                    time.sleep(0.5)
+                # Publish status (CUMULATIVE recipe progress and total recipe volume, not individual pump)
+                self.telemetry.update(pump_number, "dispensing" if running else "idle", recipe_progress_ml, total_recipe_ml, flow_rate, recipe_elapsed_ms)
+                self.log.debug("Recipe Status: %.1f/%.1fml (%.0f%%)", recipe_progress_ml, total_recipe_ml, (recipe_progress_ml / total_recipe_ml) * 100, category="status")
             
-            # Simulate slight variance (+/- 5%)
-            actual_ml = quantity_ml * random.uniform(0.95, 1.05)
-            actual_ml = round(actual_ml, 2)
+            # Simulate this pump's dispense (assume 20ml/s, at least 500ms without flow physics)
+            with self.pumps_running([pump_number], "dispensing", quantity_ml):
+                actual_ml = await self.pour(pump_number, quantity_ml, recipe_pump_duration_ms(quantity_ml), token, report)
+                if actual_ml is None:
+                    self.report_emergency_stop(token, pump_number)
+                    return
             
             total_actual_ml += actual_ml
             total_requested_ml += quantity_ml
             cumulative_ml += actual_ml  # Update cumulative progress for next pump
             
-            print(f"[ESP32] Pump {pump_number} complete: {actual_ml}ml (cumulative: {cumulative_ml:.1f}ml)")
-            self.pumps_active -= 1
+            self.log.info("Pump %s complete: %sml (cumulative: %.1fml)", pump_number, actual_ml, cumulative_ml, category="dispense", pump_id=pump_number)
             
             # Small delay between pumps (like real ESP32)
             if idx < len(ingredients) - 1:
-                time.sleep(0.5)
+                await token.sleep(0.5)
         
-        # Send single completion message for entire recipe
-        total_duration_ms = int((time.time() - total_start_time) * 1000)
+        # Send single completion message for entire recipe (after the final status)
+        self.telemetry.flush()
+        total_duration_ms = int((self.clock.monotonic() - total_start_time) * 1000)
         complete = {
             "pump_id": 0,  # 0 = multi-pump recipe
             "recipe_name": recipe_name,
             "requested_ml": round(total_requested_ml, 2),
             "actual_ml": round(total_actual_ml, 2),
             "duration_ms": total_duration_ms,
-            "timestamp": datetime.utcnow().isoformat() + "Z"
+            "makespan_ms": total_duration_ms,
+            "telemetry_bytes": int(self.telemetry.pump_bytes(recipe_pumps) - telemetry_start),
+            "timestamp": self.clock.utc_timestamp()
         }
         
-        self.client.publish("intellivend/dispense/complete", json.dumps(complete), qos=1)
-        print(f"[ESP32] ✓ Recipe complete: {total_actual_ml:.1f}ml total in {total_duration_ms}ms")
-    
-    def simulate_dispense(self, pump_id: int, amount_ml: float, duration_ms: int, recipe_name: str):
-        """Adagolás szimulálása progress update-ekkel"""
-        self.pumps_active += 1
-        start_time = time.time()
-        duration_sec = duration_ms / 1000.0
+        self.publish_complete("dispense/complete", complete, token)
+        self.log.info("✓ Recipe complete: %.1fml total in %dms (%d status bytes)", total_actual_ml, total_duration_ms, complete["telemetry_bytes"], category="dispense", command_id=token.command_id)
         
-        steps = int(duration_sec / 0.5)  # 500ms-enként update
-        if steps < 1:
-            steps = 1
+    async def simulate_concurrent_recipe(self, ingredients: list, recipe_name: str, token: CancelToken, layered: bool = False):
+        """Több pumpás adagolás párhuzamosan, max_active_pumps tápegység limittel
         
-        for i in range(steps + 1):
-            if self.stop_event.is_set():
-                print(f"[ESP32] Dispense stopped (emergency)")
-                self.publish_error(pump_id, "EMERGENCY_STOP", "Emergency stop triggered", "warning")
-                self.pumps_active -= 1
+        Az "order" mező precedencia feltétel: a rétegzett (layered) összetevő csak az
+        összes kisebb sorszámú után indul, és a nagyobb sorszámúak csak utána. A nem
+        rétegzett összetevők egymással párhuzamosan futnak.
+        """
+        total_start_time = self.clock.monotonic()
+        total_recipe_ml = sum(item.get("quantity_ml", 0.0) for item in ingredients)
+        stages = plan_recipe_stages(ingredients, layered)
+        recipe_pumps = [item.get("pump_number", 1) for item in ingredients]
+        telemetry_start = self.telemetry.pump_bytes(recipe_pumps)
+        
+        # Shared recipe progress (ingredient index -> poured ml), for cumulative status
+        poured = [0.0] * len(ingredients)
+        actual = [0.0] * len(ingredients)
+        
+        self.log.info("Recipe: %s, Total volume: %.1fml, %d stage(s), max %d pumps", recipe_name, total_recipe_ml, len(stages), self.max_active_pumps, category="dispense")
+        
+        for stage in stages:
+            await asyncio.gather(*(
+                self.profiled("pour_ingredient", self.pour_ingredient(index, item, poured, actual, total_recipe_ml, total_start_time, token))
+                for index, item in stage
+            ))
+            if token.cancelled:
+                return
+        
+        # Send single completion message for entire recipe (after the final status)
+        self.telemetry.flush()
+        makespan_ms = int((self.clock.monotonic() - total_start_time) * 1000)
+        sequential_ms = sum(recipe_pump_duration_ms(item.get("quantity_ml", 0.0)) for item in ingredients) + 500 * (len(ingredients) - 1)
+        total_actual_ml = sum(actual)
+        complete = {
+            "pump_id": 0,  # 0 = multi-pump recipe
+            "recipe_name": recipe_name,
+            "requested_ml": round(total_recipe_ml, 2),
+            "actual_ml": round(total_actual_ml, 2),
+            "duration_ms": makespan_ms,
+            "makespan_ms": makespan_ms,
+            "sequential_estimate_ms": sequential_ms,
+            "max_active_pumps": self.max_active_pumps,
+            "telemetry_bytes": int(self.telemetry.pump_bytes(recipe_pumps) - telemetry_start),
+            "timestamp": self.clock.utc_timestamp()
+        }
+        
+        self.publish_complete("dispense/complete", complete, token)
+        speedup = sequential_ms / makespan_ms if makespan_ms > 0 else 1.0
+        self.log.info("✓ Recipe complete: %.1fml total, makespan %dms (sequential ~%dms, %.2fx)", total_actual_ml, makespan_ms, sequential_ms, speedup, category="dispense", command_id=token.command_id)
+        
+    async def pour_ingredient(self, index: int, item: Dict, poured: list, actual: list, total_recipe_ml: float, total_start_time: float, token: CancelToken):
+        """Egy összetevő adagolása párhuzamos módban (pumpa slot foglalással)"""
+        pump_number = item.get("pump_number", 1)
+        quantity_ml = item.get("quantity_ml", 0.0)
+        
+        async with self.pump_budget:
+            # Stopped while waiting for a free pump slot: never started
+            if token.cancelled:
                 return
+                
+            def report(current_ml: float, running: bool):
+                poured[index] = current_ml
+                
+                # Cumulative recipe progress over all pumps
+                recipe_progress_ml = sum(poured)
+                recipe_elapsed_ms = int((self.clock.monotonic() - total_start_time) * 1000)
+                flow_rate = (recipe_progress_ml / recipe_elapsed_ms) * 1000 if recipe_elapsed_ms > 0 else 0.0
+                
+                self.telemetry.update(pump_number, "dispensing" if running else "idle", recipe_progress_ml, total_recipe_ml, flow_rate, recipe_elapsed_ms)
             
-            progress = i / steps
-            current_ml = amount_ml * progress
-            elapsed_ms = int((time.time() - start_time) * 1000)
+            with self.pumps_running([pump_number], "dispensing", quantity_ml):
+                self.log.info("Pump %s: %sml of %s started (%d active)", pump_number, quantity_ml, item.get("ingredient", "Unknown"), self.pumps_active, category="dispense", pump_id=pump_number)
+                actual_ml = await self.pour(pump_number, quantity_ml, recipe_pump_duration_ms(quantity_ml), token, report)
+                if actual_ml is None:
+                    self.report_emergency_stop(token, pump_number)
+                    return
+            
+            actual[index] = actual_ml
+            poured[index] = actual_ml
+            
+            self.log.info("Pump %s complete: %sml (cumulative: %.1f/%.1fml)", pump_number, actual[index], sum(poured), total_recipe_ml, category="dispense", pump_id=pump_number)
+            
+    async def simulate_dispense(self, pump_id: int, amount_ml: float, duration_ms: int, recipe_name: str, token: CancelToken):
+        """Adagolás szimulálása progress update-ekkel"""
+        start_time = self.clock.monotonic()
+        telemetry_start = self.telemetry.pump_bytes([pump_id])
+        
+        def report(current_ml: float, running: bool):
+            elapsed_ms = int((self.clock.monotonic() - start_time) * 1000)
             
             # Calculate flow rate (ml/s)
             if elapsed_ms > 0:
@@ -319,74 +1193,64 @@ class ESP32Mock:
                 flow_rate = 0.0
             
             # Publish status
-            status = {
-                "pump_id": pump_id,
-                "state": "dispensing" if progress < 1.0 else "idle",
-                "progress_ml": round(current_ml, 2),
-                "target_ml": amount_ml,
-                "flow_rate_ml_s": round(flow_rate, 2),
-                "elapsed_ms": elapsed_ms,
-                "timestamp": datetime.utcnow().isoformat() + "Z"
-            }
-            
-            self.client.publish("intellivend/status", json.dumps(status), qos=0)
-            print(f"[ESP32] Status: {current_ml:.1f}/{amount_ml}ml ({progress*100:.0f}%)")
-            
-            if i < steps:
-                time.sleep(0.5)
+            self.telemetry.update(pump_id, "dispensing" if running else "idle", current_ml, amount_ml, flow_rate, elapsed_ms)
+            self.log.debug("Status: %.1f/%sml (%.0f%%)", current_ml, amount_ml, current_ml / amount_ml * 100 if amount_ml else 100, category="status")
         
-        # Simulate slight variance in actual amount (+/- 5%)
-        actual_ml = amount_ml * random.uniform(0.95, 1.05)
-        actual_ml = round(actual_ml, 2)
+        with self.pumps_running([pump_id], "dispensing", amount_ml):
+            actual_ml = await self.pour(pump_id, amount_ml, duration_ms, token, report)
+            if actual_ml is None:
+                self.report_emergency_stop(token, pump_id)
+                return
         
-        # Publish completion
+        # Publish completion (after the final status)
+        self.telemetry.flush()
         complete = {
             "pump_id": pump_id,
             "recipe_name": recipe_name,
             "requested_ml": amount_ml,
             "actual_ml": actual_ml,
-            "duration_ms": int((time.time() - start_time) * 1000),
-            "timestamp": datetime.utcnow().isoformat() + "Z"
+            "duration_ms": int((self.clock.monotonic() - start_time) * 1000),
+            "telemetry_bytes": int(self.telemetry.pump_bytes([pump_id]) - telemetry_start),
+            "timestamp": self.clock.utc_timestamp()
         }
         
-        self.client.publish("intellivend/dispense/complete", json.dumps(complete), qos=1)
-        print(f"[ESP32] Dispense complete: {actual_ml}ml dispensed")
+        self.publish_complete("dispense/complete", complete, token)
+        self.log.info("Dispense complete: %sml dispensed (%d status bytes)", actual_ml, complete["telemetry_bytes"], category="dispense", pump_id=pump_id, command_id=token.command_id)
         
-        self.pumps_active -= 1
-    
-    def handle_flush_command(self, payload: Dict):
+    async def handle_flush_command(self, payload: Dict):
         """Flush parancs kezelése"""
         pump_id = payload.get("pump_id")
         duration_ms = payload.get("duration_ms")
         
         if pump_id is None or duration_ms is None:
-            self.publish_error(0, "INVALID_COMMAND", "Missing pump_id or duration_ms", "warning")
+            self.publish_error(0, "INVALID_COMMAND", "Missing pump_id or duration_ms", "warning", command_id=payload.get("command_id"))
+            return
+        if not valid_pump_target(pump_id):
+            self.publish_error(0, "INVALID_COMMAND", f"Invalid pump_id: {pump_id!r} (1-{NUM_PUMPS} or -1)", "warning", command_id=payload.get("command_id"))
             return
         
         # Check if bulk flush (pump_id = -1)
         if pump_id == -1:
-            print(f"[ESP32] Starting BULK FLUSH (all pumps), {duration_ms}ms")
-            pump_ids = list(range(1, 9))  # 8 pumps
+            self.log.info("Starting BULK FLUSH (all pumps), %sms", duration_ms, category="flush")
+            pump_ids = list(range(1, NUM_PUMPS + 1))
         else:
-            print(f"[ESP32] Starting flush: Pump {pump_id}, {duration_ms}ms")
+            self.log.info("Starting flush: Pump %s, %sms", pump_id, duration_ms, category="flush", pump_id=pump_id)
             pump_ids = [pump_id]
         
-        # Run flush in separate thread
-        thread = threading.Thread(
-            target=self.simulate_flush,
-            args=(pump_ids, duration_ms),
-            daemon=True
-        )
-        thread.start()
-    
-    def simulate_flush(self, pump_ids: list, duration_ms: int):
+        # Run flush
+        with self.operation("flush", payload.get("command_id"), payload) as token:
+            await self.simulate_flush(pump_ids, duration_ms, token)
+            
+    async def simulate_flush(self, pump_ids: list, duration_ms: int, token: CancelToken):
         """Öblítés szimulálása"""
-        self.pumps_active += len(pump_ids)
-        start_time = time.time()
         duration_sec = duration_ms / 1000.0
         
         # Simulate flush
-        time.sleep(duration_sec)
+        with self.pumps_running(pump_ids, "flushing"):
+            if await token.sleep(duration_sec):
+                for pump_id in pump_ids:
+                    self.report_emergency_stop(token, pump_id)
+                return
         
         # Publish completion for each pump
         for pump_id in pump_ids:
@@ -394,138 +1258,660 @@ class ESP32Mock:
                 "pump_id": pump_id,
                 "action_type": "flush",
                 "duration_ms": duration_ms,
-                "timestamp": datetime.utcnow().isoformat() + "Z"
+                "timestamp": self.clock.utc_timestamp()
             }
             
-            self.client.publish("intellivend/maintenance/complete", json.dumps(complete), qos=1)
-            print(f"[ESP32] Flush complete: Pump {pump_id}")
-        
-        self.pumps_active -= len(pump_ids)
-    
-    def handle_calibration_command(self, payload: Dict):
-        """Kalibráció parancs kezelése"""
+            self.publish_complete("maintenance/complete", complete, token)
+            self.log.info("Flush complete: Pump %s", pump_id, category="flush", pump_id=pump_id)
+            
+    async def handle_calibration_command(self, payload: Dict):
+        """Kalibráció parancs kezelése (pump_id -1: az összes pumpa, párhuzamosan)"""
         pump_id = payload.get("pump_id")
         test_amount_ml = payload.get("test_amount_ml", 50.0)
         timeout_ms = payload.get("timeout_ms", 30000)
+        command_id = payload.get("command_id")
         
-        print(f"[ESP32] Starting calibration: Pump {pump_id}, {test_amount_ml}ml")
+        if pump_id is None:
+            self.publish_error(0, "INVALID_COMMAND", "Missing pump_id", "warning", command_id=command_id)
+            return
+        if not valid_pump_target(pump_id):
+            self.publish_error(0, "INVALID_COMMAND", f"Invalid pump_id: {pump_id!r} (1-{NUM_PUMPS} or -1)", "warning", command_id=command_id)
+            return
         
-        # Run calibration in separate thread
-        thread = threading.Thread(
-            target=self.simulate_calibration,
-            args=(pump_id, test_amount_ml, timeout_ms),
-            daemon=True
-        )
-        thread.start()
-    
-    def simulate_calibration(self, pump_id: int, test_amount_ml: float, timeout_ms: int):
-        """Kalibráció szimulálása"""
-        self.pumps_active += 1
+        # Check if bulk calibration (pump_id = -1), as bulk flush
+        if pump_id == -1:
+            pump_ids = list(range(1, NUM_PUMPS + 1))
+            trials = payload.get("trials", DEFAULT_CALIBRATION_TRIALS)
+        else:
+            pump_ids = [pump_id]
+            trials = payload.get("trials", 1)
+        
+        if not isinstance(trials, int) or not 1 <= trials <= MAX_CALIBRATION_TRIALS or not test_amount_ml or test_amount_ml <= 0 or not timeout_ms or timeout_ms <= 0:
+            self.publish_error(pump_id, "INVALID_COMMAND", f"Invalid calibration parameters (trials 1-{MAX_CALIBRATION_TRIALS}, test_amount_ml > 0, timeout_ms > 0)", "warning", command_id=command_id)
+            return
         
-        # Simulate dispensing test amount
-        actual_duration_ms = int(test_amount_ml * random.uniform(80, 120))  # ~100ms per ml
-        time.sleep(actual_duration_ms / 1000.0)
+        self.log.info("Starting calibration: Pump %s, %sml x %d trial(s), timeout %sms", pump_id, test_amount_ml, trials, timeout_ms, category="calibration", pump_id=pump_id)
         
-        # Publish completion
-        complete = {
+        # Run calibration
+        with self.operation("calibration", command_id, payload) as token:
+            await self.simulate_calibration(pump_id, pump_ids, test_amount_ml, timeout_ms, trials, token, payload.get("apply", False))
+            
+    async def simulate_calibration(self, pump_id: int, pump_ids: list, test_amount_ml: float, timeout_ms: int, trials: int, token: CancelToken, apply: bool = False):
+        """Kalibráció szimulálása: pumpánként több mérés, a pumpák párhuzamosan (max_active_pumps limittel)
+        
+        A timeout_ms mérésenként érvényes (mint a firmware pumpa timeout-ja); a
+        túllépő mérés leáll, CALIBRATION_TIMEOUT hibát jelez és kimarad a statisztikából.
+        Az eredmény egyetlen maintenance/complete üzenet, pumpánként az átlaggal,
+        szórásnégyzettel és az ajánlott calibration_factor értékkel.
+        """
+        start_time = self.clock.monotonic()
+        results = await asyncio.gather(*(self.profiled("calibrate_pump", self.calibrate_pump(pid, test_amount_ml, timeout_ms, trials, token)) for pid in pump_ids))
+        if token.cancelled:
+            return
+        
+        if apply:
+            for result in results:
+                if result["recommended_calibration_factor"] is not None:
+                    self.calibration_factors[result["pump_id"]] = result["recommended_calibration_factor"]
+        
+        # Publish completion (one batched message)
+        if pump_id == -1:
+            complete = {
+                "pump_id": -1,
+                "action_type": "calibration",
+                "test_amount_ml": test_amount_ml,
+                "trials": trials,
+                "timeout_ms": timeout_ms,
+                "applied": bool(apply),
+                "results": results,
+                "duration_ms": int((self.clock.monotonic() - start_time) * 1000),
+                "timestamp": self.clock.utc_timestamp()
+            }
+        else:
+            # Single pump: the original fields, extended with the trial statistics
+            result = results[0]
+            complete = {
+                "pump_id": pump_id,
+                "action_type": "calibration",
+                "test_amount_ml": test_amount_ml,
+                "actual_duration_ms": result["mean_duration_ms"],
+                "ml_per_second": result["ml_per_second"],
+                **{key: value for key, value in result.items() if key != "pump_id"},
+                "applied": bool(apply),
+                "timestamp": self.clock.utc_timestamp()
+            }
+        
+        self.publish_complete("maintenance/complete", complete, token)
+        for result in results:
+            self.log.info("Calibration complete: Pump %s, %s ml/s, mean %sml (variance %s), factor %s", result["pump_id"], result["ml_per_second"], result["mean_ml"], result["variance_ml"], result["recommended_calibration_factor"], category="calibration", pump_id=result["pump_id"])
+            
+    async def calibrate_pump(self, pump_id: int, test_amount_ml: float, timeout_ms: int, trials: int, token: CancelToken) -> Dict:
+        """Egy pumpa kalibrációs méréssorozata (pumpa slot foglalással) és statisztikája"""
+        measured = []
+        durations = []
+        timeouts = 0
+        
+        async with self.pump_budget:
+            for trial in range(trials):
+                # Stopped while waiting for a free pump slot or between trials
+                if token.cancelled:
+                    self.report_emergency_stop(token, pump_id)
+                    break
+                with self.pumps_running([pump_id], "calibrating", test_amount_ml):
+                    trial_result = await self.calibration_trial(pump_id, test_amount_ml, timeout_ms, token)
+                    if trial_result is None:
+                        self.report_emergency_stop(token, pump_id)
+                        break
+                
+                delivered_ml, duration_ms, timed_out = trial_result
+                if timed_out:
+                    timeouts += 1
+                    self.publish_error(pump_id, "CALIBRATION_TIMEOUT", f"Calibration trial {trial + 1} exceeded {timeout_ms}ms", "warning",
+                                       {"trial": trial + 1, "delivered_ml": round(delivered_ml, 2), "timeout_ms": timeout_ms}, token.command_id)
+                    continue
+                measured.append(delivered_ml)
+                durations.append(duration_ms)
+        
+        mean_ml = statistics.fmean(measured) if measured else None
+        mean_duration_ms = int(statistics.fmean(durations)) if durations else None
+        current_factor = self.calibration_factors.get(pump_id, 1.0)
+        return {
             "pump_id": pump_id,
-            "action_type": "calibration",
-            "test_amount_ml": test_amount_ml,
-            "actual_duration_ms": actual_duration_ms,
-            "ml_per_second": round(test_amount_ml / (actual_duration_ms / 1000.0), 2),
-            "timestamp": datetime.utcnow().isoformat() + "Z"
+            "trials": trials,
+            "completed_trials": len(measured),
+            "timed_out_trials": timeouts,
+            "measured_ml": [round(value, 2) for value in measured],
+            "mean_ml": round(mean_ml, 2) if measured else None,
+            "variance_ml": round(statistics.variance(measured), 4) if len(measured) > 1 else 0.0 if measured else None,
+            "mean_duration_ms": mean_duration_ms,
+            "ml_per_second": round(mean_ml / (mean_duration_ms / 1000.0), 2) if mean_duration_ms else None,
+            # Firmware convention: calibrationFactor = testAmountML / actualML (relative to the current factor)
+            "current_calibration_factor": current_factor,
+            "recommended_calibration_factor": round(current_factor * test_amount_ml / mean_ml, 4) if mean_ml else None,
         }
         
-        self.client.publish("intellivend/maintenance/complete", json.dumps(complete), qos=1)
-        print(f"[ESP32] Calibration complete: Pump {pump_id}, {complete['ml_per_second']} ml/s")
+    async def calibration_trial(self, pump_id: int, test_amount_ml: float, timeout_ms: int, token: CancelToken):
+        """Egy kalibrációs mérés: (kimért ml, időtartam ms, timeout volt-e), None ha megszakították"""
+        timeout_s = timeout_ms / 1000.0
+        
+        if self.physics is None:
+            # ~100ms per ml, measured volume within +/- 5% of the test amount
+            duration_ms = int(test_amount_ml * self.random.uniform(80, 120))
+            delivered_ml = test_amount_ml * self.random.uniform(0.95, 1.05)
+            timed_out = duration_ms > timeout_ms
+            if timed_out:
+                delivered_ml *= timeout_ms / duration_ms
+                duration_ms = timeout_ms
+            if await token.sleep(duration_ms / 1000.0):
+                return None
+            return delivered_ml, duration_ms, timed_out
+        
+        # Flow physics: the pump runs to the target pulse count, the delivered (true) volume is what the user measures
+        slot = self.physics.slot(self.physics_base, pump_id)
+        done = self.physics.start_pump(slot, test_amount_ml, self.calibration_factors.get(pump_id, 1.0))
+        cancelled = await token.sleep(timeout_s, until=done)
+        if not done.done():
+            self.physics.stop_pump(slot, done)
+        if cancelled:
+            return None
+        
+        result = done.result()
+        self.pump_state.progress(self.state_base, pump_id, result["measured_ml"])
+        return result["delivered_ml"], result["run_time_ms"], result["reason"] != TARGET_REACHED
         
-        self.pumps_active -= 1
-    
     def handle_emergency_stop(self, payload: Dict):
         """Emergency stop kezelése"""
+        received_at = time.perf_counter()
         reason = payload.get("reason", "Unknown")
-        print(f"[ESP32] EMERGENCY STOP: {reason}")
+        self.log.warning("EMERGENCY STOP: %s", reason, category="estop")
         
-        # Stop all operations
+        # Interrupt every in-flight operation; each one releases its own pumps
+        command_time = parse_timestamp(payload.get("timestamp"))
+        for token in list(self.operations):
+            token.cancel(reason, received_at, command_time)
+        
+        # Discard commands that have not started yet
         self.stop_event.set()
-        self.pumps_active = 0
+        dropped = self.drop_queued_jobs(reason)
+        if dropped:
+            self.log.warning("Discarded %d queued command(s)", dropped, category="estop")
+        if self.orders is not None:
+            cancelled = self.orders.clear()
+            for order in cancelled:
+                with recording(order.dedup):
+                    self.publish_order(order, CANCELLED, 0, 0)
+                self.count_order("cancelled")
+            if cancelled:
+                self.log.warning("Cancelled %d queued order(s)", len(cancelled), category="estop")
         
         # Publish error
         self.publish_error(0, "EMERGENCY_STOP", f"Emergency stop: {reason}", "critical")
         
-        # Reset after 2 seconds
-        time.sleep(2)
+        # Reset after 2 seconds (without blocking the event loop)
+        if self.estop_clear_task is not None:
+            self.estop_clear_task.cancel()
+        self.estop_clear_task = self.spawn(self.clear_emergency_stop(2.0))
+        
+    async def clear_emergency_stop(self, delay: float):
+        """Emergency stop feloldása a megadott idő után"""
+        await asyncio.sleep(delay)
         self.stop_event.clear()
-        print(f"[ESP32] Emergency stop cleared, ready for new commands")
-    
-    def publish_error(self, pump_id: int, error_code: str, message: str, severity: str):
-        """Hiba publikálása"""
+        self.log.info("Emergency stop cleared, ready for new commands", category="estop")
+        
+    def publish_complete(self, name: str, complete: Dict, token: CancelToken):
+        """Befejezés publikálása (QoS 1), a parancs azonosítójával, ha volt
+        
+        Folytatott adagolásnál a kért mennyiség az eredeti parancsé, a kiadagolt a restart
+        előtti és utáni együtt (resumed_ml: a restart előtt kiadagolt rész).
+        """
+        if token.carried and name == "dispense/complete":
+            carried_ml = sum(token.carried.values())
+            complete["requested_ml"] = round(sum(quantity_ml for _, quantity_ml in order_ingredients(token.payload)), 2)
+            complete["actual_ml"] = round(complete["actual_ml"] + carried_ml, 2)
+            complete["resumed_ml"] = round(carried_ml, 2)
+        if token.command_id is not None:
+            complete["command_id"] = token.command_id
+        self.publish(name, complete, qos=1)
+        record_reply(name, complete, 1)
+        
+    def publish_error(self, pump_id: int, error_code: str, message: str, severity: str, context: Optional[Dict] = None, command_id: Optional[str] = None):
+        """Hiba publikálása (context: további mezők a context objektumba)"""
         error = {
             "pump_id": pump_id,
             "error_code": error_code,
             "severity": severity,
             "message": message,
-            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "timestamp": self.clock.utc_timestamp(),
             "context": {
-                "uptime_ms": int((time.time() - self.uptime_start) * 1000),
+                "uptime_ms": int((self.clock.monotonic() - self.uptime_start) * 1000),
                 "pumps_active": self.pumps_active
             }
         }
+        if context:
+            error["context"].update(context)
+        if command_id is not None:
+            error["command_id"] = command_id
         
-        self.client.publish("intellivend/error", json.dumps(error), qos=1)
-        print(f"[ESP32] Error published: {error_code} - {message}")
-    
-    def heartbeat_loop(self):
-        """Heartbeat küldés 10 másodpercenként"""
-        while not self.stop_event.is_set():
+        self.publish("error", error, qos=1)
+        record_reply("error", error, 1)
+        self.pump_state.set_error(self.state_base, pump_id, error_code)
+        if self.metrics is not None:
+            self.metrics.errors.inc((error_code,))
+        self.log.warning("Error published: %s - %s", error_code, message, category="error", pump_id=pump_id, error_code=error_code, command_id=command_id)
+        
+    async def heartbeat_loop(self):
+        """Heartbeat küldés heartbeat_interval másodpercenként (emergency stop nem állítja le)
+        
+        Adaptív módban működő pumpák mellett heartbeat_active_interval a periódus, és
+        az első pumpa indulásakor azonnal megy egy heartbeat (a gyors periódus kezdete).
+        """
+        while True:
             if self.connected:
-                uptime_ms = int((time.time() - self.uptime_start) * 1000)
-                
-                # Simulate WiFi RSSI (-30 to -90 dBm)
-                wifi_rssi = random.randint(-90, -30)
-                
-                # Simulate heap memory (ESP32 has ~300KB free heap typically)
-                total_heap = 327680  # bytes
-                free_heap = random.randint(200000, 300000)
+                self.send_heartbeat()
+            
+            if self.heartbeat_active_interval is None:
+                await asyncio.sleep(self.heartbeat_interval)
+                continue
+            
+            self.pumps_started.clear()
+            try:
+                await asyncio.wait_for(self.pumps_started.wait(), self.current_heartbeat_interval())
+            except asyncio.TimeoutError:
+                pass
                 
-                heartbeat = {
-                    "uptime_ms": uptime_ms,
-                    "wifi_rssi": wifi_rssi,
-                    "free_heap": free_heap,
-                    "total_heap": total_heap,
-                    "pumps_active": self.pumps_active,
-                    "firmware_version": "MOCK_v1.0.0",
-                    "timestamp": datetime.utcnow().isoformat() + "Z"
+    def current_heartbeat_interval(self) -> float:
+        """Az aktuális heartbeat periódus (adaptív módban a pumpák állapotától függ)"""
+        if self.heartbeat_active_interval is not None and self.pumps_active:
+            return self.heartbeat_active_interval
+        return self.heartbeat_interval
+        
+    def publish_availability(self, state: str):
+        """Retained elérhetőség (online / offline) közvetlenül a kliensen; a Last Will ugyanezt a topicot használja"""
+        topic = self.topic("availability")
+        self.client.publish(topic, state, qos=1, retain=True)
+        if self.recorder is not None:
+            self.recorder.record(OUTBOUND, topic, state, 1, True)
+        if self.metrics is not None:
+            self.metrics.messages_published.inc(("availability",))
+        self.log.debug("Availability: %s", state, category="connection")
+        
+    def send_heartbeat(self):
+        """Egy heartbeat üzenet összeállítása és publikálása"""
+        uptime_ms = int((self.clock.monotonic() - self.uptime_start) * 1000)
+        
+        # Simulate WiFi RSSI (-30 to -90 dBm)
+        wifi_rssi = self.random.randint(-90, -30)
+        
+        # Simulate heap memory (ESP32 has ~300KB free heap typically)
+        total_heap = 327680  # bytes
+        free_heap = self.random.randint(200000, 300000)
+        
+        # One consistent copy of the pump table (lock-free, as any other reader would take it)
+        snapshot = self.state_snapshot()
+        
+        heartbeat = {
+            "uptime_ms": uptime_ms,
+            "wifi_rssi": wifi_rssi,
+            "free_heap": free_heap,
+            "total_heap": total_heap,
+            "pumps_active": snapshot["pumps_active"],
+            "firmware_version": "MOCK_v1.0.0",
+            "heartbeat_interval_ms": int(self.current_heartbeat_interval() * 1000),
+            "timestamp": self.clock.utc_timestamp()
+        }
+        if not self.reset_reported:
+            # First heartbeat after boot: why the device (re)started
+            heartbeat["reset_reason"] = self.reset_reason
+            heartbeat["boot_count"] = self.boot_count
+            self.reset_reported = True
+        
+        self.publish("heartbeat", heartbeat, qos=0, retain=False)
+        self.log.info("Heartbeat sent (uptime: %.0fs, WiFi: %ddBm)", uptime_ms / 1000, wifi_rssi, category="heartbeat")
+        
+    def max_operations(self) -> int:
+        """Egyszerre folyamatban lévő műveletek legnagyobb száma: worker-ek, futó rendelés és rendelés sor"""
+        return self.workers + (self.orders.depth + 1 if self.orders is not None else 0)
+        
+    def checkpoint_state(self) -> Dict:
+        """Az eszköz menthető állapota (state snapshot): uptime, kalibráció, futó műveletek
+        
+        A futó műveletek indulási sorrendben (azonos időnél command_id szerint) kerülnek
+        a pillanatképbe, így a visszaállítás determinisztikus sorrendben folytatja őket.
+        """
+        running = sorted((token for token in self.operations if token.payload is not None),
+                         key=lambda token: (token.started_at, token.command_id or ""))
+        operations = [{"kind": token.kind, "payload": token.payload, "poured": token.poured} for token in running]
+        if self.orders is not None:
+            # Orders waiting in the device queue are lost with the restart, as the running one
+            operations.extend({"kind": "order", "payload": order.payload, "poured": {}} for order in self.orders.waiting)
+        return {
+            "uptime_s": self.clock.monotonic() - self.uptime_start,
+            "boot_count": self.boot_count,
+            "calibration_factors": self.calibration_factors,
+            "operations": operations,
+        }
+        
+    def restore_snapshot(self, state: Dict, reason: str, policy: str):
+        """Állapot visszaállítása pillanatképből (induláskor, a kapcsolódás előtt)
+        
+        A megszakított műveletek a run_async indulásakor a policy szerint folytatódnak vagy hibával zárulnak.
+        """
+        self.uptime_start = self.clock.monotonic() - state["uptime_s"]
+        self.boot_count = state["boot_count"] + 1
+        self.reset_reason = reason
+        self.restart_policy = policy
+        self.calibration_factors.update(state["calibration_factors"])
+        self.interrupted_operations = state["operations"]
+        
+    def recover_operations(self):
+        """A restart előtt futó műveletek folytatása (resume) vagy DEVICE_RESTART hibával zárása (abort)
+        
+        Resume módban az adagolás a még ki nem adagolt mennyiséggel indul újra, az
+        öblítés és a kalibráció elölről. A hibák (QoS 1) a kapcsolódásig pufferben várnak.
+        """
+        handlers = {
+            "dispense": self.handle_dispense_command,
+            "order": self.handle_dispense_command,
+            "flush": self.handle_flush_command,
+            "calibration": self.handle_calibration_command,
+        }
+        for operation in self.interrupted_operations:
+            kind, payload = operation["kind"], operation["payload"]
+            poured = {int(pump_id): ml for pump_id, ml in operation["poured"].items()}
+            command_id = payload.get("command_id")
+            entry = None
+            if self.dedup is not None:
+                # A redelivery of the interrupted command is answered, not executed again
+                key = command_key(self.topic(COMMAND_TOPICS[kind]), payload)
+                entry = self.dedup.add(key) if key is not None else None
+            
+            if self.restart_policy == RESUME:
+                if kind in ("dispense", "order"):
+                    payload = remaining_dispense(payload, poured)
+                    if payload is None:
+                        continue
+                self.log.info("Resuming %s after restart (%.1fml poured)", kind, sum(poured.values()), category="restart", command_id=command_id)
+                self.dispatch(handlers[kind], payload, entry)
+            else:
+                context = {
+                    "operation": kind,
+                    "poured_ml": round(sum(poured.values()), 2),
+                    "reset_reason": self.reset_reason,
+                    "boot_count": self.boot_count,
                 }
+                with recording(entry):
+                    self.publish_error(payload.get("pump_id") or 0, "DEVICE_RESTART", f"{kind.capitalize()} interrupted by device restart", "critical", context, command_id)
+        self.interrupted_operations = []
+        
+    async def run_async(self):
+        """Kapcsolódás és kapcsolat fenntartása az aktuális event loop-on (megszakításig fut)"""
+        self.loop = asyncio.get_running_loop()
+        self.disconnected = asyncio.Event()
+        self.job_queue = asyncio.Queue(maxsize=self.queue_depth)
+        self.pump_budget = asyncio.Semaphore(self.max_active_pumps)
+        if self.loopback is None:
+            AsyncioHelper(self.loop, self.client)
+        
+        for _ in range(self.workers):
+            self.spawn(self.worker_loop())
+        
+        if self.orders is not None:
+            self.spawn(self.order_loop())
+        
+        if self.telemetry.batched:
+            self.spawn(self.telemetry.run())
+        
+        if self.link is not None and self.impairment.disconnect_interval:
+            self.spawn(self.link.run(self))
+        
+        if self.interrupted_operations:
+            self.recover_operations()
+        
+        try:
+            attempts = 0
+            while not self.shutting_down:
+                if attempts and self.metrics is not None:
+                    self.metrics.reconnects.inc()
+                attempts += 1
+                try:
+                    self.client.connect(self.broker, self.port, keepalive=120)
+                except OSError as e:
+                    if self.disconnected_at is None:
+                        self.disconnected_at = self.clock.monotonic()
+                    delay = self.backoff.next()
+                    self.log.warning("Connection error: %s, retrying in %.1fs", e, delay, category="connection")
+                    await asyncio.sleep(delay)
+                    continue
                 
-                self.client.publish("intellivend/heartbeat", json.dumps(heartbeat), qos=0, retain=False)
-                print(f"[ESP32] Heartbeat sent (uptime: {uptime_ms/1000:.0f}s, WiFi: {wifi_rssi}dBm)")
+                await self.disconnected.wait()
+                self.disconnected.clear()
+                
+                if not self.shutting_down:
+                    # Exponential backoff with jitter: a fleet-wide drop does not reconnect in lockstep
+                    delay = self.backoff.next()
+                    self.log.info("Reconnecting in %.1fs (%d message(s) buffered)", delay, len(self.offline_buffer), category="connection")
+                    await asyncio.sleep(delay)
+        finally:
+            await self.shutdown()
             
-            time.sleep(10)
-    
-    def run(self):
-        """Mock client futtatása"""
-        print("=" * 60)
-        print("IntelliVend ESP32 Mock Client")
-        print("=" * 60)
-        print(f"Broker: {self.broker}:{self.port}")
+    async def shutdown(self):
+        """Futó szimulációk leállítása és bontás"""
+        self.shutting_down = True
+        
+        for task in list(self.tasks):
+            task.cancel()
+        
+        if self.telemetry.batched:
+            self.telemetry.flush()
+            stats = self.telemetry.summary()
+            self.log.info("Telemetry (%s): %d frames, %d pump entries, %d suppressed, %d bytes", stats["mode"], stats["frames"], stats["entries"], stats["suppressed"], stats["bytes"], category="telemetry", **stats)
+        
+        if self.connected:
+            # A clean disconnect discards the Last Will: report offline explicitly
+            self.publish_availability(AVAILABILITY_OFFLINE)
+            self.client.disconnect()
+            try:
+                await asyncio.wait_for(self.disconnected.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+                
+    def run(self, duration: Optional[float] = None, embedded_broker: Optional[MQTTBroker] = None, metrics_server: Optional[MetricsServer] = None, soak: Optional[SoakTest] = None, snapshot: Optional[SnapshotStore] = None):
+        """Mock client futtatása
+        
+        Args:
+            duration: Futási idő szimulált másodpercben (None = megszakításig)
+            embedded_broker: A futás idejére elindítandó beágyazott broker (opcionális)
+            metrics_server: A futás idejére elindítandó /metrics HTTP végpont (opcionális)
+            soak: Soak teszt, amely a futást felügyeli és leállítja (opcionális)
+            snapshot: Állapot pillanatkép, amit a futás alatt időszakosan és leálláskor ment (opcionális)
+        """
+        identity = []
         if self.username:
-            print(f"Username: {self.username}")
-            print(f"Password: {'*' * len(self.password) if self.password else 'None'}")
-        print(f"Error rate: {self.error_rate * 100:.1f}%")
-        print("=" * 60)
-        print()
+            identity.append(f"Username: {self.username}")
+            identity.append(f"Password: {'*' * len(self.password) if self.password else 'None'}")
+        print_banner("IntelliVend ESP32 Mock Client", mock_banner(self, identity, embedded_broker, metrics_server, soak, snapshot))
         
         try:
-            self.client.connect(self.broker, self.port, keepalive=120)
-            self.client.loop_forever()
+            main = self.run_async() if soak is None else soak.supervise(self.run_async())
+            self.clock.run(run_with_services(main, embedded_broker, metrics_server, self.physics, self.profiler, snapshot), duration)
         except KeyboardInterrupt:
             print("\n\n[ESP32] Shutting down...")
-            self.stop_event.set()
-            self.client.disconnect()
             print("[ESP32] Goodbye!")
         except Exception as e:
-            print(f"[ESP32] Fatal error: {e}")
+            self.log.error("Fatal error: %s", e)
+
+class ESP32Fleet:
+    """Több szimulált ESP32 eszköz futtatása egyetlen asyncio event loop-on"""
+    
+    def __init__(self, devices: int, device_prefix: str = "ESP32_MOCK", clock: Optional[SimClock] = None, first_index: int = 1, **device_options):
+        """
+        Args:
+            devices: Szimulált eszközök száma
+            device_prefix: Eszköz azonosító prefix (pl. ESP32_MOCK -> ESP32_MOCK_001)
+            first_index: Az első eszköz sorszáma (több folyamatos futásnál a shard eleje)
+            clock: Közös szimulációs óra (None = valós idő)
+            device_options: Minden eszköznek átadott ESP32Mock paraméterek (broker, port, seed, ...)
+        """
+        self.clock = clock or SimClock()
+        self.log = DeviceLogger("[FLEET]")
+        
+        # One state table for the whole fleet (contiguous arrays, constant size per pump)
+        self.pump_state = device_options.pop("pump_state", None) or PumpStateTable(self.clock)
+        
+        self.devices = [
+            ESP32Mock(device_id=f"{device_prefix}_{index:03d}", clock=self.clock, pump_state=self.pump_state, **device_options)
+            for index in range(first_index, first_index + devices)
+        ]
+        
+        # Shared settings (for the banner)
+        first = self.devices[0]
+        self.broker = first.broker
+        self.port = first.port
+        self.loopback = first.loopback
+        self.physics = first.physics
+        self.impairment = first.impairment
+        self.profiler = first.profiler
+        self.orders = first.orders
+        self.dedup = first.dedup
+        self.heartbeat_interval = first.heartbeat_interval
+        self.heartbeat_active_interval = first.heartbeat_active_interval
+        self.username = first.username
+        self.error_rate = first.error_rate
+        
+    async def run_async(self):
+        """Összes eszköz indítása (lépcsőzetes kapcsolódással)"""
+        tasks = []
+        try:
+            for device in self.devices:
+                tasks.append(asyncio.create_task(device.run_async()))
+                await asyncio.sleep(FLEET_CONNECT_INTERVAL)
+            
+            self.log.info("%d devices started", len(self.devices))
+            if self.impairment is not None and self.impairment.storm_interval:
+                tasks.append(asyncio.create_task(self.reconnect_storm_loop()))
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            
+    async def reconnect_storm_loop(self):
+        """Fleet szintű kapcsolatvesztés storm_interval szimulált másodpercenként (minden eszköz egyszerre)"""
+        while True:
+            await asyncio.sleep(self.impairment.storm_interval)
+            connected = [device for device in self.devices if device.connected]
+            self.log.warning("Reconnect storm: dropping %d connections", len(connected), category="connection")
+            for device in connected:
+                device.force_disconnect("reconnect storm")
+                
+    def run(self, duration: Optional[float] = None, embedded_broker: Optional[MQTTBroker] = None, metrics_server: Optional[MetricsServer] = None, soak: Optional[SoakTest] = None, snapshot: Optional[SnapshotStore] = None):
+        """Fleet futtatása
+        
+        Args:
+            duration: Futási idő szimulált másodpercben (None = megszakításig)
+            embedded_broker: A futás idejére elindítandó beágyazott broker (opcionális)
+            metrics_server: A futás idejére elindítandó /metrics HTTP végpont (opcionális)
+            soak: Soak teszt, amely a futást felügyeli és leállítja (opcionális)
+            snapshot: Állapot pillanatkép, amit a futás alatt időszakosan és leálláskor ment (opcionális)
+        """
+        identity = [f"Username: {self.username}"] if self.username else []
+        identity.append(f"Devices: {len(self.devices)} ({self.devices[0].client_id} ... {self.devices[-1].client_id})")
+        identity.append("Topics: intellivend/<device>/...")
+        print_banner("IntelliVend ESP32 Mock Fleet", mock_banner(self, identity, embedded_broker, metrics_server, soak, snapshot))
+        
+        try:
+            main = self.run_async() if soak is None else soak.supervise(self.run_async())
+            self.clock.run(run_with_services(main, embedded_broker, metrics_server, self.physics, self.profiler, snapshot), duration)
+        except KeyboardInterrupt:
+            print("\n\n[FLEET] Shutting down...")
+            print("[FLEET] Goodbye!")
+        except Exception as e:
+            self.log.error("Fatal error: %s", e)
+
+async def run_with_services(coro, *services):
+    """Coroutine futtatása, előtte a szolgáltatások (beágyazott broker, metrics végpont, flow physics, pillanatkép; None = kihagyva) elindítása ugyanazon az event loop-on"""
+    started = []
+    try:
+        for service in services:
+            if service is not None:
+                await service.start()
+                started.append(service)
+        return await coro
+    finally:
+        for service in reversed(started):
+            await service.stop()
+
+def print_banner(title: str, lines: list):
+    """Indítási banner: cím és a beállítások sorai"""
+    print("=" * 60)
+    print(title)
+    print("=" * 60)
+    for line in lines:
+        print(line)
+    print("=" * 60)
+    print()
+
+def mock_banner(mock, identity: list, embedded_broker: Optional[MQTTBroker], metrics_server: Optional[MetricsServer], soak: Optional[SoakTest], snapshot: Optional[SnapshotStore]) -> list:
+    """Banner sorok egy eszközhöz vagy fleet-hez (mock: ESP32Mock vagy ESP32Fleet, identity: a broker utáni sorok)"""
+    lines = [f"Broker: {describe_broker(mock.broker, mock.port, mock.loopback, embedded_broker)}", *identity]
+    lines += describe_settings(mock.error_rate, mock.clock, mock.heartbeat_interval, mock.heartbeat_active_interval,
+                               mock.orders.depth if mock.orders is not None else 0, mock.dedup)
+    if metrics_server is not None:
+        lines.append(f"Metrics: {describe_metrics(metrics_server)}")
+    if mock.physics is not None:
+        lines.append(f"Flow physics: {mock.physics.summary()['backend']} ({mock.physics.flow_rate_ml_s:g}ml/s nominal, {mock.physics.bottle_ml:g}ml bottles)")
+    if mock.impairment is not None:
+        lines.append(f"Link impairment: {mock.impairment.describe()}")
+    if mock.profiler is not None:
+        lines.append(f"Profiling: {mock.profiler.describe()}")
+    if snapshot is not None:
+        lines.append(f"State snapshot: {snapshot.describe()}")
+    if soak is not None:
+        lines.append(f"Soak test: {soak.describe()}")
+    return lines
+
+def describe_settings(error_rate: float, clock: SimClock, heartbeat_interval: float, heartbeat_active_interval: Optional[float], order_queue: int, dedup: Optional[CommandDedup]) -> list:
+    """Minden futási módban (egy eszköz, fleet, több folyamat) kiírt beállítások sorai"""
+    lines = [
+        f"Error rate: {error_rate * 100:.1f}%",
+        f"Clock: {describe_clock(clock)}",
+        f"Heartbeat: {describe_heartbeat(heartbeat_interval, heartbeat_active_interval)}",
+    ]
+    if order_queue:
+        lines.append(f"Order queue: {order_queue} waiting per device (dispense/queue updates)")
+    if dedup is not None:
+        lines.append(f"Command dedup: {dedup.describe()}")
+    return lines
+
+def describe_metrics(metrics_server: MetricsServer) -> str:
+    """/metrics végpont leírása a banner számára"""
+    return f"http://{metrics_server.host}:{metrics_server.port}/metrics"
+
+def describe_broker(host: str, port: int, loopback: Optional[MQTTBroker], embedded_broker: Optional[MQTTBroker]) -> str:
+    """Broker leírása a banner számára"""
+    if loopback is not None:
+        if embedded_broker is not None:
+            return f"in-process loopback (TCP listener: {embedded_broker.host}:{embedded_broker.port})"
+        return "in-process loopback (no TCP listener)"
+    if embedded_broker is not None:
+        return f"embedded {host}:{port}"
+    return f"{host}:{port}"
+
+def describe_clock(clock: SimClock) -> str:
+    """Óra mód leírása a banner számára"""
+    if clock.virtual:
+        return "virtual (discrete-event)"
+    if clock.time_scale != 1.0:
+        return f"accelerated ({clock.time_scale:g}x)"
+    return "real-time"
+
+def describe_heartbeat(interval: float, active_interval: Optional[float]) -> str:
+    """Heartbeat és elérhetőség leírása a banner számára"""
+    if active_interval is None:
+        heartbeat = f"every {interval:g}s"
+    else:
+        heartbeat = f"every {interval:g}s idle, {active_interval:g}s while pumping"
+    return f"{heartbeat}, presence on .../availability (retained birth + Last Will)"
 
 def main():
     """CLI entry point"""
@@ -545,6 +1931,60 @@ Példák:
   
   # 10% hiba generálás teszteléshez
   python3 esp32_mock.py --error-rate 0.1
+  
+  # 500 eszközös fleet (intellivend/ESP32_MOCK_001/... topicok)
+  python3 esp32_mock.py --devices 500
+  
+  # 100x gyorsított idő, reprodukálható véletlen számokkal
+  python3 esp32_mock.py --time-scale 100 --seed 42
+  
+  # Virtuális idő (csak folyamaton belüli brokerrel): 1 óra szimulált forgalom, fix kezdő időponttal
+  python3 esp32_mock.py --loopback --virtual-time --duration 3600 --seed 42 --start-time 2025-01-01T18:00:00
+  
+  # Kötegelt, bináris status telemetria (eszközönként egy frame tick-enként)
+  python3 esp32_mock.py --devices 100 --telemetry struct --telemetry-delta-ml 1.0
+  
+  # Beágyazott broker: a backend és a terhelés generátor a 127.0.0.1:1883 címre kapcsolódik
+  python3 esp32_mock.py --embedded-broker --devices 100
+  
+  # Loopback: az eszközök TCP nélkül kapcsolódnak, a broker továbbra is elérhető TCP-n
+  python3 esp32_mock.py --embedded-broker --loopback --devices 1000
+  
+  # Prometheus metrikák: http://127.0.0.1:9108/metrics
+  python3 esp32_mock.py --devices 100 --metrics-port 9108
+  
+  # Flow fizika: pumpánkénti hozam görbe, priming, átfolyásmérő impulzusok, drift, palack fogyás
+  python3 esp32_mock.py --devices 100 --flow-physics --bottle-ml 700
+  
+  # 2000 eszköz 8 folyamatban (minden folyamat saját MQTT kapcsolatokkal), összesített metrikák
+  python3 esp32_mock.py --devices 2000 --processes 8 --broker 127.0.0.1 --metrics-port 9108
+  
+  # Gyenge Wi-Fi: 80+0-40ms késleltetés, 2% status vesztés, bontás ~5 percenként, 10 percenként storm
+  python3 esp32_mock.py --devices 100 --link-latency-ms 80 --link-jitter-ms 40 --link-drop-rate 0.02 \\
+      --disconnect-interval 300 --reconnect-storm 600
+  
+  # Ritka heartbeat üresjáratban (60s), gyakori adagolás közben (1s); offline: Last Will az availability topicon
+  python3 esp32_mock.py --devices 100 --heartbeat-interval 60 --heartbeat-active-interval 1
+  
+  # Rendelés sor: eszközönként max. 5 várakozó rendelés, pozíció és ETA a dispense/queue topicon
+  python3 esp32_mock.py --devices 20 --order-queue 5
+  
+  # Ismételt kézbesítés szűrése: eszközönként 2048 parancs 15 percig (command_id vagy payload hash)
+  python3 esp32_mock.py --devices 100 --link-duplicate-rate 0.05 --dedup-size 2048 --dedup-ttl 900
+  
+  # Profilozás: handlerenkénti cProfile + 30s-onkénti tracemalloc snapshot, futás közben kapcsolható
+  python3 esp32_mock.py --devices 200 --profile-paused --profile-memory 30
+  mosquitto_pub -t intellivend/mock/profile -m '{"enabled": true}'
+  
+  # 24 órás soak teszt: vegyes forgalom, erőforrás drift esetén FAIL riport és 1-es kilépési kód
+  python3 esp32_mock.py --embedded-broker --devices 20 --soak 24h --soak-report soak.json
+  
+  # Meleg újraindítás: állapot mentése 5s-onként, újraindításkor a félbeszakadt adagolások folytatódnak
+  python3 esp32_mock.py --devices 500 --flow-physics --snapshot fleet.ivsnap --restart-policy resume
+  
+  # Forgalom rögzítése, majd visszajátszása 10x sebességgel (mqtt_recorder.py)
+  python3 esp32_mock.py --devices 50 --record session.ivrec
+  python3 mqtt_recorder.py replay session.ivrec --speed 10
         """
     )
     
@@ -573,6 +2013,24 @@ Példák:
         help="MQTT password (opcionális)"
     )
     
+    parser.add_argument(
+        "--embedded-broker",
+        action="store_true",
+        help="Beágyazott MQTT broker indítása (--listen-host:--port), a mock ehhez kapcsolódik"
+    )
+    
+    parser.add_argument(
+        "--listen-host",
+        default="127.0.0.1",
+        help="A beágyazott broker listen címe (default: 127.0.0.1)"
+    )
+    
+    parser.add_argument(
+        "--loopback",
+        action="store_true",
+        help="Az eszközök TCP nélkül, folyamaton belül kapcsolódnak a beágyazott brokerhez"
+    )
+    
     parser.add_argument(
         "--error-rate",
         type=float,
@@ -580,6 +2038,328 @@ Példák:
         help="Hibák generálásának valószínűsége 0.0-1.0 (default: 0.0)"
     )
     
+    parser.add_argument(
+        "--devices",
+        type=int,
+        default=1,
+        help="Szimulált eszközök száma; 1 felett fleet mód eszközönkénti topicokkal (default: 1)"
+    )
+    
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Worker folyamatok száma fleet módban, az eszközök szétosztva; 0 = CPU magok száma (default: 1)"
+    )
+    
+    parser.add_argument(
+        "--device-prefix",
+        default="ESP32_MOCK",
+        help="Eszköz azonosító prefix fleet módban (default: ESP32_MOCK)"
+    )
+    
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Parancs végrehajtó workerek száma eszközönként (default: {DEFAULT_WORKERS})"
+    )
+    
+    parser.add_argument(
+        "--queue-depth",
+        type=int,
+        default=DEFAULT_QUEUE_DEPTH,
+        help=f"Várakozó parancsok max. száma eszközönként, felette BUSY hiba (default: {DEFAULT_QUEUE_DEPTH})"
+    )
+    
+    parser.add_argument(
+        "--concurrent-recipes",
+        action="store_true",
+        help="Receptek nem rétegzett összetevőinek párhuzamos adagolása (az order mező precedencia)"
+    )
+    
+    parser.add_argument(
+        "--max-active-pumps",
+        type=int,
+        default=DEFAULT_MAX_ACTIVE_PUMPS,
+        help=f"Egyszerre működő pumpák max. száma párhuzamos módban (default: {DEFAULT_MAX_ACTIVE_PUMPS})"
+    )
+    
+    parser.add_argument(
+        "--order-queue",
+        type=int,
+        default=0,
+        help="Eszközönkénti rendelés sor: ennyi recept várakozhat az éppen adagoló mögött, felette BUSY hiba; pozíció és ETA a dispense/queue topicon (default: 0 = nincs sor)"
+    )
+    
+    parser.add_argument(
+        "--dedup-size",
+        type=int,
+        default=DEFAULT_DEDUP_SIZE,
+        help=f"Eszközönként megjegyzett parancsok száma (command_id vagy payload hash); ismételt kézbesítés nem fut újra (default: {DEFAULT_DEDUP_SIZE}, 0 = kikapcsolva)"
+    )
+    
+    parser.add_argument(
+        "--dedup-ttl",
+        type=float,
+        default=DEFAULT_DEDUP_TTL,
+        help=f"Parancs megjegyzésének ideje szimulált másodpercben (default: {DEFAULT_DEDUP_TTL:g})"
+    )
+    
+    parser.add_argument(
+        "--heartbeat-interval",
+        type=float,
+        default=DEFAULT_HEARTBEAT_INTERVAL,
+        help=f"Heartbeat periódus szimulált másodpercben, adaptív módban üresjáratban (default: {DEFAULT_HEARTBEAT_INTERVAL:g})"
+    )
+    
+    parser.add_argument(
+        "--heartbeat-active-interval",
+        type=float,
+        default=None,
+        help="Adaptív heartbeat: periódus működő pumpák mellett (pl. 1), üresjáratban --heartbeat-interval (default: kikapcsolva)"
+    )
+    
+    parser.add_argument(
+        "--telemetry",
+        choices=TELEMETRY_MODES,
+        default="legacy",
+        help="Status mód: legacy (pumpánkénti JSON az intellivend/status topicra), vagy kötegelt json / msgpack / struct frame a .../status/batch topicra (default: legacy)"
+    )
+    
+    parser.add_argument(
+        "--telemetry-interval",
+        type=float,
+        default=0.5,
+        help="Kötegelt status frame-ek közötti idő másodpercben (default: 0.5)"
+    )
+    
+    parser.add_argument(
+        "--telemetry-delta-ml",
+        type=float,
+        default=0.0,
+        help="Kötegelt módban ennél kisebb progress változás (ml) nem kerül újraküldésre (default: 0.0)"
+    )
+    
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Csak figyelmeztetések és hibák a konzolon"
+    )
+    
+    verbosity.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Részletes kimenet (fogadott payloadok, status tick-ek, feliratkozások)"
+    )
+    
+    parser.add_argument(
+        "--log-file",
+        default=None,
+        help="Strukturált napló fájl (JSON-lines), a konzol szinttől függetlenül legalább INFO"
+    )
+    
+    parser.add_argument(
+        "--log-sample",
+        default="",
+        help="Kategóriánkénti mintavételezés, pl. status=100,heartbeat=10 (minden N. üzenet)"
+    )
+    
+    parser.add_argument(
+        "--flow-physics",
+        action="store_true",
+        help="Flow fizika motor (pumpa hozam görbe, priming, impulzusok, kalibráció drift, palack fogyás; NumPy-jal vektorizált)"
+    )
+    
+    parser.add_argument(
+        "--bottle-ml",
+        type=float,
+        default=DEFAULT_BOTTLE_ML,
+        help=f"Palack térfogat flow fizika módban, kiürülés után PUMP_TIMEOUT és csere (default: {DEFAULT_BOTTLE_ML:g})"
+    )
+    
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Prometheus /metrics HTTP végpont portja (default: kikapcsolva)"
+    )
+    
+    parser.add_argument(
+        "--metrics-host",
+        default="127.0.0.1",
+        help="A /metrics végpont listen címe (default: 127.0.0.1)"
+    )
+    
+    parser.add_argument(
+        "--record",
+        default=None,
+        help="Fogadott és publikált üzenetek rögzítése bináris naplóba (visszajátszás: mqtt_recorder.py replay)"
+    )
+    
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Handlerenkénti cProfile profilozás (collapsed-stack fájl és összesítő leállításkor)"
+    )
+    
+    parser.add_argument(
+        "--profile-paused",
+        action="store_true",
+        help="Profiler telepítése kikapcsolva; az intellivend/mock/profile topicon kapcsolható be"
+    )
+    
+    parser.add_argument(
+        "--profile-memory",
+        type=float,
+        default=None,
+        help="tracemalloc snapshot N szimulált másodpercenként, eszközönkénti foglalással (default: kikapcsolva)"
+    )
+    
+    parser.add_argument(
+        "--profile-output",
+        default="mock_profile",
+        help="Profil kimeneti fájlok előtagja: <prefix>.collapsed, <prefix>.txt (default: mock_profile)"
+    )
+    
+    parser.add_argument(
+        "--link-latency-ms",
+        type=float,
+        default=0.0,
+        help="Hálózati késleltetés irányonként, szimulált ms (default: 0)"
+    )
+    
+    parser.add_argument(
+        "--link-jitter-ms",
+        type=float,
+        default=0.0,
+        help="Véletlen többlet késleltetés 0..N ms, a sorrend megmarad (default: 0)"
+    )
+    
+    parser.add_argument(
+        "--link-drop-rate",
+        type=float,
+        default=0.0,
+        help="QoS 0 üzenetek (status, heartbeat) eldobásának valószínűsége 0.0-1.0 (default: 0.0)"
+    )
+    
+    parser.add_argument(
+        "--link-duplicate-rate",
+        type=float,
+        default=0.0,
+        help="Üzenetek duplikálásának valószínűsége mindkét irányban 0.0-1.0 (default: 0.0)"
+    )
+    
+    parser.add_argument(
+        "--disconnect-interval",
+        type=float,
+        default=None,
+        help="Eszközönkénti kényszerített kapcsolatbontás átlagosan N szimulált másodpercenként (default: kikapcsolva)"
+    )
+    
+    parser.add_argument(
+        "--reconnect-storm",
+        type=float,
+        default=None,
+        help="Minden eszköz kapcsolatának egyidejű bontása N szimulált másodpercenként (default: kikapcsolva)"
+    )
+    
+    parser.add_argument(
+        "--soak",
+        default=None,
+        metavar="DURATION",
+        help="Soak teszt: folyamatos vegyes forgalom DURATION ideig (pl. 3600, 30m, 24h), drift esetén FAIL (default: kikapcsolva)"
+    )
+    
+    parser.add_argument(
+        "--soak-rate",
+        type=float,
+        default=DEFAULT_SOAK_RATE,
+        help=f"Soak forgalom: parancsok / szimulált másodperc a teljes fleet-re (default: {DEFAULT_SOAK_RATE:g})"
+    )
+    
+    parser.add_argument(
+        "--soak-interval",
+        type=float,
+        default=DEFAULT_SOAK_INTERVAL,
+        help=f"Soak mintavételezés periódusa szimulált másodpercben (default: {DEFAULT_SOAK_INTERVAL:g})"
+    )
+    
+    parser.add_argument(
+        "--soak-rss-growth",
+        type=float,
+        default=DEFAULT_RSS_GROWTH,
+        help=f"Megengedett RSS növekedés a bemelegedési alapértékhez képest, %% (default: {DEFAULT_RSS_GROWTH:g})"
+    )
+    
+    parser.add_argument(
+        "--soak-rate-tolerance",
+        type=float,
+        default=DEFAULT_RATE_TOLERANCE,
+        help=f"Megengedett relatív eltérés az üzenet ráta alapértékétől a darabszám zaján felül (default: {DEFAULT_RATE_TOLERANCE:g})"
+    )
+    
+    parser.add_argument(
+        "--soak-report",
+        default=None,
+        help="Soak riport JSON fájlba (minták, alapértékek, hibák)"
+    )
+    
+    parser.add_argument(
+        "--snapshot",
+        default=None,
+        help="Állapot pillanatkép fájl (mmap): induláskor visszaállít belőle, futás közben időszakosan ment (default: kikapcsolva)"
+    )
+    
+    parser.add_argument(
+        "--snapshot-interval",
+        type=float,
+        default=DEFAULT_SNAPSHOT_INTERVAL,
+        help=f"Pillanatképek közötti idő szimulált másodpercben (default: {DEFAULT_SNAPSHOT_INTERVAL:g})"
+    )
+    
+    parser.add_argument(
+        "--restart-policy",
+        choices=RESTART_POLICIES,
+        default=ABORT,
+        help="Újraindításkor megszakadt műveletek: abort = DEVICE_RESTART hiba, resume = folytatás a hátralévő mennyiséggel (default: abort)"
+    )
+    
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=1.0,
+        help="Szimulált idő gyorsítása, pl. 100 = 100x gyorsabb (default: 1.0)"
+    )
+    
+    parser.add_argument(
+        "--virtual-time",
+        action="store_true",
+        help="Discrete-event mód: az óra várakozás nélkül a következő eseményre ugrik; csak --loopback vagy "
+             "--embedded-broker mellett (külső broker esetén 1ms csend után előreugrana), reprodukálható futás csak --loopback-kel"
+    )
+    
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Véletlenszám seed a reprodukálható futásokhoz (opcionális)"
+    )
+    
+    parser.add_argument(
+        "--start-time",
+        default=None,
+        help="Szimuláció kezdő időpontja ISO formátumban, UTC (default: most)"
+    )
+    
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=None,
+        help="Futási idő szimulált másodpercben (default: megszakításig)"
+    )
+    
     args = parser.parse_args()
     
     # Validate error rate
@@ -587,17 +2367,331 @@ Példák:
         print("Error rate must be between 0.0 and 1.0")
         return 1
     
-    # Create and run mock client
-    mock = ESP32Mock(
+    if args.devices < 1:
+        print("Device count must be at least 1")
+        return 1
+    
+    if args.processes < 0:
+        print("Process count must not be negative")
+        return 1
+    
+    if args.processes == 0:
+        args.processes = os.cpu_count() or 1
+    
+    if args.virtual_time and not (args.loopback or args.embedded_broker):
+        print("--virtual-time needs an in-process broker (--loopback or --embedded-broker): with an external broker "
+              "the clock would jump ahead during network round trips")
+        return 1
+    
+    if args.processes > 1 and (args.loopback or args.virtual_time):
+        print("--processes cannot be combined with --loopback or --virtual-time (both need a single event loop)")
+        return 1
+    
+    if args.workers < 1 or args.queue_depth < 1:
+        print("Workers and queue depth must be at least 1")
+        return 1
+    
+    if args.max_active_pumps < 1:
+        print("Max active pumps must be at least 1")
+        return 1
+    
+    if args.order_queue < 0:
+        print("Order queue depth cannot be negative")
+        return 1
+    
+    if args.dedup_size < 0 or args.dedup_ttl <= 0:
+        print("Dedup cache size cannot be negative and its TTL must be positive")
+        return 1
+    
+    if args.heartbeat_interval <= 0 or (args.heartbeat_active_interval is not None and args.heartbeat_active_interval <= 0):
+        print("Heartbeat intervals must be positive")
+        return 1
+    
+    if args.time_scale <= 0:
+        print("Time scale must be positive")
+        return 1
+    
+    if not telemetry_available(args.telemetry):
+        print("MessagePack telemetry requires the msgpack package (pip install msgpack)")
+        return 1
+    
+    if args.telemetry_interval <= 0:
+        print("Telemetry interval must be positive")
+        return 1
+    
+    if args.bottle_ml <= 0:
+        print("Bottle volume must be positive")
+        return 1
+    
+    if not 0.0 <= args.link_drop_rate <= 1.0 or not 0.0 <= args.link_duplicate_rate <= 1.0:
+        print("Link drop and duplicate rates must be between 0.0 and 1.0")
+        return 1
+    
+    if args.link_latency_ms < 0 or args.link_jitter_ms < 0:
+        print("Link latency and jitter must not be negative")
+        return 1
+    
+    if any(interval is not None and interval <= 0 for interval in (args.disconnect_interval, args.reconnect_storm)):
+        print("Disconnect and reconnect storm intervals must be positive")
+        return 1
+    
+    if args.profile_memory is not None and args.profile_memory <= 0:
+        print("Memory profile interval must be positive")
+        return 1
+    
+    if args.soak is not None:
+        try:
+            args.soak = parse_duration(args.soak)
+        except ValueError as e:
+            print(e)
+            return 1
+        if args.soak <= 0 or args.soak_rate <= 0 or args.soak_interval <= 0:
+            print("Soak duration, rate and interval must be positive")
+            return 1
+        if args.processes > 1:
+            print("--soak cannot be combined with --processes (resources are sampled in one process)")
+            return 1
+    
+    if args.snapshot_interval <= 0:
+        print("Snapshot interval must be positive")
+        return 1
+    
+    if args.metrics_port is not None and not 1 <= args.metrics_port <= 65535:
+        print("Metrics port must be between 1 and 65535")
+        return 1
+    
+    try:
+        parse_sampling(args.log_sample)
+    except ValueError as e:
+        print(e)
+        return 1
+    
+    start_time = None
+    if args.start_time is not None:
+        try:
+            start_time = datetime.fromisoformat(args.start_time.rstrip("Z")).replace(tzinfo=timezone.utc).timestamp()
+        except ValueError:
+            print(f"Invalid start time: {args.start_time}")
+            return 1
+    
+    clock = SimClock(time_scale=args.time_scale, virtual=args.virtual_time, start_time=start_time)
+    
+    # Background logging (flushed on exit)
+    listener = start_logging(args, args.log_file)
+    try:
+        if args.processes > 1 and args.devices > 1:
+            return run_sharded(args, clock)
+        return run_mock(args, clock)
+    finally:
+        listener.stop()
+
+def start_logging(args, log_file: Optional[str]):
+    """Háttérszálas naplózás a CLI szint kapcsolókkal (a listener-t kilépéskor le kell állítani)"""
+    level = logging.WARNING if args.quiet else logging.DEBUG if args.verbose else logging.INFO
+    return setup_logging(level, log_file, min(logging.INFO, level), parse_sampling(args.log_sample))
+
+def build_device_options(args, clock: SimClock, loopback: Optional[MQTTBroker], metrics: Optional[MockMetrics], recorder: Optional[TrafficRecorder], physics: Optional[FlowPhysics], profiler: Optional[MockProfiler] = None) -> Dict:
+    """Az egyedi mock és minden fleet eszköz közös ESP32Mock paraméterei"""
+    return dict(
         broker=args.broker,
         port=args.port,
         username=args.username,
         password=args.password,
-        error_rate=args.error_rate
+        error_rate=args.error_rate,
+        clock=clock,
+        seed=args.seed,
+        workers=args.workers,
+        queue_depth=args.queue_depth,
+        concurrent_recipes=args.concurrent_recipes,
+        max_active_pumps=args.max_active_pumps,
+        order_queue=args.order_queue,
+        dedup_size=args.dedup_size,
+        dedup_ttl=args.dedup_ttl,
+        heartbeat_interval=args.heartbeat_interval,
+        heartbeat_active_interval=args.heartbeat_active_interval,
+        loopback=loopback,
+        telemetry=args.telemetry,
+        telemetry_interval=args.telemetry_interval,
+        telemetry_delta_ml=args.telemetry_delta_ml,
+        metrics=metrics,
+        recorder=recorder,
+        physics=physics,
+        impairment=build_impairment(args),
+        profiler=profiler
     )
+
+def build_profiler(args, output_prefix: str) -> Optional[MockProfiler]:
+    """Profiler a CLI kapcsolókból (None, ha egyik --profile kapcsoló sincs megadva)"""
+    if not (args.profile or args.profile_paused or args.profile_memory):
+        return None
+    return MockProfiler(output_prefix, enabled=args.profile, memory_interval=args.profile_memory)
+
+def build_impairment(args) -> Optional[LinkImpairment]:
+    """Hálózati zavar beállítások a CLI kapcsolókból (None, ha nincs megadva)"""
+    impairment = LinkImpairment(args.link_latency_ms, args.link_jitter_ms, args.link_drop_rate, args.link_duplicate_rate,
+                                args.disconnect_interval, args.reconnect_storm)
+    if impairment.shapes_traffic or impairment.disconnect_interval or impairment.storm_interval:
+        return impairment
+    return None
+
+def build_soak(args, devices: list, clock: SimClock, metrics: MockMetrics, loopback: Optional[MQTTBroker]) -> Optional[SoakTest]:
+    """Soak teszt a CLI kapcsolókból, saját forgalom klienssel (None, ha nincs megadva)"""
+    if args.soak is None:
+        return None
+    client_id = f"IntelliVend_Soak_{os.getpid()}"
+    if loopback is not None:
+        client = LoopbackClient(loopback, client_id=client_id, clean_session=True)
+        attach = None
+    else:
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id, clean_session=True)
+        attach = AsyncioHelper
+    if args.username:
+        client.username_pw_set(args.username, args.password)
+    return SoakTest(devices, clock, metrics, client, args.broker, args.port, args.soak, interval=args.soak_interval,
+                    rate=args.soak_rate, rss_growth=args.soak_rss_growth, rate_tolerance=args.soak_rate_tolerance,
+                    seed=args.seed, attach=attach)
+
+def build_snapshot(args, path: Optional[str], devices: list, clock: SimClock, physics: Optional[FlowPhysics]) -> Optional[SnapshotStore]:
+    """Állapot pillanatkép a CLI kapcsolókból; a meglévő fájlból az eszközök azonnal visszaállnak (None, ha nincs megadva)"""
+    if not path:
+        return None
+    snapshot = SnapshotStore(path, devices, clock, physics, interval=args.snapshot_interval, policy=args.restart_policy)
+    snapshot.restore()
+    return snapshot
+
+def run_mock(args, clock: SimClock) -> int:
+    """Mock vagy fleet létrehozása és futtatása a feldolgozott CLI argumentumokkal"""
+    # Embedded broker: TCP listener and/or in-process loopback transport
+    broker = None
+    embedded_broker = None
+    if args.embedded_broker or args.loopback:
+        broker = MQTTBroker(args.listen_host, args.port, args.username, args.password)
+    if args.embedded_broker:
+        embedded_broker = broker
+        args.broker = "127.0.0.1" if args.listen_host in ("0.0.0.0", "") else args.listen_host
+    loopback = broker if args.loopback else None
+    
+    # Optional Prometheus endpoint (one registry for all devices)
+    metrics = None
+    metrics_server = None
+    if args.metrics_port is not None or args.soak is not None:
+        # The soak test derives the message rate from the counters
+        metrics = MockMetrics()
+    if args.metrics_port is not None:
+        metrics_server = MetricsServer(metrics.registry, args.metrics_host, args.metrics_port)
+    
+    # Optional flow physics (one engine stepping the pumps of all devices)
+    physics = FlowPhysics(clock, seed=args.seed, bottle_ml=args.bottle_ml) if args.flow_physics else None
+    
+    recorder = None
+    if args.record:
+        try:
+            recorder = TrafficRecorder(args.record, clock)
+        except OSError as e:
+            print(f"Cannot open record file: {e}")
+            return 1
+    
+    # Optional profiler (one per process, switchable at runtime on the control topic)
+    profiler = build_profiler(args, args.profile_output)
     
-    mock.run()
+    # Options shared by the single mock and every fleet device
+    device_options = build_device_options(args, clock, loopback, metrics, recorder, physics, profiler)
+    
+    soak = None
+    try:
+        # Fleet mode: per-device client IDs and topic prefixes
+        if args.devices > 1:
+            fleet = ESP32Fleet(devices=args.devices, device_prefix=args.device_prefix, **device_options)
+            soak = build_soak(args, fleet.devices, clock, metrics, loopback)
+            snapshot = build_snapshot(args, args.snapshot, fleet.devices, clock, physics)
+            fleet.run(args.duration if soak is None else None, embedded_broker, metrics_server, soak, snapshot)
+        else:
+            mock = ESP32Mock(**device_options)
+            soak = build_soak(args, [mock], clock, metrics, loopback)
+            snapshot = build_snapshot(args, args.snapshot, [mock], clock, physics)
+            mock.run(args.duration if soak is None else None, embedded_broker, metrics_server, soak, snapshot)
+    finally:
+        if recorder is not None:
+            recorder.close()
+            print(f"Recorded {recorder.records} messages ({recorder.bytes_written} bytes) to {args.record}")
+    
+    if soak is not None:
+        soak.print_report()
+        if args.soak_report:
+            soak.write_report(args.soak_report)
+            print(f"Soak report written to {args.soak_report}")
+        return 0 if soak.passed and not soak.interrupted else 1
     return 0
 
+def run_sharded(args, clock: SimClock) -> int:
+    """Fleet több worker folyamatban (--processes); a szülő futtatja a brokert és a /metrics végpontot"""
+    embedded_broker = None
+    if args.embedded_broker:
+        embedded_broker = MQTTBroker(args.listen_host, args.port, args.username, args.password)
+        args.broker = "127.0.0.1" if args.listen_host in ("0.0.0.0", "") else args.listen_host
+    
+    shards = plan_shards(args.devices, args.processes)
+    runner = ShardedFleet(run_shard, [(args, shard, first_index, devices, clock.epoch_origin) for shard, (first_index, devices) in enumerate(shards)], clock)
+    metrics_server = MetricsServer(runner.registry, args.metrics_host, args.metrics_port) if args.metrics_port is not None else None
+    
+    lines = [f"Broker: {describe_broker(args.broker, args.port, None, embedded_broker)}"]
+    if args.username:
+        lines.append(f"Username: {args.username}")
+    lines.append(f"Devices: {args.devices} in {len(shards)} processes ({', '.join(str(devices) for _, devices in shards)})")
+    lines.append("Topics: intellivend/<device>/...")
+    dedup = CommandDedup(args.dedup_size, args.dedup_ttl, clock) if args.dedup_size else None
+    lines += describe_settings(args.error_rate, clock, args.heartbeat_interval, args.heartbeat_active_interval, args.order_queue, dedup)
+    if metrics_server is not None:
+        lines.append(f"Metrics: {describe_metrics(metrics_server)} (all processes)")
+    impairment = build_impairment(args)
+    if impairment is not None:
+        lines.append(f"Link impairment: {impairment.describe()}")
+    profiler = build_profiler(args, shard_path(args.profile_output, 0))
+    if profiler is not None:
+        lines.append(f"Profiling: {profiler.describe()} (one file set per process)")
+    if args.snapshot:
+        lines.append(f"State snapshot: {shard_path(args.snapshot, 0)} ... every {args.snapshot_interval:g}s, restart policy: {args.restart_policy} (one file per process)")
+    print_banner("IntelliVend ESP32 Mock Fleet (multi-process)", lines)
+    
+    try:
+        clock.run(run_with_services(runner.run(), embedded_broker, metrics_server))
+    except KeyboardInterrupt:
+        print("\n\n[SHARDS] Shutting down...")
+    
+    elapsed = runner.elapsed() or 0.0
+    print(f"[SHARDS] {'Worker':>6} {'Devices':>8} {'Received':>10} {'Published':>10} {'Errors':>7} {'Reconnects':>10}  Clean exit")
+    for row in runner.summary():
+        devices = shards[row["shard"]][1] if row["shard"] is not None else args.devices
+        name = str(row["shard"]) if row["shard"] is not None else "total"
+        print(f"[SHARDS] {name:>6} {devices:>8} {row['received']:>10} {row['published']:>10} {row['errors']:>7} {row['reconnects']:>10}  {'yes' if row['clean_exit'] else 'no'}")
+    total = runner.summary()[-1]
+    if elapsed > 0:
+        print(f"[SHARDS] {elapsed:.1f}s, {(total['received'] + total['published']) / elapsed:.0f} msgs/s")
+    return 0 if total["clean_exit"] else 1
+
+def run_shard(args, shard: int, first_index: int, devices: int, epoch_origin: float, stop_event, stats_queue):
+    """Egy worker folyamat: az eszközök egy szelete saját event loop-on és MQTT kapcsolatokkal"""
+    # Ctrl-C is handled by the parent, which signals stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    
+    clock = SimClock(time_scale=args.time_scale, start_time=epoch_origin)
+    listener = start_logging(args, shard_path(args.log_file, shard) if args.log_file else None)
+    
+    # Metrics are always collected: they are the stats the parent aggregates
+    metrics = MockMetrics()
+    physics = FlowPhysics(clock, seed=args.seed, bottle_ml=args.bottle_ml) if args.flow_physics else None
+    recorder = TrafficRecorder(shard_path(args.record, shard), clock) if args.record else None
+    try:
+        profiler = build_profiler(args, shard_path(args.profile_output, shard))
+        fleet = ESP32Fleet(devices=devices, device_prefix=args.device_prefix, first_index=first_index,
+                           **build_device_options(args, clock, None, metrics, recorder, physics, profiler))
+        snapshot = build_snapshot(args, shard_path(args.snapshot, shard) if args.snapshot else None, fleet.devices, clock, physics)
+        reporter = ShardReporter(shard, clock, metrics.registry, stop_event, stats_queue)
+        clock.run(run_with_services(reporter.supervise(fleet.run_async()), fleet.physics, fleet.profiler, snapshot), args.duration)
+    finally:
+        if recorder is not None:
+            recorder.close()
+        listener.stop()
+
 if __name__ == "__main__":
     exit(main())
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+IntelliVend több folyamatos (sharded) fleet futtató
+===================================================
+
+Egy folyamat a GIL miatt egy CPU magot használ; nagy üzenetrátánál a JSON
+kódolás és a paho kliens ciklusa ezt telíti. A --processes N kapcsolóval a
+szimulált eszközök N worker folyamat között oszlanak meg (shard-ok), mindegyik
+saját event loop-pal és saját MQTT kapcsolatokkal, ugyanazzal a konfigurációval.
+
+A szülő folyamat:
+- elindítja a worker-eket (spawn, SIGINT-et figyelmen kívül hagyva),
+- futtatja a közös szolgáltatásokat (beágyazott broker, /metrics végpont),
+- összegzi a worker-ek metrika snapshot-jait (MergedRegistry),
+- Ctrl-C-re (vagy ha egy worker kilép) leállítási jelet küld, megvárja a
+  worker-ek rendezett leállását (MQTT bontás, utolsó snapshot), és összesít.
+
+Az eszköz azonosítók globálisan egyediek (ESP32_MOCK_001 ... ESP32_MOCK_N a
+shard-ok között folytonosan), a per-eszköz seed miatt (eszköz véletlenszámok és
+flow fizika egyaránt) a futás a shard-ok számától függetlenül reprodukálható.
+Fájl kimenetek (--record, --log-file, --snapshot) shard-onként külön fájlba
+kerülnek (pl. session.2.ivrec).
+
+Használat:
+    python3 esp32_mock.py --devices 2000 --processes 8 --broker 127.0.0.1
+    python3 esp32_mock.py --devices 2000 --processes 0 --embedded-broker --metrics-port 9108
+"""
+
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from mock_logging import DeviceLogger
+from mock_metrics import MergedRegistry, Registry
+
+# Real seconds between two stop / liveness checks, and between two metric snapshots of a worker
+POLL_INTERVAL = 0.2
+STATS_INTERVAL = 1.0
+
+# Real seconds between two aggregated progress lines of the parent
+PROGRESS_INTERVAL = 10.0
+
+# Real seconds a worker gets for a clean shutdown before it is terminated
+SHUTDOWN_TIMEOUT = 10.0
+
+
+def plan_shards(devices: int, processes: int) -> List[Tuple[int, int]]:
+    """Eszközök szétosztása: shard-onként (első eszköz sorszáma, eszközök száma)"""
+    processes = max(1, min(processes, devices))
+    size, extra = divmod(devices, processes)
+    shards = []
+    first_index = 1
+    for shard in range(processes):
+        count = size + (1 if shard < extra else 0)
+        shards.append((first_index, count))
+        first_index += count
+    return shards
+
+
+def shard_path(path: str, shard: int) -> str:
+    """Shard-onkénti fájlnév (session.ivrec -> session.2.ivrec)"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{shard}{ext}"
+
+
+class ShardReporter:
+    """Worker oldal: metrika snapshot-ok küldése a szülőnek és leállás a szülő jelzésére"""
+
+    def __init__(self, shard: int, clock, registry: Registry, stop_event, stats_queue):
+        """
+        Args:
+            shard: A worker sorszáma
+            clock: A worker szimulációs órája (a várakozások szimulált időben futnak)
+            registry: A worker metrikái
+            stop_event: A szülő leállítási jelzése (multiprocessing.Event)
+            stats_queue: Snapshot-ok a szülő felé (multiprocessing.Queue)
+        """
+        self.shard = shard
+        self.clock = clock
+        self.registry = registry
+        self.stop_event = stop_event
+        self.stats_queue = stats_queue
+
+    def report(self, final: bool = False):
+        self.stats_queue.put((self.shard, self.registry.snapshot(), final))
+
+    async def supervise(self, coro):
+        """A fleet futtatása a szülő leállítási jelzéséig; leálláskor a fleet rendezetten bont"""
+        task = asyncio.ensure_future(coro)
+        last_report = time.monotonic()
+        try:
+            while not task.done() and not self.stop_event.is_set():
+                await asyncio.wait({task}, timeout=POLL_INTERVAL * self.clock.time_scale)
+                if time.monotonic() - last_report >= STATS_INTERVAL:
+                    self.report()
+                    last_report = time.monotonic()
+            if task.done():
+                return task.result()
+        finally:
+            # Same path as KeyboardInterrupt in a single process: cancel, let the devices disconnect
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            self.report(final=True)
+
+
+class ShardedFleet:
+    """Szülő oldal: worker folyamatok indítása, felügyelete és a metrikák összegzése"""
+
+    def __init__(self, target: Callable, shard_args: Sequence[Tuple], clock):
+        """
+        Args:
+            target: Worker belépési pont, hívása: target(*shard_args[i], stop_event, stats_queue)
+            shard_args: Shard-onkénti argumentumok (picklable)
+            clock: A szülő szimulációs órája (a várakozások szimulált időben futnak)
+        """
+        self.clock = clock
+        self.log = DeviceLogger("[SHARDS]")
+        self.registry = MergedRegistry()
+
+        # spawn: no inherited event loop, logging thread or MQTT sockets from the parent
+        context = multiprocessing.get_context("spawn")
+        self.stop_event = context.Event()
+        self.stats_queue = context.Queue()
+        self.processes = [
+            context.Process(target=target, args=(*args, self.stop_event, self.stats_queue), name=f"intellivend-shard-{shard}", daemon=True)
+            for shard, args in enumerate(shard_args)
+        ]
+        self.finished: Dict[int, bool] = {}
+        self.started = 0.0
+
+    def start(self):
+        """Worker-ek indítása; a SIGINT figyelmen kívül hagyását öröklik, a Ctrl-C-t csak a szülő kezeli"""
+        previous = signal.signal(signal.SIGINT, signal.SIG_IGN)
+        try:
+            for process in self.processes:
+                process.start()
+        finally:
+            signal.signal(signal.SIGINT, previous)
+        self.started = time.monotonic()
+        self.log.info("%d worker processes started", len(self.processes))
+
+    def drain(self):
+        """Beérkezett snapshot-ok feldolgozása (blokkolás nélkül)"""
+        while True:
+            try:
+                shard, snapshot, final = self.stats_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.registry.update(shard, snapshot)
+            if final:
+                self.finished[shard] = True
+
+    def alive(self) -> int:
+        return sum(1 for process in self.processes if process.is_alive())
+
+    async def run(self):
+        """Futás, amíg minden worker fut; utána (vagy megszakításkor) rendezett leállítás"""
+        self.start()
+        last_progress = time.monotonic()
+        try:
+            # One worker exiting (duration reached, crash) stops the whole fleet
+            while self.alive() == len(self.processes):
+                self.drain()
+                if time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                    self.log_progress()
+                    last_progress = time.monotonic()
+                await asyncio.sleep(POLL_INTERVAL * self.clock.time_scale)
+        finally:
+            await self.shutdown()
+
+    async def shutdown(self):
+        self.stop_event.set()
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        while self.alive() and time.monotonic() < deadline:
+            self.drain()
+            await asyncio.sleep(POLL_INTERVAL * self.clock.time_scale)
+
+        for shard, process in enumerate(self.processes):
+            if process.is_alive():
+                self.log.warning("Worker %d did not stop in %.0fs, terminating", shard, SHUTDOWN_TIMEOUT)
+                process.terminate()
+            process.join()
+            if process.exitcode:
+                self.log.warning("Worker %d exited with code %s", shard, process.exitcode)
+        self.drain()
+
+    def log_progress(self):
+        received = self.registry.total("intellivend_mock_messages_received_total")
+        published = self.registry.total("intellivend_mock_messages_published_total")
+        elapsed = time.monotonic() - self.started
+        self.log.info("%d/%d workers, %d devices connected, %d received, %d published (%.0f msgs/s)",
+                      self.alive(), len(self.processes), self.registry.total("intellivend_mock_devices_connected"),
+                      received, published, (received + published) / elapsed if elapsed > 0 else 0.0, category="shards")
+
+    def summary(self) -> List[Dict]:
+        """Shard-onkénti és összesített statisztika (az utolsó snapshot-okból)"""
+        rows = []
+        for shard in list(range(len(self.processes))) + [None]:
+            rows.append({
+                "shard": shard,
+                "received": int(self.registry.total("intellivend_mock_messages_received_total", shard)),
+                "published": int(self.registry.total("intellivend_mock_messages_published_total", shard)),
+                "errors": int(self.registry.total("intellivend_mock_errors_total", shard)),
+                "reconnects": int(self.registry.total("intellivend_mock_mqtt_reconnects_total", shard)),
+                "clean_exit": all(self.finished.get(index, False) for index in ([shard] if shard is not None else range(len(self.processes)))),
+            })
+        return rows
+
+    def elapsed(self) -> Optional[float]:
+        return time.monotonic() - self.started if self.started else None
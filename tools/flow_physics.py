@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+IntelliVend flow fizika
+=======================
+
+Az ESP32 mock pumpáinak és átfolyásmérőinek fizikai modellje (--flow-physics).
+A fix 20 ml/s-os lineáris rámpa helyett egyetlen, az összes eszköz összes
+pumpáját egyszerre léptető tick számolja:
+
+- Pumpánkénti flow görbe: névleges hozam (pumpánként eltérő), felfutás
+  (1 - e^(-t/tau)) és pulzálás zaj
+- Priming késleltetés: indításkor a cső feltöltéséig nincs átfolyás
+- Átfolyásmérő impulzusok, mint a firmware flowPulseCount ISR-jei
+  (PULSES_PER_LITER = 450, config.h.sample); a mért ml az impulzusokból számolt,
+  a pumpa a firmware-hez hasonlóan a cél impulzusszám elérésekor áll le
+- Kalibráció: a firmware calibration_factor-ral szorzott cél térfogata, és az
+  érzékelő valódi érzékenysége, ami az átfolyt mennyiséggel arányosan elmászik
+- Palack fogyás: alacsony szintnél csökkenő hozam (levegő), üres palacknál
+  szárazon futás, majd a firmware-hez hasonló PUMP_TIMEOUT
+
+A tick NumPy-jal vektorizált (pip install numpy); NumPy nélkül egy tiszta
+Python implementáció fut, ami csak a működő pumpákon iterál. A két változat
+azonos modellt és azonos zajt számol.
+
+Reprodukálhatóság: a pumpa jellemzők az eszköz azonosítójából és a seed-ből
+származnak, a zaj pedig pumpánként egy lépésszámlálóból (számláló alapú
+hash), így egy eszköz eredménye nem függ attól, hány másik eszköz osztozik a
+motoron (pl. a --processes szerinti shard felosztástól).
+
+Használat:
+    physics = FlowPhysics(clock, seed=42)
+    await physics.start()                                   # tick task (run_with_services)
+    base = physics.add_device("ESP32_MOCK_001")             # eszközönként 8 pumpa slot
+    result = await physics.start_pump(base + 2, 50.0, 1.0)  # 3. pumpa, 50 ml
+    result["reason"], result["measured_ml"]                 # leállás oka, a futás mért / valódi ml-e
+"""
+
+import asyncio
+import math
+import random
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency, the pure-Python step is used instead
+    np = None
+
+from device_state import NUM_PUMPS
+
+# Firmware constants (IntelliVend_ESP32/config.h.sample, IntelliVend_ESP32.ino)
+PULSES_PER_LITER = 450.0
+PUMP_TIMEOUT_S = 60.0
+
+DEFAULT_TICK = 0.05             # seconds between physics steps (simulated)
+DEFAULT_FLOW_RATE = 20.0        # nominal pump flow (ml/s), as assumed by the legacy mock
+DEFAULT_PRIMING = 0.4           # seconds until liquid reaches the flow meter
+DEFAULT_RAMP = 0.2              # flow ramp-up time constant (seconds)
+DEFAULT_BOTTLE_ML = 700.0
+DEFAULT_DRIFT_PER_LITER = 0.002  # sensor gain drift (relative) per liter pumped, standard deviation
+LOW_LEVEL_ML = 30.0             # below this the pump starts drawing air
+PULSATION = 0.03                # relative flow noise per tick
+
+# splitmix64 constants (counter-based noise, identical in both step implementations)
+_MASK64 = (1 << 64) - 1
+_GOLDEN = 0x9E3779B97F4A7C15
+_MIX1 = 0xBF58476D1CE4E5B9
+_MIX2 = 0x94D049BB133111EB
+
+# Finish reasons
+TARGET_REACHED = "target"
+TIMEOUT = "timeout"
+STOPPED = "stopped"
+
+
+def _primed_volume(t: float, priming: float, ramp: float) -> float:
+    """Egységnyi névleges hozam mellett a [0, t] alatt átfolyt térfogat (priming + exponenciális felfutás)"""
+    wet = max(0.0, t - priming)
+    return wet - ramp * (1.0 - math.exp(-wet / ramp))
+
+
+def _splitmix64(x: int) -> int:
+    z = (x + _GOLDEN) & _MASK64
+    z = ((z ^ (z >> 30)) * _MIX1) & _MASK64
+    z = ((z ^ (z >> 27)) * _MIX2) & _MASK64
+    return z ^ (z >> 31)
+
+
+def _noise(key: int, step: int) -> float:
+    """A pumpa (key) step-edik tick-jének zaja: N(1, PULSATION), 0 alá nem megy (Box-Muller)"""
+    u1 = (_splitmix64((key + 2 * step) & _MASK64) >> 11) * 2.0 ** -53
+    u2 = (_splitmix64((key + 2 * step + 1) & _MASK64) >> 11) * 2.0 ** -53
+    return max(0.0, 1.0 + PULSATION * math.sqrt(-2.0 * math.log(1.0 - u1)) * math.cos(2.0 * math.pi * u2))
+
+
+def _splitmix64_numpy(x):
+    z = x + np.uint64(_GOLDEN)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(_MIX1)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(_MIX2)
+    return z ^ (z >> np.uint64(31))
+
+
+def _noise_numpy(keys, steps):
+    counter = keys + np.uint64(2) * steps
+    u1 = (_splitmix64_numpy(counter) >> np.uint64(11)) * 2.0 ** -53
+    u2 = (_splitmix64_numpy(counter + np.uint64(1)) >> np.uint64(11)) * 2.0 ** -53
+    return np.maximum(0.0, 1.0 + PULSATION * np.sqrt(-2.0 * np.log(1.0 - u1)) * np.cos(2.0 * np.pi * u2))
+
+
+def numpy_available() -> bool:
+    return np is not None
+
+
+class FlowPhysics:
+    """Az összes szimulált pumpa flow modellje, egy közös tick-kel"""
+
+    def __init__(self, clock, tick: float = DEFAULT_TICK, seed: Optional[int] = None, flow_rate_ml_s: float = DEFAULT_FLOW_RATE,
+                 priming_s: float = DEFAULT_PRIMING, ramp_s: float = DEFAULT_RAMP, bottle_ml: float = DEFAULT_BOTTLE_ML,
+                 drift_per_liter: float = DEFAULT_DRIFT_PER_LITER, use_numpy: Optional[bool] = None):
+        """
+        Args:
+            clock: Szimulációs óra (SimClock)
+            tick: Lépésköz szimulált másodpercben
+            seed: Véletlenszám seed (pumpa szórás, drift, zaj; eszközönként az azonosítóval együtt)
+            flow_rate_ml_s: Névleges pumpa hozam (pumpánként ±10% eltéréssel)
+            priming_s: Indítás utáni holtidő, amíg a folyadék eléri az érzékelőt
+            ramp_s: A hozam felfutásának időállandója
+            bottle_ml: Palack térfogat; kiürülés után szárazon futás, a timeout után a palack cserélődik
+            drift_per_liter: Az érzékelő érzékenységének literenkénti elmászása (szórás)
+            use_numpy: None = NumPy, ha telepítve van
+        """
+        if use_numpy and np is None:
+            raise RuntimeError("Vectorized flow physics requires numpy (pip install numpy)")
+        self.clock = clock
+        self.tick = tick
+        self.flow_rate_ml_s = flow_rate_ml_s
+        self.priming_s = priming_s
+        self.ramp_s = ramp_s
+        self.bottle_ml = bottle_ml
+        self.drift_per_liter = drift_per_liter
+        self.vectorized = np is not None if use_numpy is None else use_numpy
+        self.seed = seed
+        self.random = random.Random(seed)
+
+        self.size = 0
+        fields = ("nominal", "gain", "drift", "bottle", "run_time", "pulse_acc", "target_pulses", "volume", "flow", "running",
+                  "noise_key", "noise_step")
+        if self.vectorized:
+            dtypes = {"running": bool, "noise_key": np.uint64, "noise_step": np.uint64}
+            self.state = {name: np.zeros(0, dtype=dtypes.get(name, np.float64)) for name in fields}
+        else:
+            self.state = {name: [] for name in fields}
+
+        self.waiters: Dict[int, asyncio.Future] = {}
+        # Runs requested while the slot was busy: (future, target pulses), started one after another
+        self.queued: Dict[int, deque] = {}
+        self.running_slots: Set[int] = set()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+        # Statistics
+        self.ticks = 0
+        self.pump_ticks = 0
+
+    def add_device(self, device_id: Optional[str] = None) -> int:
+        """Egy eszköz pumpáinak felvétele; az eszköz első slotjának indexe
+
+        A pumpák jellemzői és zaja seed mellett csak a seed-től és a device_id-től függenek.
+        """
+        base = self.size
+        if self.seed is not None and device_id is not None:
+            device_random = random.Random(f"{self.seed}:{device_id}:physics")
+        else:
+            device_random = random.Random(self.random.getrandbits(64))
+        initial = {
+            "nominal": [self.flow_rate_ml_s * device_random.uniform(0.9, 1.1) for _ in range(NUM_PUMPS)],
+            "gain": [device_random.uniform(0.97, 1.03) for _ in range(NUM_PUMPS)],
+            "drift": [device_random.gauss(0.0, self.drift_per_liter) for _ in range(NUM_PUMPS)],
+            "bottle": [self.bottle_ml] * NUM_PUMPS,
+            "noise_key": [device_random.getrandbits(64) for _ in range(NUM_PUMPS)],
+            "noise_step": [0] * NUM_PUMPS,
+        }
+        for name, values in self.state.items():
+            column = initial.get(name, [False if name == "running" else 0.0] * NUM_PUMPS)
+            if self.vectorized:
+                self.state[name] = np.concatenate((values, np.asarray(column, dtype=values.dtype)))
+            else:
+                values.extend(column)
+        self.size += NUM_PUMPS
+        return base
+
+    def slot(self, base: int, pump_id: int) -> int:
+        """Eszköz slot bázis + pumpa szám (1-8) -> slot index (más pumpa szám: ValueError)"""
+        if not isinstance(pump_id, int) or isinstance(pump_id, bool) or not 1 <= pump_id <= NUM_PUMPS:
+            raise ValueError(f"Invalid pump number: {pump_id!r} (1-{NUM_PUMPS})")
+        return base + pump_id - 1
+
+    def start_pump(self, slot: int, target_ml: float, calibration_factor: float = 1.0) -> asyncio.Future:
+        """Pumpa indítása; a future a futás saját eredményével (result() + "reason": target, timeout vagy stopped) teljesül
+
+        A cél a firmware szerint target_ml * calibration_factor / 1000 * PULSES_PER_LITER, amit
+        egész impulzusszámmal hasonlít össze (flowPulseCount < targetPulses), így felfelé kerekít.
+        Ha a pumpa éppen fut, az új futás sorba áll, és az előző leállása után indul.
+        """
+        waiter = asyncio.get_running_loop().create_future()
+        target_pulses = math.ceil(target_ml * calibration_factor / 1000.0 * PULSES_PER_LITER)
+        if slot in self.waiters:
+            self.queued.setdefault(slot, deque()).append((waiter, target_pulses))
+        else:
+            self.begin(slot, waiter, target_pulses)
+        return waiter
+
+    def begin(self, slot: int, waiter: asyncio.Future, target_pulses: float):
+        state = self.state
+        state["run_time"][slot] = 0.0
+        state["pulse_acc"][slot] = 0.0
+        state["volume"][slot] = 0.0
+        state["flow"][slot] = 0.0
+        state["target_pulses"][slot] = target_pulses
+        state["running"][slot] = True
+        self.running_slots.add(slot)
+        self.waiters[slot] = waiter
+        self.wakeup.set()
+
+    def is_running(self, slot: int, waiter: asyncio.Future) -> bool:
+        """A waiter futása éppen a pumpán van (nem sorban áll és nem fejeződött be)"""
+        return self.waiters.get(slot) is waiter
+
+    def stop_pump(self, slot: int, waiter: Optional[asyncio.Future] = None):
+        """Pumpa leállítása (pl. emergency stop); waiter megadásakor csak az a futás (sorban állva is)"""
+        if waiter is None or self.is_running(slot, waiter):
+            if self.state["running"][slot]:
+                self.finish(slot, STOPPED)
+            return
+        queue = self.queued.get(slot)
+        for entry in list(queue or ()):
+            if entry[0] is waiter:
+                queue.remove(entry)
+                if not waiter.done():
+                    # Never started: nothing pumped
+                    waiter.set_result(dict(self.result(slot), measured_ml=0.0, delivered_ml=0.0, flow_pulses=0, run_time_ms=0, reason=STOPPED))
+
+    def finish(self, slot: int, reason: str):
+        self.state["running"][slot] = False
+        self.state["flow"][slot] = 0.0
+        self.running_slots.discard(slot)
+        if reason == TIMEOUT and self.state["bottle"][slot] < 1.0:
+            self.state["bottle"][slot] = self.bottle_ml  # ran dry: the operator swaps the bottle
+        waiter = self.waiters.pop(slot, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(dict(self.result(slot), reason=reason))
+
+        # The next run waiting for this pump
+        queue = self.queued.get(slot)
+        while queue:
+            waiter, target_pulses = queue.popleft()
+            if not waiter.done():
+                self.begin(slot, waiter, target_pulses)
+                break
+        if queue is not None and not queue:
+            del self.queued[slot]
+
+    def pulses(self, slot: int) -> int:
+        return int(self.state["pulse_acc"][slot])
+
+    def measured_ml(self, slot: int) -> float:
+        """A firmware getFlowML() értéke: impulzusokból számolt térfogat"""
+        return self.pulses(slot) / PULSES_PER_LITER * 1000.0
+
+    def sample(self, slot: int) -> Tuple[float, float]:
+        """(mért ml, pillanatnyi mért hozam ml/s)"""
+        return self.measured_ml(slot), float(self.state["flow"][slot])
+
+    def result(self, slot: int) -> Dict:
+        """Az utolsó futás adatai (mért és valódi térfogat, impulzusok, palack szint)"""
+        state = self.state
+        return {
+            "measured_ml": round(self.measured_ml(slot), 2),
+            "delivered_ml": round(float(state["volume"][slot]), 2),
+            "flow_pulses": self.pulses(slot),
+            "run_time_ms": int(state["run_time"][slot] * 1000),
+            "bottle_ml": round(float(state["bottle"][slot]), 1),
+            "sensor_gain": round(float(state["gain"][slot]), 4),
+        }
+
+    def step(self, dt: float):
+        """Egy tick az összes működő pumpára"""
+        if not self.running_slots:
+            return
+        self.ticks += 1
+        if self.vectorized:
+            finished = self.step_numpy(dt)
+        else:
+            finished = self.step_python(dt)
+        for slot, reason in finished:
+            self.finish(slot, reason)
+
+    def step_numpy(self, dt: float) -> List[Tuple[int, str]]:
+        state = self.state
+        idx = np.flatnonzero(state["running"])
+        self.pump_ticks += idx.size
+
+        t0 = state["run_time"][idx]
+        t1 = t0 + dt
+        wet0 = np.maximum(0.0, t0 - self.priming_s)
+        wet1 = np.maximum(0.0, t1 - self.priming_s)
+        ramp = self.ramp_s
+        unit = (wet1 - wet0) + ramp * (np.exp(-wet1 / ramp) - np.exp(-wet0 / ramp))
+
+        bottle = state["bottle"][idx]
+        steps = state["noise_step"][idx]
+        noise = _noise_numpy(state["noise_key"][idx], steps)
+        state["noise_step"][idx] = steps + np.uint64(1)
+        volume = state["nominal"][idx] * unit * noise * np.minimum(1.0, bottle / LOW_LEVEL_ML)
+        volume = np.minimum(volume, bottle)
+
+        # Flow meter: stop at the target pulse count (interpolated inside the tick)
+        gain = state["gain"][idx]
+        acc = state["pulse_acc"][idx]
+        pulses = volume * gain * (PULSES_PER_LITER / 1000.0)
+        target = state["target_pulses"][idx]
+        reached = acc + pulses >= target
+        fraction = np.where(reached & (pulses > 0), (target - acc) / np.where(pulses > 0, pulses, 1.0), 1.0)
+        volume = volume * fraction
+        pulses = pulses * fraction
+        elapsed = np.where(reached, t0 + dt * fraction, t1)
+
+        state["pulse_acc"][idx] = np.where(reached, target, acc + pulses)
+        state["volume"][idx] += volume
+        state["bottle"][idx] = bottle - volume
+        state["gain"][idx] = gain * (1.0 + state["drift"][idx] * volume / 1000.0)
+        state["flow"][idx] = pulses / (PULSES_PER_LITER / 1000.0) / dt
+        state["run_time"][idx] = elapsed
+
+        timed_out = ~reached & (elapsed >= PUMP_TIMEOUT_S)
+        return ([(int(slot), TARGET_REACHED) for slot in idx[reached]]
+                + [(int(slot), TIMEOUT) for slot in idx[timed_out]])
+
+    def step_python(self, dt: float) -> List[Tuple[int, str]]:
+        state = self.state
+        finished = []
+        for slot in sorted(self.running_slots):
+            self.pump_ticks += 1
+
+            t0 = state["run_time"][slot]
+            unit = _primed_volume(t0 + dt, self.priming_s, self.ramp_s) - _primed_volume(t0, self.priming_s, self.ramp_s)
+            bottle = state["bottle"][slot]
+            noise = _noise(state["noise_key"][slot], state["noise_step"][slot])
+            state["noise_step"][slot] += 1
+            volume = min(state["nominal"][slot] * unit * noise * min(1.0, bottle / LOW_LEVEL_ML), bottle)
+
+            gain = state["gain"][slot]
+            acc = state["pulse_acc"][slot]
+            pulses = volume * gain * (PULSES_PER_LITER / 1000.0)
+            target = state["target_pulses"][slot]
+            reached = acc + pulses >= target
+            fraction = 1.0
+            if reached and pulses > 0:
+                fraction = (target - acc) / pulses
+                volume *= fraction
+                pulses *= fraction
+            elapsed = t0 + dt * fraction
+
+            state["pulse_acc"][slot] = target if reached else acc + pulses
+            state["volume"][slot] += volume
+            state["bottle"][slot] = bottle - volume
+            state["gain"][slot] = gain * (1.0 + state["drift"][slot] * volume / 1000.0)
+            state["flow"][slot] = pulses / (PULSES_PER_LITER / 1000.0) / dt
+            state["run_time"][slot] = elapsed
+
+            if reached:
+                finished.append((slot, TARGET_REACHED))
+            elif elapsed >= PUMP_TIMEOUT_S:
+                finished.append((slot, TIMEOUT))
+        return finished
+
+    async def run(self):
+        """Tick-elés, amíg van működő pumpa; egyébként várakozás a következő indításig"""
+        while True:
+            if not self.running_slots:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            last = self.clock.monotonic()
+            while self.running_slots:
+                await asyncio.sleep(self.tick)
+                now = self.clock.monotonic()
+                self.step(now - last)
+                last = now
+
+    async def start(self):
+        """Tick task indítása (run_with_services szolgáltatásként)"""
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def summary(self) -> Dict:
+        return {
+            "backend": "numpy" if self.vectorized else "python",
+            "pumps": self.size,
+            "ticks": self.ticks,
+            "pump_ticks": self.pump_ticks,
+        }
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+IntelliVend HDR-stílusú hisztogram
+==================================
+
+Log-lineáris bucket-ekkel dolgozó latency hisztogram (HdrHistogram mintájára):
+a rögzített értékek a megadott számú értékes jegy pontossággal tárolódnak,
+fix memóriaigénnyel, függetlenül a minták számától.
+
+Használat:
+    hist = HdrHistogram(significant_figures=3)
+    hist.record(1250)            # pl. mikroszekundum
+    hist.value_at_percentile(99)
+    print(hist.percentile_distribution(scale=1000.0, unit="ms"))
+"""
+
+import math
+from collections import Counter
+from typing import Dict, List, Optional
+
+
+class HdrHistogram:
+    """Egész értékek (pl. latency µs-ban) hisztogramja rögzített relatív pontossággal"""
+
+    def __init__(self, significant_figures: int = 3):
+        """
+        Args:
+            significant_figures: Értékes jegyek száma (1-5); 3 = 0.1% relatív hiba
+        """
+        if not 1 <= significant_figures <= 5:
+            raise ValueError("significant_figures must be between 1 and 5")
+
+        self.significant_figures = significant_figures
+        largest_single_unit = 2 * 10 ** significant_figures
+        self.sub_bucket_magnitude = int(math.ceil(math.log2(largest_single_unit)))
+        self.sub_bucket_count = 1 << self.sub_bucket_magnitude
+        self.sub_bucket_half_magnitude = self.sub_bucket_magnitude - 1
+
+        self.counts: Counter = Counter()
+        self.total_count = 0
+        self.min_value: Optional[int] = None
+        self.max_value: Optional[int] = None
+        self.sum = 0
+
+    def _index(self, value: int) -> int:
+        bucket = max(0, value.bit_length() - self.sub_bucket_magnitude)
+        return (bucket << self.sub_bucket_half_magnitude) + (value >> bucket)
+
+    def _highest_equivalent(self, index: int) -> int:
+        if index < self.sub_bucket_count:
+            return index
+        bucket = (index >> self.sub_bucket_half_magnitude) - 1
+        sub_bucket = index - (bucket << self.sub_bucket_half_magnitude)
+        return ((sub_bucket + 1) << bucket) - 1
+
+    def record(self, value: int, count: int = 1):
+        """Érték rögzítése (negatív érték 0-ként)"""
+        value = max(0, int(value))
+        self.counts[self._index(value)] += count
+        self.total_count += count
+        self.sum += value * count
+        if self.min_value is None or value < self.min_value:
+            self.min_value = value
+        if self.max_value is None or value > self.max_value:
+            self.max_value = value
+
+    def merge(self, other: "HdrHistogram"):
+        """Másik (azonos pontosságú) hisztogram hozzáadása"""
+        if other.significant_figures != self.significant_figures:
+            raise ValueError("Cannot merge histograms with different precision")
+        self.counts.update(other.counts)
+        self.total_count += other.total_count
+        self.sum += other.sum
+        if other.min_value is not None:
+            self.min_value = other.min_value if self.min_value is None else min(self.min_value, other.min_value)
+        if other.max_value is not None:
+            self.max_value = other.max_value if self.max_value is None else max(self.max_value, other.max_value)
+
+    def mean(self) -> float:
+        return self.sum / self.total_count if self.total_count else 0.0
+
+    def value_at_percentile(self, percentile: float) -> int:
+        """Az érték, amely alatt (vagy egyenlő) a minták adott százaléka van"""
+        if self.total_count == 0:
+            return 0
+        target = max(1, int(math.ceil(percentile / 100.0 * self.total_count)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._highest_equivalent(index), self.max_value)
+        return self.max_value
+
+    def summary(self, percentiles: List[float] = (50, 95, 99, 99.9)) -> Dict:
+        """Összegzés dict-ként (count, min, mean, percentilisek, max)"""
+        result = {
+            "count": self.total_count,
+            "min": self.min_value or 0,
+            "mean": round(self.mean(), 3),
+        }
+        for percentile in percentiles:
+            result[f"p{percentile:g}"] = self.value_at_percentile(percentile)
+        result["max"] = self.max_value or 0
+        return result
+
+    def to_dict(self) -> Dict:
+        """Szerializálható forma (merge-hez, pl. több folyamat között)"""
+        return {
+            "significant_figures": self.significant_figures,
+            "counts": {str(index): count for index, count in self.counts.items()},
+            "total_count": self.total_count,
+            "min": self.min_value,
+            "max": self.max_value,
+            "sum": self.sum,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "HdrHistogram":
+        hist = cls(data["significant_figures"])
+        hist.counts = Counter({int(index): count for index, count in data["counts"].items()})
+        hist.total_count = data["total_count"]
+        hist.min_value = data["min"]
+        hist.max_value = data["max"]
+        hist.sum = data["sum"]
+        return hist
+
+    def percentile_distribution(self, ticks_per_half_distance: int = 5, scale: float = 1.0, unit: str = "") -> str:
+        """Percentilis eloszlás táblázat (HdrHistogram outputPercentileDistribution formátum)"""
+        lines = [f"{'Value' + (' (' + unit + ')' if unit else ''):>14} {'Percentile':>12} {'TotalCount':>11} {'1/(1-Percentile)':>17}", ""]
+        if self.total_count == 0:
+            return "\n".join(lines)
+
+        percentile = 0.0
+        while True:
+            value = self.value_at_percentile(percentile)
+            # By bucket: the reported value is clamped to max_value, below the highest equivalent of its bucket
+            last_index = self._index(value)
+            count = sum(c for index, c in self.counts.items() if index <= last_index)
+            inverse = 1.0 / (1.0 - percentile / 100.0) if percentile < 100.0 else float("inf")
+            lines.append(f"{value / scale:14.3f} {percentile / 100.0:12.6f} {count:11d} {inverse:17.2f}")
+            if percentile >= 100.0 or count >= self.total_count:
+                break
+            # Halve the remaining distance to 100% every ticks_per_half_distance steps
+            remaining = 100.0 - percentile
+            half_distance = 2 ** int(math.log2(100.0 / remaining)) if remaining > 0 else 1
+            percentile += 50.0 / (ticks_per_half_distance * half_distance)
+            if 100.0 - percentile < 1e-9 or percentile > 99.9999:
+                percentile = 100.0
+
+        lines.append("")
+        lines.append(f"#[Mean = {self.mean() / scale:.3f}, Max = {(self.max_value or 0) / scale:.3f}, Total count = {self.total_count}]")
+        return "\n".join(lines)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+IntelliVend mock hálózati zavarok és újrakapcsolódás
+====================================================
+
+A bárpult Wi-Fi-je gyakran szakad; ez a modul a mock eszközök MQTT kapcsolatát
+rontja konfigurálható módon, hogy mérhető legyen, milyen gyorsan áll helyre a
+backend (handleMessage útvonal), és elveszhet-e adagolás befejezés.
+
+Zavarok (eszközönként, saját reprodukálható véletlen forrással):
+- késleltetés és jitter mindkét irányban; a sorrend megmarad (TCP), a jitter
+  a későbbi üzeneteket is késlelteti
+- üzenet eldobás: csak QoS 0 (status, heartbeat); QoS 1/2 csomagot a protokoll
+  újraküld, az csak késik
+- duplikálás: az üzenet kétszer érkezik (mint egy újraküldött QoS 1 PUBLISH)
+- kényszerített kapcsolatbontás átlagosan N szimulált másodpercenként
+  (exponenciális eloszlás), és fleet szintű "reconnect storm": minden eszköz
+  egyszerre veszti el a kapcsolatot
+
+Újrakapcsolódás exponenciális backoff-fal (equal jitter), sikeres kapcsolódáskor
+nullázva. Az offline idő alatt publikált QoS 1 üzeneteket (befejezések, hibák) a
+mock puffereli és kapcsolódás után sorrendben elküldi; a QoS 0 üzenetek elvesznek.
+
+Használat:
+    impairment = LinkImpairment(latency_ms=80, jitter_ms=40, drop_rate=0.02, disconnect_interval=300)
+    link = ImpairedLink(impairment, random.Random(seed))
+    link.outbound(send, topic, payload, qos, retain)
+    link.inbound(deliver, message)
+"""
+
+import asyncio
+import random
+import socket
+from collections import deque
+from typing import Callable, Optional
+
+from mqtt_broker import LoopbackClient
+
+# Reconnect backoff (simulated seconds): first delay, cap and growth factor
+RECONNECT_INITIAL_DELAY = 1.0
+RECONNECT_MAX_DELAY = 60.0
+RECONNECT_FACTOR = 2.0
+
+# QoS 1/2 messages published while offline, kept for sending after the reconnect
+OFFLINE_BUFFER_SIZE = 256
+
+OUTBOUND = "out"
+INBOUND = "in"
+
+
+class LinkImpairment:
+    """Hálózati zavar beállítások (közös minden eszközre, picklable)"""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, drop_rate: float = 0.0, duplicate_rate: float = 0.0,
+                 disconnect_interval: Optional[float] = None, storm_interval: Optional[float] = None):
+        """
+        Args:
+            latency_ms: Fix késleltetés irányonként (szimulált ms)
+            jitter_ms: Véletlen többlet késleltetés 0..jitter_ms (szimulált ms)
+            drop_rate: QoS 0 üzenetek eldobásának valószínűsége 0.0-1.0
+            duplicate_rate: Üzenetek duplikálásának valószínűsége 0.0-1.0
+            disconnect_interval: Eszközönkénti kapcsolatbontások átlagos távolsága (szimulált s, None = nincs)
+            storm_interval: Fleet szintű, egyidejű kapcsolatbontás periódusa (szimulált s, None = nincs)
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.drop_rate = drop_rate
+        self.duplicate_rate = duplicate_rate
+        self.disconnect_interval = disconnect_interval
+        self.storm_interval = storm_interval
+
+    @property
+    def shapes_traffic(self) -> bool:
+        """Érinti-e az egyes üzeneteket (késleltetés, eldobás, duplikálás)"""
+        return bool(self.latency_ms or self.jitter_ms or self.drop_rate or self.duplicate_rate)
+
+    def describe(self) -> str:
+        """Leírás a banner számára"""
+        parts = []
+        if self.latency_ms or self.jitter_ms:
+            parts.append(f"latency {self.latency_ms:g}ms +0-{self.jitter_ms:g}ms")
+        if self.drop_rate:
+            parts.append(f"drop {self.drop_rate * 100:g}% (QoS 0)")
+        if self.duplicate_rate:
+            parts.append(f"duplicate {self.duplicate_rate * 100:g}%")
+        if self.disconnect_interval:
+            parts.append(f"disconnect every ~{self.disconnect_interval:g}s")
+        if self.storm_interval:
+            parts.append(f"reconnect storm every {self.storm_interval:g}s")
+        return ", ".join(parts) or "none"
+
+
+class ImpairedLink:
+    """Egy eszköz zavart kapcsolata (irányonként sorrendtartó késleltetés, eldobás, duplikálás)"""
+
+    def __init__(self, impairment: LinkImpairment, rng: random.Random, metrics=None):
+        """
+        Args:
+            impairment: Zavar beállítások
+            rng: Az eszköz saját véletlen forrása (a parancs szimulációtól független)
+            metrics: MockMetrics a számlálókhoz (opcionális)
+        """
+        self.impairment = impairment
+        self.random = rng
+        self.metrics = metrics
+        # Per direction: earliest time the next message may arrive (keeps TCP ordering under jitter),
+        # and the messages in flight in sending order (timers due at the same time fire in any order)
+        self.next_due = {OUTBOUND: 0.0, INBOUND: 0.0}
+        self.in_flight = {OUTBOUND: deque(), INBOUND: deque()}
+
+    def outbound(self, send: Callable, topic: str, payload, qos: int, retain: bool = False):
+        """Publikálás a zavart kapcsolaton: send(topic, payload, qos, retain) később / kétszer / soha"""
+        self.transfer(OUTBOUND, qos, send, topic, payload, qos, retain)
+
+    def inbound(self, deliver: Callable, message):
+        """Fogadott üzenet kézbesítése a zavart kapcsolaton: deliver(message)"""
+        self.transfer(INBOUND, message.qos, deliver, message)
+
+    def transfer(self, direction: str, qos: int, callback: Callable, *args):
+        impairment = self.impairment
+        if qos == 0 and impairment.drop_rate and self.random.random() < impairment.drop_rate:
+            if self.metrics is not None:
+                self.metrics.link_dropped.inc((direction,))
+            return
+
+        copies = 1
+        if impairment.duplicate_rate and self.random.random() < impairment.duplicate_rate:
+            copies = 2
+            if self.metrics is not None:
+                self.metrics.link_duplicated.inc((direction,))
+
+        loop = asyncio.get_running_loop()
+        if not (impairment.latency_ms or impairment.jitter_ms):
+            for _ in range(copies):
+                loop.call_soon(callback, *args)
+            return
+
+        delay = (impairment.latency_ms + self.random.uniform(0.0, impairment.jitter_ms)) / 1000.0
+        due = max(loop.time() + delay, self.next_due[direction])
+        self.next_due[direction] = due
+        for _ in range(copies):
+            self.in_flight[direction].append((callback, args))
+            loop.call_at(due, self.arrive, direction)
+
+    def arrive(self, direction: str):
+        """A legrégebbi úton lévő üzenet kézbesítése (a due idők irányonként nem csökkennek)"""
+        callback, args = self.in_flight[direction].popleft()
+        callback(*args)
+
+    async def run(self, device):
+        """Kényszerített kapcsolatbontások átlagosan disconnect_interval szimulált másodpercenként"""
+        interval = self.impairment.disconnect_interval
+        while True:
+            await asyncio.sleep(self.random.expovariate(1.0 / interval))
+            if device.connected:
+                device.force_disconnect("link impairment")
+
+
+class ReconnectBackoff:
+    """Exponenciális backoff equal jitter-rel (a fél késleltetés fix, a másik fele véletlen)"""
+
+    def __init__(self, rng: random.Random, initial: float = RECONNECT_INITIAL_DELAY, maximum: float = RECONNECT_MAX_DELAY,
+                 factor: float = RECONNECT_FACTOR):
+        self.random = rng
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.attempt = 0
+
+    def next(self) -> float:
+        """A következő várakozás (szimulált s); a maximum eléréséig minden hívás duplázza"""
+        delay = min(self.maximum, self.initial * self.factor ** self.attempt)
+        if delay < self.maximum:
+            self.attempt += 1
+        return delay / 2 + self.random.uniform(0.0, delay / 2)
+
+    def reset(self):
+        self.attempt = 0
+
+
+def force_disconnect(client):
+    """Váratlan kapcsolatvesztés (a broker szempontjából hálózati hiba, Last Will-lel)"""
+    if isinstance(client, LoopbackClient):
+        client.drop()
+        return
+
+    # paho: shut the socket down under the client; the network loop sees EOF and reports a lost connection
+    sock = client.socket()
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
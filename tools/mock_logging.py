@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+IntelliVend mock naplózás
+=========================
+
+Nem blokkoló, strukturált naplózás az ESP32 mock számára (a print hívások helyett).
+
+- A naplóbejegyzések egy sorba kerülnek (QueueHandler), a kiírást egy háttérszál
+  végzi (QueueListener), így a konzol / fájl I/O nem lassítja az event loop-ot
+- A %-stílusú üzenetek formázása is a háttérszálon történik
+- Szintek: --quiet (csak figyelmeztetések és hibák), alap (INFO), --verbose (DEBUG)
+- Kategóriánkénti mintavételezés, pl. "status=100" -> minden 100. status tick kerül a naplóba
+- Opcionális JSON-lines napló fájl (egy JSON objektum soronként)
+
+Letiltott szint vagy kimaradó minta esetén a hívás még a LogRecord létrehozása
+előtt visszatér, így a hot path-okon nincs string formázás.
+
+Használat:
+    listener = setup_logging(logging.INFO, log_file="mock.jsonl", sampling={"status": 100})
+    log = DeviceLogger("[ESP32]", "ESP32_MOCK")
+    log.info("Dispense complete: %.2fml", actual_ml, category="dispense", pump_id=3)
+    listener.stop()
+"""
+
+import json
+import logging
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from typing import Dict, Optional
+
+LOGGER_NAME = "intellivend.mock"
+
+# Argument types formatted eagerly (they may change before the listener thread runs)
+_MUTABLE_ARGS = (dict, list, set, bytearray)
+
+
+class Sampler:
+    """Kategóriánkénti 1 / N mintavételezés"""
+
+    def __init__(self, rates: Optional[Dict[str, int]] = None):
+        self.rates: Dict[str, int] = dict(rates or {})
+        self.counters: Dict[str, int] = {}
+
+    def allow(self, category: str) -> bool:
+        rate = self.rates.get(category)
+        if rate is None or rate <= 1:
+            return True
+        count = self.counters.get(category, 0)
+        self.counters[category] = count + 1
+        return count % rate == 0
+
+
+_sampler = Sampler()
+
+
+class DeviceLogger:
+    """Eszközönkénti logger (tag prefix, kategória és strukturált mezők)"""
+
+    __slots__ = ("logger", "tag", "device")
+
+    def __init__(self, tag: str, device: Optional[str] = None):
+        """
+        Args:
+            tag: Konzol prefix, pl. "[ESP32]" vagy "[ESP32_MOCK_001]"
+            device: Eszköz azonosító a strukturált naplóban
+        """
+        self.logger = logging.getLogger(LOGGER_NAME)
+        self.tag = tag
+        self.device = device
+
+    def isEnabledFor(self, level: int) -> bool:
+        """Engedélyezett-e a szint (drága argumentumok előállítása előtti ellenőrzéshez)"""
+        return self.logger.isEnabledFor(level)
+
+    def log(self, level: int, msg: str, *args, category: str = "general", **fields):
+        if not self.logger.isEnabledFor(level) or not _sampler.allow(category):
+            return
+        self.logger.log(level, msg, *args, extra={"tag": self.tag, "device": self.device, "category": category, "fields": fields})
+
+    def debug(self, msg: str, *args, category: str = "general", **fields):
+        self.log(logging.DEBUG, msg, *args, category=category, **fields)
+
+    def info(self, msg: str, *args, category: str = "general", **fields):
+        self.log(logging.INFO, msg, *args, category=category, **fields)
+
+    def warning(self, msg: str, *args, category: str = "general", **fields):
+        self.log(logging.WARNING, msg, *args, category=category, **fields)
+
+    def error(self, msg: str, *args, category: str = "general", **fields):
+        self.log(logging.ERROR, msg, *args, category=category, **fields)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler, ami a formázást a listener szálra hagyja (immutable argumentumok esetén)"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            return super().prepare(record)
+        args = record.args
+        if isinstance(args, dict) or any(isinstance(arg, _MUTABLE_ARGS) for arg in args or ()):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class ConsoleFormatter(logging.Formatter):
+    """Konzol formátum: "<tag> <üzenet>" (mint a korábbi print kimenet)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        tag = getattr(record, "tag", None)
+        return f"{tag} {message}" if tag else message
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Strukturált napló: egy JSON objektum soronként"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).replace(tzinfo=None).isoformat() + "Z",
+            "level": record.levelname,
+            "device": getattr(record, "device", None),
+            "category": getattr(record, "category", "general"),
+            "message": record.getMessage(),
+        }
+        for key, value in (getattr(record, "fields", None) or {}).items():
+            if value is not None:
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+
+def parse_sampling(value: str) -> Dict[str, int]:
+    """Mintavételezés feldolgozása, pl. "status=100,heartbeat=10" """
+    rates = {}
+    for part in value.split(","):
+        if not part.strip():
+            continue
+        category, _, rate = part.partition("=")
+        try:
+            rates[category.strip()] = int(rate)
+        except ValueError:
+            raise ValueError(f"Invalid sampling rate: {part}")
+        if rates[category.strip()] < 1:
+            raise ValueError(f"Sampling rate must be at least 1: {part}")
+    return rates
+
+
+def setup_logging(level: int = logging.INFO, log_file: Optional[str] = None, file_level: int = logging.INFO,
+                  sampling: Optional[Dict[str, int]] = None) -> QueueListener:
+    """Háttérszálas naplózás beállítása; a visszaadott listener-t kilépéskor le kell állítani (stop())
+
+    Args:
+        level: Konzol naplózási szint
+        log_file: JSON-lines napló fájl (opcionális)
+        file_level: A napló fájl szintje (független a konzoltól, pl. --quiet mellett is teljes)
+        sampling: Kategóriánkénti mintavételezés (kategória -> N, minden N. üzenet)
+    """
+    console = logging.StreamHandler(sys.stdout)
+    console.setLevel(level)
+    console.setFormatter(ConsoleFormatter())
+    handlers = [console]
+    effective = level
+
+    if log_file:
+        file_handler = logging.FileHandler(log_file, encoding="utf-8")
+        file_handler.setLevel(file_level)
+        file_handler.setFormatter(JsonLinesFormatter())
+        handlers.append(file_handler)
+        effective = min(level, file_level)
+
+    queue = SimpleQueue()
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(DeferredQueueHandler(queue))
+    logger.setLevel(effective)
+    logger.propagate = False
+
+    _sampler.rates = dict(sampling or {})
+    _sampler.counters.clear()
+
+    listener = QueueListener(queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+IntelliVend mock metrikák
+=========================
+
+Függőség nélküli, Prometheus kompatibilis metrikák és /metrics HTTP végpont az
+ESP32 mock számára (text exposition format 0.0.4), hogy a szimulátor és a
+backend terhelés alatt egymás mellett figyelhető legyen Grafanában.
+
+A metrikák a teljes folyamatra (fleet esetén minden eszközre) összesítettek; a
+címkék csak a topic név (eszköz prefix nélkül), a parancs típus és az error_code,
+így a kardinalitás az eszközszámtól független.
+
+Több folyamatos fleet (--processes) esetén minden worker folyamat a saját
+registry-jének snapshot-ját küldi a szülőnek, amely a MergedRegistry-vel
+összegzi és egyetlen /metrics végponton szolgálja ki.
+
+Használat:
+    metrics = MockMetrics()
+    server = MetricsServer(metrics.registry, "127.0.0.1", 9108)
+    await server.start()
+    ...
+    curl http://127.0.0.1:9108/metrics
+"""
+
+import asyncio
+import bisect
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Handler duration buckets (simulated seconds): dispenses take seconds, calibrations up to ~30s
+HANDLER_BUCKETS = (0.005, 0.05, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Monoton növekvő számláló (opcionális címkékkel)"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # An unlabelled counter is exposed as 0 before the first increment
+        self.values: Dict[Tuple[str, ...], float] = {} if self.labelnames else {(): 0.0}
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                for labels, value in sorted(self.values.items())]
+
+    def snapshot(self) -> Dict:
+        return {"kind": self.kind, "name": self.name, "documentation": self.documentation,
+                "labelnames": self.labelnames, "values": dict(self.values)}
+
+
+class Gauge:
+    """Pillanatnyi érték, a lekérdezéskor meghívott függvényből"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, collect: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {_format_value(self.collect())}"]
+
+    def snapshot(self) -> Dict:
+        return {"kind": self.kind, "name": self.name, "documentation": self.documentation,
+                "labelnames": (), "values": {(): self.collect()}}
+
+
+class Histogram:
+    """Kumulatív bucket-es hisztogram (opcionális címkékkel)"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = HANDLER_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, labels: Tuple[str, ...] = ()):
+        series = self.series.get(labels)
+        if series is None:
+            # Per-bucket counts (+Inf last), sum, count
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = ("le", _format_value(bound) if bound != math.inf else "+Inf")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+    def snapshot(self) -> Dict:
+        return {"kind": self.kind, "name": self.name, "documentation": self.documentation,
+                "labelnames": self.labelnames, "buckets": self.buckets,
+                "series": {labels: [list(counts), total, count] for labels, (counts, total, count) in self.series.items()}}
+
+
+class Registry:
+    """Metrikák gyűjteménye és a Prometheus text formátumú kimenet"""
+
+    def __init__(self):
+        self.metrics: List = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> List[Dict]:
+        """Az összes metrika pillanatnyi értéke picklable formában (folyamatok közötti küldéshez)"""
+        return [metric.snapshot() for metric in self.metrics]
+
+
+class MergedRegistry:
+    """Több folyamat registry snapshot-jainak összesítése (counter, gauge: összeg, hisztogram: bucket-enként)"""
+
+    def __init__(self):
+        self.snapshots: Dict[int, List[Dict]] = {}
+
+    def update(self, source: int, snapshot: List[Dict]):
+        """Egy folyamat (shard) legutóbbi snapshot-ja; a korábbit felülírja"""
+        self.snapshots[source] = snapshot
+
+    def total(self, name: str, source: Optional[int] = None) -> float:
+        """Egy counter vagy gauge összege minden címkére (source: csak egy folyamaté)"""
+        sources = [source] if source is not None else list(self.snapshots)
+        return sum(sum(metric["values"].values())
+                   for index in sources for metric in self.snapshots.get(index, ()) if metric["name"] == name)
+
+    def render(self) -> str:
+        merged: Dict[str, object] = {}
+        for snapshot in self.snapshots.values():
+            for data in snapshot:
+                metric = merged.get(data["name"])
+                if data["kind"] == "histogram":
+                    if metric is None:
+                        metric = merged[data["name"]] = Histogram(data["name"], data["documentation"], data["labelnames"], data["buckets"])
+                    for labels, (counts, total, count) in data["series"].items():
+                        series = metric.series.setdefault(labels, [[0] * len(counts), 0.0, 0])
+                        series[0] = [a + b for a, b in zip(series[0], counts)]
+                        series[1] += total
+                        series[2] += count
+                else:
+                    if metric is None:
+                        metric = merged[data["name"]] = Counter(data["name"], data["documentation"], data["labelnames"])
+                        metric.kind = data["kind"]
+                        metric.values = {}
+                    for labels, value in data["values"].items():
+                        metric.values[labels] = metric.values.get(labels, 0.0) + value
+
+        registry = Registry()
+        for metric in merged.values():
+            registry.register(metric)
+        return registry.render()
+
+
+class MockMetrics:
+    """Az ESP32 mock metrikái (egy példány a teljes fleet-re)"""
+
+    def __init__(self):
+        self.registry = Registry()
+        self.devices: List = []
+
+        self.messages_received = self.registry.register(Counter(
+            "intellivend_mock_messages_received_total", "MQTT messages received, by topic (without device prefix)", ("topic",)))
+        self.messages_published = self.registry.register(Counter(
+            "intellivend_mock_messages_published_total", "MQTT messages published, by topic (without device prefix)", ("topic",)))
+        self.handler_duration = self.registry.register(Histogram(
+            "intellivend_mock_handler_duration_seconds", "Command handler execution time in simulated seconds, by command", ("command",)))
+        self.errors = self.registry.register(Counter(
+            "intellivend_mock_errors_total", "Errors published, by error_code", ("error_code",)))
+        self.reconnects = self.registry.register(Counter(
+            "intellivend_mock_mqtt_reconnects_total", "MQTT reconnect attempts"))
+        self.outages = self.registry.register(Histogram(
+            "intellivend_mock_mqtt_outage_seconds", "Time from losing the broker connection to the next CONNACK, in simulated seconds"))
+        self.forced_disconnects = self.registry.register(Counter(
+            "intellivend_mock_forced_disconnects_total", "Connections dropped by link impairment or reconnect storms"))
+        self.link_dropped = self.registry.register(Counter(
+            "intellivend_mock_link_dropped_total", "QoS 0 messages dropped by link impairment, by direction", ("direction",)))
+        self.link_duplicated = self.registry.register(Counter(
+            "intellivend_mock_link_duplicated_total", "Messages duplicated by link impairment, by direction", ("direction",)))
+        self.offline_buffered = self.registry.register(Counter(
+            "intellivend_mock_offline_buffered_total", "QoS 1/2 messages buffered while disconnected"))
+        self.offline_dropped = self.registry.register(Counter(
+            "intellivend_mock_offline_dropped_total", "Messages lost while disconnected (QoS 0, or offline buffer full)"))
+        self.orders = self.registry.register(Counter(
+            "intellivend_mock_orders_total", "Orders handled by the device order queues, by result", ("result",)))
+        self.order_wait = self.registry.register(Histogram(
+            "intellivend_mock_order_wait_seconds", "Time an order waited in the device order queue before pouring, in simulated seconds"))
+        self.command_dedup = self.registry.register(Counter(
+            "intellivend_mock_command_dedup_total",
+            "Commands checked against the dedup cache, by result (hit = redelivery not executed, untracked = no command_id or timestamp)",
+            ("result",)))
+
+        self.registry.register(Gauge(
+            "intellivend_mock_devices_connected", "Simulated devices currently connected to the broker",
+            lambda: sum(1 for device in self.devices if device.connected)))
+        self.registry.register(Gauge(
+            "intellivend_mock_active_operations", "Operations (dispense, flush, calibration) in progress",
+            lambda: sum(len(device.operations) for device in self.devices)))
+        self.registry.register(Gauge(
+            "intellivend_mock_pumps_active", "Pumps currently running",
+            lambda: sum(table.active_total() for table in {id(device.pump_state): device.pump_state for device in self.devices}.values())))
+        self.registry.register(Gauge(
+            "intellivend_mock_dispatch_queue_depth", "Commands waiting in the dispatch queues",
+            lambda: sum(device.job_queue.qsize() for device in self.devices if device.job_queue is not None)))
+        self.registry.register(Gauge(
+            "intellivend_mock_orders_waiting", "Orders waiting in the device order queues",
+            lambda: sum(len(device.orders) for device in self.devices if device.orders is not None)))
+        self.registry.register(Gauge(
+            "intellivend_mock_dedup_entries", "Commands remembered in the device dedup caches",
+            lambda: sum(len(device.dedup) for device in self.devices if device.dedup is not None)))
+        self.registry.register(Gauge(
+            "intellivend_mock_workers", "Command worker coroutines",
+            lambda: sum(device.workers for device in self.devices if device.job_queue is not None)))
+        self.registry.register(Gauge(
+            "intellivend_mock_threads", "Operating system threads in the mock process",
+            threading.active_count))
+
+    def attach(self, device):
+        """Eszköz hozzáadása az összesített gauge-okhoz"""
+        self.devices.append(device)
+
+
+class MetricsServer:
+    """Minimális asyncio HTTP szerver a GET /metrics végponthoz"""
+
+    def __init__(self, registry: Registry, host: str = "127.0.0.1", port: int = 9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            # Skip request headers
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            parts = request_line.decode("latin-1").split()
+            path = parts[1].split("?", 1)[0] if len(parts) >= 2 else ""
+            if len(parts) >= 2 and parts[0] == "GET" and path == "/metrics":
+                status, content_type, body = "200 OK", "text/plain; version=0.0.4; charset=utf-8", self.registry.render().encode()
+            else:
+                status, content_type, body = "404 Not Found", "text/plain; charset=utf-8", b"Not found. Try /metrics\n"
+
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                         f"Connection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (ConnectionError, UnicodeDecodeError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+IntelliVend mock profilozás
+===========================
+
+Beépített profilozás a szimulátorhoz, ha terhelés alatt maga a mock lassul.
+
+- CPU: a parancs handlerek (handle_dispense_command, handle_flush_command,
+  handle_calibration_command, handle_emergency_stop) és a külön taskban futó
+  szimulációs workerek (pour_ingredient, calibrate_pump) handlerenként saját
+  cProfile profillal futnak. A profil csak a coroutine saját lépései alatt
+  aktív (az event loop többi taskja nem keveredik bele); a handlerből közvetlenül
+  hívott simulate_* függvények a handler profiljában jelennek meg.
+- Memória: tracemalloc; minden profilozott lépés nettó foglalása az adott
+  eszközhöz számítódik (közelítés: amit egy lépés lefoglal és később más
+  szabadít fel, annál az eszköznél marad), és időszakos snapshot-ok a
+  legnagyobb / leggyorsabban növő foglalási helyekről.
+- Kimenet leállításkor (és kérésre): flamegraph kompatibilis collapsed-stack
+  fájl (<prefix>.collapsed, flamegraph.pl / speedscope) és összesítő táblázat
+  (<prefix>.txt). A collapsed stack-ek a cProfile hívási gráfjából becsültek
+  (a hívók közötti időmegosztás arányos).
+
+Futás közben kapcsolható az intellivend/mock/profile topicon, így kikapcsolt
+állapotban a handlerek nem fizetik meg a profilozás árát:
+    {"enabled": true}                 CPU profilozás be / ki
+    {"memory": true}                  tracemalloc be / ki
+    {"dump": true}                    kimeneti fájlok írása most
+    {"reset": true}                   eddigi adatok törlése
+
+Használat:
+    python3 esp32_mock.py --devices 200 --profile --profile-memory 30
+    python3 esp32_mock.py --devices 200 --profile-paused
+    mosquitto_pub -t intellivend/mock/profile -m '{"enabled": true}'
+    flamegraph.pl mock_profile.collapsed > mock_profile.svg
+"""
+
+import asyncio
+import cProfile
+import os
+import pstats
+import time
+import tracemalloc
+import types
+from typing import Dict, List, Optional, Tuple
+
+from mock_logging import DeviceLogger
+
+PROFILE_TOPIC = "intellivend/mock/profile"
+
+# Traceback depth kept by tracemalloc (deeper = more precise sites, more overhead)
+TRACEMALLOC_FRAMES = 8
+
+# Rows of the summary tables, and recursion limit of the collapsed-stack walk
+TOP_FUNCTIONS = 3
+TOP_ROWS = 15
+MAX_STACK_DEPTH = 64
+
+
+def frame_name(function: Tuple[str, int, str]) -> str:
+    """pstats függvény kulcs -> collapsed-stack keret név (fájl:függvény:sor)"""
+    filename, lineno, name = function
+    if filename == "~":
+        return name.strip("<>").replace(";", ",")  # built-ins, e.g. <method 'send' of 'coroutine' objects>
+    return f"{os.path.basename(filename)}:{name}:{lineno}".replace(";", ",")
+
+
+def collapsed_stacks(stats: pstats.Stats, root: str) -> Dict[str, int]:
+    """Becsült collapsed stack-ek (mikroszekundum) egy cProfile profilból
+
+    A saját idő (tottime) a hívási utak között a hívónkénti kumulatív idő
+    arányában oszlik meg; rekurzív hívásoknál az út megszakad.
+    """
+    entries = stats.stats
+    callees: Dict[Tuple, List[Tuple[Tuple, float]]] = {}
+    for function, (_, _, _, _, callers) in entries.items():
+        for caller, (_, _, _, cumulative) in callers.items():
+            callees.setdefault(caller, []).append((function, cumulative))
+
+    stacks: Dict[str, int] = {}
+
+    def visit(function, path: List[str], visited: frozenset, weight: float):
+        _, _, own, cumulative, _ = entries[function]
+        path = path + [frame_name(function)]
+        micros = int(own * weight * 1_000_000)
+        if micros > 0:
+            key = ";".join(path)
+            stacks[key] = stacks.get(key, 0) + micros
+        if len(path) >= MAX_STACK_DEPTH:
+            return
+        for callee, edge in callees.get(function, ()):
+            callee_cumulative = entries[callee][3]
+            if callee in visited or edge <= 0 or callee_cumulative <= 0:
+                continue
+            visit(callee, path, visited | {callee}, weight * edge / callee_cumulative)
+
+    for function, (_, _, _, _, callers) in entries.items():
+        if not callers:
+            visit(function, [root], frozenset({function}), 1.0)
+    return stacks
+
+
+class LabelProfile:
+    """Egy handler / worker cProfile profilja és számlálói"""
+
+    __slots__ = ("profile", "invocations", "steps", "wall")
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.invocations = 0
+        self.steps = 0
+        self.wall = 0.0
+
+
+class MockProfiler:
+    """Folyamatonként egy profiler (fleet esetén közös minden eszközre)"""
+
+    def __init__(self, output_prefix: str = "mock_profile", enabled: bool = True, memory_interval: Optional[float] = None):
+        """
+        Args:
+            output_prefix: Kimeneti fájlok előtagja (<prefix>.collapsed, <prefix>.txt)
+            enabled: CPU profilozás induláskor (False: csak az MQTT vezérlő topicról kapcsolható be)
+            memory_interval: tracemalloc snapshot-ok közötti idő szimulált másodpercben (None = memória profil kikapcsolva)
+        """
+        self.output_prefix = output_prefix
+        self.enabled = enabled
+        self.memory_interval = memory_interval
+        self.log = DeviceLogger("[PROFILE]")
+
+        self.labels: Dict[str, LabelProfile] = {}
+        self.active = False  # a profile is collecting on the event loop thread right now
+        self.control_device = None
+
+        # Memory: net allocation per device during profiled steps, and snapshots
+        self.memory = False
+        self.device_bytes: Dict[str, int] = {}
+        self.first_snapshot: Optional[tracemalloc.Snapshot] = None
+        self.last_snapshot: Optional[tracemalloc.Snapshot] = None
+        self.snapshots = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def attach(self, device) -> bool:
+        """Eszköz regisztrálása; az első eszköz iratkozik fel a vezérlő topicra (True)"""
+        if self.control_device is None:
+            self.control_device = device
+            return True
+        return False
+
+    def describe(self) -> str:
+        """Leírás a banner számára"""
+        memory = f"memory every {self.memory_interval:g}s" if self.memory_interval else "memory off"
+        return f"CPU {'on' if self.enabled else 'paused'}, {memory} (control: {PROFILE_TOPIC}, output: {self.output_prefix}.collapsed/.txt)"
+
+    # --- Wrapping (no-op while disabled) ---
+
+    def wrap(self, device_id: str, label: str, coro):
+        """Coroutine profilozott futtatása (kikapcsolt állapotban változatlanul visszaadja)"""
+        if not (self.enabled or self.memory):
+            return coro
+        return self._profiled(device_id, label, coro)
+
+    def call(self, device_id: str, label: str, function, *args):
+        """Szinkron handler profilozott hívása (pl. emergency stop a priority lane-en)"""
+        if not (self.enabled or self.memory) or self.active:
+            return function(*args)
+        entry = self.entry(label)
+        entry.invocations += 1
+        return self.step(device_id, entry, function, *args)
+
+    def entry(self, label: str) -> LabelProfile:
+        entry = self.labels.get(label)
+        if entry is None:
+            entry = self.labels[label] = LabelProfile()
+        return entry
+
+    def step(self, device_id: str, entry: LabelProfile, function, *args):
+        """Egy lépés futtatása a label profiljával; beágyazott lépésnél a külső profil gyűjt"""
+        if self.active:
+            return function(*args)
+        cpu = self.enabled
+        memory = self.memory
+        allocated = tracemalloc.get_traced_memory()[0] if memory else 0
+        started = time.perf_counter()
+        self.active = True
+        if cpu:
+            entry.profile.enable()
+        try:
+            return function(*args)
+        finally:
+            if cpu:
+                entry.profile.disable()
+            self.active = False
+            entry.steps += 1
+            entry.wall += time.perf_counter() - started
+            if memory and tracemalloc.is_tracing():
+                self.device_bytes[device_id] = self.device_bytes.get(device_id, 0) + tracemalloc.get_traced_memory()[0] - allocated
+
+    async def _profiled(self, device_id: str, label: str, coro):
+        entry = self.entry(label)
+        entry.invocations += 1
+        return await self._drive(device_id, entry, coro)
+
+    @types.coroutine
+    def _drive(self, device_id: str, entry: LabelProfile, coro):
+        # Drive the coroutine by hand, so the profile is only enabled while its own steps run
+        value = None
+        error = None
+        try:
+            while True:
+                try:
+                    if error is None:
+                        yielded = self.step(device_id, entry, coro.send, value)
+                    else:
+                        yielded = self.step(device_id, entry, coro.throw, error)
+                except StopIteration as stop:
+                    return stop.value
+                try:
+                    value = yield yielded
+                    error = None
+                except BaseException as e:
+                    value = None
+                    error = e
+        finally:
+            coro.close()
+
+    # --- Runtime control ---
+
+    def handle_control(self, payload: Dict):
+        """Vezérlő üzenet (intellivend/mock/profile)"""
+        if payload.get("reset"):
+            self.reset()
+        if "enabled" in payload:
+            self.enabled = bool(payload["enabled"])
+            self.log.info("CPU profiling %s", "enabled" if self.enabled else "disabled", category="profile")
+        if "memory" in payload:
+            self.set_memory(bool(payload["memory"]))
+        if payload.get("dump"):
+            self.write()
+
+    def set_memory(self, enabled: bool):
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        elif not enabled and tracemalloc.is_tracing():
+            self.take_snapshot()
+            tracemalloc.stop()
+        self.memory = enabled
+        self.log.info("Memory profiling %s", "enabled" if enabled else "disabled", category="profile")
+
+    def reset(self):
+        self.labels.clear()
+        self.device_bytes.clear()
+        self.first_snapshot = None
+        self.last_snapshot = None
+        self.snapshots = 0
+        self.log.info("Profile data reset", category="profile")
+
+    # --- Memory snapshots (service: start / stop) ---
+
+    async def start(self):
+        if self.memory_interval:
+            self.set_memory(True)
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        self.write()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    async def run(self):
+        """Időszakos tracemalloc snapshot-ok (amíg a memória profil be van kapcsolva)"""
+        while True:
+            await asyncio.sleep(self.memory_interval or 60.0)
+            if self.memory and tracemalloc.is_tracing():
+                self.take_snapshot()
+
+    def take_snapshot(self):
+        snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+        if self.first_snapshot is None:
+            self.first_snapshot = snapshot
+        self.last_snapshot = snapshot
+        self.snapshots += 1
+        current, peak = tracemalloc.get_traced_memory()
+        top = max(self.device_bytes.items(), key=lambda item: item[1], default=None)
+        self.log.info("Memory snapshot %d: %.1f MB traced (peak %.1f MB)%s", self.snapshots, current / 1e6, peak / 1e6,
+                      f", top device {top[0]} {top[1] / 1e3:+.1f} KB" if top else "", category="profile")
+
+    # --- Output ---
+
+    def summary_lines(self) -> List[str]:
+        """Összesítő táblázat (handlerenként CPU idő, top függvények; eszközönkénti memória)"""
+        lines = [f"{'Handler':<28} {'Calls':>8} {'Steps':>9} {'CPU s':>9} {'ms/call':>9}  Top functions (tottime)"]
+        for label, entry in sorted(self.labels.items(), key=lambda item: -item[1].wall):
+            functions = []
+            total = 0.0
+            if entry.profile.getstats():
+                stats = pstats.Stats(entry.profile)
+                total = stats.total_tt
+                ranked = sorted(stats.stats.items(), key=lambda item: -item[1][2])[:TOP_FUNCTIONS]
+                functions = [f"{frame_name(function)} {data[2] * 1000:.1f}ms" for function, data in ranked]
+            per_call = total * 1000 / entry.invocations if entry.invocations else 0.0
+            lines.append(f"{label:<28} {entry.invocations:>8} {entry.steps:>9} {total:>9.3f} {per_call:>9.3f}  {', '.join(functions)}")
+
+        if self.device_bytes:
+            lines.append("")
+            lines.append(f"{'Device':<28} {'Net allocated KB':>16}")
+            for device_id, size in sorted(self.device_bytes.items(), key=lambda item: -item[1])[:TOP_ROWS]:
+                lines.append(f"{device_id:<28} {size / 1e3:>16.1f}")
+
+        if self.last_snapshot is not None:
+            lines.append("")
+            lines.append(f"{'Allocation site':<60} {'KB':>10} {'Growth KB':>10}")
+            for stat in self.last_snapshot.compare_to(self.first_snapshot, "lineno")[:TOP_ROWS]:
+                frame = stat.traceback[0]
+                site = f"{os.path.basename(frame.filename)}:{frame.lineno}"
+                lines.append(f"{site:<60} {stat.size / 1e3:>10.1f} {stat.size_diff / 1e3:>+10.1f}")
+        return lines
+
+    def write(self):
+        """Collapsed-stack fájl és összesítő írása (felülírja az előzőt)"""
+        if not self.labels and not self.device_bytes:
+            return
+        stacks: Dict[str, int] = {}
+        for label, entry in self.labels.items():
+            if entry.profile.getstats():
+                for stack, micros in collapsed_stacks(pstats.Stats(entry.profile), label).items():
+                    stacks[stack] = stacks.get(stack, 0) + micros
+
+        try:
+            with open(f"{self.output_prefix}.collapsed", "w", encoding="utf-8") as f:
+                for stack, micros in sorted(stacks.items()):
+                    f.write(f"{stack} {micros}\n")
+            lines = self.summary_lines()
+            with open(f"{self.output_prefix}.txt", "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            self.log.error("Cannot write profile: %s", e, category="profile")
+            return
+
+        for line in lines:
+            self.log.info("%s", line, category="profile")
+        self.log.info("Profile written to %s.collapsed and %s.txt", self.output_prefix, self.output_prefix, category="profile")
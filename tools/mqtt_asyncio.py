@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+IntelliVend paho-mqtt asyncio integráció
+========================================
+
+A paho-mqtt kliens socket eseményeit egy asyncio event loop-ba köti, így a
+hálózati ciklust nem külön szál hajtja. A mock, a load generator és a benchmark
+közösen használja.
+
+Használat:
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    AsyncioHelper(asyncio.get_running_loop(), client)
+    client.connect(host, port)
+"""
+
+import asyncio
+from typing import Optional
+
+import paho.mqtt.client as mqtt
+
+
+class AsyncioHelper:
+    """paho-mqtt kliens socket eseményeinek bekötése egy asyncio event loop-ba
+
+    A paho hálózati ciklusát (loop_read / loop_write / loop_misc) így nem egy
+    külön szál hajtja, hanem a közös event loop, ezért sok kliens futhat egy szálon.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, client: mqtt.Client):
+        self.loop = loop
+        self.client = client
+        self.misc: Optional[asyncio.Task] = None
+
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self.misc = self.loop.create_task(self.misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self.misc is not None:
+            self.misc.cancel()
+            self.misc = None
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def misc_loop(self):
+        """Keepalive / ping kezelés másodpercenként"""
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
@@ -0,0 +1,807 @@
+#!/usr/bin/env python3
+"""
+IntelliVend beágyazott MQTT broker
+==================================
+
+Függőség nélküli, asyncio alapú MQTT 3.1.1 broker offline teszteléshez és
+teljesítmény mérésekhez. A mock, a terhelés generátor és a Node backend is
+kapcsolódhat hozzá localhoston, így nem kell Mosquitto / Home Assistant broker.
+
+Támogatott:
+- QoS 0/1/2 (a QoS 2 exactly-once kézfogással)
+- Retained üzenetek
+- Wildcard feliratkozások (+ és #), topic fa alapú illesztéssel
+- Last Will üzenetek, keepalive figyelés, persistent session (clean_session=False)
+- Opcionális username/password ellenőrzés
+
+Loopback transport: a LoopbackClient ugyanabban a folyamatban, TCP és MQTT
+kódolás nélkül kapcsolódik a brokerhez. A payload bytes objektum másolás nélkül
+jut el a feliratkozókhoz, a QoS kézfogás elmarad (a kézbesítés folyamaton belül
+megbízható). Az API a paho-mqtt kliens általunk használt részével egyezik.
+
+Használat:
+    python3 mqtt_broker.py                      # 127.0.0.1:1883
+    python3 mqtt_broker.py --host 0.0.0.0 --port 1884 --username u --password p
+"""
+
+import asyncio
+import argparse
+import itertools
+import time
+from collections import deque
+from typing import Dict, Optional, Set, Tuple
+
+# MQTT control packet types
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+PUBREC = 5
+PUBREL = 6
+PUBCOMP = 7
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+# CONNACK return codes
+CONNACK_ACCEPTED = 0
+CONNACK_BAD_PROTOCOL = 1
+CONNACK_IDENTIFIER_REJECTED = 2
+CONNACK_BAD_CREDENTIALS = 4
+
+# Maximum number of QoS > 0 messages queued for an offline persistent session
+MAX_QUEUED_MESSAGES = 1000
+
+# QoS 0 messages are dropped for a client whose socket write buffer exceeds this (bytes)
+MAX_WRITE_BUFFER = 1024 * 1024
+
+# Time allowed between TCP accept and CONNECT (seconds)
+CONNECT_TIMEOUT = 10.0
+
+
+class ProtocolError(Exception):
+    """Hibás vagy nem támogatott MQTT csomag"""
+
+
+class _TopicNode:
+    __slots__ = ("children", "subscribers")
+
+    def __init__(self):
+        self.children: Dict[str, "_TopicNode"] = {}
+        self.subscribers: Dict["Session", int] = {}
+
+
+class SubscriptionTree:
+    """Topic szűrők fája: egy publish illesztése a topic szintjeinek számával arányos"""
+
+    def __init__(self):
+        self.root = _TopicNode()
+
+    def add(self, topic_filter: str, session: "Session", qos: int):
+        node = self.root
+        for level in topic_filter.split("/"):
+            node = node.children.setdefault(level, _TopicNode())
+        node.subscribers[session] = qos
+
+    def remove(self, topic_filter: str, session: "Session"):
+        path = [self.root]
+        for level in topic_filter.split("/"):
+            node = path[-1].children.get(level)
+            if node is None:
+                return
+            path.append(node)
+
+        path[-1].subscribers.pop(session, None)
+
+        # Prune empty branches
+        levels = topic_filter.split("/")
+        for index in range(len(levels), 0, -1):
+            node = path[index]
+            if node.subscribers or node.children:
+                break
+            del path[index - 1].children[levels[index - 1]]
+
+    def match(self, topic: str) -> Dict["Session", int]:
+        """Illeszkedő feliratkozók a legnagyobb QoS-sel (átfedő szűrők esetén is egyszer)"""
+        levels = topic.split("/")
+        matches: Dict[Session, int] = {}
+        # Topics starting with $ are not matched by wildcards at the first level
+        self._match(self.root, levels, 0, matches, topic.startswith("$"))
+        return matches
+
+    def _match(self, node: _TopicNode, levels, index: int, matches: Dict, system: bool):
+        wildcards = not (system and index == 0)
+
+        if wildcards:
+            multi = node.children.get("#")
+            if multi is not None:
+                _collect(multi.subscribers, matches)
+
+        if index == len(levels):
+            _collect(node.subscribers, matches)
+            return
+
+        child = node.children.get(levels[index])
+        if child is not None:
+            self._match(child, levels, index + 1, matches, system)
+
+        if wildcards:
+            single = node.children.get("+")
+            if single is not None:
+                self._match(single, levels, index + 1, matches, system)
+
+
+def _collect(subscribers: Dict, matches: Dict):
+    for session, qos in subscribers.items():
+        if matches.get(session, -1) < qos:
+            matches[session] = qos
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """Illeszkedik-e a topic a szűrőre (+ és # wildcard)"""
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    if topic.startswith("$") and filter_levels[0] in ("+", "#"):
+        return False
+
+    for index, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if index >= len(topic_levels) or (level != "+" and level != topic_levels[index]):
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def valid_topic_filter(topic_filter: str) -> bool:
+    if not topic_filter:
+        return False
+    levels = topic_filter.split("/")
+    for index, level in enumerate(levels):
+        if "#" in level and (level != "#" or index != len(levels) - 1):
+            return False
+        if "+" in level and level != "+":
+            return False
+    return True
+
+
+class Session:
+    """Kliens session (feliratkozások, nyugtázatlan és offline sorba állított üzenetek)"""
+
+    __slots__ = ("client_id", "clean", "subscriptions", "outbound", "inbound_qos2", "queued", "connection", "_packet_ids")
+
+    def __init__(self, client_id: str, clean: bool):
+        self.client_id = client_id
+        self.clean = clean
+        self.subscriptions: Dict[str, int] = {}
+        self.outbound: Dict[int, Tuple[str, bytes, int, bool]] = {}
+        self.inbound_qos2: Set[int] = set()
+        self.queued: deque = deque(maxlen=MAX_QUEUED_MESSAGES)
+        self.connection = None
+        self._packet_ids = itertools.cycle(range(1, 65536))
+
+    def next_packet_id(self) -> Optional[int]:
+        """Szabad packet id a kimenő QoS 1/2 üzenethez (None: mind a 65535 nyugtázatlan)"""
+        if len(self.outbound) >= 65535:
+            return None
+        while True:
+            packet_id = next(self._packet_ids)
+            if packet_id not in self.outbound:
+                return packet_id
+
+    def deliver(self, topic: str, payload: bytes, qos: int, retain: bool):
+        connection = self.connection
+        if connection is None:
+            if qos > 0 and not self.clean:
+                self.queued.append((topic, payload, qos, retain))
+            return
+        connection.send_publish(self, topic, payload, qos, retain)
+
+
+class MQTTBroker:
+    """asyncio MQTT 3.1.1 broker (TCP listener és/vagy loopback kliensek)"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 1883, username: Optional[str] = None, password: Optional[str] = None):
+        """
+        Args:
+            host: Listen cím a TCP kapcsolatokhoz
+            port: Listen port (0 = véletlen szabad port)
+            username: Elvárt MQTT username (None = bárki kapcsolódhat)
+            password: Elvárt MQTT password
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+
+        self.sessions: Dict[str, Session] = {}
+        self.subscriptions = SubscriptionTree()
+        self.retained: Dict[str, Tuple[bytes, int]] = {}
+        self.connections: Set["_TcpConnection"] = set()
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.keepalive_task: Optional[asyncio.Task] = None
+        self._client_ids = itertools.count(1)
+
+        self.stats = {
+            "clients_connected": 0,
+            "messages_received": 0,
+            "messages_sent": 0,
+            "messages_dropped": 0,
+            "bytes_received": 0,
+            "bytes_sent": 0,
+        }
+
+    async def start(self):
+        """TCP listener indítása az aktuális event loop-on"""
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.keepalive_task = asyncio.get_running_loop().create_task(self.keepalive_loop())
+        print(f"[BROKER] Listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        """Listener leállítása és a kapcsolatok bontása"""
+        if self.keepalive_task is not None:
+            self.keepalive_task.cancel()
+            self.keepalive_task = None
+        if self.server is not None:
+            self.server.close()
+            for connection in list(self.connections):
+                connection.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    # ------------------------------------------------------------------
+    # Session handling (shared by TCP and loopback clients)
+    # ------------------------------------------------------------------
+
+    def authenticate(self, username: Optional[str], password: Optional[str]) -> bool:
+        if self.username is None:
+            return True
+        return username == self.username and password == self.password
+
+    def open_session(self, client_id: str, clean: bool, connection) -> Tuple[Session, bool]:
+        """Session létrehozása vagy átvétele; visszaadja (session, session_present)"""
+        if not client_id:
+            client_id = f"auto-{next(self._client_ids)}"
+
+        session = self.sessions.get(client_id)
+        if session is not None and session.connection is not None:
+            # Session takeover: the previous connection is closed
+            previous = session.connection
+            session.connection = None
+            self.stats["clients_connected"] -= 1
+            previous.close()
+
+        if session is not None and clean:
+            self.drop_session(session)
+            session = None
+
+        present = session is not None
+        if session is None:
+            session = Session(client_id, clean)
+            self.sessions[client_id] = session
+        session.clean = clean
+        session.connection = connection
+        self.stats["clients_connected"] += 1
+        return session, present
+
+    def resume_session(self, session: Session):
+        """Nyugtázatlan és offline sorba állított üzenetek újraküldése"""
+        connection = session.connection
+        for packet_id, (topic, payload, qos, retain) in list(session.outbound.items()):
+            connection.resend(session, packet_id, topic, payload, qos, retain)
+        while session.queued and session.connection is connection:
+            session.deliver(*session.queued.popleft())
+
+    def close_session(self, session: Session, connection, will: Optional[Tuple[str, bytes, int, bool]] = None):
+        """Kapcsolat lezárása (will: Last Will üzenet nem szabályos bontás esetén)"""
+        if session.connection is not connection:
+            return
+        session.connection = None
+        self.stats["clients_connected"] -= 1
+        if session.clean:
+            self.drop_session(session)
+        if will is not None:
+            self.publish(*will)
+
+    def drop_session(self, session: Session):
+        for topic_filter in session.subscriptions:
+            self.subscriptions.remove(topic_filter, session)
+        session.subscriptions.clear()
+        if self.sessions.get(session.client_id) is session:
+            del self.sessions[session.client_id]
+
+    def subscribe(self, session: Session, topic_filter: str, qos: int) -> int:
+        """Feliratkozás; visszaadja a megadott QoS-t vagy 0x80-at hiba esetén"""
+        if not valid_topic_filter(topic_filter) or qos > 2:
+            return 0x80
+        session.subscriptions[topic_filter] = qos
+        self.subscriptions.add(topic_filter, session, qos)
+        return qos
+
+    def send_retained(self, session: Session, topic_filter: str, qos: int):
+        for topic, (payload, retained_qos) in list(self.retained.items()):
+            if topic_matches(topic_filter, topic):
+                session.deliver(topic, payload, min(qos, retained_qos), True)
+
+    def unsubscribe(self, session: Session, topic_filter: str):
+        if session.subscriptions.pop(topic_filter, None) is not None:
+            self.subscriptions.remove(topic_filter, session)
+
+    def publish(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False):
+        """Üzenet továbbítása az illeszkedő feliratkozóknak"""
+        self.stats["messages_received"] += 1
+        if retain:
+            if payload:
+                self.retained[topic] = (payload, qos)
+            else:
+                self.retained.pop(topic, None)
+
+        for session, subscription_qos in self.subscriptions.match(topic).items():
+            session.deliver(topic, payload, min(qos, subscription_qos), False)
+
+    # ------------------------------------------------------------------
+    # TCP transport
+    # ------------------------------------------------------------------
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = _TcpConnection(self, writer)
+        self.connections.add(connection)
+        try:
+            packet_type, flags, body = await asyncio.wait_for(self.read_packet(reader), CONNECT_TIMEOUT)
+            if packet_type != CONNECT:
+                raise ProtocolError("First packet must be CONNECT")
+            if not connection.handle_connect(body):
+                return
+
+            while not connection.closed:
+                packet_type, flags, body = await self.read_packet(reader)
+                connection.last_seen = time.monotonic()
+                connection.handle_packet(packet_type, flags, body)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, ProtocolError, UnicodeDecodeError):
+            pass
+        finally:
+            self.connections.discard(connection)
+            connection.connection_lost()
+
+    async def read_packet(self, reader: asyncio.StreamReader) -> Tuple[int, int, bytes]:
+        header = (await reader.readexactly(1))[0]
+        remaining = 0
+        multiplier = 1
+        for _ in range(4):
+            byte = (await reader.readexactly(1))[0]
+            remaining += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        else:
+            raise ProtocolError("Malformed remaining length")
+
+        body = await reader.readexactly(remaining) if remaining else b""
+        self.stats["bytes_received"] += remaining + 2
+        return header >> 4, header & 0x0F, body
+
+    async def keepalive_loop(self):
+        """1.5 x keepalive ideig csendes kliensek bontása
+
+        A csend valós időben (time.monotonic) mérődik, az ellenőrzés viszont az event
+        loop órája szerint fut másodpercenként, ami SimClock mellett szimulált idő:
+        gyorsított módban gyakrabban, virtuális módban minden időugrásnál.
+        """
+        while True:
+            await asyncio.sleep(1.0)
+            now = time.monotonic()
+            for connection in list(self.connections):
+                if connection.keepalive and now - connection.last_seen > connection.keepalive * 1.5:
+                    connection.close()
+
+
+def _encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        if length:
+            byte |= 0x80
+        encoded.append(byte)
+        if not length:
+            return bytes(encoded)
+
+
+def _encode_string(value: str) -> bytes:
+    data = value.encode()
+    return len(data).to_bytes(2, "big") + data
+
+
+def _read_string(body: bytes, offset: int) -> Tuple[str, int]:
+    data, end = _read_binary(body, offset)
+    return data.decode(), end
+
+
+def _read_binary(body: bytes, offset: int) -> Tuple[bytes, int]:
+    length = _read_uint16(body, offset)
+    end = offset + 2 + length
+    if end > len(body):
+        raise ProtocolError("String exceeds packet")
+    return body[offset + 2:end], end
+
+
+def _read_uint16(body: bytes, offset: int) -> int:
+    """Két bájtos big-endian mező (hossz, packet id, keepalive)"""
+    if offset + 2 > len(body):
+        raise ProtocolError("Truncated packet")
+    return int.from_bytes(body[offset:offset + 2], "big")
+
+
+def _read_byte(body: bytes, offset: int) -> int:
+    if offset >= len(body):
+        raise ProtocolError("Truncated packet")
+    return body[offset]
+
+
+class _TcpConnection:
+    """Egy TCP kliens kapcsolat protokoll kezelése"""
+
+    def __init__(self, broker: MQTTBroker, writer: asyncio.StreamWriter):
+        self.broker = broker
+        self.writer = writer
+        self.session: Optional[Session] = None
+        self.will: Optional[Tuple[str, bytes, int, bool]] = None
+        self.keepalive = 0
+        self.last_seen = time.monotonic()
+        self.closed = False
+
+    def write(self, data: bytes):
+        if not self.closed:
+            self.writer.write(data)
+            self.broker.stats["bytes_sent"] += len(data)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.writer.close()
+
+    def connection_lost(self):
+        self.close()
+        if self.session is not None:
+            self.broker.close_session(self.session, self, self.will)
+            self.session = None
+
+    def handle_connect(self, body: bytes) -> bool:
+        protocol, offset = _read_string(body, 0)
+        level = _read_byte(body, offset)
+        flags = _read_byte(body, offset + 1)
+        self.keepalive = _read_uint16(body, offset + 2)
+        client_id, offset = _read_string(body, offset + 4)
+
+        if protocol not in ("MQTT", "MQIsdp") or level not in (3, 4):
+            self.write(bytes((CONNACK << 4, 2, 0, CONNACK_BAD_PROTOCOL)))
+            self.close()
+            return False
+
+        clean = bool(flags & 0x02)
+        if not client_id and not clean:
+            self.write(bytes((CONNACK << 4, 2, 0, CONNACK_IDENTIFIER_REJECTED)))
+            self.close()
+            return False
+
+        will = None
+        if flags & 0x04:
+            will_topic, offset = _read_string(body, offset)
+            will_payload, offset = _read_binary(body, offset)
+            will = (will_topic, will_payload, (flags >> 3) & 0x03, bool(flags & 0x20))
+
+        username = password = None
+        if flags & 0x80:
+            username, offset = _read_string(body, offset)
+        if flags & 0x40:
+            password, offset = _read_string(body, offset)
+
+        if not self.broker.authenticate(username, password):
+            self.write(bytes((CONNACK << 4, 2, 0, CONNACK_BAD_CREDENTIALS)))
+            self.close()
+            return False
+
+        self.will = will
+        self.session, present = self.broker.open_session(client_id, clean, self)
+        self.write(bytes((CONNACK << 4, 2, int(present), CONNACK_ACCEPTED)))
+        self.broker.resume_session(self.session)
+        return True
+
+    def handle_packet(self, packet_type: int, flags: int, body: bytes):
+        session = self.session
+
+        if packet_type == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            topic, offset = _read_string(body, 0)
+            if qos > 2 or not topic or "+" in topic or "#" in topic:
+                raise ProtocolError("Invalid PUBLISH")
+            packet_id = 0
+            if qos:
+                packet_id = _read_uint16(body, offset)
+                offset += 2
+            payload = body[offset:]
+            retain = bool(flags & 0x01)
+
+            if qos == 2:
+                # Exactly once: deliver on first receipt, ignore retransmits until PUBREL
+                if packet_id not in session.inbound_qos2:
+                    session.inbound_qos2.add(packet_id)
+                    self.broker.publish(topic, payload, qos, retain)
+                self.write(bytes((PUBREC << 4, 2)) + packet_id.to_bytes(2, "big"))
+            else:
+                self.broker.publish(topic, payload, qos, retain)
+                if qos == 1:
+                    self.write(bytes((PUBACK << 4, 2)) + packet_id.to_bytes(2, "big"))
+
+        elif packet_type == PUBACK or packet_type == PUBCOMP:
+            session.outbound.pop(_read_uint16(body, 0), None)
+
+        elif packet_type == PUBREC:
+            packet_id = _read_uint16(body, 0)
+            entry = session.outbound.get(packet_id)
+            if entry is not None:
+                # Payload no longer needed, only the PUBREL state
+                session.outbound[packet_id] = (entry[0], None, entry[2], entry[3])
+            self.write(bytes(((PUBREL << 4) | 0x02, 2)) + body[:2])
+
+        elif packet_type == PUBREL:
+            session.inbound_qos2.discard(_read_uint16(body, 0))
+            self.write(bytes((PUBCOMP << 4, 2)) + body[:2])
+
+        elif packet_type == SUBSCRIBE:
+            packet_id = _read_uint16(body, 0).to_bytes(2, "big")
+            offset = 2
+            granted = []
+            requested = []
+            while offset < len(body):
+                topic_filter, offset = _read_string(body, offset)
+                qos = _read_byte(body, offset)
+                offset += 1
+                code = self.broker.subscribe(session, topic_filter, qos)
+                granted.append(code)
+                if code != 0x80:
+                    requested.append((topic_filter, qos))
+            if not granted:
+                raise ProtocolError("Empty SUBSCRIBE")
+            self.write(bytes((SUBACK << 4,)) + _encode_length(2 + len(granted)) + packet_id + bytes(granted))
+            for topic_filter, qos in requested:
+                self.broker.send_retained(session, topic_filter, qos)
+
+        elif packet_type == UNSUBSCRIBE:
+            _read_uint16(body, 0)
+            offset = 2
+            while offset < len(body):
+                topic_filter, offset = _read_string(body, offset)
+                self.broker.unsubscribe(session, topic_filter)
+            self.write(bytes((UNSUBACK << 4, 2)) + body[:2])
+
+        elif packet_type == PINGREQ:
+            self.write(bytes((PINGRESP << 4, 0)))
+
+        elif packet_type == DISCONNECT:
+            # Graceful disconnect: the will message is discarded
+            self.will = None
+            self.close()
+
+        else:
+            raise ProtocolError(f"Unexpected packet type {packet_type}")
+
+    def send_publish(self, session: Session, topic: str, payload: bytes, qos: int, retain: bool):
+        if qos == 0:
+            transport = self.writer.transport
+            if transport is not None and transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+                self.broker.stats["messages_dropped"] += 1
+                return
+            packet_id = None
+        else:
+            packet_id = session.next_packet_id()
+            if packet_id is None:
+                # Subscriber stopped acknowledging: disconnect it, the publisher is not affected
+                self.broker.stats["messages_dropped"] += 1
+                self.close()
+                return
+            session.outbound[packet_id] = (topic, payload, qos, retain)
+        self._write_publish(topic, payload, qos, retain, packet_id, False)
+
+    def resend(self, session: Session, packet_id: int, topic: str, payload: Optional[bytes], qos: int, retain: bool):
+        if payload is None:
+            # QoS 2 message already received by the client, continue with PUBREL
+            self.write(bytes(((PUBREL << 4) | 0x02, 2)) + packet_id.to_bytes(2, "big"))
+        else:
+            self._write_publish(topic, payload, qos, retain, packet_id, True)
+
+    def _write_publish(self, topic: str, payload: bytes, qos: int, retain: bool, packet_id: Optional[int], dup: bool):
+        variable = _encode_string(topic)
+        if packet_id is not None:
+            variable += packet_id.to_bytes(2, "big")
+        header = (PUBLISH << 4) | (dup << 3) | (qos << 1) | int(retain)
+        self.write(bytes((header,)) + _encode_length(len(variable) + len(payload)) + variable + payload)
+        self.broker.stats["messages_sent"] += 1
+
+
+class LoopbackMessage:
+    """Kézbesített üzenet (a paho MQTTMessage megfelelője)"""
+
+    __slots__ = ("topic", "payload", "qos", "retain", "mid")
+
+    def __init__(self, topic: str, payload: bytes, qos: int, retain: bool, mid: int = 0):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.mid = mid
+
+
+class LoopbackPublishResult:
+    """Publish eredmény (a paho MQTTMessageInfo megfelelője)"""
+
+    __slots__ = ("rc", "mid")
+
+    def __init__(self, rc: int, mid: int):
+        self.rc = rc
+        self.mid = mid
+
+    def is_published(self) -> bool:
+        return self.rc == 0
+
+    def wait_for_publish(self, timeout: Optional[float] = None):
+        pass
+
+
+class LoopbackClient:
+    """Folyamaton belüli MQTT kliens, ami közvetlenül a brokerhez kapcsolódik (TCP nélkül)
+
+    A paho-mqtt Client (callback API v2) általunk használt részét valósítja meg:
+    connect / disconnect / subscribe / unsubscribe / publish / username_pw_set,
+    valamint az on_connect / on_disconnect / on_message callbackeket. A callbackek
+    az event loop következő iterációjában futnak, mint a valódi hálózati kliensnél.
+    """
+
+    def __init__(self, broker: MQTTBroker, client_id: str = "", clean_session: bool = True):
+        self.broker = broker
+        self.client_id = client_id
+        self.clean_session = clean_session
+        self.username: Optional[str] = None
+        self.password: Optional[str] = None
+        self.will: Optional[Tuple[str, bytes, int, bool]] = None
+
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+
+        self.session: Optional[Session] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._mids = itertools.count(1)
+
+    def username_pw_set(self, username: str, password: Optional[str] = None):
+        self.username = username
+        self.password = password
+
+    def will_set(self, topic: str, payload=None, qos: int = 0, retain: bool = False):
+        self.will = (topic, _to_bytes(payload), qos, retain)
+
+    def is_connected(self) -> bool:
+        return self.session is not None
+
+    def connect(self, host: str = "localhost", port: int = 1883, keepalive: int = 60):
+        """Kapcsolódás (a host / port / keepalive paraméterek csak a paho kompatibilitást szolgálják)"""
+        self.loop = asyncio.get_running_loop()
+        if not self.broker.authenticate(self.username, self.password):
+            self.loop.call_soon(self._connected, CONNACK_BAD_CREDENTIALS, False)
+            return CONNACK_BAD_CREDENTIALS
+
+        self.session, present = self.broker.open_session(self.client_id, self.clean_session, self)
+        self.loop.call_soon(self._connected, CONNACK_ACCEPTED, present)
+        return 0
+
+    def _connected(self, reason_code: int, session_present: bool):
+        if self.on_connect is not None:
+            self.on_connect(self, None, {"session_present": session_present}, reason_code, None)
+        if reason_code == CONNACK_ACCEPTED and self.session is not None:
+            self.broker.resume_session(self.session)
+
+    def disconnect(self):
+        """Szabályos bontás (Last Will nélkül)"""
+        self._close(None, 0)
+        return 0
+
+    def drop(self):
+        """Váratlan kapcsolatvesztés szimulálása (Last Will publikálással)"""
+        self._close(self.will, 7)
+
+    def _close(self, will, reason_code: int):
+        session = self.session
+        if session is None:
+            return
+        self.session = None
+        self.broker.close_session(session, self, will)
+        if self.on_disconnect is not None:
+            self.loop.call_soon(self.on_disconnect, self, None, {}, reason_code, None)
+
+    def close(self):
+        """Broker oldali bontás (session átvétel)"""
+        self._close(None, 7)
+
+    def subscribe(self, topic, qos: int = 0):
+        if self.session is None:
+            return (4, None)
+        topics = topic if isinstance(topic, list) else [(topic, qos)]
+        for topic_filter, topic_qos in topics:
+            if self.broker.subscribe(self.session, topic_filter, topic_qos) != 0x80:
+                self.broker.send_retained(self.session, topic_filter, topic_qos)
+        return (0, next(self._mids))
+
+    def unsubscribe(self, topic):
+        if self.session is None:
+            return (4, None)
+        for topic_filter in (topic if isinstance(topic, list) else [topic]):
+            self.broker.unsubscribe(self.session, topic_filter)
+        return (0, next(self._mids))
+
+    def publish(self, topic: str, payload=None, qos: int = 0, retain: bool = False) -> LoopbackPublishResult:
+        mid = next(self._mids)
+        if self.session is None:
+            return LoopbackPublishResult(4, mid)
+        self.broker.publish(topic, _to_bytes(payload), qos, retain)
+        return LoopbackPublishResult(0, mid)
+
+    # Broker -> client delivery (zero-copy: the payload object is passed through)
+    def send_publish(self, session: Session, topic: str, payload: bytes, qos: int, retain: bool):
+        self.broker.stats["messages_sent"] += 1
+        self.loop.call_soon(self._deliver, LoopbackMessage(topic, payload, qos, retain))
+
+    def resend(self, session: Session, packet_id: int, topic: str, payload: Optional[bytes], qos: int, retain: bool):
+        session.outbound.pop(packet_id, None)
+        if payload is not None:
+            self.send_publish(session, topic, payload, qos, retain)
+
+    def _deliver(self, message: LoopbackMessage):
+        if self.session is not None and self.on_message is not None:
+            self.on_message(self, None, message)
+
+
+def _to_bytes(payload) -> bytes:
+    if payload is None:
+        return b""
+    if isinstance(payload, str):
+        return payload.encode()
+    if isinstance(payload, (int, float)):
+        return str(payload).encode()
+    return bytes(payload)
+
+
+async def _serve(broker: MQTTBroker, duration: Optional[float]):
+    await broker.start()
+    try:
+        if duration is None:
+            await asyncio.Event().wait()
+        else:
+            await asyncio.sleep(duration)
+    finally:
+        await broker.stop()
+
+
+def main():
+    """CLI entry point (önálló broker, pl. a Node backend számára)"""
+    parser = argparse.ArgumentParser(description="IntelliVend beágyazott MQTT 3.1.1 broker")
+    parser.add_argument("--host", default="127.0.0.1", help="Listen cím (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=1883, help="Listen port (default: 1883)")
+    parser.add_argument("--username", default=None, help="Elvárt MQTT username (opcionális)")
+    parser.add_argument("--password", default=None, help="Elvárt MQTT password (opcionális)")
+    parser.add_argument("--duration", type=float, default=None, help="Futási idő másodpercben (default: megszakításig)")
+    args = parser.parse_args()
+
+    broker = MQTTBroker(args.host, args.port, args.username, args.password)
+    try:
+        asyncio.run(_serve(broker, args.duration))
+    except KeyboardInterrupt:
+        print("\n[BROKER] Shutting down...")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+IntelliVend MQTT forgalom rögzítés és visszajátszás
+===================================================
+
+A mock minden fogadott parancsát és publikált üzenetét (topic, QoS, retain,
+payload, szimulált monoton időbélyeg) egy tömör, csak hozzáfűzött bináris
+naplóba írja (--record). A napló később tetszőleges brokerre visszajátszható
+1x, Nx vagy maximális sebességgel, pl. egy éles incidens reprodukálásához vagy
+a backend változások összehasonlító méréséhez.
+
+A visszajátszás memory-mapped I/O-val olvassa a naplót, így a több GB-os
+felvételek sem kerülnek egyben a memóriába.
+
+Fájl formátum:
+    fejléc:  b"IVREC" + verzió (1 bájt)
+    rekord:  "<dBBHI" (időbélyeg s, irány, flag-ek, topic hossz, payload hossz),
+             majd a topic (UTF-8) és a payload bájtjai
+    irány:   0 = fogadott (parancs), 1 = publikált (telemetria, befejezés, hiba)
+    flag-ek: bit 0-1 QoS, bit 2 retain
+
+Ha a felvétel közben megszakad a futás, a csonka utolsó rekord olvasáskor
+kimarad. Egy fájlba több futás is hozzáfűzhető; visszaugró időbélyegnél a
+visszajátszás új munkamenetként folytatja (nincs várakozás).
+
+Használat:
+    python3 esp32_mock.py --devices 50 --record session.ivrec
+    python3 mqtt_recorder.py info session.ivrec
+    python3 mqtt_recorder.py replay session.ivrec --broker 127.0.0.1 --speed 10
+    python3 mqtt_recorder.py replay session.ivrec --speed 0 --direction in
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import time
+from typing import Dict, Iterator, NamedTuple, Optional
+
+import paho.mqtt.client as mqtt
+
+MAGIC = b"IVREC"
+FORMAT_VERSION = 1
+FILE_HEADER = struct.Struct("<5sB")
+RECORD_HEADER = struct.Struct("<dBBHI")
+
+INBOUND = 0
+OUTBOUND = 1
+DIRECTIONS = {"in": (INBOUND,), "out": (OUTBOUND,), "both": (INBOUND, OUTBOUND)}
+
+# Write buffer of the recorder (flushed when full, on close, and at least this often in real seconds)
+WRITE_BUFFER = 1024 * 1024
+FLUSH_INTERVAL = 1.0
+
+
+class Record(NamedTuple):
+    timestamp: float
+    direction: int
+    topic: str
+    payload: bytes
+    qos: int
+    retain: bool
+
+
+class TrafficRecorder:
+    """Hozzáfűző bináris napló (a mock event loop-járól hívva, pufferelt írással)"""
+
+    def __init__(self, path: str, clock):
+        """
+        Args:
+            path: Napló fájl (létező fájl esetén hozzáfűzés)
+            clock: Szimulációs óra (SimClock), az időbélyegek a szimulált monoton időből
+        """
+        self.path = path
+        self.clock = clock
+        self.file = open(path, "ab", buffering=WRITE_BUFFER)
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER.pack(MAGIC, FORMAT_VERSION))
+        self.records = 0
+        self.bytes_written = 0
+        self.last_flush = time.monotonic()
+
+    def record(self, direction: int, topic: str, payload, qos: int = 0, retain: bool = False):
+        """Egy üzenet rögzítése (payload: bytes vagy str)"""
+        if isinstance(payload, str):
+            payload = payload.encode()
+        topic_bytes = topic.encode()
+        header = RECORD_HEADER.pack(self.clock.monotonic(), direction, qos | (4 if retain else 0), len(topic_bytes), len(payload))
+        self.file.write(header)
+        self.file.write(topic_bytes)
+        self.file.write(payload)
+        self.records += 1
+        self.bytes_written += len(header) + len(topic_bytes) + len(payload)
+
+        # Bound the data lost if the process is killed (e.g. SIGTERM) during a long, low-rate capture
+        now = time.monotonic()
+        if now - self.last_flush >= FLUSH_INTERVAL:
+            self.file.flush()
+            self.last_flush = now
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def read_records(path: str) -> Iterator[Record]:
+    """Rekordok olvasása memory-mapped fájlból (a csonka utolsó rekord kimarad)"""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < FILE_HEADER.size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, version = FILE_HEADER.unpack_from(data, 0)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ValueError(f"Not an IntelliVend traffic recording (or unsupported version): {path}")
+
+            offset = FILE_HEADER.size
+            while offset + RECORD_HEADER.size <= size:
+                timestamp, direction, flags, topic_length, payload_length = RECORD_HEADER.unpack_from(data, offset)
+                start = offset + RECORD_HEADER.size
+                end = start + topic_length + payload_length
+                if end > size:
+                    break
+                topic = data[start:start + topic_length].decode("utf-8", errors="replace")
+                yield Record(timestamp, direction, topic, data[start + topic_length:end], flags & 3, bool(flags & 4))
+                offset = end
+
+
+def summarize(path: str) -> Dict:
+    """Felvétel összesítése (rekordok, időtartam, topiconkénti darabszám)"""
+    summary = {"records": 0, "inbound": 0, "outbound": 0, "payload_bytes": 0, "duration_s": 0.0, "sessions": 0, "topics": {}}
+    previous = None
+    for record in read_records(path):
+        if previous is None or record.timestamp < previous:
+            summary["sessions"] += 1
+        else:
+            summary["duration_s"] += record.timestamp - previous
+        previous = record.timestamp
+        summary["records"] += 1
+        summary["inbound" if record.direction == INBOUND else "outbound"] += 1
+        summary["payload_bytes"] += len(record.payload)
+        summary["topics"][record.topic] = summary["topics"].get(record.topic, 0) + 1
+    return summary
+
+
+class TrafficReplayer:
+    """Felvétel visszajátszása egy MQTT brokerre (eredeti időzítés / speed szorzó / max sebesség)"""
+
+    def __init__(self, broker: str = "127.0.0.1", port: int = 1883, username: Optional[str] = None, password: Optional[str] = None,
+                 speed: float = 1.0, directions=(OUTBOUND,), topic_prefix: Optional[str] = None):
+        """
+        Args:
+            speed: Sebesség szorzó (1 = eredeti időzítés, 0 = várakozás nélkül)
+            directions: Visszajátszott irányok (INBOUND: parancsok, OUTBOUND: eszköz üzenetek)
+            topic_prefix: Csak az ezzel kezdődő topicok visszajátszása (opcionális)
+        """
+        self.speed = speed
+        self.directions = set(directions)
+        self.topic_prefix = topic_prefix
+        self.broker = broker
+        self.port = port
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"intellivend-replay-{os.getpid()}", clean_session=True)
+        if username and password:
+            self.client.username_pw_set(username, password)
+
+        self.published = 0
+        self.skipped = 0
+        self.max_lag = 0.0
+
+    def replay(self, path: str) -> Dict:
+        """Visszajátszás (blokkoló); a végén megvárja a QoS > 0 üzenetek kézbesítését"""
+        self.client.connect(self.broker, self.port, keepalive=60)
+        self.client.loop_start()
+        started = time.monotonic()
+        last_info = None
+        base = None
+        previous = None
+        offset = 0.0
+        try:
+            for record in read_records(path):
+                if record.direction not in self.directions or (self.topic_prefix and not record.topic.startswith(self.topic_prefix)):
+                    self.skipped += 1
+                    continue
+
+                # Schedule relative to the first record; a new session continues without a gap
+                if base is None:
+                    base = record.timestamp
+                elif record.timestamp < previous:
+                    offset += previous - base
+                    base = record.timestamp
+                previous = record.timestamp
+
+                if self.speed > 0:
+                    due = started + (offset + record.timestamp - base) / self.speed
+                    delay = due - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        self.max_lag = max(self.max_lag, -delay)
+
+                last_info = self.client.publish(record.topic, record.payload, qos=record.qos, retain=record.retain)
+                self.published += 1
+
+            if last_info is not None and last_info.rc == mqtt.MQTT_ERR_SUCCESS:
+                last_info.wait_for_publish(timeout=30)
+        finally:
+            self.client.loop_stop()
+            self.client.disconnect()
+
+        elapsed = time.monotonic() - started
+        return {
+            "published": self.published,
+            "skipped": self.skipped,
+            "elapsed_s": round(elapsed, 3),
+            "rate_msgs_s": round(self.published / elapsed, 1) if elapsed > 0 else 0.0,
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+        }
+
+
+def main():
+    """CLI entry point"""
+    parser = argparse.ArgumentParser(description="IntelliVend MQTT felvétel információ és visszajátszás")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    info = commands.add_parser("info", help="Felvétel összesítése")
+    info.add_argument("file", help="Felvétel fájl (esp32_mock.py --record)")
+
+    replay = commands.add_parser("replay", help="Felvétel visszajátszása brokerre")
+    replay.add_argument("file", help="Felvétel fájl (esp32_mock.py --record)")
+    replay.add_argument("--broker", default="127.0.0.1", help="MQTT broker címe (default: 127.0.0.1)")
+    replay.add_argument("--port", type=int, default=1883, help="MQTT broker port (default: 1883)")
+    replay.add_argument("--username", default=None, help="MQTT username (opcionális)")
+    replay.add_argument("--password", default=None, help="MQTT password (opcionális)")
+    replay.add_argument("--speed", type=float, default=1.0, help="Sebesség szorzó, 0 = maximális sebesség (default: 1.0)")
+    replay.add_argument("--direction", choices=sorted(DIRECTIONS), default="out", help="out: eszköz üzenetek (a backend felé), in: parancsok (a mock felé), both (default: out)")
+    replay.add_argument("--topic-prefix", default=None, help="Csak az ezzel kezdődő topicok visszajátszása")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "info":
+            summary = summarize(args.file)
+            print(f"Records: {summary['records']} ({summary['inbound']} inbound, {summary['outbound']} outbound), {summary['sessions']} session(s)")
+            print(f"Duration: {summary['duration_s']:.3f}s (simulated), payload: {summary['payload_bytes']} bytes")
+            for topic, count in sorted(summary["topics"].items(), key=lambda item: -item[1]):
+                print(f"  {count:>10}  {topic}")
+            return 0
+
+        if args.speed < 0:
+            print("Speed must not be negative")
+            return 1
+
+        replayer = TrafficReplayer(args.broker, args.port, args.username, args.password, args.speed, DIRECTIONS[args.direction], args.topic_prefix)
+        print(f"[REPLAY] {args.file} -> {args.broker}:{args.port} ({'max speed' if args.speed == 0 else f'{args.speed:g}x'}, direction: {args.direction})")
+        result = replayer.replay(args.file)
+        print(f"[REPLAY] {result['published']} published, {result['skipped']} skipped in {result['elapsed_s']}s "
+              f"({result['rate_msgs_s']} msgs/s, max lag {result['max_lag_ms']}ms)")
+        return 0
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return 1
+    except KeyboardInterrupt:
+        print("\n[REPLAY] Interrupted")
+        return 1
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+IntelliVend mock eszköz oldali rendelés sor
+===========================================
+
+Sor nélkül a recept futása közben érkező második dispense/command azonnal
+elindul, és ugyanazokat a pumpákat hajtja párhuzamosan, ezért a backendnek kell
+sorosítania a rendeléseket és megvárnia minden dispense/complete üzenetet.
+
+Az --order-queue N kapcsolóval minden eszköz saját rendelés sort tart:
+- recept futása közben legfeljebb N rendelést fogad el várakozásra, telített
+  sornál BUSY hibával utasít el,
+- minden változásnál (elfogadás, indulás, megszakítás) dispense/queue üzenetet
+  küld rendelésenként a pozícióval és a becsült indulási idővel (ETA),
+- a sorban következő rendelést az aktuális futása közben előre ellenőrzi
+  (karbantartás alatt álló pumpák, palack szint flow physics módban),
+- az előző befejezése után a következőt azonnal indítja, parancs körút nélkül.
+
+A rendelés formátuma és a mennyiségek már elfogadáskor ellenőrzésre kerülnek
+(pumpa szám 1-8, pozitív mennyiség, ésszerű teljes térfogat).
+
+Használat:
+    orders = OrderQueue(depth=4, clock=clock)
+    position = orders.submit(Order(payload, order_ingredients(payload), estimated_ms, clock.monotonic()))  # None: tele
+    order = await orders.next()     # a következő rendelés, ettől kezdve ez adagol
+    orders.finish()
+    orders.positions()              # [(rendelés, pozíció, ETA ms), ...], 0 = éppen adagol
+"""
+
+import asyncio
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from device_state import NUM_PUMPS
+
+# Larger than any glass: an order above this is a backend bug, not a drink
+MAX_ORDER_ML = 1000.0
+
+# Pump operations an order has to wait for (the pump is not available for dispensing)
+MAINTENANCE_STATES = ("flushing", "calibrating")
+
+# dispense/queue states
+POURING = "pouring"
+WAITING_FOR_PUMPS = "waiting_for_pumps"
+QUEUED = "queued"
+CANCELLED = "cancelled"
+
+
+def order_ingredients(payload: Dict) -> List[Tuple]:
+    """A dispense/command összetevői (pumpa, ml) párokként, mindkét formátumból"""
+    amount_ml = payload.get("amount_ml")
+    if isinstance(amount_ml, list):
+        return [(item.get("pump_number", 1), item.get("quantity_ml", 0.0)) if isinstance(item, dict) else (None, None)
+                for item in amount_ml]
+    return [(payload.get("pump_id"), amount_ml)]
+
+
+def validate_ingredients(ingredients: List[Tuple]) -> Optional[str]:
+    """Pumpa számok és mennyiségek ellenőrzése (minden adagolásnál); hibaüzenet, vagy None ha rendben van"""
+    if not ingredients:
+        return "Order has no ingredients"
+    for pump_id, quantity_ml in ingredients:
+        if not isinstance(pump_id, int) or isinstance(pump_id, bool) or not 1 <= pump_id <= NUM_PUMPS:
+            return f"Invalid pump number: {pump_id!r} (1-{NUM_PUMPS})"
+        if not isinstance(quantity_ml, (int, float)) or isinstance(quantity_ml, bool) or quantity_ml <= 0:
+            return f"Invalid quantity for pump {pump_id}: {quantity_ml!r}"
+    return None
+
+
+def validate_order(ingredients: List[Tuple]) -> Optional[str]:
+    """Rendelés ellenőrzése a sorba fogadás előtt: összetevők és ésszerű teljes térfogat"""
+    problem = validate_ingredients(ingredients)
+    if problem is not None:
+        return problem
+    total_ml = sum(quantity_ml for _, quantity_ml in ingredients)
+    if total_ml > MAX_ORDER_ML:
+        return f"Order volume {total_ml:.0f}ml exceeds {MAX_ORDER_ML:.0f}ml"
+    return None
+
+
+class Order:
+    """Egy elfogadott rendelés (az eredeti parancs és a becslések)"""
+
+    __slots__ = ("payload", "command_id", "recipe_name", "ingredients", "estimated_ml", "estimated_ms",
+                 "accepted_at", "started_at", "blocked_pumps", "low_level_pumps", "dedup")
+
+    def __init__(self, payload: Dict, ingredients: List[Tuple], estimated_ms: int, accepted_at: float):
+        """
+        Args:
+            payload: Az eredeti dispense/command payload (változatlanul kerül végrehajtásra)
+            ingredients: (pumpa, ml) párok
+            estimated_ms: Becsült adagolási idő
+            accepted_at: Elfogadás ideje (szimulált monotonic)
+        """
+        self.payload = payload
+        self.command_id = payload.get("command_id")
+        self.recipe_name = payload.get("recipe_name", "Unknown")
+        self.ingredients = ingredients
+        self.estimated_ml = sum(quantity_ml for _, quantity_ml in ingredients)
+        self.estimated_ms = estimated_ms
+        self.accepted_at = accepted_at
+        self.started_at: Optional[float] = None
+
+        # Pre-validation results while the previous order is pouring
+        self.blocked_pumps: List[int] = []
+        self.low_level_pumps: List[int] = []
+
+        # Deduplication entry of the command (completions are recorded into it), if any
+        self.dedup = None
+
+    @property
+    def pump_ids(self) -> List[int]:
+        return sorted({pump_id for pump_id, _ in self.ingredients})
+
+
+class OrderQueue:
+    """Eszközönkénti rendelés sor: egy adagoló rendelés, legfeljebb depth várakozó"""
+
+    def __init__(self, depth: int, clock):
+        """
+        Args:
+            depth: Várakozó rendelések maximális száma (az éppen adagoló nélkül)
+            clock: Szimulációs óra (SimClock), az ETA számításához
+        """
+        self.depth = depth
+        self.clock = clock
+        self.waiting: deque = deque()
+        self.current: Optional[Order] = None
+        self.ready = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self.waiting)
+
+    def submit(self, order: Order) -> Optional[int]:
+        """Rendelés felvétele; a várakozási pozíció (1 = következő), None ha a sor tele"""
+        if len(self.waiting) >= self.depth:
+            return None
+        self.waiting.append(order)
+        self.ready.set()
+        return len(self.waiting)
+
+    async def next(self) -> Order:
+        """A következő rendelés (várakozik, amíg nincs); ettől kezdve ez az aktuális"""
+        while not self.waiting:
+            self.ready.clear()
+            await self.ready.wait()
+        order = self.waiting.popleft()
+        order.started_at = self.clock.monotonic()
+        self.current = order
+        return order
+
+    def finish(self):
+        self.current = None
+
+    def head(self) -> Optional[Order]:
+        """A következőként induló rendelés"""
+        return self.waiting[0] if self.waiting else None
+
+    def clear(self) -> List[Order]:
+        """Minden várakozó rendelés eldobása (emergency stop); az eldobott rendelések"""
+        dropped = list(self.waiting)
+        self.waiting.clear()
+        return dropped
+
+    def positions(self) -> List[Tuple[Order, int, int]]:
+        """(rendelés, pozíció, ETA ms) az aktuálissal (pozíció 0) kezdve
+
+        Az ETA az aktuális rendelés hátralévő becsült ideje plusz az előtte
+        várakozók becsült ideje; az aktuális rendelés ETA-ja a hátralévő idő.
+        """
+        now = self.clock.monotonic()
+        rows = []
+        eta_ms = 0.0
+        if self.current is not None:
+            eta_ms = max(0.0, self.current.estimated_ms - (now - self.current.started_at) * 1000)
+            rows.append((self.current, 0, int(eta_ms)))
+        for position, order in enumerate(self.waiting, 1):
+            rows.append((order, position, int(eta_ms)))
+            eta_ms += order.estimated_ms
+        return rows
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+IntelliVend szimulációs óra
+===========================
+
+Cserélhető óra az ESP32 mock számára. Az asyncio event loop idejét (loop.time())
+a szimulált idő adja, így minden asyncio.sleep(), timeout és időzítő automatikusan
+a szimulált időben fut.
+
+Módok:
+- Valós idő (time_scale = 1.0)
+- Gyorsított idő (pl. time_scale = 100.0 -> 1 valós másodperc = 100 szimulált másodperc)
+- Virtuális idő (discrete-event): ha nincs kész esemény, az óra azonnal a következő
+  időzítőre ugrik, várakozás nélkül
+
+A payloadok timestamp, elapsed_ms és uptime_ms mezői a SimClock-ból számolódnak,
+így gyorsított és virtuális módban is konzisztensek maradnak.
+
+Korlát: virtuális módban az óra előreugrik, ha a hálózaton VIRTUAL_IO_GRACE (1ms)
+valós ideig nincs forgalom. Külső (TCP) broker késleltetése ennél jóval nagyobb
+lehet, így a futás sem reprodukálható, sem helyes nem lesz: virtuális idő csak
+folyamaton belüli brokerrel (--loopback, --embedded-broker) használható, és a
+futás csak --loopback mellett bitre reprodukálható.
+"""
+
+import asyncio
+import selectors
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+# Real time to wait for in-flight network I/O before a virtual time jump (seconds)
+VIRTUAL_IO_GRACE = 0.001
+
+
+class SimClock:
+    """Szimulált óra (valós, gyorsított vagy virtuális idő)"""
+
+    def __init__(self, time_scale: float = 1.0, virtual: bool = False, start_time: Optional[float] = None):
+        """
+        Args:
+            time_scale: Szimulált másodpercek száma valós másodpercenként (csak nem virtuális módban)
+            virtual: Discrete-event mód - az idő csak a következő ütemezett eseményre ugrik
+            start_time: A szimuláció kezdete Unix időbélyegként (None = most)
+        """
+        if time_scale <= 0:
+            raise ValueError("time_scale must be positive")
+
+        self.time_scale = time_scale
+        self.virtual = virtual
+        self.epoch_origin = time.time() if start_time is None else start_time
+        self._real_origin = time.monotonic()
+        self._virtual_now = 0.0
+
+    def monotonic(self) -> float:
+        """Eltelt szimulált idő a szimuláció indulása óta (másodperc)"""
+        if self.virtual:
+            return self._virtual_now
+        return (time.monotonic() - self._real_origin) * self.time_scale
+
+    def time(self) -> float:
+        """Szimulált Unix időbélyeg (másodperc)"""
+        return self.epoch_origin + self.monotonic()
+
+    def utc_timestamp(self) -> str:
+        """Szimulált UTC időbélyeg ISO formátumban (mint datetime.utcnow().isoformat() + "Z")"""
+        return datetime.fromtimestamp(self.time(), timezone.utc).replace(tzinfo=None).isoformat() + "Z"
+
+    def advance(self, seconds: float):
+        """Virtuális idő léptetése (csak virtuális módban)"""
+        if seconds > 0:
+            self._virtual_now += seconds
+
+    def to_real(self, seconds: float) -> float:
+        """Szimulált időtartam átváltása valós időre"""
+        return seconds / self.time_scale
+
+    def new_event_loop(self) -> asyncio.AbstractEventLoop:
+        """Az órát használó asyncio event loop létrehozása"""
+        return SimEventLoop(self)
+
+    def run(self, coro, duration: Optional[float] = None):
+        """Coroutine futtatása az óra saját event loop-ján
+
+        Args:
+            coro: A futtatandó coroutine
+            duration: Maximális futási idő szimulált másodpercben (None = korlátlan)
+
+        KeyboardInterrupt esetén a fő task megszakításra kerül, a finally blokkok
+        (pl. MQTT bontás) még lefutnak, majd a kivétel továbbadódik.
+        """
+        loop = self.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        if duration is not None:
+            coro = _run_for(coro, duration)
+
+        task = loop.create_task(coro)
+        try:
+            return loop.run_until_complete(task)
+        except KeyboardInterrupt:
+            task.cancel()
+            loop.run_until_complete(asyncio.gather(task, return_exceptions=True))
+            raise
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            asyncio.set_event_loop(None)
+            loop.close()
+
+
+async def _run_for(coro, duration: float):
+    """Coroutine futtatása legfeljebb duration szimulált másodpercig"""
+    try:
+        return await asyncio.wait_for(coro, duration)
+    except asyncio.TimeoutError:
+        return None
+
+
+class SimEventLoop(asyncio.SelectorEventLoop):
+    """asyncio event loop, amelynek ideje a SimClock szimulált ideje"""
+
+    def __init__(self, clock: SimClock):
+        self.clock = clock
+        super().__init__(SimSelector(selectors.DefaultSelector(), clock))
+
+    def time(self) -> float:
+        return self.clock.monotonic()
+
+
+class SimSelector(selectors.BaseSelector):
+    """Selector wrapper, ami a select() timeoutot a szimulált időhöz igazítja
+
+    Gyorsított módban a timeout valós időre váltódik át. Virtuális módban a
+    selector rövid ideig (VIRTUAL_IO_GRACE) vár a folyamatban lévő I/O-ra, és
+    ha nincs ilyen, az órát a következő időzítőig lépteti. Amíg kimenő adat vár
+    küldésre, virtuális módban sem ugrik előre az idő, így a szimuláció nem
+    futhat el a hálózat elől.
+    """
+
+    def __init__(self, selector: selectors.BaseSelector, clock: SimClock):
+        self.selector = selector
+        self.clock = clock
+
+    def register(self, fileobj, events, data=None):
+        return self.selector.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        return self.selector.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self.selector.modify(fileobj, events, data)
+
+    def get_key(self, fileobj):
+        return self.selector.get_key(fileobj)
+
+    def get_map(self):
+        return self.selector.get_map()
+
+    def close(self):
+        self.selector.close()
+
+    def select(self, timeout=None):
+        if not self.clock.virtual:
+            if timeout is not None:
+                timeout = self.clock.to_real(timeout)
+            return self.selector.select(timeout)
+
+        events = self.selector.select(0 if timeout == 0 else VIRTUAL_IO_GRACE)
+        if events:
+            return events
+
+        # Pending writes or no timers at all: wait for real I/O
+        if timeout is None or self._has_pending_writes():
+            return self.selector.select(None)
+
+        self.clock.advance(timeout)
+        return []
+
+    def _has_pending_writes(self) -> bool:
+        return any(key.events & selectors.EVENT_WRITE for key in self.selector.get_map().values())
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+IntelliVend mock soak teszt erőforrás drift figyeléssel
+=======================================================
+
+Rövid kézi teszt nem mutatja meg a hosszú futások lassú romlását (szivárgó
+szálak / fájlleírók / memória, elcsúszó pumps_active számláló, e-stop után
+csendben leálló heartbeat). A --soak DURATION mód a mock mellett folyamatos,
+vegyes forgalmat generál a brokeren keresztül (adagolás, több pumpás recept,
+öblítés, kalibráció, ritkán emergency stop), és időszakosan mintavételez:
+
+- RSS (rezidens memória), szálak száma, nyitott fájlleírók száma
+- üzenet ráta (fogadott + publikált üzenetek / szimulált másodperc)
+- pumps_active konzisztencia: futó művelet nélkül egy pumpa sem működhet
+- heartbeat élet: kapcsolódott eszköz heartbeat task-ja nem állhat le
+
+Az alapérték (bemelegedés) csak akkor indul, amikor a forgalom már a teljes
+mintavételi periódusban futott és minden eszköz kapcsolódva van; újrakapcsolódás
+a bemelegedést újraindítja. Ha egy metrika a küszöbön túl elmászik, a futás
+azonnal leáll, és a riport FAIL eredménnyel, 1-es kilépési kóddal zárul. Az
+üzenet ráta megengedett eltérése a tűrés plusz a darabszám zaja (k·√N/N, a
+bemelegedésből becsült túlszórással); túl kevés üzenetnél a ráta ellenőrzés
+kimarad. A konzisztencia hibák (pumps_active, heartbeat) bemelegedés alatt is
+azonnal hibát jelentenek.
+
+Használat:
+    python3 esp32_mock.py --embedded-broker --devices 20 --soak 24h
+    python3 esp32_mock.py --loopback --devices 200 --virtual-time --soak 7d --soak-interval 600 --soak-report soak.json
+"""
+
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import resource
+import statistics
+import sys
+import threading
+from typing import Callable, Dict, List, Optional
+
+from mock_logging import DeviceLogger
+
+# Simulated seconds between two samples, and fleet-wide commands per simulated second
+DEFAULT_SOAK_INTERVAL = 60.0
+DEFAULT_SOAK_RATE = 0.2
+
+# Steady samples forming the baseline; drift is judged on the last WINDOW samples
+WARMUP_SAMPLES = 5
+WINDOW_SAMPLES = 5
+
+# Message rate check: expected messages a window needs for a meaningful comparison,
+# and the allowed count noise in standard deviations
+MIN_RATE_MESSAGES = 200
+RATE_SIGMAS = 4.0
+
+# Default drift thresholds
+DEFAULT_RSS_GROWTH = 25.0       # percent over the baseline
+DEFAULT_RATE_TOLERANCE = 0.25   # relative deviation of the message rate from the baseline, on top of the count noise
+THREAD_SLACK = 2                # threads over the baseline (e.g. a paho reconnect thread)
+FD_SLACK = 16                   # descriptors over the baseline (sockets during reconnects)
+
+# Traffic mix (weights): emergency stops are rare, as in a bar
+TRAFFIC_MIX = {"dispense": 0.55, "recipe": 0.25, "flush": 0.1, "calibration": 0.08, "estop": 0.02}
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(value: str) -> float:
+    """Időtartam másodpercben: 3600, 90s, 30m, 24h, 7d"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*", value)
+    if match is None:
+        raise ValueError(f"Invalid duration: {value!r} (e.g. 3600, 30m, 24h)")
+    return float(match.group(1)) * DURATION_UNITS.get(match.group(2) or "s")
+
+
+def rss_kb() -> int:
+    """Aktuális rezidens memória (KB); /proc nélkül a csúcsérték"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def open_fds() -> Optional[int]:
+    """Nyitott fájlleírók száma (None, ha a platformon nem mérhető)"""
+    for path in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(path))
+        except OSError:
+            continue
+    return None
+
+
+class SoakTest:
+    """Vegyes forgalom a brokeren át és erőforrás drift figyelés a mock eszközei mellett"""
+
+    def __init__(self, devices: List, clock, metrics, client, broker: str, port: int, duration: float,
+                 interval: float = DEFAULT_SOAK_INTERVAL, rate: float = DEFAULT_SOAK_RATE, rss_growth: float = DEFAULT_RSS_GROWTH,
+                 rate_tolerance: float = DEFAULT_RATE_TOLERANCE, seed: Optional[int] = None, attach: Optional[Callable] = None):
+        """
+        Args:
+            devices: A figyelt ESP32Mock példányok (a parancsok célpontjai)
+            clock: Szimulációs óra (SimClock)
+            metrics: MockMetrics (az üzenet rátához)
+            client: A forgalom MQTT kliense (paho vagy LoopbackClient, még nem kapcsolódva)
+            broker: Broker címe a forgalom kliensének
+            port: Broker port
+            duration: Soak időtartam szimulált másodpercben
+            interval: Mintavételezési periódus (szimulált s)
+            rate: Parancsok / szimulált másodperc a teljes fleet-re
+            rss_growth: Megengedett RSS növekedés az alapértékhez képest (%)
+            rate_tolerance: Megengedett relatív eltérés az üzenet ráta alapértékétől
+            seed: Véletlenszám seed a forgalomhoz
+            attach: A kliens bekötése az event loop-ba kapcsolódás előtt, hívása: attach(loop, client)
+        """
+        self.devices = devices
+        self.clock = clock
+        self.metrics = metrics
+        self.client = client
+        self.broker = broker
+        self.port = port
+        self.duration = duration
+        self.interval = interval
+        self.rate = rate
+        self.rss_growth = rss_growth
+        self.rate_tolerance = rate_tolerance
+        self.attach = attach
+        self.random = random.Random(f"{seed}:soak") if seed is not None else random.Random()
+        self.log = DeviceLogger("[SOAK]")
+
+        self.sent: Dict[str, int] = {kind: 0 for kind in TRAFFIC_MIX}
+        self.samples: List[Dict] = []
+        self.warmup: List[Dict] = []
+        self.baseline: Optional[Dict] = None
+        self.rate_checks_skipped = 0
+        self.failures: List[str] = []
+        self.interrupted = False
+        self.started = 0.0
+        self.last_messages = 0.0
+        self.last_sample_at = 0.0
+        self.traffic_started_at: Optional[float] = None
+
+    def describe(self) -> str:
+        """Leírás a banner számára"""
+        return (f"{self.duration:g}s, {self.rate:g} commands/s, sample every {self.interval:g}s, "
+                f"RSS +{self.rss_growth:g}%, message rate ±{self.rate_tolerance * 100:g}% + count noise")
+
+    @property
+    def passed(self) -> bool:
+        return not self.failures
+
+    # --- Traffic ---
+
+    def build_command(self, kind: str, command_id: str):
+        """(topic név, payload) egy véletlen parancshoz"""
+        pumps = list(range(1, 9))
+        if kind == "dispense":
+            return "dispense/command", {"pump_id": self.random.choice(pumps), "amount_ml": self.random.randint(20, 60),
+                                        "recipe_name": "Soak", "command_id": command_id}
+        if kind == "recipe":
+            chosen = self.random.sample(pumps, self.random.randint(2, 4))
+            ingredients = [{"pump_number": pump, "quantity_ml": self.random.randint(10, 40), "order": order}
+                           for order, pump in enumerate(chosen, 1)]
+            return "dispense/command", {"pump_id": chosen[0], "amount_ml": ingredients, "recipe_name": "Soak recipe",
+                                        "command_id": command_id}
+        if kind == "flush":
+            return "maintenance/flush", {"pump_id": self.random.choice(pumps + [-1]), "duration_ms": self.random.randint(1000, 3000),
+                                         "command_id": command_id}
+        if kind == "calibration":
+            return "calibration/start", {"pump_id": self.random.choice(pumps), "test_amount_ml": 10, "command_id": command_id}
+        return "emergency/stop", {"reason": "Soak test", "timestamp": self.clock.utc_timestamp()}
+
+    async def traffic(self):
+        """Poisson érkezésű vegyes parancsok véletlen eszközöknek"""
+        kinds = list(TRAFFIC_MIX)
+        weights = [TRAFFIC_MIX[kind] for kind in kinds]
+        sequence = 0
+        while True:
+            await asyncio.sleep(self.random.expovariate(self.rate))
+            kind = self.random.choices(kinds, weights=weights)[0]
+            device = self.random.choice(self.devices)
+            sequence += 1
+            name, payload = self.build_command(kind, f"soak-{sequence}")
+            qos = 2 if kind == "estop" else 1
+            self.client.publish(device.topic(name), json.dumps(payload), qos=qos)
+            self.sent[kind] += 1
+
+    # --- Sampling ---
+
+    def sample(self) -> Dict:
+        now = self.clock.monotonic()
+        messages = sum(self.metrics.messages_received.values.values()) + sum(self.metrics.messages_published.values.values())
+        elapsed = now - self.last_sample_at
+        count = int(messages - self.last_messages)
+        connected = sum(1 for device in self.devices if device.connected)
+        # Steady: traffic ran for the whole interval and every device is connected
+        steady = self.traffic_started_at is not None and self.traffic_started_at <= self.last_sample_at and connected == len(self.devices)
+        self.last_messages = messages
+        self.last_sample_at = now
+
+        # Without a running operation no pump of the device may be marked active
+        inconsistent = [device.client_id for device in self.devices if device.pumps_active and not device.operations]
+        dead_heartbeats = [device.client_id for device in self.devices
+                           if device.heartbeat_task is not None and device.heartbeat_task.done()]
+        return {
+            "elapsed_s": round(now - self.started, 1),
+            "rss_kb": rss_kb(),
+            "threads": threading.active_count(),
+            "fds": open_fds(),
+            "tasks": len(asyncio.all_tasks()),
+            "message_rate": round(count / elapsed, 3) if elapsed > 0 else 0.0,
+            "messages": count,
+            "interval_s": round(elapsed, 3),
+            "steady": steady,
+            "pumps_active": sum(device.pumps_active for device in self.devices),
+            "operations": sum(len(device.operations) for device in self.devices),
+            "connected": connected,
+            "inconsistent_devices": inconsistent,
+            "dead_heartbeats": dead_heartbeats,
+        }
+
+    def check(self, sample: Dict):
+        """Konzisztencia minden mintán, drift a bemelegedés után (a hibák a failures listába kerülnek)"""
+        if sample["inconsistent_devices"]:
+            self.failures.append(f"pumps_active without a running operation on {', '.join(sample['inconsistent_devices'][:5])}")
+        if sample["dead_heartbeats"]:
+            self.failures.append(f"heartbeat loop stopped on {', '.join(sample['dead_heartbeats'][:5])}")
+
+        if self.baseline is None:
+            self.warm_up(sample)
+            return
+
+        window = self.samples[-WINDOW_SAMPLES:]
+        rss = statistics.median(s["rss_kb"] for s in window)
+        if rss > self.baseline["rss_kb"] * (1 + self.rss_growth / 100.0):
+            self.failures.append(f"RSS grew {rss / self.baseline['rss_kb'] * 100 - 100:.1f}% ({self.baseline['rss_kb']:.0f}KB -> {rss:.0f}KB, limit {self.rss_growth:g}%)")
+        if sample["threads"] > self.baseline["threads"] + THREAD_SLACK:
+            self.failures.append(f"Thread count grew from {self.baseline['threads']:.0f} to {sample['threads']} (limit +{THREAD_SLACK})")
+        if "fds" in self.baseline and sample["fds"] is not None and sample["fds"] > self.baseline["fds"] + FD_SLACK:
+            self.failures.append(f"Open file descriptors grew from {self.baseline['fds']:.0f} to {sample['fds']} (limit +{FD_SLACK})")
+        self.check_rate(window)
+
+    def warm_up(self, sample: Dict):
+        """Alapérték az egymást követő WARMUP_SAMPLES steady mintából; nem steady minta a bemelegedést újraindítja"""
+        if not sample["steady"]:
+            self.warmup = []
+            return
+        self.warmup.append(sample)
+        if len(self.warmup) < WARMUP_SAMPLES:
+            return
+        warmup = self.warmup
+        self.baseline = {key: statistics.median(s[key] for s in warmup) for key in ("rss_kb", "threads")}
+        if all(s["fds"] is not None for s in warmup):
+            self.baseline["fds"] = statistics.median(s["fds"] for s in warmup)
+
+        # Rate from the pooled counts; messages come in bursts (progress + completion per command),
+        # so the count variance is estimated against the Poisson mean (dispersion, at least 1)
+        messages = sum(s["messages"] for s in warmup)
+        rate = messages / sum(s["interval_s"] for s in warmup)
+        dispersion = 1.0
+        if rate > 0:
+            dispersion = max(1.0, statistics.mean((s["messages"] - rate * s["interval_s"]) ** 2 / (rate * s["interval_s"]) for s in warmup))
+        self.baseline.update(message_rate=round(rate, 3), messages=messages, dispersion=round(dispersion, 2))
+        self.log.info("Baseline after %.0fs: RSS %.0fKB, %d threads, %s fds, %.2f msgs/s (dispersion %.1f)", sample["elapsed_s"],
+                      self.baseline["rss_kb"], self.baseline["threads"], self.baseline.get("fds", "n/a"), rate, dispersion, category="soak")
+
+    def check_rate(self, window: List[Dict]):
+        """Üzenet ráta a window-ban: megengedett eltérés = tűrés + RATE_SIGMAS·√(D/N) (ablak és alapérték zaja)"""
+        messages = sum(s["messages"] for s in window)
+        seconds = sum(s["interval_s"] for s in window)
+        expected = self.baseline["message_rate"] * seconds
+        if expected < MIN_RATE_MESSAGES or self.baseline["messages"] < MIN_RATE_MESSAGES:
+            if not self.rate_checks_skipped:
+                self.log.info("Message rate check skipped: %.0f expected messages per window (minimum %d)",
+                              expected, MIN_RATE_MESSAGES, category="soak")
+            self.rate_checks_skipped += 1
+            return
+        noise = RATE_SIGMAS * math.sqrt(self.baseline["dispersion"] * (1 / expected + 1 / self.baseline["messages"]))
+        limit = self.rate_tolerance + noise
+        deviation = messages / expected - 1
+        if abs(deviation) > limit:
+            self.failures.append(f"Message rate drifted from {self.baseline['message_rate']:.2f} to {messages / seconds:.2f} msgs/s "
+                                 f"({deviation * 100:+.1f}%, limit ±{limit * 100:.1f}%)")
+
+    async def supervise(self, coro):
+        """A mock futtatása a soak idejére forgalommal és mintavételezéssel; hibánál azonnal leáll"""
+        task = asyncio.ensure_future(coro)
+        loop = asyncio.get_running_loop()
+        if self.attach is not None:
+            self.attach(loop, self.client)
+        self.client.connect(self.broker, self.port)
+        traffic = None
+
+        self.started = self.last_sample_at = self.clock.monotonic()
+        end = self.started + self.duration
+        try:
+            while not task.done() and not self.failures:
+                if traffic is None and any(device.connected for device in self.devices):
+                    traffic = loop.create_task(self.traffic())
+                    self.traffic_started_at = self.clock.monotonic()
+                remaining = end - self.clock.monotonic()
+                await asyncio.wait({task}, timeout=min(self.interval, remaining))
+                if task.done():
+                    break
+                sample = self.sample()
+                self.samples.append(sample)
+                self.check(sample)
+                self.log.info("%6.0fs RSS %dKB, %d threads, %s fds, %.2f msgs/s, %d pumps active, %d/%d connected",
+                              sample["elapsed_s"], sample["rss_kb"], sample["threads"], sample["fds"], sample["message_rate"],
+                              sample["pumps_active"], sample["connected"], len(self.devices), category="soak")
+                if remaining <= self.interval:
+                    break
+            if task.done():
+                return task.result()
+        except asyncio.CancelledError:
+            self.interrupted = True
+            raise
+        finally:
+            if traffic is not None:
+                traffic.cancel()
+            self.client.disconnect()
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    # --- Report ---
+
+    def report(self) -> Dict:
+        return {
+            "result": "PASS" if self.passed else "FAIL",
+            "interrupted": self.interrupted,
+            "duration_s": self.duration,
+            "elapsed_s": self.samples[-1]["elapsed_s"] if self.samples else 0.0,
+            "devices": len(self.devices),
+            "commands_sent": dict(self.sent),
+            "baseline": self.baseline,
+            "rate_checks_skipped": self.rate_checks_skipped,
+            "failures": self.failures,
+            "samples": self.samples,
+        }
+
+    def print_report(self):
+        report = self.report()
+        print()
+        print("=" * 72)
+        print("IntelliVend Mock Soak Test - Results")
+        print("=" * 72)
+        print(f"Result: {report['result']}{' (interrupted)' if self.interrupted else ''}   "
+              f"Elapsed: {report['elapsed_s']:.0f}s of {self.duration:g}s   Samples: {len(self.samples)}   Devices: {len(self.devices)}")
+        print("Commands sent: " + ", ".join(f"{kind}={count}" for kind, count in self.sent.items()))
+        if self.samples:
+            print()
+            print(f"{'Metric':<16}{'baseline':>12}{'final':>12}{'max':>12}")
+            for key in ("rss_kb", "threads", "fds", "tasks", "message_rate", "pumps_active"):
+                values = [s[key] for s in self.samples if s[key] is not None]
+                if not values:
+                    continue
+                baseline = (self.baseline or {}).get(key)
+                print(f"{key:<16}{'-' if baseline is None else f'{baseline:g}':>12}{values[-1]:>12g}{max(values):>12g}")
+        if self.baseline is None and self.samples:
+            print(f"No baseline: fewer than {WARMUP_SAMPLES} steady samples (traffic running on every connected device)")
+        elif self.rate_checks_skipped:
+            print(f"Message rate check skipped {self.rate_checks_skipped}x (fewer than {MIN_RATE_MESSAGES} expected messages per window)")
+        for failure in self.failures:
+            print(f"FAIL: {failure}")
+        print("=" * 72)
+
+    def write_report(self, path: str):
+        with open(path, "w") as output:
+            json.dump(self.report(), output, indent=2)
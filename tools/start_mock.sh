@@ -2,17 +2,27 @@
 #
 # ESP32 Mock Client indító szkript
 # Használat: ./start_mock.sh
+#           ./start_mock.sh --embedded-broker   # külső broker nélkül
 #
 
 # MQTT hitelesítési adatok
 MQTT_USER="username"
 MQTT_PASS="password"
 
-# Python executable
-PYTHON="/Users/vmihaly/dev/IntelliVend/.venv/bin/python"
+# Script könyvtár (a repo bármely helyről indítható)
+SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
+
+# Python executable (felülírható: PYTHON=/path/to/python ./start_mock.sh)
+if [ -z "$PYTHON" ]; then
+  if [ -x "$SCRIPT_DIR/../.venv/bin/python" ]; then
+    PYTHON="$SCRIPT_DIR/../.venv/bin/python"
+  else
+    PYTHON="python3"
+  fi
+fi
 
 # Mock script path
-SCRIPT_PATH="/Users/vmihaly/dev/IntelliVend/tools/esp32_mock.py"
+SCRIPT_PATH="$SCRIPT_DIR/esp32_mock.py"
 
 echo "🚀 Indítás: ESP32 Mock Client"
 echo "========================================"
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+IntelliVend mock állapot pillanatkép (gyors meleg újraindítás)
+==============================================================
+
+Újraindításkor a mock minden állapotot elveszít: az uptime nulláról indul, a
+futó adagolások nyom nélkül eltűnnek, a palack szintek és a kalibrációs
+faktorok visszaállnak. Így nem tesztelhető, hogyan kezeli a backend a rendelés
+közben újrainduló eszközt, és egy nagy fleet minden indításkor nulláról épül.
+
+A --snapshot FILE kapcsolóval a mock időszakosan (és szabályos leálláskor)
+minden eszköz állapotát egy tömör, memóriába leképezett (mmap) fájlba írja, és
+induláskor abból állítja vissza, milliszekundumok alatt:
+
+- eszközönként: uptime, boot számláló, kalibrációs faktorok
+- pumpánként flow physics módban: palack szint, névleges hozam, érzékelő
+  érzékenység és drift
+- a futó műveletek (adagolás, öblítés, kalibráció) eredeti parancsa, a
+  pumpánként már kiadagolt mennyiséggel
+
+A visszaállított eszköz a megszakított műveleteket a --restart-policy szerint
+kezeli: abort (alapértelmezés, mint a valódi firmware): DEVICE_RESTART hiba a
+parancs command_id-jével és a kiadagolt mennyiséggel; resume: az adagolás a
+hátralévő mennyiséggel folytatódik, az öblítés / kalibráció újraindul. Az első
+heartbeat reset_reason mezője jelzi az indulás okát: poweron (nincs
+pillanatkép), sw (szabályos leállás után), panic (a folyamat leállás nélkül
+halt meg, pl. kill -9).
+
+Fájl formátum: fejléc, majd két slot (A/B), mindegyikben a teljes fleet fix
+méretű rekordjai. A rekord mérete az eszközök limitjeiből adódik (worker-ek,
+futó rendelés és rendelés sor: ennyi művelet lehet egyszerre folyamatban);
+ha a futó műveletek ennél mégis több helyet foglalnak, a mentés hibával
+kimarad, és az előző teljes pillanatkép marad érvényes (nem vész el csendben
+művelet). Írás a régebbi slotba, páratlan szekvenciával kezdve és
+párosra zárva (mint a device_state seqlock-ja); visszaállításkor a legnagyobb
+páros szekvenciájú slot érvényes, így egy írás közbeni kill sem rontja el.
+
+Használat:
+    store = SnapshotStore("fleet.ivsnap", devices, clock, physics, interval=5.0, policy="resume")
+    store.restore()                 # induláskor, a kapcsolódás előtt
+    await store.start()             # időszakos mentés (run_with_services)
+    await store.stop()              # utolsó, szabályos mentés
+"""
+
+import asyncio
+import json
+import math
+import mmap
+import os
+import struct
+import time
+from typing import Dict, List, Optional
+
+from device_state import NUM_PUMPS
+from mock_logging import DeviceLogger
+
+DEFAULT_SNAPSHOT_INTERVAL = 5.0   # simulated seconds between checkpoints
+
+# Restart policies for operations interrupted by the restart
+ABORT = "abort"
+RESUME = "resume"
+RESTART_POLICIES = (ABORT, RESUME)
+
+# Reset reasons (as esp_reset_reason(): ESP_RST_POWERON, ESP_RST_SW, ESP_RST_PANIC)
+RESET_POWERON = "poweron"
+RESET_SW = "sw"
+RESET_PANIC = "panic"
+
+MAGIC = b"IVSNAP02"
+FILE_HEADER = struct.Struct("<8sII")            # magic, record size, device count
+SLOT_HEADER = struct.Struct("<QBxxxxxxxd")      # sequence (odd while writing), clean shutdown, wall clock time
+DEVICE = struct.Struct("<32sdI")                # client id, uptime (s), boot count
+PUMP = struct.Struct("<ddddd")                  # calibration factor, bottle ml, nominal ml/s, sensor gain, drift (NaN = not set)
+OPERATIONS_LENGTH = struct.Struct("<I")         # length of the JSON of the in-flight operations that follows
+OPERATION_SIZE = 1024                           # JSON budget of one in-flight operation (a recipe of NUM_PUMPS ingredients)
+
+# Fixed part of a device record; the operations area is sized from the device limits
+RECORD_HEADER_SIZE = DEVICE.size + NUM_PUMPS * PUMP.size + OPERATIONS_LENGTH.size
+
+# Flow physics columns kept per pump, in PUMP order after the calibration factor
+PHYSICS_COLUMNS = ("bottle", "nominal", "gain", "drift")
+
+
+class SnapshotStore:
+    """Fleet állapot mentése és visszaállítása egy mmap pillanatkép fájlból"""
+
+    def __init__(self, path: str, devices: List, clock, physics=None, interval: float = DEFAULT_SNAPSHOT_INTERVAL,
+                 policy: str = ABORT):
+        """
+        Args:
+            path: Pillanatkép fájl (induláskor ebből állít vissza, ha létezik)
+            devices: A mentendő ESP32Mock példányok (client_id alapján párosítva)
+            clock: Szimulációs óra (SimClock)
+            physics: Közös flow fizika motor (None = nincs palack / hozam állapot)
+            interval: Mentések közötti idő szimulált másodpercben
+            policy: Megszakított műveletek kezelése visszaállításkor: abort vagy resume
+        """
+        self.path = path
+        self.devices = devices
+        self.clock = clock
+        self.physics = physics
+        self.interval = interval
+        self.policy = policy
+        self.log = DeviceLogger("[SNAPSHOT]")
+
+        self.file = None
+        self.map: Optional[mmap.mmap] = None
+        self.task: Optional[asyncio.Task] = None
+        self.sequence = 0
+        self.slot = 0
+        # Room for every operation a device can have in flight at once
+        self.operations_size = OPERATION_SIZE * max((device.max_operations() for device in devices), default=1)
+        self.record_size = RECORD_HEADER_SIZE + self.operations_size
+        self.slot_size = SLOT_HEADER.size + self.record_size * len(devices)
+
+        # Statistics
+        self.checkpoints = 0
+        self.failed_checkpoints = 0
+        self.last_checkpoint_ms = 0.0
+        self.restored = 0
+        self.restore_ms = 0.0
+
+    def describe(self) -> str:
+        """Leírás a banner számára"""
+        size_kb = (FILE_HEADER.size + 2 * self.slot_size) / 1024
+        return f"{self.path} every {self.interval:g}s ({size_kb:.0f}KB), restart policy: {self.policy}"
+
+    # --- Restore ---
+
+    def restore(self) -> int:
+        """Eszközök visszaállítása a legutóbbi érvényes slotból (a visszaállított eszközök száma)
+
+        Pillanatkép nélkül (vagy érvénytelen fájlnál) minden eszköz poweron okkal indul.
+        """
+        started = time.perf_counter()
+        try:
+            with open(self.path, "rb") as snapshot:
+                data = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return 0  # no snapshot yet (ValueError: empty file)
+
+        try:
+            magic, record_size, count = FILE_HEADER.unpack_from(data, 0)
+            if magic != MAGIC or record_size < RECORD_HEADER_SIZE:
+                self.log.warning("Ignoring snapshot %s: unknown format", self.path, category="snapshot")
+                return 0
+
+            # The record size of the writer (its limits may differ from the current ones)
+            slot_size = SLOT_HEADER.size + record_size * count
+            best = None
+            for slot in range(2):
+                offset = FILE_HEADER.size + slot * slot_size
+                if offset + slot_size > len(data):
+                    continue
+                sequence, clean, written_at = SLOT_HEADER.unpack_from(data, offset)
+                if sequence and sequence % 2 == 0 and (best is None or sequence > best[0]):
+                    best = (sequence, clean, written_at, offset + SLOT_HEADER.size)
+            if best is None:
+                self.log.warning("Ignoring snapshot %s: no complete checkpoint", self.path, category="snapshot")
+                return 0
+
+            self.sequence, clean, written_at, offset = best
+            reason = RESET_SW if clean else RESET_PANIC
+            records = {}
+            for index in range(count):
+                record = self.unpack(data, offset + index * record_size)
+                records[record["client_id"]] = record
+        except (struct.error, json.JSONDecodeError, UnicodeDecodeError) as e:
+            # Truncated file or corrupted record: start as if there was no snapshot
+            self.log.warning("Ignoring snapshot %s: %s", self.path, e, category="snapshot")
+            return 0
+        finally:
+            data.close()
+
+        for device in self.devices:
+            record = records.get(device.client_id)
+            if record is None:
+                continue
+            self.restore_physics(device, record["pumps"])
+            device.restore_snapshot(record, reason, self.policy)
+            self.restored += 1
+
+        self.restore_ms = (time.perf_counter() - started) * 1000
+        interrupted = sum(len(device.interrupted_operations) for device in self.devices)
+        self.log.info("Restored %d/%d devices from %s in %.1fms (reset reason: %s, %d interrupted operation(s), written %.0fs ago)",
+                      self.restored, len(self.devices), self.path, self.restore_ms, reason, interrupted, time.time() - written_at,
+                      category="snapshot")
+        return self.restored
+
+    def unpack(self, data, offset: int) -> Dict:
+        client_id, uptime_s, boot_count = DEVICE.unpack_from(data, offset)
+        offset += DEVICE.size
+        pumps = []
+        for _ in range(NUM_PUMPS):
+            pumps.append(PUMP.unpack_from(data, offset))
+            offset += PUMP.size
+        length, = OPERATIONS_LENGTH.unpack_from(data, offset)
+        offset += OPERATIONS_LENGTH.size
+        operations = json.loads(bytes(data[offset:offset + length])) if length else []
+        return {
+            "client_id": client_id.rstrip(b"\0").decode(),
+            "uptime_s": uptime_s,
+            "boot_count": boot_count,
+            "calibration_factors": {pump_id: pump[0] for pump_id, pump in enumerate(pumps, 1) if not math.isnan(pump[0])},
+            "pumps": pumps,
+            "operations": operations,
+        }
+
+    def restore_physics(self, device, pumps: List):
+        """Palack szint és pumpa jellemzők visszaírása a flow physics oszlopaiba"""
+        if self.physics is None:
+            return
+        for pump_id, pump in enumerate(pumps, 1):
+            slot = self.physics.slot(device.physics_base, pump_id)
+            for name, value in zip(PHYSICS_COLUMNS, pump[1:]):
+                if not math.isnan(value):
+                    self.physics.state[name][slot] = value
+
+    # --- Checkpoint ---
+
+    async def start(self):
+        self.open()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        if self.map is not None:
+            self.checkpoint(clean=True)
+            self.map.flush()
+            self.map.close()
+            self.file.close()
+            self.map = None
+            self.log.info("Final checkpoint to %s (%d checkpoints, %d skipped, last %.2fms)", self.path, self.checkpoints,
+                          self.failed_checkpoints, self.last_checkpoint_ms, category="snapshot")
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.checkpoint()
+
+    def open(self):
+        """A pillanatkép fájl leképezése (méret a fleet méretéből; eltérő fájl újra létrejön)"""
+        size = FILE_HEADER.size + 2 * self.slot_size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.file = os.fdopen(fd, "r+b")
+        current = os.fstat(fd).st_size
+        header = self.file.read(FILE_HEADER.size) if current >= FILE_HEADER.size else b""
+        if current != size or header != FILE_HEADER.pack(MAGIC, self.record_size, len(self.devices)):
+            self.file.truncate(0)
+            self.file.truncate(size)
+        self.map = mmap.mmap(fd, size)
+        FILE_HEADER.pack_into(self.map, 0, MAGIC, self.record_size, len(self.devices))
+
+        # Write into the slot that does not hold the newest complete (even) checkpoint; an odd
+        # sequence is an interrupted or skipped write, the next checkpoint may overwrite it
+        sequences = [SLOT_HEADER.unpack_from(self.map, self.slot_offset(slot))[0] for slot in range(2)]
+        complete = [slot for slot in range(2) if sequences[slot] % 2 == 0]
+        newest = max(complete, key=lambda slot: sequences[slot]) if complete else 1
+        self.sequence = max(self.sequence, *sequences)
+        self.sequence += self.sequence % 2
+        self.slot = 1 - newest
+
+    def slot_offset(self, slot: int) -> int:
+        return FILE_HEADER.size + slot * self.slot_size
+
+    def checkpoint(self, clean: bool = False):
+        """Minden eszköz állapotának kiírása a régebbi slotba (páratlan szekvencia az írás alatt)
+
+        Ha egy eszköz futó műveletei nem férnek el, a slot érvénytelen (páratlan) marad,
+        és a következő mentés is ebbe íródik: az előző teljes pillanatkép marad a visszaállítási pont.
+        """
+        started = time.perf_counter()
+        data = self.map
+        offset = self.slot_offset(self.slot)
+        self.sequence += 1
+        SLOT_HEADER.pack_into(data, offset, self.sequence, 0, time.time())
+
+        record_offset = offset + SLOT_HEADER.size
+        overflow = []
+        for device in self.devices:
+            if not self.pack(device, device.checkpoint_state(), record_offset):
+                overflow.append(device.client_id)
+            record_offset += self.record_size
+
+        self.sequence += 1
+        if overflow:
+            self.failed_checkpoints += 1
+            self.log.error("Checkpoint skipped, previous one kept: in-flight operations of %s exceed %d bytes",
+                           ", ".join(overflow[:5]), self.operations_size, category="snapshot")
+            return
+        SLOT_HEADER.pack_into(data, offset, self.sequence, 1 if clean else 0, time.time())
+        self.slot = 1 - self.slot
+        self.checkpoints += 1
+        self.last_checkpoint_ms = (time.perf_counter() - started) * 1000
+
+    def pack(self, device, state: Dict, offset: int) -> bool:
+        """Egy eszköz rekordjának kiírása (False, ha a futó műveletek nem férnek el)"""
+        data = self.map
+        DEVICE.pack_into(data, offset, device.client_id.encode()[:32], state["uptime_s"], state["boot_count"])
+        offset += DEVICE.size
+
+        factors = state["calibration_factors"]
+        for pump_id in range(1, NUM_PUMPS + 1):
+            physics = [math.nan] * len(PHYSICS_COLUMNS)
+            if self.physics is not None:
+                slot = self.physics.slot(device.physics_base, pump_id)
+                physics = [float(self.physics.state[name][slot]) for name in PHYSICS_COLUMNS]
+            PUMP.pack_into(data, offset, factors.get(pump_id, math.nan), *physics)
+            offset += PUMP.size
+
+        encoded = json.dumps(state["operations"], separators=(",", ":")).encode()
+        if len(encoded) > self.operations_size:
+            return False
+        OPERATIONS_LENGTH.pack_into(data, offset, len(encoded))
+        data[offset + OPERATIONS_LENGTH.size:offset + OPERATIONS_LENGTH.size + len(encoded)] = encoded
+        return True
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+IntelliVend status telemetria
+=============================
+
+A pumpák status üzeneteinek publikálása az ESP32 mock számára.
+
+Módok:
+- legacy:  pumpánként, minden tick-en egy teljes JSON dokumentum az intellivend/status
+           topicra (az eredeti viselkedés, ezt használja a backend)
+- json:    eszközönként tick-enként egyetlen kötegelt frame a <prefix>/status/batch topicra
+- msgpack: mint a json, MessagePack kódolással (pip install msgpack)
+- struct:  fix elrendezésű bináris frame
+
+Kötegelt módban a változatlan (vagy a küszöbnél kisebb mértékben változott)
+pumpa állapotok nem kerülnek újraküldésre, és ha nincs mit küldeni, a frame
+elmarad. Az időbélyeg Unix ms egész szám (nincs ISO formázás tick-enként).
+
+Frame formátumok (kötegelt módok):
+    json / msgpack:  {"ts": <unix ms>, "pumps": [[pump_id, state, progress_ml, target_ml, flow_rate_ml_s, elapsed_ms], ...]}
+    struct:          fejléc "<BBQ" (verzió, pumpák száma, unix ms), majd pumpánként
+                     "<BBfffI" (pump_id, state, progress_ml, target_ml, flow_rate_ml_s, elapsed_ms)
+A state kódja a STATES tuple indexe.
+"""
+
+import asyncio
+import json
+import struct
+from typing import Callable, Dict, List, Tuple
+
+try:
+    import msgpack
+except ImportError:  # optional dependency, only needed for the msgpack encoding
+    msgpack = None
+
+TELEMETRY_MODES = ("legacy", "json", "msgpack", "struct")
+
+STATES = ("idle", "dispensing", "flushing", "calibrating")
+STATE_CODES = {state: code for code, state in enumerate(STATES)}
+
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("<BBQ")
+FRAME_ENTRY = struct.Struct("<BBfffI")
+
+# A pump entry is re-sent at least this often even if unchanged (seconds)
+DEFAULT_MAX_SILENCE = 5.0
+
+
+def telemetry_available(mode: str) -> bool:
+    """Használható-e a kódolás (a msgpack opcionális függőség)"""
+    return mode in TELEMETRY_MODES and (mode != "msgpack" or msgpack is not None)
+
+
+def mqtt_publish_size(topic: str, payload_length: int, qos: int = 0) -> int:
+    """Egy PUBLISH csomag mérete a hálózaton (fix fejléc + topic + packet id + payload)"""
+    remaining = 2 + len(topic.encode()) + (2 if qos else 0) + payload_length
+    length_bytes = 1
+    while remaining >= 128 ** length_bytes:
+        length_bytes += 1
+    return 1 + length_bytes + remaining
+
+
+def encode_frame(mode: str, timestamp_ms: int, entries: List[Tuple]) -> bytes:
+    """Kötegelt status frame kódolása"""
+    if mode == "struct":
+        return FRAME_HEADER.pack(FRAME_VERSION, len(entries), timestamp_ms) + b"".join(
+            FRAME_ENTRY.pack(*entry) for entry in entries
+        )
+
+    frame = {
+        "ts": timestamp_ms,
+        "pumps": [[pump_id, state, round(progress, 2), round(target, 2), round(flow, 2), elapsed]
+                  for pump_id, state, progress, target, flow, elapsed in entries],
+    }
+    if mode == "msgpack":
+        return msgpack.packb(frame)
+    return json.dumps(frame, separators=(",", ":")).encode()
+
+
+def decode_frame(mode: str, payload: bytes) -> Dict:
+    """Kötegelt status frame dekódolása (pl. a fogadó oldali teszteléshez)"""
+    if mode == "struct":
+        version, count, timestamp_ms = FRAME_HEADER.unpack_from(payload, 0)
+        if version != FRAME_VERSION:
+            raise ValueError(f"Unsupported frame version {version}")
+        pumps = [list(FRAME_ENTRY.unpack_from(payload, FRAME_HEADER.size + index * FRAME_ENTRY.size)) for index in range(count)]
+        return {"ts": timestamp_ms, "pumps": pumps}
+    if mode == "msgpack":
+        return msgpack.unpackb(payload)
+    return json.loads(payload)
+
+
+class StatusPublisher:
+    """Pumpa status publikálás (legacy vagy kötegelt) bájt statisztikával"""
+
+    def __init__(self, publish_raw: Callable[[str, bytes], None], topic: Callable[[str], str], clock,
+                 mode: str = "legacy", interval: float = 0.5, min_delta_ml: float = 0.0, max_silence: float = DEFAULT_MAX_SILENCE):
+        """
+        Args:
+            publish_raw: Publikáló függvény (topic név, payload bytes), QoS 0
+            topic: Topic név -> teljes topic (eszköz prefix)
+            clock: Szimulációs óra (SimClock)
+            mode: legacy, json, msgpack vagy struct
+            interval: Kötegelt frame-ek közötti idő (szimulált másodperc)
+            min_delta_ml: Ennél kisebb progress változás nem kerül újraküldésre
+            max_silence: Változatlan állapot ennyi idő után mégis újraküldésre kerül
+        """
+        if mode not in TELEMETRY_MODES:
+            raise ValueError(f"Unknown telemetry mode: {mode}")
+        if mode == "msgpack" and msgpack is None:
+            raise RuntimeError("msgpack telemetry requires the msgpack package (pip install msgpack)")
+
+        self.publish_raw = publish_raw
+        self.clock = clock
+        self.mode = mode
+        self.interval = interval
+        self.min_delta_ml = min_delta_ml
+        self.max_silence = max_silence
+        self.status_topic = topic("status")
+        self.batch_topic = topic("status/batch")
+
+        # Batched mode state: latest unsent entry and last sent entry per pump
+        self.pending: Dict[int, Tuple] = {}
+        self.last_sent: Dict[int, Tuple[int, float, float]] = {}
+        self.wakeup = asyncio.Event()
+
+        # Statistics
+        self.frames = 0
+        self.entries = 0
+        self.suppressed = 0
+        self.bytes_total = 0
+        self.bytes_by_pump: Dict[int, float] = {}
+
+    @property
+    def batched(self) -> bool:
+        return self.mode != "legacy"
+
+    def pump_bytes(self, pump_ids) -> float:
+        """A megadott pumpákra jutó, eddig elküldött status bájtok (hálózati méret)"""
+        return sum(self.bytes_by_pump.get(pump_id, 0.0) for pump_id in set(pump_ids))
+
+    def update(self, pump_id: int, state: str, progress_ml: float, target_ml: float, flow_rate_ml_s: float, elapsed_ms: int):
+        """Pumpa állapot frissítése (legacy módban azonnali publikálás)"""
+        if not self.batched:
+            status = {
+                "pump_id": pump_id,
+                "state": state,
+                "progress_ml": round(progress_ml, 2),
+                "target_ml": target_ml,
+                "flow_rate_ml_s": round(flow_rate_ml_s, 2),
+                "elapsed_ms": elapsed_ms,
+                "timestamp": self.clock.utc_timestamp()
+            }
+            payload = json.dumps(status).encode()
+            self.publish_raw("status", payload)
+            self.account(self.status_topic, payload, [pump_id])
+            return
+
+        state_code = STATE_CODES[state]
+        if pump_id in self.pending:
+            self.suppressed += 1  # coalesced into the next frame
+        else:
+            last = self.last_sent.get(pump_id)
+            if (last is not None and last[0] == state_code
+                    and abs(progress_ml - last[1]) <= self.min_delta_ml
+                    and self.clock.monotonic() - last[2] < self.max_silence):
+                self.suppressed += 1
+                return
+
+        self.pending[pump_id] = (pump_id, state_code, progress_ml, target_ml, flow_rate_ml_s, elapsed_ms)
+        self.wakeup.set()
+
+    def flush(self):
+        """Függő pumpa állapotok elküldése egy frame-ben (kötegelt mód)"""
+        if not self.pending:
+            return
+
+        entries = list(self.pending.values())
+        self.pending.clear()
+        payload = encode_frame(self.mode, int(self.clock.time() * 1000), entries)
+        self.publish_raw("status/batch", payload)
+
+        now = self.clock.monotonic()
+        for entry in entries:
+            self.last_sent[entry[0]] = (entry[1], entry[2], now)
+        self.account(self.batch_topic, payload, [entry[0] for entry in entries])
+
+    def account(self, topic: str, payload: bytes, pump_ids: List[int]):
+        size = mqtt_publish_size(topic, len(payload))
+        self.frames += 1
+        self.bytes_total += size
+        self.entries += len(pump_ids)
+        share = size / len(pump_ids)
+        for pump_id in pump_ids:
+            self.bytes_by_pump[pump_id] = self.bytes_by_pump.get(pump_id, 0.0) + share
+
+    async def run(self):
+        """Kötegelt frame-ek küldése tick-enként; ha nincs változás, a ciklus vár (adaptív ráta)"""
+        while True:
+            if not self.pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            await asyncio.sleep(self.interval)
+            self.flush()
+
+    def summary(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "frames": self.frames,
+            "entries": self.entries,
+            "suppressed": self.suppressed,
+            "bytes": self.bytes_total,
+        }
@@ -0,0 +1,6 @@
+"""pytest: a tesztek a tools modulokat közvetlenül importálják, mint a scriptek egymást"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,83 @@
+"""Közös teszt segéd: egy ESP32Mock futtatása virtuális időben, loopback brokeren
+
+A backend (a Home Assistant oldal) egy külön loopback kliens: parancsokat küld az
+eszköznek, és rögzíti az eszköz minden üzenetét a szimulált idővel együtt.
+"""
+
+import asyncio
+import json
+
+from esp32_mock import ESP32Mock
+from flow_physics import FlowPhysics
+from mqtt_broker import LoopbackClient, MQTTBroker
+from sim_clock import SimClock
+
+# Simulated time for the device to connect and subscribe before the scenario starts (seconds)
+CONNECT_TIME = 0.1
+
+
+class Backend:
+    """A backend oldal: parancs küldés és a fogadott üzenetek gyűjtése"""
+
+    def __init__(self, broker: MQTTBroker, clock: SimClock, topic_prefix: str = "intellivend"):
+        self.clock = clock
+        self.topic_prefix = topic_prefix
+        self.client = LoopbackClient(broker, client_id="backend")
+        self.client.on_message = self.on_message
+        # (simulated time, topic below the prefix, decoded JSON payload)
+        self.messages = []
+
+    def connect(self):
+        self.client.connect()
+        self.client.subscribe(f"{self.topic_prefix}/#", 1)
+
+    def on_message(self, client, userdata, msg):
+        try:
+            payload = json.loads(msg.payload.decode())
+        except ValueError:
+            payload = msg.payload
+        self.messages.append((self.clock.monotonic(), msg.topic[len(self.topic_prefix) + 1:], payload))
+
+    def send(self, name: str, payload: dict, qos: int = 1):
+        self.client.publish(f"{self.topic_prefix}/{name}", json.dumps(payload), qos=qos)
+
+    def received(self, name: str) -> list:
+        """Egy topic üzenetei (szimulált idő, payload) párokként"""
+        return [(at, payload) for at, topic, payload in self.messages if topic == name]
+
+    def errors(self, error_code: str) -> list:
+        return [payload for _, payload in self.received("error") if payload["error_code"] == error_code]
+
+
+def run_device(scenario, physics: bool = False, **options):
+    """A scenario(mock, backend) coroutine futtatása egy csatlakozott eszközzel
+
+    physics: flow physics motor az eszköz pumpáihoz (tiszta Python lépés, az eszköz seed-jével)
+
+    Returns:
+        (mock, backend, a scenario visszatérési értéke)
+    """
+    clock = SimClock(virtual=True, start_time=0.0)
+    broker = MQTTBroker()
+    options.setdefault("seed", 1)
+    if physics:
+        options["physics"] = FlowPhysics(clock, seed=options["seed"], use_numpy=False)
+    mock = ESP32Mock(clock=clock, loopback=broker, **options)
+    backend = Backend(broker, clock, mock.topic_prefix)
+
+    async def main():
+        backend.connect()
+        if mock.physics is not None:
+            await mock.physics.start()
+        device = asyncio.ensure_future(mock.run_async())
+        await asyncio.sleep(CONNECT_TIME)
+        try:
+            return await scenario(mock, backend)
+        finally:
+            device.cancel()
+            await asyncio.gather(device, return_exceptions=True)
+            if mock.physics is not None:
+                await mock.physics.stop()
+
+    result = clock.run(main())
+    return mock, backend, result
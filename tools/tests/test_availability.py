@@ -0,0 +1,70 @@
+"""Elérhetőség: retained birth, Last Will kapcsolatvesztéskor, offline szabályos leálláskor, adaptív heartbeat"""
+
+import asyncio
+import unittest
+
+from mock_harness import run_device
+
+
+def retained(mock, backend):
+    """A brokeren tárolt retained availability üzenet (payload, qos)"""
+    return backend.client.broker.retained.get(mock.topic("availability"))
+
+
+class AvailabilityTest(unittest.TestCase):
+
+    def test_retained_birth_on_connect(self):
+        async def scenario(mock, backend):
+            return retained(mock, backend)
+
+        _, backend, birth = run_device(scenario)
+        self.assertEqual(birth, (b"online", 1))
+        self.assertEqual(backend.received("availability")[0][1], b"online")
+
+    def test_last_will_marks_the_device_offline(self):
+        async def scenario(mock, backend):
+            await asyncio.sleep(1)
+            mock.force_disconnect("test")
+            await asyncio.sleep(0.01)
+            return [payload for _, payload in backend.received("availability")], retained(mock, backend)
+
+        _, _, (states, will) = run_device(scenario)
+        self.assertEqual(states, [b"online", b"offline"])
+        self.assertEqual(will, (b"offline", 1))
+
+    def test_clean_shutdown_publishes_offline(self):
+        async def scenario(mock, backend):
+            await asyncio.sleep(1)
+
+        _, backend, _ = run_device(scenario)
+        self.assertEqual([payload for _, payload in backend.received("availability")], [b"online", b"offline"])
+
+
+class AdaptiveHeartbeatTest(unittest.TestCase):
+
+    def heartbeat_times(self, **options) -> list:
+        async def scenario(mock, backend):
+            await asyncio.sleep(30)
+            backend.send("dispense/command", {"pump_id": 1, "amount_ml": 100, "command_id": "d1"})
+            await asyncio.sleep(35)
+
+        _, backend, _ = run_device(scenario, **options)
+        return [round(at, 1) for at, _ in backend.received("heartbeat")]
+
+    def test_fixed_interval(self):
+        times = self.heartbeat_times(heartbeat_interval=10.0)
+        self.assertEqual(len(times), 7)
+
+    def test_fast_while_pumps_run_slow_when_idle(self):
+        times = self.heartbeat_times(heartbeat_interval=20.0, heartbeat_active_interval=1.0)
+        idle = [at for at in times if at < 30.1]
+        active = [at for at in times if 30.1 <= at <= 35.1]
+        after = [at for at in times if at > 36.5]
+        self.assertEqual(len(idle), 2)
+        # The first pump start sends a heartbeat at once, then one every second for the 5s dispense
+        self.assertGreaterEqual(len(active), 5)
+        self.assertLessEqual(len(after), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
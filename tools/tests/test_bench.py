@@ -0,0 +1,52 @@
+"""esp32_bench: minden benchmark lefut stub és loopback transporttal, regresszió összevetés"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import unittest
+
+from esp32_bench import BENCHMARKS, TRANSPORTS, compare, parse_list, run_suite
+
+
+def result(msgs_per_sec: float, alloc: float) -> dict:
+    return {"msgs_per_sec": msgs_per_sec, "alloc_peak_bytes_per_msg": alloc}
+
+
+class BenchSuiteTest(unittest.TestCase):
+
+    def test_every_benchmark_runs(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = asyncio.run(run_suite(["stub", "loopback"], list(BENCHMARKS), iterations=200, repeats=1))
+        self.assertEqual(set(results), {f"{name}@{transport}" for transport in ("stub", "loopback") for name in BENCHMARKS})
+        for key, measured in results.items():
+            with self.subTest(key=key):
+                self.assertGreater(measured["msgs_per_sec"], 0)
+                self.assertGreaterEqual(measured["alloc_peak_bytes_per_msg"], 0)
+
+
+class CompareTest(unittest.TestCase):
+
+    def compare(self, results: dict, baseline: dict) -> list:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return compare(results, baseline, threshold=10.0)
+
+    def test_regressions_over_the_threshold(self):
+        baseline = {"a@stub": result(1000, 100), "b@stub": result(1000, 100), "c@stub": result(1000, 100)}
+        results = {"a@stub": result(950, 105), "b@stub": result(800, 100), "c@stub": result(1000, 150), "d@stub": result(1, 1)}
+        self.assertEqual(self.compare(results, baseline), ["b@stub: SLOWER", "c@stub: MORE ALLOC"])
+
+    def test_zero_allocation_baseline(self):
+        self.assertEqual(self.compare({"a@stub": result(1000, 50)}, {"a@stub": result(1000, 0)}), [])
+
+
+class ParseListTest(unittest.TestCase):
+
+    def test_allowed_values(self):
+        self.assertEqual(parse_list("stub, loopback,", TRANSPORTS), ["stub", "loopback"])
+        with self.assertRaises(argparse.ArgumentTypeError):
+            parse_list("stub,tcp", TRANSPORTS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+"""Kalibráció: több mérés pumpánként, bulk kalibráció párhuzamosan, timeout, ajánlott calibration_factor"""
+
+import asyncio
+import unittest
+
+from device_state import NUM_PUMPS
+from esp32_mock import MAX_CALIBRATION_TRIALS
+from mock_harness import run_device
+
+
+def calibrate(backend, pump_id: int, command_id: str = "cal", **options):
+    backend.send("calibration/start", {"pump_id": pump_id, "command_id": command_id, **options})
+
+
+class CalibrationTest(unittest.TestCase):
+
+    def run_calibration(self, duration: float = 120.0, physics: bool = False, **command):
+        async def scenario(mock, backend):
+            calibrate(backend, **command)
+            await asyncio.sleep(duration)
+            return dict(mock.calibration_factors)
+
+        _, backend, factors = run_device(scenario, physics=physics)
+        completes = [payload for _, payload in backend.received("maintenance/complete")]
+        return completes, backend, factors
+
+    def test_single_pump_trials(self):
+        [complete], _, _ = self.run_calibration(pump_id=2, test_amount_ml=20.0, trials=3)
+        self.assertEqual((complete["pump_id"], complete["action_type"], complete["command_id"]), (2, "calibration", "cal"))
+        self.assertEqual((complete["trials"], complete["completed_trials"], len(complete["measured_ml"])), (3, 3, 3))
+        self.assertAlmostEqual(complete["mean_ml"], 20.0, delta=1.0)
+        self.assertGreaterEqual(complete["variance_ml"], 0.0)
+        self.assertAlmostEqual(complete["recommended_calibration_factor"], 20.0 / complete["mean_ml"], places=2)
+        self.assertFalse(complete["applied"])
+
+    def test_bulk_calibration_runs_pumps_in_parallel(self):
+        [complete], _, _ = self.run_calibration(pump_id=-1, test_amount_ml=20.0, trials=2)
+        self.assertEqual(complete["pump_id"], -1)
+        self.assertEqual([result["pump_id"] for result in complete["results"]], list(range(1, NUM_PUMPS + 1)))
+        self.assertTrue(all(result["completed_trials"] == 2 for result in complete["results"]))
+        # ~2s per trial (100ms/ml): 8 pumps x 2 trials in two batches of max_active_pumps = 4
+        self.assertLess(complete["duration_ms"], 2 * 2 * 2400 + 500)
+        self.assertGreater(complete["duration_ms"], 2 * 2 * 1600)
+
+    def test_trial_over_the_timeout_is_reported_and_excluded(self):
+        [complete], backend, _ = self.run_calibration(pump_id=1, test_amount_ml=50.0, trials=2, timeout_ms=1000)
+        timeouts = backend.errors("CALIBRATION_TIMEOUT")
+        self.assertEqual([error["context"]["trial"] for error in timeouts], [1, 2])
+        self.assertEqual({error["command_id"] for error in timeouts}, {"cal"})
+        self.assertEqual((complete["completed_trials"], complete["timed_out_trials"]), (0, 2))
+        self.assertIsNone(complete["mean_ml"])
+        self.assertIsNone(complete["recommended_calibration_factor"])
+
+    def test_invalid_parameters(self):
+        for command in ({"pump_id": 9}, {"pump_id": -1, "trials": MAX_CALIBRATION_TRIALS + 1}, {"pump_id": 1, "test_amount_ml": 0}):
+            with self.subTest(command=command):
+                completes, backend, _ = self.run_calibration(duration=1.0, **command)
+                self.assertEqual(completes, [])
+                self.assertEqual(len(backend.errors("INVALID_COMMAND")), 1)
+
+    def test_applied_factor_is_used_by_the_physics(self):
+        [complete], _, factors = self.run_calibration(pump_id=3, test_amount_ml=40.0, trials=3, apply=True, physics=True)
+        self.assertTrue(complete["applied"])
+        self.assertEqual(factors, {3: complete["recommended_calibration_factor"]})
+        # Flow physics: the sensor gain makes the delivered volume differ from the test amount
+        self.assertNotEqual(complete["recommended_calibration_factor"], 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+"""command_dedup: kulcsképzés, LRU / TTL cache és a bejegyzések befejezése"""
+
+import asyncio
+import unittest
+
+from command_dedup import CommandDedup, DedupEntry, command_key, record_reply, recording
+from mock_harness import run_device
+from sim_clock import SimClock
+
+
+class CommandKeyTest(unittest.TestCase):
+
+    def test_command_id_is_the_key(self):
+        self.assertEqual(command_key("intellivend/dispense/command", {"command_id": "abc", "pump_id": 1}), "id:abc")
+
+    def test_payload_hash_needs_a_timestamp(self):
+        self.assertIsNone(command_key("intellivend/dispense/command", {"pump_id": 1, "amount_ml": 20}))
+        key = command_key("intellivend/dispense/command", {"pump_id": 1, "timestamp": "2025-01-01T00:00:00Z"})
+        self.assertTrue(key.startswith("sha1:"))
+
+    def test_payload_hash_ignores_field_order_but_not_topic(self):
+        first = command_key("a/dispense/command", {"pump_id": 1, "timestamp": "t"})
+        self.assertEqual(first, command_key("a/dispense/command", {"timestamp": "t", "pump_id": 1}))
+        self.assertNotEqual(first, command_key("b/dispense/command", {"pump_id": 1, "timestamp": "t"}))
+
+
+class CommandDedupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = SimClock(virtual=True)
+        self.dedup = CommandDedup(size=2, ttl=10.0, clock=self.clock)
+
+    def test_lookup_miss_then_hit(self):
+        self.assertIsNone(self.dedup.lookup("id:1"))
+        entry = self.dedup.add("id:1")
+        self.assertIs(self.dedup.lookup("id:1"), entry)
+        self.assertEqual((self.dedup.misses, self.dedup.hits), (1, 1))
+
+    def test_entry_expires_after_ttl(self):
+        self.dedup.add("id:1")
+        self.clock.advance(10.0)
+        self.assertIsNone(self.dedup.lookup("id:1"))
+        self.assertEqual(self.dedup.expired, 1)
+        self.assertEqual(len(self.dedup), 0)
+
+    def test_least_recently_used_is_evicted(self):
+        self.dedup.add("id:1")
+        self.dedup.add("id:2")
+        self.dedup.lookup("id:1")
+        self.dedup.add("id:3")
+        self.assertIsNone(self.dedup.lookup("id:2"))
+        self.assertIsNotNone(self.dedup.lookup("id:1"))
+        self.assertEqual(self.dedup.evicted, 1)
+
+
+class DedupEntryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.entry = DedupEntry("id:1", expires_at=10.0)
+
+    def test_new_entry_is_in_progress(self):
+        self.assertFalse(self.entry.finished)
+        self.assertEqual(self.entry.replies, [])
+
+    def test_intermediate_reply_does_not_finish(self):
+        with recording(self.entry):
+            record_reply("error", {"error_code": "PUMP_TIMEOUT"}, 1)
+            self.assertFalse(self.entry.finished)
+            record_reply("dispense/complete", {"actual_ml": 20}, 1)
+        self.assertTrue(self.entry.finished)
+        self.assertEqual([name for name, _, _ in self.entry.replies], ["error", "dispense/complete"])
+
+    def test_hand_off_leaves_the_entry_open_for_the_next_owner(self):
+        with recording(self.entry):
+            self.entry.hand_off()
+        self.assertFalse(self.entry.finished)
+        with recording(self.entry):
+            record_reply("dispense/complete", {"actual_ml": 20}, 1)
+        self.assertTrue(self.entry.finished)
+
+    def test_explicit_finish(self):
+        self.entry.finish()
+        self.assertTrue(self.entry.finished)
+
+    def test_replies_outside_recording_are_not_kept(self):
+        record_reply("dispense/complete", {}, 1)
+        with recording(None):
+            record_reply("dispense/complete", {}, 1)
+        self.assertEqual(self.entry.replies, [])
+
+
+class DeviceDedupTest(unittest.TestCase):
+
+    def run_duplicates(self, gap: float, **options):
+        async def scenario(mock, backend):
+            command = {"pump_id": 1, "amount_ml": 20, "command_id": "d1"}
+            backend.send("dispense/command", command)
+            await asyncio.sleep(gap)
+            backend.send("dispense/command", command)
+            await asyncio.sleep(5)
+
+        _, backend, _ = run_device(scenario, **options)
+        return backend
+
+    def test_duplicate_in_progress_is_ignored(self):
+        backend = self.run_duplicates(0.2)
+        self.assertEqual(len(backend.received("dispense/complete")), 1)
+        self.assertEqual(backend.errors("BUSY"), [])
+
+    def test_duplicate_of_a_finished_command_gets_the_same_reply(self):
+        backend = self.run_duplicates(2.0)
+        [(first_at, first), (second_at, second)] = backend.received("dispense/complete")
+        self.assertEqual(first, second)
+        # Resent at once, not poured again
+        self.assertAlmostEqual(second_at, 2.0 + 0.1, delta=0.1)
+
+    def test_disabled_dedup_runs_the_command_twice(self):
+        backend = self.run_duplicates(2.0, dedup_size=0)
+        completes = [payload for _, payload in backend.received("dispense/complete")]
+        self.assertEqual(len(completes), 2)
+        self.assertNotEqual(completes[0]["timestamp"], completes[1]["timestamp"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+"""device_state: tömb alapú pumpa állapot tábla (átfedő műveletek, hibák, seqlock snapshot)"""
+
+import unittest
+
+from device_state import NUM_PUMPS, PumpStateTable
+from sim_clock import SimClock
+
+
+class PumpStateTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = SimClock(virtual=True)
+        self.table = PumpStateTable(self.clock)
+        self.first = self.table.add_device()
+        self.second = self.table.add_device()
+
+    def test_devices_get_separate_slots(self):
+        self.assertEqual((self.first, self.second, self.table.size), (0, NUM_PUMPS, 2 * NUM_PUMPS))
+        self.table.begin(self.second, 1, "dispensing")
+        self.assertEqual((self.table.active(self.first), self.table.active(self.second)), (0, 1))
+
+    def test_invalid_pump_number(self):
+        for pump_id in (0, NUM_PUMPS + 1, -1, 2.0, True):
+            with self.subTest(pump_id=pump_id), self.assertRaises(ValueError):
+                self.table.begin(self.first, pump_id, "dispensing")
+
+    def test_overlapping_operations_keep_the_pump_active(self):
+        self.table.begin(self.first, 3, "dispensing", 40.0)
+        self.table.begin(self.first, 3, "flushing")
+        self.table.end(self.first, 3)
+        self.assertEqual(self.table.active(self.first), 1)
+        self.table.end(self.first, 3)
+        self.table.end(self.first, 3)  # never below zero
+        self.assertEqual(self.table.active(self.first), 0)
+        self.assertEqual(self.table.snapshot(self.first)["pumps"][2]["state"], "idle")
+
+    def test_snapshot(self):
+        self.table.begin(self.first, 2, "dispensing", 40.0)
+        self.clock.advance(1.5)
+        self.table.progress(self.first, 2, 30.004)
+        snapshot = self.table.snapshot(self.first)
+        self.assertEqual(snapshot["pumps_active"], 1)
+        self.assertEqual(snapshot["pumps"][1], {"pump_id": 2, "state": "dispensing", "progress_ml": 30.0, "target_ml": 40.0,
+                                                "elapsed_ms": 1500, "error": None})
+        self.assertEqual(snapshot["pumps"][0]["elapsed_ms"], 0)
+        self.assertEqual(len(snapshot["pumps"]), NUM_PUMPS)
+
+    def test_errors_per_pump_and_per_device(self):
+        self.table.set_error(self.second, 4, "PUMP_TIMEOUT")
+        self.table.set_error(self.second, 0, "EMERGENCY_STOP")
+        snapshot = self.table.snapshot(self.second)
+        self.assertEqual((snapshot["pumps"][3]["error"], snapshot["error"]), ("PUMP_TIMEOUT", "EMERGENCY_STOP"))
+        self.assertIsNone(self.table.snapshot(self.first)["error"])
+        # A new operation clears the pump's error
+        self.table.begin(self.second, 4, "calibrating")
+        self.assertIsNone(self.table.snapshot(self.second)["pumps"][3]["error"])
+
+    def test_busy_and_active_total(self):
+        self.table.begin(self.first, 1, "flushing")
+        self.table.begin(self.first, 2, "dispensing")
+        self.table.begin(self.second, 1, "calibrating")
+        self.assertEqual(self.table.busy(self.first, [1, 2, 3], ("flushing", "calibrating")), [1])
+        self.assertEqual(self.table.active_total(), 3)
+
+    def test_writes_keep_the_sequence_even(self):
+        self.table.begin(self.first, 1, "dispensing")
+        self.table.progress(self.first, 1, 5.0)
+        self.table.set_error(self.first, 1, "BUSY")
+        self.table.end(self.first, 1)
+        self.assertEqual(self.table.sequence % 2, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+"""Parancs dispatcher: priority lane az emergency stopnak, korlátos worker pool, BUSY telítettségnél"""
+
+import asyncio
+import unittest
+
+from mock_harness import run_device
+
+
+def dispense(command_id: str, pump_id: int = 1, amount_ml: float = 100.0) -> dict:
+    return {"pump_id": pump_id, "amount_ml": amount_ml, "command_id": command_id}
+
+
+class DispatcherTest(unittest.TestCase):
+
+    def test_full_queue_rejects_with_busy(self):
+        async def scenario(mock, backend):
+            backend.send("dispense/command", dispense("running"))
+            await asyncio.sleep(0.1)
+            backend.send("dispense/command", dispense("queued", pump_id=2))
+            backend.send("dispense/command", dispense("rejected", pump_id=3))
+            await asyncio.sleep(20)
+
+        _, backend, _ = run_device(scenario, workers=1, queue_depth=1)
+        busy = backend.errors("BUSY")
+        self.assertEqual([error["command_id"] for error in busy], ["rejected"])
+        self.assertEqual(busy[0]["pump_id"], 3)
+        completed = [payload["command_id"] for _, payload in backend.received("dispense/complete")]
+        self.assertEqual(completed, ["running", "queued"])
+
+    def test_worker_pool_runs_commands_in_parallel(self):
+        async def scenario(mock, backend):
+            for pump_id in (1, 2):
+                backend.send("dispense/command", dispense(f"pump{pump_id}", pump_id=pump_id))
+            await asyncio.sleep(20)
+
+        _, backend, _ = run_device(scenario, workers=2, queue_depth=2)
+        finished = [at for at, _ in backend.received("dispense/complete")]
+        self.assertEqual(len(finished), 2)
+        # 100ml at 20ml/s: both finish after ~5s, not one after the other
+        self.assertLess(max(finished), 8.0)
+
+    def test_emergency_stop_bypasses_busy_workers(self):
+        async def scenario(mock, backend):
+            backend.send("dispense/command", dispense("running"))
+            await asyncio.sleep(1.0)
+            sent_at = mock.clock.monotonic()
+            backend.send("emergency/stop", {"reason": "test"}, qos=2)
+            await asyncio.sleep(3.0)
+            return sent_at
+
+        _, backend, sent_at = run_device(scenario, workers=1, queue_depth=1)
+        stops = [(at, payload) for at, payload in backend.received("error") if payload["error_code"] == "EMERGENCY_STOP"]
+        self.assertEqual({payload.get("command_id") for _, payload in stops}, {"running", None})
+        # Handled on the network loop while the only worker is still pouring
+        for at, _ in stops:
+            self.assertAlmostEqual(at, sent_at, places=3)
+        self.assertEqual(backend.received("dispense/complete"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+"""esp32_mock: recept szakaszok (order / layered) és a megszakított adagolás hátralévő része"""
+
+import unittest
+
+from esp32_mock import RESUME_MIN_ML, RESUMED_KEY, plan_recipe_stages, remaining_dispense
+
+
+def ingredient(pump: int, ml: float, order: int, **extra) -> dict:
+    return dict(pump_number=pump, quantity_ml=ml, order=order, **extra)
+
+
+def stage_pumps(stages: list) -> list:
+    return [[item["pump_number"] for _, item in stage] for stage in stages]
+
+
+class PlanRecipeStagesTest(unittest.TestCase):
+
+    def test_unlayered_ingredients_share_one_stage(self):
+        ingredients = [ingredient(1, 20, 1), ingredient(2, 30, 2), ingredient(3, 10, 3)]
+        self.assertEqual(stage_pumps(plan_recipe_stages(ingredients)), [[1, 2, 3]])
+
+    def test_stage_is_sorted_by_order_and_keeps_original_indices(self):
+        ingredients = [ingredient(1, 20, 3), ingredient(2, 30, 1), ingredient(3, 10, 2)]
+        stages = plan_recipe_stages(ingredients)
+        self.assertEqual([index for index, _ in stages[0]], [1, 2, 0])
+
+    def test_layered_ingredient_is_a_barrier(self):
+        ingredients = [ingredient(1, 20, 1), ingredient(2, 30, 2, layered=True), ingredient(3, 10, 3), ingredient(4, 10, 4)]
+        self.assertEqual(stage_pumps(plan_recipe_stages(ingredients)), [[1], [2], [3, 4]])
+
+    def test_layered_recipe_runs_one_ingredient_per_stage(self):
+        ingredients = [ingredient(1, 20, 2), ingredient(2, 30, 1)]
+        self.assertEqual(stage_pumps(plan_recipe_stages(ingredients, layered=True)), [[2], [1]])
+
+    def test_missing_order_falls_back_to_position(self):
+        ingredients = [{"pump_number": 5, "quantity_ml": 10}, ingredient(6, 10, 1, layered=True)]
+        self.assertEqual(stage_pumps(plan_recipe_stages(ingredients)), [[5], [6]])
+
+
+class RemainingDispenseTest(unittest.TestCase):
+
+    def test_single_pump_remainder(self):
+        payload = {"pump_id": 1, "amount_ml": 50, "duration_ms": 2500, "recipe_name": "Shot", "command_id": "c1"}
+        resumed = remaining_dispense(payload, {1: 20.0})
+        self.assertEqual(resumed["amount_ml"], 30.0)
+        self.assertNotIn("duration_ms", resumed)   # recalculated from the remaining amount
+        self.assertEqual(resumed["command_id"], "c1")
+        self.assertEqual(resumed[RESUMED_KEY], {"payload": payload, "poured": {"1": 20.0}})
+
+    def test_nothing_poured_resumes_the_original_amounts(self):
+        payload = {"pump_id": 1, "amount_ml": 50}
+        resumed = remaining_dispense(payload, {})
+        self.assertEqual(resumed["amount_ml"], 50)
+        self.assertNotIn(RESUMED_KEY, resumed)
+
+    def test_single_pump_done_below_the_threshold(self):
+        payload = {"pump_id": 2, "amount_ml": 40}
+        self.assertIsNone(remaining_dispense(payload, {2: 40 - RESUME_MIN_ML / 2}))
+
+    def test_recipe_keeps_only_unfinished_ingredients(self):
+        payload = {"pump_id": 1, "amount_ml": [ingredient(1, 20, 1), ingredient(2, 30, 2), ingredient(3, 10, 3)]}
+        resumed = remaining_dispense(payload, {1: 20.0, 2: 12.5})
+        self.assertEqual([(item["pump_number"], item["quantity_ml"]) for item in resumed["amount_ml"]], [(2, 17.5), (3, 10)])
+        self.assertEqual(resumed[RESUMED_KEY]["payload"], payload)
+        self.assertEqual(resumed[RESUMED_KEY]["poured"], {"1": 20.0, "2": 12.5})
+
+    def test_finished_recipe_has_no_remainder(self):
+        payload = {"pump_id": 1, "amount_ml": [ingredient(1, 20, 1), ingredient(2, 30, 2)]}
+        self.assertIsNone(remaining_dispense(payload, {1: 20.0, 2: 29.8}))
+
+    def test_second_restart_is_computed_from_the_original(self):
+        # The snapshot keeps the original command and the cumulative poured ml of a resumed dispense
+        payload = {"pump_id": 1, "amount_ml": 60}
+        first = remaining_dispense(payload, {1: 20.0})
+        second = remaining_dispense(first[RESUMED_KEY]["payload"], {1: 45.0})
+        self.assertEqual(second["amount_ml"], 15.0)
+        self.assertEqual(second[RESUMED_KEY]["payload"], payload)
+
+
+if __name__ == "__main__":
+    unittest.main()
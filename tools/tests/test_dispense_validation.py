@@ -0,0 +1,45 @@
+"""Dispense ellenőrzés: pumpa szám és mennyiség minden adagolásnál, teljes térfogat csak a rendelés sorban"""
+
+import asyncio
+import unittest
+
+from mock_harness import run_device
+from order_queue import MAX_ORDER_ML
+
+
+def dispense(command_id: str, pump_id, amount_ml) -> dict:
+    return {"pump_id": pump_id, "amount_ml": amount_ml, "command_id": command_id}
+
+
+class DispenseValidationTest(unittest.TestCase):
+
+    def run_commands(self, commands, **options):
+        async def scenario(mock, backend):
+            for command in commands:
+                backend.send("dispense/command", command)
+            await asyncio.sleep(70)
+
+        _, backend, _ = run_device(scenario, workers=2, **options)
+        invalid = {error["command_id"]: error["message"] for error in backend.errors("INVALID_COMMAND")}
+        completed = [payload["command_id"] for _, payload in backend.received("dispense/complete")]
+        return invalid, completed
+
+    def test_direct_dispense_has_no_volume_cap(self):
+        invalid, completed = self.run_commands([dispense("large", 1, MAX_ORDER_ML + 200)])
+        self.assertEqual(invalid, {})
+        self.assertEqual(completed, ["large"])
+
+    def test_direct_dispense_checks_pumps_and_quantities(self):
+        invalid, completed = self.run_commands([dispense("pump", 9, 20), dispense("quantity", 1, -5)])
+        self.assertEqual(set(invalid), {"pump", "quantity"})
+        self.assertIn("Invalid pump number", invalid["pump"])
+        self.assertEqual(completed, [])
+
+    def test_queued_order_is_capped(self):
+        invalid, completed = self.run_commands([dispense("large", 1, MAX_ORDER_ML + 200), dispense("small", 2, 20)], order_queue=2)
+        self.assertIn("exceeds", invalid["large"])
+        self.assertEqual(completed, ["small"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+"""Emergency stop: műveletenkénti megszakítási tokenek, stop latency, eldobott várakozó parancsok"""
+
+import asyncio
+import unittest
+
+from esp32_mock import CancelToken
+from mock_harness import run_device
+
+
+class CancelTokenTest(unittest.TestCase):
+
+    def test_cancel_wakes_every_sleeper(self):
+        async def scenario():
+            token = CancelToken("dispense", "c1")
+            loop = asyncio.get_running_loop()
+            sleepers = [asyncio.ensure_future(token.sleep(60)) for _ in range(3)]
+            await asyncio.sleep(0)
+            started = loop.time()
+            token.cancel("test")
+            results = await asyncio.gather(*sleepers)
+            return results, loop.time() - started
+
+        results, waited = asyncio.run(scenario())
+        self.assertEqual(results, [True, True, True])
+        self.assertLess(waited, 1.0)
+
+    def test_sleep_returns_false_when_not_cancelled(self):
+        token = CancelToken("flush")
+        self.assertFalse(asyncio.run(token.sleep(0.01)))
+
+    def test_cancelled_token_does_not_sleep(self):
+        token = CancelToken("flush")
+        token.cancel("test")
+        self.assertTrue(asyncio.run(token.sleep(60)))
+
+    def test_first_cancel_wins(self):
+        token = CancelToken("flush")
+        token.cancel("first", requested_at=1.0)
+        token.cancel("second", requested_at=2.0)
+        self.assertEqual((token.reason, token.requested_at), ("first", 1.0))
+
+    def test_stop_context_reports_latency(self):
+        token = CancelToken("calibration")
+        token.cancel("test", command_time=0.0)
+        context = token.stop_context()
+        self.assertEqual(context["operation"], "calibration")
+        self.assertGreaterEqual(context["stop_latency_ms"], 0.0)
+        self.assertIn("end_to_end_latency_ms", context)
+
+
+class EmergencyStopTest(unittest.TestCase):
+
+    def test_stop_interrupts_running_and_discards_queued_commands(self):
+        async def scenario(mock, backend):
+            backend.send("maintenance/flush", {"pump_id": 1, "duration_ms": 10000, "command_id": "flush"})
+            await asyncio.sleep(0.1)
+            backend.send("dispense/command", {"pump_id": 2, "amount_ml": 50, "command_id": "queued"})
+            await asyncio.sleep(1.0)
+            backend.send("emergency/stop", {"reason": "test"}, qos=2)
+            await asyncio.sleep(15.0)
+
+        _, backend, _ = run_device(scenario, workers=1)
+        stops = {error.get("command_id"): error for error in backend.errors("EMERGENCY_STOP")}
+        self.assertEqual(set(stops), {"flush", "queued", None})
+        self.assertEqual(stops["flush"]["context"]["operation"], "flush")
+        self.assertIn("stop_latency_ms", stops["flush"]["context"])
+        self.assertEqual(stops["queued"]["context"]["operation"], "dispense")
+        self.assertTrue(stops["queued"]["context"]["queued"])
+        self.assertEqual(stops[None]["severity"], "critical")
+        self.assertEqual(backend.received("maintenance/complete"), [])
+        self.assertEqual(backend.received("dispense/complete"), [])
+
+    def test_stop_latch_rejects_new_work_until_cleared(self):
+        async def scenario(mock, backend):
+            backend.send("emergency/stop", {"reason": "test"}, qos=2)
+            await asyncio.sleep(0.5)
+            backend.send("dispense/command", {"pump_id": 1, "amount_ml": 20, "command_id": "latched"})
+            await asyncio.sleep(3.0)
+            backend.send("dispense/command", {"pump_id": 1, "amount_ml": 20, "command_id": "after"})
+            await asyncio.sleep(3.0)
+
+        _, backend, _ = run_device(scenario)
+        self.assertIn("latched", [error.get("command_id") for error in backend.errors("EMERGENCY_STOP")])
+        self.assertEqual([payload["command_id"] for _, payload in backend.received("dispense/complete")], ["after"])
+
+    def test_heartbeats_continue_after_stop(self):
+        async def scenario(mock, backend):
+            backend.send("emergency/stop", {"reason": "test"}, qos=2)
+            await asyncio.sleep(35.0)
+
+        _, backend, _ = run_device(scenario, heartbeat_interval=10.0)
+        self.assertGreaterEqual(len([at for at, _ in backend.received("heartbeat") if at > 1.0]), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
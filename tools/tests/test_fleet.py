@@ -0,0 +1,56 @@
+"""ESP32Fleet: több eszköz egy event loop-on, eszközönkénti topicok, közös állapot tábla"""
+
+import asyncio
+import unittest
+
+from esp32_mock import ESP32Fleet
+from mock_harness import CONNECT_TIME, Backend
+from mqtt_broker import MQTTBroker
+from sim_clock import SimClock
+
+
+class FleetTest(unittest.TestCase):
+
+    def run_fleet(self, scenario, devices: int = 3):
+        clock = SimClock(virtual=True, start_time=0.0)
+        broker = MQTTBroker()
+        fleet = ESP32Fleet(devices, clock=clock, loopback=broker, seed=1)
+        backend = Backend(broker, clock)
+
+        async def main():
+            backend.connect()
+            task = asyncio.ensure_future(fleet.run_async())
+            await asyncio.sleep(CONNECT_TIME)
+            try:
+                return await scenario(fleet, backend)
+            finally:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+        return fleet, backend, clock.run(main())
+
+    def test_devices_have_their_own_topics(self):
+        async def scenario(fleet, backend):
+            backend.send("ESP32_MOCK_002/dispense/command", {"pump_id": 1, "amount_ml": 10, "command_id": "d1"})
+            await asyncio.sleep(15)
+            return [device.connected for device in fleet.devices]
+
+        fleet, backend, connected = self.run_fleet(scenario)
+        self.assertEqual([device.client_id for device in fleet.devices], ["ESP32_MOCK_001", "ESP32_MOCK_002", "ESP32_MOCK_003"])
+        self.assertEqual(connected, [True, True, True])
+        self.assertEqual([payload["command_id"] for _, payload in backend.received("ESP32_MOCK_002/dispense/complete")], ["d1"])
+        self.assertEqual(backend.received("ESP32_MOCK_001/dispense/complete") + backend.received("ESP32_MOCK_003/dispense/complete"), [])
+        for device in fleet.devices:
+            self.assertTrue(backend.received(f"{device.client_id}/heartbeat"))
+
+    def test_devices_share_one_pump_state_table(self):
+        async def scenario(fleet, backend):
+            return None
+
+        fleet, _, _ = self.run_fleet(scenario)
+        self.assertTrue(all(device.pump_state is fleet.pump_state for device in fleet.devices))
+        self.assertEqual(len({device.state_base for device in fleet.devices}), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
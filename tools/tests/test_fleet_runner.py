@@ -0,0 +1,42 @@
+"""fleet_runner: eszközök szétosztása shard-okra, shard-onkénti fájlnevek"""
+
+import unittest
+
+from fleet_runner import plan_shards, shard_path
+
+
+class PlanShardsTest(unittest.TestCase):
+
+    def test_remainder_goes_to_the_first_shards(self):
+        self.assertEqual(plan_shards(10, 3), [(1, 4), (5, 3), (8, 3)])
+
+    def test_shards_are_contiguous_and_cover_every_device(self):
+        for devices, processes in ((1, 1), (7, 7), (100, 8), (2000, 8), (2001, 16)):
+            shards = plan_shards(devices, processes)
+            self.assertEqual(len(shards), processes)
+            self.assertEqual(sum(count for _, count in shards), devices)
+            self.assertLessEqual(max(count for _, count in shards) - min(count for _, count in shards), 1)
+            expected_first = 1
+            for first, count in shards:
+                self.assertEqual(first, expected_first)
+                expected_first += count
+
+    def test_no_empty_shard_with_more_processes_than_devices(self):
+        self.assertEqual(plan_shards(3, 8), [(1, 1), (2, 1), (3, 1)])
+
+    def test_at_least_one_shard(self):
+        self.assertEqual(plan_shards(5, 0), [(1, 5)])
+
+
+class ShardPathTest(unittest.TestCase):
+
+    def test_shard_number_before_the_extension(self):
+        self.assertEqual(shard_path("session.ivrec", 2), "session.2.ivrec")
+        self.assertEqual(shard_path("/tmp/run/mock.jsonl", 0), "/tmp/run/mock.0.jsonl")
+
+    def test_path_without_extension(self):
+        self.assertEqual(shard_path("fleet", 3), "fleet.3")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+"""flow_physics: slot kiosztás, adagolás a cél impulzusszámig, NumPy / tiszta Python egyezés"""
+
+import asyncio
+import unittest
+
+from flow_physics import NUM_PUMPS, PULSES_PER_LITER, STOPPED, TARGET_REACHED, FlowPhysics, numpy_available
+from sim_clock import SimClock
+
+
+def run_pumps(use_numpy: bool, targets, ticks: int = 200, dt: float = 0.05) -> list:
+    """Pumpák futtatása kézi tick-ekkel; az eredmények slotonként"""
+    async def scenario():
+        physics = FlowPhysics(SimClock(virtual=True), seed=7, use_numpy=use_numpy)
+        bases = [physics.add_device(f"ESP32_MOCK_{index:03d}") for index in (1, 2)]
+        runs = [physics.start_pump(physics.slot(base, pump_id), target_ml) for base in bases for pump_id, target_ml in targets]
+        for _ in range(ticks):
+            physics.step(dt)
+        return [run.result() if run.done() else None for run in runs], physics
+
+    results, physics = asyncio.run(scenario())
+    return results, physics
+
+
+class SlotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.physics = FlowPhysics(SimClock(virtual=True), seed=1, use_numpy=False)
+        self.base = self.physics.add_device("ESP32_MOCK_001")
+        self.second = self.physics.add_device("ESP32_MOCK_002")
+
+    def test_devices_get_consecutive_slots(self):
+        self.assertEqual((self.base, self.second), (0, NUM_PUMPS))
+        self.assertEqual(self.physics.slot(self.second, 1), NUM_PUMPS)
+        self.assertEqual(self.physics.slot(self.second, NUM_PUMPS), 2 * NUM_PUMPS - 1)
+
+    def test_invalid_pump_number(self):
+        for pump_id in (0, -1, NUM_PUMPS + 1, 1.0, "1", True, None):
+            with self.subTest(pump_id=pump_id), self.assertRaises(ValueError):
+                self.physics.slot(self.base, pump_id)
+
+    def test_pump_characteristics_depend_on_seed_and_device_only(self):
+        other = FlowPhysics(SimClock(virtual=True), seed=1, use_numpy=False)
+        other.add_device("ESP32_MOCK_002")
+        self.assertEqual(other.state["nominal"][:NUM_PUMPS], self.physics.state["nominal"][NUM_PUMPS:])
+
+
+class PourTest(unittest.TestCase):
+
+    def test_pump_stops_at_the_target_pulse_count(self):
+        [result, *_], physics = run_pumps(False, [(1, 40.0)])
+        self.assertEqual(result["reason"], TARGET_REACHED)
+        self.assertEqual(result["flow_pulses"], 18)  # ceil(40 ml * 450 / 1000)
+        self.assertAlmostEqual(result["measured_ml"], 18 / PULSES_PER_LITER * 1000.0, places=2)
+        # The true volume differs from the measured one by the sensor gain
+        self.assertAlmostEqual(result["delivered_ml"], result["measured_ml"] / result["sensor_gain"], delta=0.5)
+        self.assertEqual(physics.running_slots, set())
+
+    def test_stopped_pump(self):
+        async def scenario():
+            physics = FlowPhysics(SimClock(virtual=True), seed=1, use_numpy=False)
+            slot = physics.slot(physics.add_device("ESP32_MOCK_001"), 3)
+            first = physics.start_pump(slot, 100.0)
+            queued = physics.start_pump(slot, 100.0)
+            physics.step(1.0)
+            physics.stop_pump(slot, queued)
+            physics.stop_pump(slot, first)
+            return first.result(), queued.result(), physics.running_slots
+
+        first, queued, running = asyncio.run(scenario())
+        self.assertEqual(first["reason"], STOPPED)
+        self.assertGreater(first["measured_ml"], 0.0)
+        self.assertEqual((queued["reason"], queued["measured_ml"]), (STOPPED, 0.0))
+        self.assertEqual(running, set())
+
+
+@unittest.skipUnless(numpy_available(), "numpy is not installed")
+class NumpyParityTest(unittest.TestCase):
+
+    def test_vectorized_step_matches_pure_python(self):
+        targets = [(1, 40.0), (2, 15.0), (5, 120.0), (8, 60.0)]
+        python_results, python_physics = run_pumps(False, targets)
+        numpy_results, numpy_physics = run_pumps(True, targets)
+        for python_result, numpy_result in zip(python_results, numpy_results):
+            self.assertEqual(python_result["reason"], numpy_result["reason"])
+            self.assertEqual(python_result["flow_pulses"], numpy_result["flow_pulses"])
+            for key in ("measured_ml", "delivered_ml", "bottle_ml", "sensor_gain"):
+                self.assertAlmostEqual(python_result[key], numpy_result[key], places=3)
+        for name in ("bottle", "gain", "noise_step"):
+            self.assertEqual(len(python_physics.state[name]), len(numpy_physics.state[name]))
+            for python_value, numpy_value in zip(python_physics.state[name], numpy_physics.state[name]):
+                self.assertAlmostEqual(float(python_value), float(numpy_value), places=6)
+
+
+if __name__ == "__main__":
+    unittest.main()
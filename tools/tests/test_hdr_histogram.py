@@ -0,0 +1,69 @@
+"""hdr_histogram: relatív pontosság, percentilisek, összevonás és szerializálás"""
+
+import json
+import math
+import random
+import unittest
+
+from hdr_histogram import HdrHistogram
+
+
+class HdrHistogramTest(unittest.TestCase):
+
+    def test_relative_error_within_the_precision(self):
+        rng = random.Random(1)
+        values = sorted(int(rng.lognormvariate(8, 1.5)) for _ in range(10000))
+        hist = HdrHistogram(3)
+        for value in values:
+            hist.record(value)
+        for percentile in (50, 90, 99, 99.9):
+            exact = values[math.ceil(percentile / 100.0 * len(values)) - 1]
+            self.assertAlmostEqual(hist.value_at_percentile(percentile), exact, delta=max(1, exact * 0.001))
+        self.assertEqual((hist.min_value, hist.max_value, hist.value_at_percentile(100)), (values[0], values[-1], values[-1]))
+
+    def test_small_values_are_exact(self):
+        hist = HdrHistogram(2)
+        for value in range(100):
+            hist.record(value)
+        self.assertEqual([hist.value_at_percentile(p) for p in (1, 50, 100)], [0, 49, 99])
+        self.assertEqual(hist.mean(), 49.5)
+
+    def test_negative_and_weighted_values(self):
+        hist = HdrHistogram()
+        hist.record(-5)
+        hist.record(1000, count=9)
+        self.assertEqual(hist.summary(percentiles=(10, 50)), {"count": 10, "min": 0, "mean": 900.0, "p10": 0, "p50": 1000, "max": 1000})
+
+    def test_merge_and_round_trip(self):
+        first, second = HdrHistogram(), HdrHistogram()
+        for value in range(1, 1001):
+            (first if value % 2 else second).record(value * 37)
+        restored = HdrHistogram.from_dict(json.loads(json.dumps(second.to_dict())))
+        first.merge(restored)
+        whole = HdrHistogram()
+        for value in range(1, 1001):
+            whole.record(value * 37)
+        self.assertEqual(first.summary(), whole.summary())
+        with self.assertRaises(ValueError):
+            first.merge(HdrHistogram(2))
+
+    def test_empty_and_invalid(self):
+        hist = HdrHistogram()
+        self.assertEqual(hist.summary()["p99"], 0)
+        self.assertEqual(len(hist.percentile_distribution().splitlines()), 1)
+        with self.assertRaises(ValueError):
+            HdrHistogram(6)
+
+    def test_percentile_distribution_ends_at_the_total_count(self):
+        hist = HdrHistogram()
+        for value in range(1, 101):
+            hist.record(value * 1000)
+        lines = hist.percentile_distribution(scale=1000.0, unit="ms").splitlines()
+        self.assertIn("(ms)", lines[0])
+        last = lines[-3].split()
+        self.assertEqual((float(last[0]), int(last[2])), (100.0, 100))
+        self.assertEqual(lines[-1], "#[Mean = 50.500, Max = 100.000, Total count = 100]")
+
+
+if __name__ == "__main__":
+    unittest.main()
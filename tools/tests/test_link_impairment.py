@@ -0,0 +1,102 @@
+"""link_impairment: késleltetés sorrendtartással, eldobás (csak QoS 0), duplikálás, reconnect backoff"""
+
+import asyncio
+import random
+import unittest
+
+from link_impairment import ImpairedLink, LinkImpairment, ReconnectBackoff
+from mock_harness import run_device
+from sim_clock import SimClock
+
+
+def transfer(impairment: LinkImpairment, messages, seed: int = 1) -> list:
+    """Üzenetek (küldési idő, qos) átvitele; a kézbesítések (érkezési idő, sorszám) listája"""
+    clock = SimClock(virtual=True)
+    link = ImpairedLink(impairment, random.Random(seed))
+    delivered = []
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        for index, (sent_at, qos) in enumerate(messages):
+            await asyncio.sleep(sent_at - loop.time())
+            link.outbound(lambda topic, payload, qos, retain: delivered.append((round(loop.time(), 6), payload)), "t", index, qos)
+        await asyncio.sleep(10)
+
+    clock.run(scenario())
+    return delivered
+
+
+class ImpairedLinkTest(unittest.TestCase):
+
+    def test_latency_and_jitter_keep_the_order(self):
+        messages = [(index * 0.001, 1) for index in range(200)]
+        delivered = transfer(LinkImpairment(latency_ms=50, jitter_ms=200), messages)
+        self.assertEqual([index for _, index in delivered], list(range(200)))
+        arrivals = [at for at, _ in delivered]
+        self.assertEqual(arrivals, sorted(arrivals))
+        for (sent_at, _), arrived_at in zip(messages, arrivals):
+            self.assertGreaterEqual(arrived_at, sent_at + 0.05 - 1e-9)
+
+    def test_only_qos0_is_dropped(self):
+        messages = [(0.0, index % 2) for index in range(400)]
+        delivered = {index for _, index in transfer(LinkImpairment(drop_rate=0.5), messages)}
+        self.assertTrue(all(index in delivered for index in range(1, 400, 2)))
+        dropped = 200 - len([index for index in delivered if index % 2 == 0])
+        self.assertTrue(60 < dropped < 140, dropped)
+
+    def test_duplicates_arrive_together(self):
+        delivered = transfer(LinkImpairment(latency_ms=10, duplicate_rate=1.0), [(0.0, 1), (0.5, 1)])
+        self.assertEqual([index for _, index in delivered], [0, 0, 1, 1])
+        self.assertEqual(delivered[0][0], delivered[1][0])
+
+    def test_same_seed_same_impairment(self):
+        impairment = LinkImpairment(jitter_ms=100, drop_rate=0.2, duplicate_rate=0.1)
+        messages = [(index * 0.01, 0) for index in range(100)]
+        self.assertEqual(transfer(impairment, messages, seed=5), transfer(impairment, messages, seed=5))
+
+    def test_describe(self):
+        self.assertEqual(LinkImpairment().describe(), "none")
+        self.assertFalse(LinkImpairment(disconnect_interval=30).shapes_traffic)
+        self.assertIn("drop 2% (QoS 0)", LinkImpairment(drop_rate=0.02).describe())
+
+
+class ReconnectBackoffTest(unittest.TestCase):
+
+    def test_delay_doubles_with_equal_jitter_up_to_the_cap(self):
+        backoff = ReconnectBackoff(random.Random(1), initial=1.0, maximum=8.0)
+        for expected in (1.0, 2.0, 4.0, 8.0, 8.0, 8.0):
+            delay = backoff.next()
+            self.assertGreaterEqual(delay, expected / 2)
+            self.assertLessEqual(delay, expected)
+
+    def test_reset_after_a_successful_connect(self):
+        backoff = ReconnectBackoff(random.Random(1), initial=1.0)
+        for _ in range(5):
+            backoff.next()
+        backoff.reset()
+        self.assertLessEqual(backoff.next(), 1.0)
+
+
+class ForcedDisconnectTest(unittest.TestCase):
+
+    def test_completion_published_offline_is_sent_after_the_reconnect(self):
+        async def scenario(mock, backend):
+            backend.send("dispense/command", {"pump_id": 1, "amount_ml": 10, "command_id": "c1"})
+            await asyncio.sleep(0.2)
+            mock.force_disconnect("test")
+            await asyncio.sleep(0.1)
+            offline = mock.connected
+            await asyncio.sleep(10)
+            return offline, mock.connected
+
+        _, backend, (offline, reconnected) = run_device(scenario)
+        self.assertEqual((offline, reconnected), (False, True))
+        [(_, complete)] = backend.received("dispense/complete")
+        self.assertEqual(complete["command_id"], "c1")
+        states = [payload for _, payload in backend.received("availability")]
+        # Birth, Last Will, birth after the reconnect (then the clean shutdown)
+        self.assertEqual(states[:3], [b"online", b"offline", b"online"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+"""esp32_loadgen: parancs -> válasz párosítás (command_id, FIFO), futás közbeni és azonosító nélküli hibák"""
+
+import json
+import unittest
+from types import SimpleNamespace
+
+from esp32_loadgen import LoadGenerator
+
+
+def message(topic: str, payload: dict) -> SimpleNamespace:
+    return SimpleNamespace(topic=topic, payload=json.dumps(payload).encode())
+
+
+class LoadGeneratorCorrelationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.generator = LoadGenerator(seed=1, recipe_ingredients=0, flush_ms=1500, calibration_ml=35.0)
+        self.published = []
+        self.generator.client.publish = lambda topic, payload, qos=0: self.published.append((topic, json.loads(payload)))
+
+    def send(self, kind: str) -> str:
+        self.generator.send(kind)
+        return self.published[-1][1]["command_id"]
+
+    def test_command_parameters_come_from_the_options(self):
+        self.send("flush")
+        self.send("calibration")
+        (flush_topic, flush), (calibration_topic, calibration) = self.published
+        self.assertEqual((flush_topic, flush["duration_ms"]), ("intellivend/maintenance/flush", 1500))
+        self.assertEqual((calibration_topic, calibration["test_amount_ml"]), ("intellivend/calibration/start", 35.0))
+
+    def test_completion_matched_by_command_id(self):
+        first = self.send("dispense")
+        second = self.send("dispense")
+        self.generator.on_message(None, None, message("intellivend/dispense/complete", {"command_id": second}))
+        self.assertEqual(list(self.generator.pending), [first])
+        self.assertEqual(self.generator.completed["dispense"], 1)
+
+    def test_completion_without_command_id_matches_oldest_of_the_same_kind(self):
+        flush = self.send("flush")
+        first = self.send("dispense")
+        self.send("dispense")
+        self.generator.on_message(None, None, message("intellivend/dispense/complete", {"actual_ml": 40}))
+        self.assertNotIn(first, self.generator.pending)
+        self.assertIn(flush, self.generator.pending)
+
+    def test_progress_error_keeps_the_command_pending(self):
+        command_id = self.send("calibration")
+        self.generator.on_message(None, None, message("intellivend/error", {"error_code": "CALIBRATION_TIMEOUT", "command_id": command_id}))
+        self.assertIn(command_id, self.generator.pending)
+        self.generator.on_message(None, None, message("intellivend/maintenance/complete", {"action_type": "calibration", "command_id": command_id}))
+        self.assertEqual(self.generator.pending, {})
+        self.assertEqual(self.generator.errors["CALIBRATION_TIMEOUT"], 1)
+        self.assertEqual(self.generator.completed["calibration"], 1)
+
+    def test_final_error_releases_the_command(self):
+        command_id = self.send("dispense")
+        self.generator.on_message(None, None, message("intellivend/error", {"error_code": "BUSY", "command_id": command_id}))
+        self.assertEqual(self.generator.pending, {})
+        self.assertEqual(self.generator.errors["BUSY"], 1)
+
+    def test_error_without_command_id_is_counted_separately(self):
+        command_id = self.send("dispense")
+        self.generator.on_message(None, None, message("intellivend/error", {"error_code": "EMERGENCY_STOP"}))
+        self.assertIn(command_id, self.generator.pending)
+        self.assertEqual(self.generator.device_errors["EMERGENCY_STOP"], 1)
+        self.assertEqual(sum(self.generator.errors.values()), 0)
+
+    def test_reply_for_unknown_command_is_unmatched(self):
+        self.generator.on_message(None, None, message("intellivend/dispense/complete", {"command_id": "other"}))
+        self.generator.on_message(None, None, message("intellivend/error", {"error_code": "BUSY", "command_id": "other"}))
+        self.assertEqual(self.generator.unmatched, 2)
+
+    def test_fleet_topics_are_matched_per_device(self):
+        generator = LoadGenerator(devices=["ESP32_MOCK_001"], seed=1, recipe_ingredients=0)
+        published = []
+        generator.client.publish = lambda topic, payload, qos=0: published.append(topic)
+        generator.send("flush")
+        self.assertEqual(published, ["intellivend/ESP32_MOCK_001/maintenance/flush"])
+        generator.on_message(None, None, message("intellivend/ESP32_MOCK_001/maintenance/complete", {"action_type": "flush"}))
+        self.assertEqual(generator.pending, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
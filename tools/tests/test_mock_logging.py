@@ -0,0 +1,94 @@
+"""mock_logging: mintavételezés, késleltetett formázás, JSON-lines napló a háttérszálon"""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock_logging
+from mock_logging import LOGGER_NAME, DeferredQueueHandler, DeviceLogger, JsonLinesFormatter, Sampler, parse_sampling, setup_logging
+
+
+class SamplerTest(unittest.TestCase):
+
+    def test_every_nth_message_of_a_category(self):
+        sampler = Sampler({"status": 3})
+        self.assertEqual([sampler.allow("status") for _ in range(7)], [True, False, False, True, False, False, True])
+        self.assertTrue(all(sampler.allow("dispense") for _ in range(5)))
+
+    def test_parse_sampling(self):
+        self.assertEqual(parse_sampling("status=100, heartbeat=10,"), {"status": 100, "heartbeat": 10})
+        for value in ("status", "status=x", "status=0"):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_sampling(value)
+
+
+class FormattingTest(unittest.TestCase):
+
+    def record(self, msg: str, *args) -> logging.LogRecord:
+        return logging.LogRecord(LOGGER_NAME, logging.INFO, __file__, 1, msg, args, None)
+
+    def test_mutable_arguments_are_formatted_at_once(self):
+        handler = DeferredQueueHandler(None)
+        pumps = [1, 2]
+        record = handler.prepare(self.record("Pumps %s", pumps))
+        pumps.append(3)
+        self.assertEqual((record.getMessage(), record.args), ("Pumps [1, 2]", None))
+
+    def test_immutable_arguments_are_formatted_later(self):
+        record = DeferredQueueHandler(None).prepare(self.record("Dispensed %.1fml", 12.25))
+        self.assertEqual((record.msg, record.args), ("Dispensed %.1fml", (12.25,)))
+
+    def test_json_lines_fields(self):
+        record = self.record("Dispensed %.1fml", 12.25)
+        record.device, record.category, record.fields = "ESP32_MOCK_001", "dispense", {"pump_id": 3, "command_id": None}
+        entry = json.loads(JsonLinesFormatter().format(record))
+        self.assertEqual((entry["device"], entry["category"], entry["message"], entry["pump_id"]), ("ESP32_MOCK_001", "dispense", "Dispensed 12.2ml", 3))
+        self.assertNotIn("command_id", entry)
+        self.assertTrue(entry["ts"].endswith("Z"))
+
+
+class SetupLoggingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "mock.jsonl")
+
+    def tearDown(self):
+        logger = logging.getLogger(LOGGER_NAME)
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        logger.setLevel(logging.NOTSET)
+        logger.propagate = True
+        mock_logging._sampler.rates = {}
+        shutil.rmtree(self.directory)
+
+    def test_quiet_console_with_a_full_sampled_log_file(self):
+        listener = setup_logging(logging.WARNING, log_file=self.path, file_level=logging.DEBUG, sampling={"status": 2})
+        log = DeviceLogger("[ESP32]", "ESP32_MOCK_001")
+        try:
+            for tick in range(4):
+                log.debug("Status tick %d", tick, category="status")
+            log.info("Dispense complete", category="dispense", pump_id=1)
+        finally:
+            listener.stop()
+        with open(self.path, encoding="utf-8") as log_file:
+            entries = [json.loads(line) for line in log_file]
+        self.assertEqual([entry["message"] for entry in entries], ["Status tick 0", "Status tick 2", "Dispense complete"])
+        self.assertEqual(entries[2]["pump_id"], 1)
+
+    def test_disabled_level_returns_before_sampling(self):
+        listener = setup_logging(logging.INFO, sampling={"status": 2})
+        log = DeviceLogger("[ESP32]")
+        try:
+            self.assertFalse(log.isEnabledFor(logging.DEBUG))
+            log.debug("Status tick", category="status")
+        finally:
+            listener.stop()
+        self.assertEqual(mock_logging._sampler.counters, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+"""mock_metrics: Prometheus hisztogram bucket-ek (le = kisebb vagy egyenlő)"""
+
+import unittest
+
+from mock_metrics import Histogram
+
+
+def bucket_values(histogram: Histogram) -> dict:
+    values = {}
+    for line in histogram.samples():
+        name, value = line.rsplit(" ", 1)
+        values[name] = float(value)
+    return values
+
+
+class HistogramBucketTest(unittest.TestCase):
+
+    def setUp(self):
+        self.histogram = Histogram("handler_seconds", "Handler duration", ("handler",), buckets=(1.0, 0.1, 0.5))
+
+    def test_value_on_a_bound_counts_in_that_bucket(self):
+        self.histogram.observe(0.5, ("dispense",))
+        values = bucket_values(self.histogram)
+        self.assertEqual(values['handler_seconds_bucket{handler="dispense",le="0.1"}'], 0)
+        self.assertEqual(values['handler_seconds_bucket{handler="dispense",le="0.5"}'], 1)
+
+    def test_buckets_are_cumulative_with_inf_last(self):
+        for value in (0.05, 0.1, 0.3, 0.9, 2.0):
+            self.histogram.observe(value, ("dispense",))
+        lines = self.histogram.samples()
+        self.assertEqual(lines[:4], [
+            'handler_seconds_bucket{handler="dispense",le="0.1"} 2',
+            'handler_seconds_bucket{handler="dispense",le="0.5"} 3',
+            'handler_seconds_bucket{handler="dispense",le="1"} 4',
+            'handler_seconds_bucket{handler="dispense",le="+Inf"} 5',
+        ])
+        values = bucket_values(self.histogram)
+        self.assertEqual(values['handler_seconds_count{handler="dispense"}'], 5)
+        self.assertAlmostEqual(values['handler_seconds_sum{handler="dispense"}'], 3.35)
+
+    def test_label_sets_are_separate_series(self):
+        self.histogram.observe(0.2, ("dispense",))
+        self.histogram.observe(5.0, ("flush",))
+        values = bucket_values(self.histogram)
+        self.assertEqual(values['handler_seconds_bucket{handler="dispense",le="0.5"}'], 1)
+        self.assertEqual(values['handler_seconds_bucket{handler="flush",le="1"}'], 0)
+        self.assertEqual(values['handler_seconds_bucket{handler="flush",le="+Inf"}'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
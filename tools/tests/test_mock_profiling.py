@@ -0,0 +1,115 @@
+"""mock_profiling: lépésenkénti cProfile a coroutine-okon, collapsed stack kimenet, vezérlés futás közben"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+
+from mock_harness import run_device
+from mock_profiling import MockProfiler
+
+
+def busy(n: int = 20000) -> int:
+    return sum(index * index for index in range(n))
+
+
+async def handler(steps: int) -> int:
+    total = 0
+    for _ in range(steps):
+        total += busy()
+        await asyncio.sleep(0)
+    return total
+
+
+async def failing():
+    await asyncio.sleep(0)
+    raise RuntimeError("pump jammed")
+
+
+class MockProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.directory, "profile")
+
+    def tearDown(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        shutil.rmtree(self.directory)
+
+    def test_paused_profiler_leaves_the_coroutine_alone(self):
+        profiler = MockProfiler(self.prefix, enabled=False)
+        coro = handler(1)
+        self.assertIs(profiler.wrap("dev", "dispense", coro), coro)
+        self.assertEqual(asyncio.run(coro), busy())
+        self.assertEqual(profiler.labels, {})
+
+    def test_each_step_of_the_coroutine_is_profiled(self):
+        profiler = MockProfiler(self.prefix)
+        self.assertEqual(asyncio.run(profiler.wrap("dev", "dispense", handler(3))), 3 * busy())
+        entry = profiler.labels["dispense"]
+        self.assertEqual((entry.invocations, entry.steps), (1, 4))
+        self.assertFalse(profiler.active)
+
+    def test_exceptions_pass_through(self):
+        profiler = MockProfiler(self.prefix)
+        with self.assertRaisesRegex(RuntimeError, "pump jammed"):
+            asyncio.run(profiler.wrap("dev", "dispense", failing()))
+        self.assertFalse(profiler.active)
+
+    def test_nested_call_is_collected_by_the_outer_profile(self):
+        profiler = MockProfiler(self.prefix)
+        self.assertEqual(profiler.call("dev", "outer", lambda: profiler.call("dev", "inner", busy)), busy())
+        self.assertEqual(list(profiler.labels), ["outer"])
+
+    def test_collapsed_stacks_and_summary(self):
+        profiler = MockProfiler(self.prefix)
+        asyncio.run(profiler.wrap("dev", "dispense", handler(3)))
+        profiler.write()
+        with open(f"{self.prefix}.collapsed", encoding="utf-8") as collapsed:
+            stacks = [line.rsplit(" ", 1) for line in collapsed.read().splitlines()]
+        self.assertTrue(stacks)
+        self.assertTrue(all(stack.startswith("dispense;") and int(micros) > 0 for stack, micros in stacks))
+        self.assertTrue(any("test_mock_profiling.py:busy:" in stack for stack, _ in stacks))
+        with open(f"{self.prefix}.txt", encoding="utf-8") as summary:
+            self.assertIn("dispense", summary.read())
+
+    def test_runtime_control(self):
+        profiler = MockProfiler(self.prefix, enabled=False)
+        profiler.handle_control({"enabled": True, "memory": True})
+        self.assertTrue(profiler.enabled and tracemalloc.is_tracing())
+        asyncio.run(profiler.wrap("dev", "dispense", handler(1)))
+        self.assertIn("dev", profiler.device_bytes)
+        profiler.handle_control({"memory": False, "dump": True})
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual(profiler.snapshots, 1)
+        self.assertTrue(os.path.exists(f"{self.prefix}.txt"))
+        profiler.handle_control({"reset": True})
+        self.assertEqual((profiler.labels, profiler.device_bytes, profiler.snapshots), ({}, {}, 0))
+
+
+class DeviceProfilingTest(unittest.TestCase):
+
+    def test_control_topic_switches_profiling_on(self):
+        profiler = MockProfiler(enabled=False)   # nothing is written without stop() or a dump
+
+        async def scenario(mock, backend):
+            backend.send("dispense/command", {"pump_id": 1, "amount_ml": 10, "command_id": "d1"})
+            await asyncio.sleep(1)
+            before = set(profiler.labels)
+            backend.send("mock/profile", {"enabled": True})
+            await asyncio.sleep(0.1)
+            backend.send("dispense/command", {"pump_id": 1, "amount_ml": 10, "command_id": "d2"})
+            await asyncio.sleep(1)
+            return before
+
+        mock, _, before = run_device(scenario, profiler=profiler)
+        self.assertTrue(mock.profile_control)
+        self.assertEqual(before, set())
+        self.assertEqual(profiler.labels["handle_dispense_command"].invocations, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
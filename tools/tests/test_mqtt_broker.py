@@ -0,0 +1,242 @@
+"""mqtt_broker: csomag keretezés, CONNECT / PUBLISH / SUBSCRIBE feldolgozás, topic illesztés"""
+
+import asyncio
+import unittest
+
+from mqtt_broker import (CONNACK, CONNACK_ACCEPTED, CONNACK_BAD_CREDENTIALS, CONNACK_BAD_PROTOCOL, CONNACK_IDENTIFIER_REJECTED,
+                         CONNECT, PUBACK, PUBLISH, PUBREC, PUBREL, SUBACK, SUBSCRIBE, UNSUBSCRIBE, MQTTBroker, ProtocolError, _encode_length, _encode_string,
+                         _read_string, _TcpConnection, topic_matches, valid_topic_filter)
+
+
+class FakeWriter:
+    """asyncio.StreamWriter helyett: a kiírt bájtok gyűjtése"""
+
+    transport = None
+
+    def __init__(self):
+        self.data = bytearray()
+        self.closed = False
+
+    def write(self, data: bytes):
+        self.data += data
+
+    def close(self):
+        self.closed = True
+
+
+def connect_body(client_id: str, clean: bool = True, keepalive: int = 60, level: int = 4, will=None, username=None, password=None) -> bytes:
+    flags = 0x02 if clean else 0
+    payload = _encode_string(client_id)
+    if will is not None:
+        topic, message, qos, retain = will
+        flags |= 0x04 | (qos << 3) | (0x20 if retain else 0)
+        payload += _encode_string(topic) + len(message).to_bytes(2, "big") + message
+    if username is not None:
+        flags |= 0x80
+        payload += _encode_string(username)
+    if password is not None:
+        flags |= 0x40
+        payload += _encode_string(password)
+    return _encode_string("MQTT") + bytes((level, flags)) + keepalive.to_bytes(2, "big") + payload
+
+
+def publish_body(topic: str, payload: bytes, packet_id: int = None) -> bytes:
+    return _encode_string(topic) + (packet_id.to_bytes(2, "big") if packet_id is not None else b"") + payload
+
+
+def read_packet(broker: MQTTBroker, data: bytes):
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await broker.read_packet(reader)
+    return asyncio.run(read())
+
+
+class FramingTest(unittest.TestCase):
+
+    def test_remaining_length_round_trip(self):
+        broker = MQTTBroker()
+        for length in (0, 1, 127, 128, 16383, 16384, 2097151, 2097152):
+            body = bytes(length)
+            packet_type, flags, decoded = read_packet(broker, bytes(((PUBLISH << 4) | 0x03,)) + _encode_length(length) + body)
+            self.assertEqual((packet_type, flags, len(decoded)), (PUBLISH, 0x03, length))
+
+    def test_remaining_length_encoding(self):
+        self.assertEqual(_encode_length(0), b"\x00")
+        self.assertEqual(_encode_length(321), b"\xc1\x02")
+        self.assertEqual(_encode_length(268435455), b"\xff\xff\xff\x7f")
+
+    def test_remaining_length_over_four_bytes_is_malformed(self):
+        with self.assertRaises(ProtocolError):
+            read_packet(MQTTBroker(), b"\x30\xff\xff\xff\xff\x01")
+
+    def test_truncated_packet(self):
+        with self.assertRaises(asyncio.IncompleteReadError):
+            read_packet(MQTTBroker(), b"\x30\x05ab")
+
+    def test_string_longer_than_the_packet(self):
+        self.assertEqual(_read_string(b"\x00\x03abcd", 0), ("abc", 5))
+        with self.assertRaises(ProtocolError):
+            _read_string(b"\x00\x09abc", 0)
+
+
+class ConnectTest(unittest.TestCase):
+
+    def connect(self, body: bytes, broker: MQTTBroker = None):
+        broker = broker or MQTTBroker()
+        writer = FakeWriter()
+        connection = _TcpConnection(broker, writer)
+        accepted = connection.handle_connect(body)
+        return broker, connection, writer, accepted
+
+    def test_accepted(self):
+        will = ("intellivend/availability", b"offline", 1, True)
+        broker, connection, writer, accepted = self.connect(connect_body("ESP32_MOCK_001", keepalive=30, will=will))
+        self.assertTrue(accepted)
+        self.assertEqual(bytes(writer.data), bytes((CONNACK << 4, 2, 0, CONNACK_ACCEPTED)))
+        self.assertEqual(connection.keepalive, 30)
+        self.assertEqual(connection.will, will)
+        self.assertIs(broker.sessions["ESP32_MOCK_001"].connection, connection)
+
+    def test_persistent_session_is_present_on_reconnect(self):
+        broker, connection, _, _ = self.connect(connect_body("ESP32_MOCK_001", clean=False))
+        connection.connection_lost()
+        _, _, writer, _ = self.connect(connect_body("ESP32_MOCK_001", clean=False), broker)
+        self.assertEqual(bytes(writer.data), bytes((CONNACK << 4, 2, 1, CONNACK_ACCEPTED)))
+
+    def test_unsupported_protocol_level(self):
+        _, _, writer, accepted = self.connect(connect_body("ESP32_MOCK_001", level=5))
+        self.assertFalse(accepted)
+        self.assertEqual(writer.data[3], CONNACK_BAD_PROTOCOL)
+        self.assertTrue(writer.closed)
+
+    def test_empty_client_id_needs_clean_session(self):
+        _, _, writer, accepted = self.connect(connect_body("", clean=False))
+        self.assertFalse(accepted)
+        self.assertEqual(writer.data[3], CONNACK_IDENTIFIER_REJECTED)
+
+    def test_credentials(self):
+        broker = MQTTBroker(username="intellivend", password="secret")
+        _, _, writer, accepted = self.connect(connect_body("ESP32_MOCK_001", username="intellivend", password="wrong"), broker)
+        self.assertFalse(accepted)
+        self.assertEqual(writer.data[3], CONNACK_BAD_CREDENTIALS)
+        _, _, _, accepted = self.connect(connect_body("ESP32_MOCK_001", username="intellivend", password="secret"), broker)
+        self.assertTrue(accepted)
+
+    def test_truncated_connect_is_a_protocol_error(self):
+        full = connect_body("ESP32_MOCK_001", will=("intellivend/availability", b"offline", 1, True))
+        for length in (0, 1, 6, 7, 9, 11, len(full) - 1):
+            with self.subTest(length=length), self.assertRaises(ProtocolError):
+                self.connect(full[:length])
+
+    def test_malformed_connect_closes_the_connection(self):
+        async def handle():
+            reader = asyncio.StreamReader()
+            reader.feed_data(bytes((CONNECT << 4, 3)) + b"\x00\x04M")
+            reader.feed_eof()
+            writer = FakeWriter()
+            await broker.handle_client(reader, writer)
+            return writer
+
+        broker = MQTTBroker()
+        writer = asyncio.run(handle())
+        self.assertTrue(writer.closed)
+        self.assertEqual(broker.connections, set())
+
+
+class PacketTest(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = MQTTBroker()
+        self.writer = FakeWriter()
+        self.connection = _TcpConnection(self.broker, self.writer)
+        self.connection.handle_connect(connect_body("backend"))
+        self.writer.data.clear()
+
+    def test_subscribe_grants_qos_and_rejects_bad_filters(self):
+        body = b"\x00\x0a" + _encode_string("intellivend/+/dispense/#") + b"\x01" + _encode_string("a/#/b") + b"\x00"
+        self.connection.handle_packet(SUBSCRIBE, 0x02, body)
+        self.assertEqual(bytes(self.writer.data), bytes((SUBACK << 4, 4, 0x00, 0x0a, 0x01, 0x80)))
+
+    def test_qos1_publish_is_acknowledged_and_routed(self):
+        self.connection.handle_packet(SUBSCRIBE, 0x02, b"\x00\x01" + _encode_string("intellivend/#") + b"\x01")
+        self.writer.data.clear()
+        self.connection.handle_packet(PUBLISH, 0x02, publish_body("intellivend/heartbeat", b"{}", packet_id=7))
+        # Routed to the subscriber (itself, with its own packet id) before the PUBACK
+        self.assertEqual(self.writer.data[0], (PUBLISH << 4) | 0x02)
+        self.assertIn(b"intellivend/heartbeat", bytes(self.writer.data))
+        self.assertEqual(bytes(self.writer.data[-4:]), bytes((PUBACK << 4, 2, 0, 7)))
+        self.assertEqual(len(self.broker.sessions["backend"].outbound), 1)
+
+    def test_qos2_retransmit_is_delivered_once(self):
+        body = publish_body("intellivend/emergency/stop", b"{}", packet_id=9)
+        self.connection.handle_packet(PUBLISH, 0x04, body)
+        self.connection.handle_packet(PUBLISH, 0x04 | 0x08, body)
+        self.assertEqual(self.broker.stats["messages_received"], 1)
+        self.assertEqual(bytes(self.writer.data), bytes((PUBREC << 4, 2, 0, 9)) * 2)
+
+    def test_truncated_bodies_are_protocol_errors(self):
+        packets = [
+            (PUBLISH, 0x02, _encode_string("intellivend/heartbeat")[:-1]),
+            (PUBLISH, 0x02, _encode_string("intellivend/heartbeat") + b"\x07"),
+            (PUBACK, 0, b"\x07"),
+            (PUBREC, 0, b""),
+            (PUBREL, 0x02, b""),
+            (SUBSCRIBE, 0x02, b"\x00"),
+            (SUBSCRIBE, 0x02, b"\x00\x01" + _encode_string("intellivend/#")),
+            (UNSUBSCRIBE, 0x02, b"\x00"),
+        ]
+        for packet_type, flags, body in packets:
+            with self.subTest(packet_type=packet_type, body=body), self.assertRaises(ProtocolError):
+                self.connection.handle_packet(packet_type, flags, body)
+
+    def test_subscriber_out_of_packet_ids_is_disconnected_not_the_publisher(self):
+        subscriber_writer = FakeWriter()
+        subscriber = _TcpConnection(self.broker, subscriber_writer)
+        subscriber.handle_connect(connect_body("slow"))
+        subscriber.handle_packet(SUBSCRIBE, 0x02, b"\x00\x01" + _encode_string("intellivend/#") + b"\x01")
+        session = self.broker.sessions["slow"]
+        session.outbound.update((packet_id, ("intellivend/heartbeat", b"{}", 1, False)) for packet_id in range(1, 65536))
+
+        self.connection.handle_packet(PUBLISH, 0x02, publish_body("intellivend/heartbeat", b"{}", packet_id=7))
+        self.assertEqual(bytes(self.writer.data), bytes((PUBACK << 4, 2, 0, 7)))
+        self.assertTrue(subscriber_writer.closed)
+        self.assertFalse(self.connection.closed)
+        self.assertEqual(self.broker.stats["messages_dropped"], 1)
+
+    def test_wildcard_in_publish_topic(self):
+        with self.assertRaises(ProtocolError):
+            self.connection.handle_packet(PUBLISH, 0, publish_body("intellivend/+/status", b"{}"))
+
+    def test_retained_message_is_sent_on_subscribe(self):
+        self.connection.handle_packet(PUBLISH, 0x01, publish_body("intellivend/availability", b"online"))
+        self.connection.handle_packet(SUBSCRIBE, 0x02, b"\x00\x02" + _encode_string("intellivend/availability") + b"\x00")
+        retained = bytes(self.writer.data[5:])
+        self.assertEqual(retained[0], (PUBLISH << 4) | 0x01)
+        self.assertTrue(retained.endswith(b"online"))
+
+
+class TopicMatchTest(unittest.TestCase):
+
+    def test_wildcards(self):
+        self.assertTrue(topic_matches("intellivend/+/status", "intellivend/ESP32_MOCK_001/status"))
+        self.assertFalse(topic_matches("intellivend/+/status", "intellivend/a/b/status"))
+        self.assertTrue(topic_matches("intellivend/#", "intellivend"))
+        self.assertTrue(topic_matches("intellivend/#", "intellivend/a/b"))
+        self.assertFalse(topic_matches("intellivend/status", "intellivend/status/extra"))
+
+    def test_system_topics_need_an_explicit_prefix(self):
+        self.assertFalse(topic_matches("#", "$SYS/broker/uptime"))
+        self.assertFalse(topic_matches("+/broker/uptime", "$SYS/broker/uptime"))
+        self.assertTrue(topic_matches("$SYS/#", "$SYS/broker/uptime"))
+
+    def test_valid_filters(self):
+        for topic_filter in ("a", "a/+/c", "a/#", "#", "+"):
+            self.assertTrue(valid_topic_filter(topic_filter), topic_filter)
+        for topic_filter in ("", "a/#/c", "a/b#", "a/+b"):
+            self.assertFalse(valid_topic_filter(topic_filter), topic_filter)
+
+
+if __name__ == "__main__":
+    unittest.main()
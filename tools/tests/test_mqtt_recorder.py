@@ -0,0 +1,102 @@
+"""mqtt_recorder: bináris napló írás / olvasás, csonka rekord, visszajátszás egy beágyazott brokerre"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from mqtt_broker import LoopbackClient, MQTTBroker
+from mqtt_recorder import FILE_HEADER, INBOUND, OUTBOUND, TrafficRecorder, TrafficReplayer, read_records, summarize
+from sim_clock import SimClock
+
+
+class RecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "session.ivrec")
+        self.clock = SimClock(virtual=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record_session(self):
+        recorder = TrafficRecorder(self.path, self.clock)
+        recorder.record(INBOUND, "intellivend/dispense/command", '{"pump_id": 1}', qos=1)
+        self.clock.advance(1.5)
+        recorder.record(OUTBOUND, "intellivend/availability", b"online", qos=1, retain=True)
+        self.clock.advance(0.5)
+        recorder.record(OUTBOUND, "intellivend/heartbeat", b"{}")
+        recorder.close()
+        return recorder
+
+    def test_records_round_trip(self):
+        recorder = self.record_session()
+        records = list(read_records(self.path))
+        self.assertEqual(recorder.records, 3)
+        self.assertEqual(os.path.getsize(self.path), FILE_HEADER.size + recorder.bytes_written)
+        self.assertEqual([(r.timestamp, r.direction, r.topic, r.payload, r.qos, r.retain) for r in records], [
+            (0.0, INBOUND, "intellivend/dispense/command", b'{"pump_id": 1}', 1, False),
+            (1.5, OUTBOUND, "intellivend/availability", b"online", 1, True),
+            (2.0, OUTBOUND, "intellivend/heartbeat", b"{}", 0, False),
+        ])
+
+    def test_truncated_last_record_is_skipped(self):
+        self.record_session()
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+        self.assertEqual(len(list(read_records(self.path))), 2)
+
+    def test_appended_runs_are_separate_sessions(self):
+        self.record_session()
+        self.clock = SimClock(virtual=True)
+        self.record_session()
+        summary = summarize(self.path)
+        self.assertEqual((summary["records"], summary["sessions"], summary["duration_s"]), (6, 2, 4.0))
+        self.assertEqual(summary["topics"]["intellivend/heartbeat"], 2)
+
+    def test_foreign_file_is_rejected(self):
+        with open(self.path, "wb") as f:
+            f.write(b"NOTIVREC")
+        with self.assertRaises(ValueError):
+            list(read_records(self.path))
+
+    def test_replay_publishes_the_selected_direction(self):
+        self.record_session()
+        received = []
+        loop = asyncio.new_event_loop()
+        broker = MQTTBroker(port=0)
+
+        async def serve():
+            await broker.start()
+            subscriber = LoopbackClient(broker, client_id="subscriber")
+            subscriber.on_message = lambda client, userdata, msg: received.append((msg.topic, msg.payload, msg.retain))
+            subscriber.connect()
+            subscriber.subscribe("#", 1)
+
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        asyncio.run_coroutine_threadsafe(serve(), loop).result(5)
+        try:
+            replayer = TrafficReplayer(port=broker.port, speed=10.0)
+            result = replayer.replay(self.path)
+            deadline = time.monotonic() + 5
+            while len(received) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            asyncio.run_coroutine_threadsafe(broker.stop(), loop).result(5)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(5)
+            loop.close()
+
+        self.assertEqual((result["published"], result["skipped"]), (2, 1))
+        # Original spacing of 0.5s at 10x
+        self.assertGreaterEqual(result["elapsed_s"], 0.05)
+        self.assertEqual(received, [("intellivend/availability", b"online", False), ("intellivend/heartbeat", b"{}", False)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+"""order_queue: rendelés ellenőrzés, sor pozíciók és ETA, rendelések egymás után az eszközön"""
+
+import asyncio
+import unittest
+
+from esp32_mock import estimate_recipe_ms
+from mock_harness import run_device
+from order_queue import (CANCELLED, MAX_ORDER_ML, POURING, QUEUED, Order, OrderQueue, order_ingredients, validate_ingredients,
+                         validate_order)
+from sim_clock import SimClock
+
+
+def order(clock: SimClock, command_id: str, estimated_ms: int, pump_id: int = 1) -> Order:
+    payload = {"pump_id": pump_id, "amount_ml": estimated_ms / 50.0, "command_id": command_id}
+    return Order(payload, order_ingredients(payload), estimated_ms, clock.monotonic())
+
+
+class ValidationTest(unittest.TestCase):
+
+    def test_both_payload_formats(self):
+        self.assertEqual(order_ingredients({"pump_id": 3, "amount_ml": 40}), [(3, 40)])
+        recipe = {"pump_id": 0, "amount_ml": [{"pump_number": 2, "quantity_ml": 20}, {"quantity_ml": 10}, "bad"]}
+        self.assertEqual(order_ingredients(recipe), [(2, 20), (1, 10), (None, None)])
+
+    def test_pumps_and_quantities(self):
+        self.assertIsNone(validate_ingredients([(1, 20), (8, 0.5)]))
+        self.assertIn("no ingredients", validate_ingredients([]))
+        for ingredients in ([(0, 20)], [(9, 20)], [(True, 20)], [("1", 20)], [(None, None)]):
+            self.assertIn("Invalid pump number", validate_ingredients(ingredients))
+        for ingredients in ([(1, 0)], [(1, -5)], [(1, "20")], [(1, True)]):
+            self.assertIn("Invalid quantity", validate_ingredients(ingredients))
+
+    def test_order_volume_cap(self):
+        self.assertIsNone(validate_ingredients([(1, MAX_ORDER_ML), (2, 1)]))
+        self.assertIn("exceeds", validate_order([(1, MAX_ORDER_ML), (2, 1)]))
+        self.assertIsNone(validate_order([(1, MAX_ORDER_ML)]))
+        self.assertIn("Invalid pump number", validate_order([(9, MAX_ORDER_ML * 2)]))
+
+
+class OrderQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = SimClock(virtual=True)
+        self.queue = OrderQueue(2, self.clock)
+
+    def test_depth_limits_waiting_orders(self):
+        self.assertEqual(self.queue.submit(order(self.clock, "a", 1000)), 1)
+        self.assertEqual(self.queue.submit(order(self.clock, "b", 1000)), 2)
+        self.assertIsNone(self.queue.submit(order(self.clock, "c", 1000)))
+        self.assertEqual(len(self.queue), 2)
+
+    def test_positions_and_eta(self):
+        async def scenario():
+            for command_id, estimated_ms in (("a", 4000), ("b", 2000), ("c", 1000)):
+                self.queue.depth = 3
+                self.queue.submit(order(self.clock, command_id, estimated_ms))
+            current = await self.queue.next()
+            self.clock.advance(1.0)
+            return current
+
+        current = asyncio.run(scenario())
+        self.assertEqual(current.command_id, "a")
+        self.assertEqual(current.started_at, 0.0)
+        rows = [(row.command_id, position, eta_ms) for row, position, eta_ms in self.queue.positions()]
+        self.assertEqual(rows, [("a", 0, 3000), ("b", 1, 3000), ("c", 2, 5000)])
+        self.assertEqual(self.queue.head().command_id, "b")
+
+    def test_clear_drops_waiting_orders_only(self):
+        async def scenario():
+            self.queue.submit(order(self.clock, "a", 1000))
+            self.queue.submit(order(self.clock, "b", 1000))
+            await self.queue.next()
+
+        asyncio.run(scenario())
+        self.assertEqual([dropped.command_id for dropped in self.queue.clear()], ["b"])
+        self.assertEqual(self.queue.current.command_id, "a")
+        self.queue.finish()
+        self.assertEqual(self.queue.positions(), [])
+
+    def test_estimate_matches_the_dispense_plan(self):
+        self.assertEqual(estimate_recipe_ms({"pump_id": 1, "amount_ml": 40}), 2000)
+        self.assertEqual(estimate_recipe_ms({"pump_id": 1, "amount_ml": 40, "duration_ms": 1234}), 1234)
+        recipe = {"amount_ml": [{"pump_number": 1, "quantity_ml": 20, "order": 1}, {"pump_number": 2, "quantity_ml": 20, "order": 2}]}
+        self.assertGreater(estimate_recipe_ms(recipe), estimate_recipe_ms(recipe, concurrent=True))
+
+
+class DeviceOrderQueueTest(unittest.TestCase):
+
+    def test_orders_pour_one_after_another(self):
+        async def scenario(mock, backend):
+            for index, pump_id in enumerate((1, 1, 2, 3)):
+                backend.send("dispense/command", {"pump_id": pump_id, "amount_ml": 20, "command_id": f"o{index}"})
+                await asyncio.sleep(0.05)
+            await asyncio.sleep(10)
+
+        _, backend, _ = run_device(scenario, workers=4, order_queue=2)
+        self.assertEqual([error["command_id"] for error in backend.errors("BUSY")], ["o3"])
+        completes = backend.received("dispense/complete")
+        self.assertEqual([payload["command_id"] for _, payload in completes], ["o0", "o1", "o2"])
+        # 1s each, started back to back
+        finished = [at for at, _ in completes]
+        for previous, current in zip(finished, finished[1:]):
+            self.assertAlmostEqual(current - previous, 1.0, delta=0.6)
+        updates = [payload for _, payload in backend.received("dispense/queue")]
+        self.assertIn((QUEUED, 2), [(update["state"], update["position"]) for update in updates if update["command_id"] == "o2"])
+        self.assertIn(POURING, [update["state"] for update in updates if update["command_id"] == "o2"])
+
+    def test_emergency_stop_cancels_waiting_orders(self):
+        async def scenario(mock, backend):
+            for index in range(3):
+                backend.send("dispense/command", {"pump_id": 1, "amount_ml": 40, "command_id": f"o{index}"})
+            await asyncio.sleep(0.5)
+            backend.send("emergency/stop", {"reason": "test"}, qos=2)
+            await asyncio.sleep(5)
+
+        _, backend, _ = run_device(scenario, order_queue=4)
+        cancelled = [payload["command_id"] for _, payload in backend.received("dispense/queue") if payload["state"] == CANCELLED]
+        self.assertEqual(cancelled, ["o1", "o2"])
+        self.assertIn("o0", [error.get("command_id") for error in backend.errors("EMERGENCY_STOP")])
+        self.assertEqual(backend.received("dispense/complete"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+"""sim_clock: gyorsított és virtuális idő, időbélyegek, futási idő korlát"""
+
+import asyncio
+import time
+import unittest
+
+from sim_clock import SimClock
+
+
+class ScaledClockTest(unittest.TestCase):
+
+    def test_time_scale_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            SimClock(time_scale=0)
+
+    def test_accelerated_monotonic(self):
+        clock = SimClock(time_scale=100.0)
+        started = time.monotonic()
+        time.sleep(0.05)
+        elapsed_real = time.monotonic() - started
+        self.assertGreaterEqual(clock.monotonic(), 100.0 * 0.05)
+        self.assertLessEqual(clock.monotonic(), 100.0 * (elapsed_real + 0.05))
+        self.assertEqual(clock.to_real(50.0), 0.5)
+
+    def test_asyncio_sleep_runs_in_simulated_seconds(self):
+        clock = SimClock(time_scale=100.0)
+
+        async def main():
+            started = time.monotonic()
+            await asyncio.sleep(10.0)   # 0.1 real seconds
+            return time.monotonic() - started
+
+        real = clock.run(main())
+        self.assertGreaterEqual(real, 0.09)
+        self.assertLess(real, 1.0)
+        self.assertGreaterEqual(clock.monotonic(), 10.0)
+
+
+class VirtualClockTest(unittest.TestCase):
+
+    def test_jumps_to_the_next_timer_without_waiting(self):
+        clock = SimClock(virtual=True)
+        fired = []
+
+        async def sleeper(name: str, delay: float):
+            await asyncio.sleep(delay)
+            fired.append((name, clock.monotonic()))
+
+        async def main():
+            await asyncio.gather(sleeper("day", 86400.0), sleeper("hour", 3600.0), sleeper("minute", 60.0))
+
+        started = time.monotonic()
+        clock.run(main())
+        self.assertLess(time.monotonic() - started, 2.0)
+        self.assertEqual(fired, [("minute", 60.0), ("hour", 3600.0), ("day", 86400.0)])
+
+    def test_duration_limit_is_simulated(self):
+        clock = SimClock(virtual=True)
+
+        async def forever():
+            while True:
+                await asyncio.sleep(60.0)
+
+        self.assertIsNone(clock.run(forever(), duration=7200.0))
+        self.assertEqual(clock.monotonic(), 7200.0)
+
+    def test_timestamps_follow_the_simulated_time(self):
+        clock = SimClock(virtual=True, start_time=1735754400.0)   # 2025-01-01T18:00:00Z
+        self.assertEqual(clock.utc_timestamp(), "2025-01-01T18:00:00Z")
+        clock.advance(90.5)
+        self.assertEqual(clock.time(), 1735754490.5)
+        self.assertEqual(clock.utc_timestamp(), "2025-01-01T18:01:30.500000Z")
+        clock.advance(-10.0)   # time never goes backwards
+        self.assertEqual(clock.monotonic(), 90.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+"""soak: időtartam formátum, steady alapérték és a drift ellenőrzés (RSS, szálak, üzenet ráta)"""
+
+import random
+import unittest
+
+from sim_clock import SimClock
+from soak import MIN_RATE_MESSAGES, WARMUP_SAMPLES, WINDOW_SAMPLES, SoakTest, parse_duration
+
+INTERVAL = 60.0
+
+
+def sample(messages: int, steady: bool = True, rss_kb: int = 50000, threads: int = 4, fds: int = 20, **extra) -> dict:
+    result = {
+        "elapsed_s": 0.0, "rss_kb": rss_kb, "threads": threads, "fds": fds, "tasks": 10,
+        "message_rate": messages / INTERVAL, "messages": messages, "interval_s": INTERVAL, "steady": steady,
+        "pumps_active": 0, "operations": 0, "connected": 1, "inconsistent_devices": [], "dead_heartbeats": [],
+    }
+    result.update(extra)
+    return result
+
+
+class ParseDurationTest(unittest.TestCase):
+
+    def test_units(self):
+        self.assertEqual(parse_duration("3600"), 3600)
+        self.assertEqual(parse_duration("90s"), 90)
+        self.assertEqual(parse_duration("30m"), 1800)
+        self.assertEqual(parse_duration("1.5h"), 5400)
+        self.assertEqual(parse_duration("7d"), 7 * 86400)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            parse_duration("24 hours")
+
+
+class DriftCheckTest(unittest.TestCase):
+
+    def setUp(self):
+        self.soak = SoakTest([], SimClock(virtual=True), metrics=None, client=None, broker="127.0.0.1", port=1883,
+                             duration=86400, interval=INTERVAL)
+        self.random = random.Random(1)
+
+    def feed(self, *samples: dict):
+        for item in samples:
+            self.soak.samples.append(item)
+            self.soak.check(item)
+
+    def poisson(self, mean: float) -> int:
+        # Normal approximation of a Poisson count (mean is large in these tests)
+        return max(0, round(self.random.gauss(mean, mean ** 0.5)))
+
+    def test_baseline_waits_for_steady_traffic(self):
+        self.feed(sample(40, steady=False), sample(90, steady=False))
+        self.assertIsNone(self.soak.baseline)
+        self.feed(*(sample(300) for _ in range(WARMUP_SAMPLES)))
+        self.assertEqual(self.soak.baseline["message_rate"], 5.0)
+        self.assertEqual(self.soak.baseline["messages"], 300 * WARMUP_SAMPLES)
+
+    def test_unsteady_sample_restarts_the_warmup(self):
+        self.feed(*(sample(300) for _ in range(WARMUP_SAMPLES - 1)))
+        self.feed(sample(100, steady=False))
+        self.feed(*(sample(600) for _ in range(WARMUP_SAMPLES - 1)))
+        self.assertIsNone(self.soak.baseline)
+        self.feed(sample(600))
+        self.assertEqual(self.soak.baseline["message_rate"], 10.0)
+
+    def test_count_noise_is_not_drift(self):
+        self.feed(*(sample(self.poisson(120)) for _ in range(500)))
+        self.assertIsNotNone(self.soak.baseline)
+        self.assertEqual(self.soak.failures, [])
+        self.assertEqual(self.soak.rate_checks_skipped, 0)
+
+    def test_bursty_traffic_widens_the_limit(self):
+        # Messages come in bursts of 10 (one command -> progress + completion): dispersion ~10
+        self.feed(*(sample(10 * self.poisson(30)) for _ in range(500)))
+        self.assertGreater(self.soak.baseline["dispersion"], 1.0)
+        self.assertEqual(self.soak.failures, [])
+
+    def test_rate_drop_fails(self):
+        self.feed(*(sample(self.poisson(300)) for _ in range(WARMUP_SAMPLES)))
+        self.feed(*(sample(self.poisson(120)) for _ in range(WINDOW_SAMPLES)))
+        self.assertTrue(any("Message rate drifted" in failure for failure in self.soak.failures))
+
+    def test_too_few_messages_skip_the_rate_check(self):
+        expected_per_sample = MIN_RATE_MESSAGES / WINDOW_SAMPLES / 4
+        self.feed(*(sample(round(expected_per_sample)) for _ in range(WARMUP_SAMPLES)))
+        self.feed(*(sample(0) for _ in range(WINDOW_SAMPLES)))
+        self.assertEqual(self.soak.failures, [])
+        self.assertEqual(self.soak.rate_checks_skipped, WINDOW_SAMPLES)
+
+    def test_rss_growth_is_judged_on_the_window_median(self):
+        self.feed(*(sample(300) for _ in range(WARMUP_SAMPLES)))
+        self.feed(sample(300, rss_kb=80000))   # a single spike
+        self.assertEqual(self.soak.failures, [])
+        self.feed(*(sample(300, rss_kb=80000) for _ in range(WINDOW_SAMPLES)))
+        self.assertTrue(any(failure.startswith("RSS grew") for failure in self.soak.failures))
+
+    def test_thread_leak_fails(self):
+        self.feed(*(sample(300) for _ in range(WARMUP_SAMPLES)))
+        self.feed(sample(300, threads=10))
+        self.assertTrue(any(failure.startswith("Thread count grew") for failure in self.soak.failures))
+
+    def test_consistency_fails_during_warmup(self):
+        self.feed(sample(0, steady=False, inconsistent_devices=["ESP32_MOCK_001"], dead_heartbeats=["ESP32_MOCK_002"]))
+        self.assertIsNone(self.soak.baseline)
+        self.assertEqual(len(self.soak.failures), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
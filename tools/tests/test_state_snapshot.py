@@ -0,0 +1,188 @@
+"""state_snapshot: A/B slot mentés és visszaállítás, félbeszakadt írás, túl sok futó művelet, sérült fájl"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+from sim_clock import SimClock
+from state_snapshot import OPERATION_SIZE, RESET_PANIC, RESET_SW, RESUME, SLOT_HEADER, SnapshotStore
+
+
+class FakeDevice:
+    """A SnapshotStore által használt ESP32Mock felület"""
+
+    def __init__(self, client_id: str, max_operations: int = 2, state: dict = None):
+        self.client_id = client_id
+        self.physics_base = 0
+        self.limit = max_operations
+        self.state = state
+        self.restored = None
+        self.interrupted_operations = []
+
+    def max_operations(self) -> int:
+        return self.limit
+
+    def checkpoint_state(self) -> dict:
+        return self.state
+
+    def restore_snapshot(self, state: dict, reason: str, policy: str):
+        self.restored = (state, reason, policy)
+        self.interrupted_operations = state["operations"]
+
+
+def device_state(uptime_s: float, operations: list = ()) -> dict:
+    return {"uptime_s": uptime_s, "boot_count": 3, "calibration_factors": {1: 1.05, 8: 0.97}, "operations": list(operations)}
+
+
+class SnapshotStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "fleet.ivsnap")
+        self.clock = SimClock(virtual=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def store(self, devices: list) -> SnapshotStore:
+        return SnapshotStore(self.path, devices, self.clock, policy=RESUME)
+
+    def crash(self, store: SnapshotStore):
+        """Leállás utolsó mentés nélkül (mint egy kill -9)"""
+        store.map.close()
+        store.file.close()
+
+    def restore(self, *client_ids: str, max_operations: int = 2) -> list:
+        devices = [FakeDevice(client_id, max_operations) for client_id in client_ids]
+        self.store(devices).restore()
+        return devices
+
+    def test_round_trip_after_clean_shutdown(self):
+        operation = {"kind": "dispense", "payload": {"pump_id": 1, "amount_ml": 50, "command_id": "c1"}, "poured": {"1": 20.0}}
+        devices = [FakeDevice("ESP32_MOCK_001", state=device_state(120.5, [operation])), FakeDevice("ESP32_MOCK_002", state=device_state(7.0))]
+        store = self.store(devices)
+        store.open()
+        asyncio.run(store.stop())   # final, clean checkpoint
+
+        first, second = self.restore("ESP32_MOCK_001", "ESP32_MOCK_002")
+        state, reason, policy = first.restored
+        self.assertEqual((reason, policy), (RESET_SW, RESUME))
+        self.assertEqual((state["uptime_s"], state["boot_count"]), (120.5, 3))
+        self.assertEqual(state["calibration_factors"], {1: 1.05, 8: 0.97})
+        self.assertEqual(state["operations"], [operation])
+        self.assertEqual(second.restored[0]["operations"], [])
+
+    def test_checkpoint_without_shutdown_restores_as_panic(self):
+        store = self.store([FakeDevice("ESP32_MOCK_001", state=device_state(10.0))])
+        store.open()
+        store.checkpoint()
+        self.crash(store)
+        device, = self.restore("ESP32_MOCK_001")
+        self.assertEqual(device.restored[1], RESET_PANIC)
+
+    def test_newest_complete_slot_wins(self):
+        device = FakeDevice("ESP32_MOCK_001", state=device_state(10.0))
+        store = self.store([device])
+        store.open()
+        store.checkpoint()
+        device.state = device_state(15.0)
+        store.checkpoint()
+        self.crash(store)
+        restored, = self.restore("ESP32_MOCK_001")
+        self.assertEqual(restored.restored[0]["uptime_s"], 15.0)
+
+    def test_torn_write_falls_back_to_the_other_slot(self):
+        device = FakeDevice("ESP32_MOCK_001", state=device_state(10.0))
+        store = self.store([device])
+        store.open()
+        store.checkpoint()
+        device.state = device_state(15.0)
+        store.checkpoint()
+        # Killed while rewriting the newer slot: its sequence is odd again
+        newest = store.slot_offset(1 - store.slot)
+        sequence = SLOT_HEADER.unpack_from(store.map, newest)[0]
+        SLOT_HEADER.pack_into(store.map, newest, sequence + 1, 0, 0.0)
+        self.crash(store)
+        restored, = self.restore("ESP32_MOCK_001")
+        self.assertEqual(restored.restored[0]["uptime_s"], 10.0)
+
+    def test_unknown_devices_are_skipped(self):
+        store = self.store([FakeDevice("ESP32_MOCK_001", state=device_state(10.0))])
+        store.open()
+        store.checkpoint()
+        self.crash(store)
+        known, unknown = self.restore("ESP32_MOCK_001", "ESP32_MOCK_999")
+        self.assertIsNotNone(known.restored)
+        self.assertIsNone(unknown.restored)
+
+    def test_record_size_comes_from_the_file(self):
+        operation = {"kind": "flush", "payload": {"pump_id": -1, "duration_ms": 1000}, "poured": {}}
+        store = self.store([FakeDevice("ESP32_MOCK_001", max_operations=8, state=device_state(10.0, [operation]))])
+        store.open()
+        store.checkpoint()
+        self.crash(store)
+        device, = self.restore("ESP32_MOCK_001", max_operations=1)
+        self.assertEqual(device.restored[0]["operations"], [operation])
+
+    def test_operations_that_do_not_fit_keep_the_previous_checkpoint(self):
+        device = FakeDevice("ESP32_MOCK_001", max_operations=1, state=device_state(10.0))
+        store = self.store([device])
+        store.open()
+        store.checkpoint()
+        big = {"kind": "dispense", "payload": {"pump_id": 1, "amount_ml": 20, "recipe_name": "x" * OPERATION_SIZE}, "poured": {}}
+        device.state = device_state(15.0, [big])
+        store.checkpoint()
+        store.checkpoint()
+        self.assertEqual((store.checkpoints, store.failed_checkpoints), (1, 2))
+        self.crash(store)
+        restored, = self.restore("ESP32_MOCK_001")
+        self.assertEqual(restored.restored[0]["uptime_s"], 10.0)
+
+    def test_restart_after_a_skipped_checkpoint_keeps_the_parity(self):
+        device = FakeDevice("ESP32_MOCK_001", max_operations=1, state=device_state(10.0))
+        store = self.store([device])
+        store.open()
+        store.checkpoint()
+        big = {"kind": "dispense", "payload": {"pump_id": 1, "amount_ml": 20, "recipe_name": "x" * OPERATION_SIZE}, "poured": {}}
+        device.state = device_state(15.0, [big])
+        store.checkpoint()
+        self.crash(store)
+
+        # The restart writes into the skipped (odd) slot, not over the only complete checkpoint
+        device = FakeDevice("ESP32_MOCK_001", max_operations=1, state=device_state(20.0))
+        store = self.store([device])
+        store.open()
+        self.assertEqual(store.sequence % 2, 0)
+        store.checkpoint()
+        self.crash(store)
+        restored, = self.restore("ESP32_MOCK_001")
+        self.assertEqual(restored.restored[0]["uptime_s"], 20.0)
+
+    def test_truncated_file_restores_nothing(self):
+        with open(self.path, "wb") as snapshot:
+            snapshot.write(b"IVS")
+        device = FakeDevice("ESP32_MOCK_001")
+        self.assertEqual(self.store([device]).restore(), 0)
+        self.assertIsNone(device.restored)
+
+    def test_corrupted_operations_restore_nothing(self):
+        operation = {"kind": "dispense", "payload": {"pump_id": 1, "amount_ml": 50}, "poured": {}}
+        store = self.store([FakeDevice("ESP32_MOCK_001", state=device_state(10.0, [operation]))])
+        store.open()
+        store.checkpoint()
+        store.map[store.map.find(b'{"kind"')] = ord("!")
+        self.crash(store)
+        device = FakeDevice("ESP32_MOCK_001")
+        self.assertEqual(self.store([device]).restore(), 0)
+        self.assertIsNone(device.restored)
+
+    def test_missing_file_restores_nothing(self):
+        device = FakeDevice("ESP32_MOCK_001")
+        self.assertEqual(self.store([device]).restore(), 0)
+        self.assertIsNone(device.restored)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+"""telemetry: kötegelt status frame kódolás / dekódolás, változás alapú küldés"""
+
+import json
+import struct
+import unittest
+
+from sim_clock import SimClock
+from telemetry import (FRAME_ENTRY, FRAME_HEADER, STATE_CODES, StatusPublisher, decode_frame, encode_frame, mqtt_publish_size,
+                       telemetry_available)
+
+ENTRIES = [
+    (1, STATE_CODES["dispensing"], 12.5, 40.0, 20.0, 625),
+    (8, STATE_CODES["flushing"], 0.0, 0.0, 0.0, 1500),
+]
+
+
+class FrameCodecTest(unittest.TestCase):
+
+    def assert_round_trip(self, mode: str):
+        frame = decode_frame(mode, encode_frame(mode, 1700000000123, ENTRIES))
+        self.assertEqual(frame["ts"], 1700000000123)
+        self.assertEqual([list(entry) for entry in ENTRIES], frame["pumps"])
+
+    def test_json_round_trip(self):
+        self.assert_round_trip("json")
+
+    def test_struct_round_trip(self):
+        self.assert_round_trip("struct")
+
+    @unittest.skipUnless(telemetry_available("msgpack"), "msgpack is not installed")
+    def test_msgpack_round_trip(self):
+        self.assert_round_trip("msgpack")
+
+    def test_struct_frame_size(self):
+        self.assertEqual(len(encode_frame("struct", 0, ENTRIES)), FRAME_HEADER.size + 2 * FRAME_ENTRY.size)
+
+    def test_json_values_are_rounded(self):
+        frame = decode_frame("json", encode_frame("json", 0, [(2, 1, 1.23456, 40.0, 19.999, 10)]))
+        self.assertEqual(frame["pumps"], [[2, 1, 1.23, 40.0, 20.0, 10]])
+
+    def test_struct_version_is_checked(self):
+        payload = bytearray(encode_frame("struct", 0, ENTRIES))
+        payload[0] = 99
+        with self.assertRaises(ValueError):
+            decode_frame("struct", bytes(payload))
+
+    def test_truncated_struct_frame(self):
+        with self.assertRaises(struct.error):
+            decode_frame("struct", encode_frame("struct", 0, ENTRIES)[:-1])
+
+    def test_publish_size(self):
+        # Fixed header + 2 byte length + topic + payload; QoS 1 adds the packet id
+        self.assertEqual(mqtt_publish_size("a/b", 10), 1 + 1 + 2 + 3 + 10)
+        self.assertEqual(mqtt_publish_size("a/b", 10, qos=1), 1 + 1 + 2 + 3 + 2 + 10)
+        self.assertEqual(mqtt_publish_size("a", 200), 1 + 2 + 2 + 1 + 200)
+
+
+class StatusPublisherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = SimClock(virtual=True, start_time=1700000000.0)
+        self.published = []
+
+    def publisher(self, mode: str, **options) -> StatusPublisher:
+        return StatusPublisher(lambda name, payload: self.published.append((name, payload)), lambda name: f"intellivend/{name}",
+                               self.clock, mode, **options)
+
+    def test_legacy_publishes_every_update(self):
+        publisher = self.publisher("legacy")
+        publisher.update(3, "dispensing", 10.004, 40.0, 20.0, 500)
+        publisher.update(3, "dispensing", 10.004, 40.0, 20.0, 500)
+        self.assertEqual(len(self.published), 2)
+        name, payload = self.published[0]
+        status = json.loads(payload)
+        self.assertEqual(name, "status")
+        self.assertEqual((status["pump_id"], status["state"], status["progress_ml"]), (3, "dispensing", 10.0))
+
+    def test_batched_frame_decodes_to_the_updates(self):
+        publisher = self.publisher("struct")
+        publisher.update(1, "dispensing", 5.0, 40.0, 20.0, 250)
+        publisher.update(2, "calibrating", 1.0, 50.0, 20.0, 50)
+        publisher.flush()
+        [(name, payload)] = self.published
+        frame = decode_frame("struct", payload)
+        self.assertEqual(name, "status/batch")
+        self.assertEqual(frame["ts"], 1700000000000)
+        self.assertEqual([entry[:2] for entry in frame["pumps"]], [[1, STATE_CODES["dispensing"]], [2, STATE_CODES["calibrating"]]])
+
+    def test_updates_are_coalesced_and_unchanged_state_suppressed(self):
+        publisher = self.publisher("json", min_delta_ml=1.0)
+        publisher.update(1, "dispensing", 5.0, 40.0, 20.0, 250)
+        publisher.update(1, "dispensing", 6.0, 40.0, 20.0, 300)
+        publisher.flush()
+        self.assertEqual(decode_frame("json", self.published[0][1])["pumps"][0][2], 6.0)
+        publisher.update(1, "dispensing", 6.5, 40.0, 20.0, 325)
+        publisher.flush()
+        self.assertEqual(len(self.published), 1)
+        self.assertEqual(publisher.suppressed, 2)
+
+    def test_unchanged_state_is_resent_after_max_silence(self):
+        publisher = self.publisher("json", max_silence=5.0)
+        publisher.update(1, "idle", 0.0, 0.0, 0.0, 0)
+        publisher.flush()
+        self.clock.advance(5.0)
+        publisher.update(1, "idle", 0.0, 0.0, 0.0, 0)
+        publisher.flush()
+        self.assertEqual(len(self.published), 2)
+
+    def test_bytes_are_shared_between_the_pumps_of_a_frame(self):
+        publisher = self.publisher("struct")
+        publisher.update(1, "dispensing", 5.0, 40.0, 20.0, 250)
+        publisher.update(2, "dispensing", 5.0, 40.0, 20.0, 250)
+        publisher.flush()
+        self.assertAlmostEqual(publisher.pump_bytes([1]), publisher.bytes_total / 2)
+        self.assertAlmostEqual(publisher.pump_bytes([1, 2, 2]), publisher.bytes_total)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            self.publisher("xml")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""trace_workload: SQL INSERT és CSV / TSV export olvasás, rendelések összefésülése, összenyomott időközök"""
+
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+from trace_workload import TraceWorkload, iter_rows, parse_sql_values, parse_timestamp
+
+DUMP = """-- MySQL dump
+CREATE TABLE `dispensing_log` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `recipe_name` varchar(100) DEFAULT NULL,
+  `started_at` timestamp NULL DEFAULT NULL,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB;
+INSERT INTO `dispensing_log` VALUES (1,'Mojito','2025-03-07 21:00:00'),(2,'Don''t \\\\ panic','2025-03-07 21:00:30'),
+(3,'Empty','2025-03-07 21:01:00'),(4,'Cuba Libre','2025-03-07 23:00:00');
+INSERT INTO `dispensing_details` (`id`,`log_id`,`pump_id`,`ingredient_name`,`quantity_ml`,`order_number`) VALUES
+(1,1,11,'Rum',40.00,2),(2,1,12,'Lime',20.00,1),
+(3,2,12,NULL,10.50,NULL),
+(4,4,11,'Rum',50.00,1);
+INSERT INTO `pumps` (`id`,`pump_number`) VALUES (11,1),(12,2);
+"""
+
+
+class ParseTest(unittest.TestCase):
+
+    def test_sql_values(self):
+        rows = list(parse_sql_values("(1,'a,b',NULL, 2.5 ),(2,'it''s\\n',-1);"))
+        self.assertEqual(rows, [["1", "a,b", None, "2.5"], ["2", "it's\n", "-1"]])
+
+    def test_timestamps(self):
+        expected = datetime(2025, 3, 7, 21, 4, 11)
+        for value in ("2025-03-07 21:04:11", "2025-03-07T21:04:11Z", " 2025-03-07T21:04:11 "):
+            self.assertEqual(parse_timestamp(value), expected)
+        self.assertEqual(parse_timestamp("2025-03-07 21:04:11.250").microsecond, 250000)
+
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name: str, text: str) -> str:
+        path = os.path.join(self.directory, name)
+        with (gzip.open(path, "wt", encoding="utf-8") if name.endswith(".gz") else open(path, "w", encoding="utf-8")) as export:
+            export.write(text)
+        return path
+
+    def test_sql_dump_columns_from_create_table_and_insert(self):
+        path = self.write("backup.sql.gz", DUMP)
+        logs = list(iter_rows(path, "dispensing_log"))
+        self.assertEqual([row["recipe_name"] for row in logs], ["Mojito", "Don't \\ panic", "Empty", "Cuba Libre"])
+        self.assertEqual(set(logs[0]), {"id", "recipe_name", "started_at"})
+        details = list(iter_rows(path, "dispensing_details"))
+        self.assertEqual(len(details), 4)
+        self.assertIsNone(details[2]["ingredient_name"])
+
+    def test_orders_from_the_sql_dump(self):
+        trace = TraceWorkload(self.write("backup.sql", DUMP), speed=10)
+        orders = list(trace)
+        self.assertEqual([(delay, order.log_id) for delay, order in orders], [(0.0, 1), (3.0, 2), (717.0, 4)])
+        mojito = orders[0][1]
+        self.assertEqual([(item["pump_number"], item["quantity_ml"], item["order"]) for item in mojito.ingredients], [(2, 20.0, 1), (1, 40.0, 2)])
+        self.assertEqual(mojito.total_ml, 60.0)
+        self.assertEqual(orders[1][1].ingredients[0]["ingredient"], "Ingredient 12")
+        self.assertEqual((trace.orders, trace.skipped_empty, trace.orphan_details), (3, 1, 0))
+
+    def test_time_window_and_gap_cap(self):
+        path = self.write("backup.sql", DUMP)
+        trace = TraceWorkload(path, start=datetime(2025, 3, 7, 21, 0, 10), max_gap=60)
+        self.assertEqual([(delay, order.log_id) for delay, order in trace], [(0.0, 2), (60.0, 4)])
+        trace = TraceWorkload(path, end=datetime(2025, 3, 7, 22))
+        self.assertEqual([order.log_id for _, order in trace], [1, 2])
+        self.assertEqual(trace.last_started_at, datetime(2025, 3, 7, 21, 0, 30))
+
+    def test_csv_and_tsv_exports(self):
+        logs = self.write("log.csv", "id,recipe_name,started_at\n1,Mojito,2025-03-07 21:00:00\n3,Gin Tonic,2025-03-07 21:02:00\n")
+        details = self.write("details.tsv", "id\tlog_id\tpump_id\tingredient_name\tquantity_ml\torder_number\n"
+                                            "1\t1\t3\tRum\t40\t1\n2\t2\t4\tGin\t30\t1\n3\t3\t5\t\\N\t25\t1\n")
+        trace = TraceWorkload(logs, details=details)
+        orders = list(trace)
+        self.assertEqual([(delay, order.log_id) for delay, order in orders], [(0.0, 1), (120.0, 3)])
+        # No pumps export: pumps.id is the pump number
+        self.assertEqual(orders[1][1].ingredients, [{"pump_number": 5, "quantity_ml": 25.0, "ingredient": "Ingredient 5", "order": 1}])
+        self.assertEqual(trace.orphan_details, 1)
+        self.assertIn("log.csv + ", trace.describe())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+IntelliVend trace alapú terhelés a dispensing_log előzményekből
+===============================================================
+
+A szintetikus érkezési eloszlások (constant, poisson, burst) nem adják vissza
+a valódi forgalmat: a péntek esti csúcsot, a népszerű receptek összetételét, a
+rendelések közötti valódi szüneteket. Ez a modul az éles adatbázis
+dispensing_log és dispensing_details tábláinak exportjából állít elő terhelést
+az esp32_loadgen.py számára (--trace):
+
+- minden naplózott rendelésből pontosan az a több pumpás amount_ml tömb lesz,
+  amit a backend küldött (pump_number, quantity_ml, ingredient, order), az
+  order_number sorrendjében; a pumps tábla alapján a pumps.id -> pump_number
+  leképezéssel, ha az export tartalmazza (egyébként id = pump_number)
+- a rendelések az eredeti started_at különbségekkel indulnak, egy
+  gyorsítási szorzóval összenyomva (--trace-speed), opcionálisan a hosszú
+  szünetek (zárva tartás) levágásával (--trace-max-gap)
+- időablak szűrés (--trace-start / --trace-end), pl. egy péntek este
+
+Bemenet: mysqldump / phpMyAdmin SQL export (.sql, .sql.gz), vagy táblánként egy
+CSV / TSV fájl fejléccel (mysql --batch kimenet is). A sorok feldolgozása
+lusta: a két tábla egy-egy folyamként, elsődleges kulcs (id) sorrendben kerül
+összefésülésre log_id szerint, így több hónapnyi előzmény sem kerül a memóriába.
+
+Használat:
+    trace = TraceWorkload("backup.sql.gz", speed=60, start=datetime(2025, 3, 7, 18), end=datetime(2025, 3, 8, 2))
+    for delay, order in trace:      # delay: várakozás az előző rendelés óta (s, összenyomva)
+        payload["amount_ml"] = order.ingredients
+"""
+
+import csv
+import gzip
+import re
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Column order of the tables in database/schema.sql (dumps without column lists or CREATE TABLE)
+TABLE_COLUMNS = {
+    "dispensing_log": ("id", "recipe_id", "recipe_name", "total_volume_ml", "status", "error_message", "notes",
+                       "started_at", "completed_at", "duration_seconds"),
+    "dispensing_details": ("id", "log_id", "pump_id", "ingredient_id", "ingredient_name", "quantity_ml", "order_number",
+                           "status", "dispensed_at"),
+    "pumps": ("id", "pump_number", "ingredient_id", "gpio_pin", "flow_meter_pin", "is_active", "calibration_factor", "notes",
+              "created_at", "updated_at"),
+}
+
+# NULL as written by mysql --batch and by SELECT ... INTO OUTFILE
+CSV_NULLS = ("NULL", "\\N")
+
+SQL_ESCAPES = {"0": "\0", "b": "\b", "n": "\n", "r": "\r", "t": "\t", "Z": "\x1a"}
+
+INSERT_RE = re.compile(r"INSERT\s+(?:IGNORE\s+)?INTO\s+`?(\w+)`?\s*(?:\(([^)]*)\))?\s*VALUES\s*", re.IGNORECASE)
+CREATE_RE = re.compile(r"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?`?(\w+)`?", re.IGNORECASE)
+COLUMN_RE = re.compile(r"\s*`(\w+)`\s")
+
+
+def open_text(path: str):
+    """Szöveges export megnyitása (.gz esetén kitömörítve, folyamként)"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace", newline="")
+    return open(path, "r", encoding="utf-8", errors="replace", newline="")
+
+
+def parse_sql_values(text: str, pos: int = 0) -> Iterator[List[Optional[str]]]:
+    """Egy INSERT VALUES (...),(...) szakasz sorai; idézett érték szövegként, NULL None-ként, egyéb nyers szövegként"""
+    length = len(text)
+    while pos < length:
+        if text[pos] != "(":
+            pos += 1
+            continue
+        pos += 1
+        row: List[Optional[str]] = []
+        while pos < length:
+            while text[pos] in " \t\r\n":
+                pos += 1
+            if text[pos] == "'":
+                pos += 1
+                chunks = []
+                while True:
+                    end = pos
+                    while text[end] not in "'\\":
+                        end += 1
+                    chunks.append(text[pos:end])
+                    if text[end] == "\\":
+                        chunks.append(SQL_ESCAPES.get(text[end + 1], text[end + 1]))
+                        pos = end + 2
+                    elif text.startswith("''", end):
+                        chunks.append("'")
+                        pos = end + 2
+                    else:
+                        pos = end + 1
+                        break
+                row.append("".join(chunks))
+            else:
+                end = pos
+                while text[end] not in ",)":
+                    end += 1
+                token = text[pos:end].strip()
+                row.append(None if token.upper() == "NULL" else token)
+                pos = end
+            while text[pos] in " \t\r\n":
+                pos += 1
+            if text[pos] == ")":
+                pos += 1
+                yield row
+                break
+            pos += 1  # comma between values
+
+
+def iter_sql_rows(path: str, table: str) -> Iterator[Dict[str, Optional[str]]]:
+    """Egy tábla sorai egy SQL exportból (kiterjesztett és soronkénti INSERT, phpMyAdmin többsoros INSERT)"""
+    columns = TABLE_COLUMNS.get(table)
+    create_columns: Optional[List[str]] = None
+    insert_columns = None
+    in_insert = False
+    with open_text(path) as dump:
+        for line in dump:
+            if create_columns is not None:
+                # Column definitions of CREATE TABLE, until the closing parenthesis
+                match = COLUMN_RE.match(line)
+                if match:
+                    create_columns.append(match.group(1))
+                elif line.lstrip().startswith(")"):
+                    columns = tuple(create_columns)
+                    create_columns = None
+                continue
+
+            if in_insert:
+                values = line
+            else:
+                match = CREATE_RE.match(line)
+                if match and match.group(1) == table:
+                    create_columns = []
+                    continue
+                match = INSERT_RE.match(line)
+                if match is None or match.group(1) != table:
+                    continue
+                insert_columns = tuple(name.strip(" `") for name in match.group(2).split(",")) if match.group(2) else columns
+                values = line[match.end():]
+                in_insert = True
+
+            for row in parse_sql_values(values):
+                yield dict(zip(insert_columns, row))
+            if values.rstrip().endswith(";"):
+                in_insert = False
+
+
+def iter_csv_rows(path: str) -> Iterator[Dict[str, Optional[str]]]:
+    """CSV / TSV export sorai fejléc alapján (.tsv, .txt: tabulátor, egyébként a fejlécből felismerve)"""
+    name = path[:-3] if path.endswith(".gz") else path
+    with open_text(path) as export:
+        header = export.readline()
+        delimiter = "\t" if name.endswith((".tsv", ".txt")) or header.count("\t") > header.count(",") else ","
+        for row in csv.DictReader(_chain(header, export), delimiter=delimiter):
+            yield {key: (None if value in CSV_NULLS else value) for key, value in row.items()}
+
+
+def _chain(first: str, rest):
+    """Az előre beolvasott fejléc sor visszaillesztése a folyam elé"""
+    yield first
+    yield from rest
+
+
+def iter_rows(source: str, table: str) -> Iterator[Dict[str, Optional[str]]]:
+    """Tábla sorai SQL exportból (.sql, .sql.gz) vagy a tábla CSV / TSV exportjából"""
+    name = source[:-3] if source.endswith(".gz") else source
+    if name.endswith(".sql"):
+        return iter_sql_rows(source, table)
+    return iter_csv_rows(source)
+
+
+def parse_timestamp(value: str) -> datetime:
+    """MySQL TIMESTAMP / DATETIME (2025-03-07 21:04:11[.123]) vagy ISO 8601 (Z nélkül is)"""
+    return datetime.fromisoformat(value.strip().rstrip("Z"))
+
+
+class TraceOrder:
+    """Egy naplózott rendelés a visszajátszáshoz"""
+
+    __slots__ = ("log_id", "recipe_name", "started_at", "ingredients")
+
+    def __init__(self, log_id: int, recipe_name: str, started_at: datetime, ingredients: List[Dict]):
+        """
+        Args:
+            log_id: dispensing_log.id (a backend ezt küldi pump_id-ként recept parancsban)
+            recipe_name: Recept neve
+            started_at: Az eredeti indulási időpont
+            ingredients: amount_ml tömb elemei (pump_number, quantity_ml, ingredient, order)
+        """
+        self.log_id = log_id
+        self.recipe_name = recipe_name
+        self.started_at = started_at
+        self.ingredients = ingredients
+
+    @property
+    def total_ml(self) -> float:
+        return sum(item["quantity_ml"] for item in self.ingredients)
+
+
+class TraceWorkload:
+    """Rendelések lusta folyama a dispensing_log + dispensing_details exportból, összenyomott időközökkel"""
+
+    def __init__(self, source: str, details: Optional[str] = None, pumps: Optional[str] = None, speed: float = 1.0,
+                 start: Optional[datetime] = None, end: Optional[datetime] = None, max_gap: Optional[float] = None):
+        """
+        Args:
+            source: SQL export (mindhárom tábla), vagy a dispensing_log CSV / TSV exportja
+            details: A dispensing_details CSV / TSV exportja (SQL exportnál None: ugyanabból a fájlból)
+            pumps: A pumps tábla exportja a pumps.id -> pump_number leképezéshez (SQL exportnál alapból a source)
+            speed: Időtömörítés: az eredeti időközök ennyiszer rövidebbek
+            start: Az ennél korábban indult rendelések kihagyása
+            end: Az ennél később indult rendelések előtt a folyam véget ér
+            max_gap: Két rendelés közötti eredeti szünet felső korlátja másodpercben (zárva tartás kihagyása)
+        """
+        self.source = source
+        self.details = details or source
+        self.pumps = pumps or (source if details is None else None)
+        self.speed = speed
+        self.start = start
+        self.end = end
+        self.max_gap = max_gap
+
+        # Statistics of the last iteration
+        self.orders = 0
+        self.skipped_empty = 0
+        self.orphan_details = 0
+        self.first_started_at: Optional[datetime] = None
+        self.last_started_at: Optional[datetime] = None
+
+    def describe(self) -> str:
+        """Leírás a banner számára"""
+        parts = [f"{self.speed:g}x"]
+        if self.start or self.end:
+            parts.append(f"{self.start or '...'} - {self.end or '...'}")
+        if self.max_gap is not None:
+            parts.append(f"gaps capped at {self.max_gap:g}s")
+        sources = self.source if self.details == self.source else f"{self.source} + {self.details}"
+        return f"{sources} ({', '.join(parts)})"
+
+    def pump_numbers(self) -> Dict[int, int]:
+        """pumps.id -> pump_number (üres, ha nincs pumps export: ekkor id = pump_number)"""
+        if self.pumps is None:
+            return {}
+        return {int(row["id"]): int(row["pump_number"]) for row in iter_rows(self.pumps, "pumps")
+                if row.get("id") is not None and row.get("pump_number") is not None}
+
+    def orders_merged(self) -> Iterator[TraceOrder]:
+        """Rendelések log_id szerinti összefésüléssel (mindkét folyam elsődleges kulcs sorrendben)"""
+        pump_numbers = self.pump_numbers()
+        details = iter_rows(self.details, "dispensing_details")
+        detail = next(details, None)
+
+        for log in iter_rows(self.source, "dispensing_log"):
+            log_id = int(log["id"])
+            ingredients = []
+            while detail is not None and int(detail["log_id"]) <= log_id:
+                if int(detail["log_id"]) < log_id:
+                    # Details of a log row that is not in the export (or out of primary key order)
+                    self.orphan_details += 1
+                else:
+                    pump_id = int(detail["pump_id"])
+                    ingredients.append({
+                        "pump_number": pump_numbers.get(pump_id, pump_id),
+                        "quantity_ml": float(detail["quantity_ml"]),
+                        "ingredient": detail.get("ingredient_name") or f"Ingredient {pump_id}",
+                        "order": int(detail.get("order_number") or len(ingredients) + 1),
+                    })
+                detail = next(details, None)
+
+            if not ingredients or not log.get("started_at"):
+                self.skipped_empty += 1
+                continue
+            ingredients.sort(key=lambda item: item["order"])
+            yield TraceOrder(log_id, log.get("recipe_name") or "Unknown", parse_timestamp(log["started_at"]), ingredients)
+
+    def __iter__(self) -> Iterator[Tuple[float, TraceOrder]]:
+        """(várakozás az előző rendelés óta másodpercben, rendelés); az első várakozás 0"""
+        self.orders = self.skipped_empty = self.orphan_details = 0
+        self.first_started_at = self.last_started_at = None
+        previous: Optional[datetime] = None
+        for order in self.orders_merged():
+            if self.start is not None and order.started_at < self.start:
+                continue
+            if self.end is not None and order.started_at > self.end:
+                break
+            gap = 0.0 if previous is None else max(0.0, (order.started_at - previous).total_seconds())
+            if self.max_gap is not None:
+                gap = min(gap, self.max_gap)
+            previous = order.started_at
+
+            self.orders += 1
+            if self.first_started_at is None:
+                self.first_started_at = order.started_at
+            self.last_started_at = order.started_at
+            yield gap / self.speed, order